@@ -0,0 +1,25 @@
+"""add_combat_turn_order
+
+Revision ID: a8b9c0d1e2f3
+Revises: f7a8b9c0d1e2
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8b9c0d1e2f3'
+down_revision = 'f7a8b9c0d1e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Сохраненный порядок ходов; для уже идущих боев строится при первом переходе хода
+    op.add_column('combat_sessions', sa.Column('turn_order', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('combat_sessions', 'turn_order')
@@ -0,0 +1,25 @@
+"""add_expression_to_dice_history
+
+Revision ID: c4d5e6f7a8b9
+Revises: b3c4d5e6f7a8
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d5e6f7a8b9'
+down_revision = 'b3c4d5e6f7a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Выражение кубиков для бросков по выражению ("4d6kh3+2")
+    op.add_column('dice_roll_history', sa.Column('expression', sa.String(length=100), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('dice_roll_history', 'expression')
@@ -0,0 +1,31 @@
+"""add_game_dice_rng_streams
+
+Revision ID: d5e6f7a8b9c0
+Revises: c4d5e6f7a8b9
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e6f7a8b9c0'
+down_revision = 'c4d5e6f7a8b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Seed игры создается при первом броске, поэтому для существующих игр поля пустые
+    op.add_column('game_sessions', sa.Column('dice_seed', sa.String(length=64), nullable=True))
+    op.add_column('game_sessions', sa.Column('dice_seed_commitment', sa.String(length=64), nullable=True))
+    op.add_column('game_sessions', sa.Column('dice_rng_offset', sa.BigInteger(), nullable=False, server_default='0'))
+    op.add_column('dice_roll_history', sa.Column('rng_offset', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('dice_roll_history', 'rng_offset')
+    op.drop_column('game_sessions', 'dice_rng_offset')
+    op.drop_column('game_sessions', 'dice_seed_commitment')
+    op.drop_column('game_sessions', 'dice_seed')
@@ -0,0 +1,43 @@
+"""dice_history_keyset_indexes
+
+Revision ID: e6f7a8b9c0d1
+Revises: d5e6f7a8b9c0
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6f7a8b9c0d1'
+down_revision = 'd5e6f7a8b9c0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Составные индексы под keyset-пагинацию (created_at, id) по убыванию
+    op.create_index(
+        'ix_dice_roll_history_game_created_id', 'dice_roll_history',
+        ['game_id', sa.text('created_at DESC'), sa.text('id DESC')], unique=False
+    )
+    op.create_index(
+        'ix_dice_roll_history_game_user_created_id', 'dice_roll_history',
+        ['game_id', 'user_id', sa.text('created_at DESC'), sa.text('id DESC')], unique=False
+    )
+    op.create_index(
+        'ix_dice_roll_history_game_type_created_id', 'dice_roll_history',
+        ['game_id', 'roll_type', sa.text('created_at DESC'), sa.text('id DESC')], unique=False
+    )
+    # game_id покрывается префиксом составного индекса, created_at отдельно не используется
+    op.drop_index('ix_dice_roll_history_game_id', table_name='dice_roll_history')
+    op.drop_index('ix_dice_roll_history_created_at', table_name='dice_roll_history')
+
+
+def downgrade() -> None:
+    op.create_index('ix_dice_roll_history_created_at', 'dice_roll_history', ['created_at'], unique=False)
+    op.create_index('ix_dice_roll_history_game_id', 'dice_roll_history', ['game_id'], unique=False)
+    op.drop_index('ix_dice_roll_history_game_type_created_id', table_name='dice_roll_history')
+    op.drop_index('ix_dice_roll_history_game_user_created_id', table_name='dice_roll_history')
+    op.drop_index('ix_dice_roll_history_game_created_id', table_name='dice_roll_history')
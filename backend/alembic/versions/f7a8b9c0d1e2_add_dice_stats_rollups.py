@@ -0,0 +1,49 @@
+"""add_dice_stats_rollups
+
+Revision ID: f7a8b9c0d1e2
+Revises: e6f7a8b9c0d1
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7a8b9c0d1e2'
+down_revision = 'e6f7a8b9c0d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Агрегаты статистики бросков; для существующей истории заполняются rebuild_dice_stats.py
+    op.create_table(
+        'dice_roll_stats',
+        sa.Column('game_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('roll_type', sa.String(length=50), nullable=False),
+        sa.Column('rolls', sa.BigInteger(), nullable=False),
+        sa.Column('total_sum', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['game_id'], ['game_sessions.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('game_id', 'user_id', 'roll_type')
+    )
+    op.create_table(
+        'dice_face_stats',
+        sa.Column('game_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('roll_type', sa.String(length=50), nullable=False),
+        sa.Column('faces', sa.Integer(), nullable=False),
+        sa.Column('value', sa.Integer(), nullable=False),
+        sa.Column('count', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['game_id'], ['game_sessions.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('game_id', 'user_id', 'roll_type', 'faces', 'value')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('dice_face_stats')
+    op.drop_table('dice_roll_stats')
@@ -18,6 +18,7 @@ from ..schemas.combat import (
     CombatParticipantResponse,
     StartCombatRequest,
     RollInitiativeRequest,
+    InitiativeBatchResult,
     EndTurnRequest,
     AttackRequest,
     AttackResponse,
@@ -31,6 +32,7 @@ from ..schemas.combat import (
 from ..services.combat_service import (
     start_combat,
     roll_initiative,
+    roll_initiative_for_uncontrolled,
     get_initiative_order,
     get_current_combat,
     get_combat_session,
@@ -43,11 +45,18 @@ from ..services.combat_service import (
     remove_condition,
     roll_death_save,
     roll_saving_throw,
+    add_participant,
 )
-from ..services.game_service import is_master, is_participant
+from ..services.dice_expression import DiceExpressionError, roll_expression
+from ..services.dice_rng import get_game_rng
+from ..services.game_service import is_master, is_participant, get_game_tokens
+from ..services.game_cache import update_token_in_redis
 from ..sockets.game_events import (
     emit_combat_started,
     emit_initiative_rolled,
+    emit_initiative_batch,
+    emit_death_save,
+    emit_participant_added,
     emit_combat_ended,
     emit_combat_attack,
     emit_combat_damage,
@@ -58,21 +67,12 @@ from ..sockets.game_events import (
 router = APIRouter(prefix="/api/games/{game_id}/combat", tags=["combat"])
 
 
-def _participant_to_response(participant, db: Session) -> CombatParticipantResponse:
+def _participant_to_response(
+    participant,
+    character_name: Optional[str] = None,
+    token_name: Optional[str] = None,
+) -> CombatParticipantResponse:
     """Преобразование участника боя в ответ API"""
-    character_name = None
-    token_name = None
-    
-    if participant.character_id:
-        character = db.query(Character).filter(Character.id == participant.character_id).first()
-        if character:
-            character_name = character.name
-    
-    if participant.token_id:
-        token = db.query(Token).filter(Token.id == participant.token_id).first()
-        if token:
-            token_name = token.name
-    
     return CombatParticipantResponse(
         id=participant.id,
         combat_id=participant.combat_id,
@@ -99,6 +99,65 @@ def _participant_to_response(participant, db: Session) -> CombatParticipantRespo
     )
 
 
+def _with_names(query):
+    """Имена персонажа и токена участника через LEFT JOIN"""
+    return (
+        query.outerjoin(Character, Character.id == CombatParticipant.character_id)
+        .outerjoin(Token, Token.id == CombatParticipant.token_id)
+    )
+
+
+def _participant_response(participant, db: Session) -> CombatParticipantResponse:
+    """Ответ для одного участника: имена одним запросом"""
+    names = _with_names(
+        db.query(Character.name, Token.name).select_from(CombatParticipant)
+    ).filter(CombatParticipant.id == participant.id).first()
+    return _participant_to_response(participant, *(names or (None, None)))
+
+
+def _participant_responses(combat, db: Session) -> List[CombatParticipantResponse]:
+    """
+    Участники боя с именами одним запросом
+
+    Для боя из движка в памяти (`combat_engine`) значения участников берутся
+    из памяти, из БД — только имена.
+    """
+    rows = _with_names(
+        db.query(CombatParticipant, Character.name, Token.name)
+    ).filter(CombatParticipant.combat_id == combat.id).all()
+    in_memory = getattr(combat, "by_id", None)
+    if in_memory is not None:
+        return [
+            _participant_to_response(in_memory[p.id], character_name, token_name)
+            for p, character_name, token_name in rows if p.id in in_memory
+        ]
+    return [_participant_to_response(p, character_name, token_name) for p, character_name, token_name in rows]
+
+
+def _turn_state(combat) -> dict:
+    """Порядок ходов для событий, которые его меняют (как в `combat:initiative_batch`)"""
+    return {
+        "combat_id": str(combat.id),
+        "turn_order": [entry["id"] for entry in combat.turn_order or []],
+        "current_turn_index": combat.current_turn_index,
+        "round_number": combat.round_number,
+    }
+
+
+def _combat_response(combat, db: Session) -> CombatSessionResponse:
+    return CombatSessionResponse(
+        id=combat.id,
+        game_id=combat.game_id,
+        is_active=combat.is_active,
+        current_turn_index=combat.current_turn_index,
+        round_number=combat.round_number,
+        started_at=combat.started_at,
+        ended_at=combat.ended_at,
+        participants=_participant_responses(combat, db),
+        turn_order=[entry["id"] for entry in combat.turn_order or []],
+    )
+
+
 @router.post("/start", response_model=CombatSessionResponse, status_code=status.HTTP_201_CREATED)
 async def start_combat_endpoint(
     game_id: UUID,
@@ -121,10 +180,19 @@ async def start_combat_endpoint(
     token_max_hp_map = {}
     token_armor_class_map = {}
     
+    # Персонажи и токены всех участников — два запроса IN (...)
+    requested_ids = list(dict.fromkeys(request.participant_ids))
+    characters = {
+        c.id: c for c in db.query(Character).filter(Character.id.in_(requested_ids)).all()
+    } if requested_ids else {}
+    token_ids = [pid for pid in requested_ids if pid not in characters]
+    tokens = {
+        row.id for row in db.query(Token.id).filter(Token.id.in_(token_ids)).all()
+    } if token_ids else set()
+    
     for participant_id in request.participant_ids:
         # Проверяем, это персонаж или токен
-        character = db.query(Character).filter(Character.id == participant_id).first()
-        token = db.query(Token).filter(Token.id == participant_id).first()
+        character = characters.get(participant_id)
         
         if character:
             max_hp = character.max_hp or character.level * 10
@@ -138,7 +206,7 @@ async def start_combat_endpoint(
             })
             character_max_hp_map[participant_id] = max_hp
             character_armor_class_map[participant_id] = armor_class
-        elif token:
+        elif participant_id in tokens:
             # Это токен/монстр - используем значения по умолчанию или из токена
             max_hp = 10  # Значение по умолчанию для монстров
             armor_class = 10  # Значение по умолчанию
@@ -168,20 +236,8 @@ async def start_combat_endpoint(
         token_armor_class_map
     )
     
-    # Получаем участников для ответа
-    participants = combat_session.participants
-    participant_responses = [_participant_to_response(p, db) for p in participants]
-    
-    response_data = CombatSessionResponse(
-        id=combat_session.id,
-        game_id=combat_session.game_id,
-        is_active=combat_session.is_active,
-        current_turn_index=combat_session.current_turn_index,
-        round_number=combat_session.round_number,
-        started_at=combat_session.started_at,
-        ended_at=combat_session.ended_at,
-        participants=participant_responses
-    )
+    # Участники с именами для ответа
+    response_data = _combat_response(combat_session, db)
     
     # Эмитируем WebSocket событие
     await emit_combat_started(game_id, response_data.model_dump())
@@ -216,14 +272,48 @@ async def roll_initiative_endpoint(
     # Бросаем инициативу
     participant = roll_initiative(db, combat_id, request.participant_id, request.initiative_roll)
     
-    participant_response = _participant_to_response(participant, db)
+    participant_response = _participant_response(participant, db)
     
-    # Эмитируем WebSocket событие
-    await emit_initiative_rolled(game_id, participant_response.model_dump())
+    # Эмитируем WebSocket событие: инициатива пересортировывает порядок ходов
+    await emit_initiative_rolled(game_id, {
+        **participant_response.model_dump(mode="json"),
+        **_turn_state(combat),
+    })
     
     return participant_response
 
 
+@router.post("/{combat_id}/roll-initiative-all", response_model=InitiativeBatchResult)
+async def roll_initiative_all_endpoint(
+    game_id: UUID,
+    combat_id: UUID,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Бросок инициативы всем участникам без игрока (только мастер)"""
+    # Проверяем права мастера
+    if not is_master(db, game_id, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Только мастер может бросать инициативу за всех"
+        )
+    
+    # Проверяем, что боевая сессия существует и принадлежит игре
+    combat = get_combat_session(db, combat_id)
+    if combat.game_id != game_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Combat session not found for this game"
+        )
+    
+    # Бросаем инициативу (одно событие на всю группу)
+    result = InitiativeBatchResult(**roll_initiative_for_uncontrolled(db, combat_id))
+    
+    await emit_initiative_batch(game_id, result.model_dump())
+    
+    return result
+
+
 @router.get("/current", response_model=Optional[CombatSessionResponse])
 async def get_current_combat_endpoint(
     game_id: UUID,
@@ -243,20 +333,7 @@ async def get_current_combat_endpoint(
     if not combat:
         return None
     
-    # Получаем участников
-    participants = combat.participants
-    participant_responses = [_participant_to_response(p, db) for p in participants]
-    
-    return CombatSessionResponse(
-        id=combat.id,
-        game_id=combat.game_id,
-        is_active=combat.is_active,
-        current_turn_index=combat.current_turn_index,
-        round_number=combat.round_number,
-        started_at=combat.started_at,
-        ended_at=combat.ended_at,
-        participants=participant_responses
-    )
+    return _combat_response(combat, db)
 
 
 @router.post("/{combat_id}/end", response_model=CombatSessionResponse)
@@ -285,20 +362,7 @@ async def end_combat_endpoint(
     # Завершаем бой
     combat = end_combat(db, combat_id)
     
-    # Получаем участников для ответа
-    participants = combat.participants
-    participant_responses = [_participant_to_response(p, db) for p in participants]
-    
-    response_data = CombatSessionResponse(
-        id=combat.id,
-        game_id=combat.game_id,
-        is_active=combat.is_active,
-        current_turn_index=combat.current_turn_index,
-        round_number=combat.round_number,
-        started_at=combat.started_at,
-        ended_at=combat.ended_at,
-        participants=participant_responses
-    )
+    response_data = _combat_response(combat, db)
     
     # Эмитируем WebSocket событие
     await emit_combat_ended(game_id)
@@ -425,7 +489,7 @@ async def damage_endpoint(
         "was_defeated": was_defeated
     })
     
-    return _participant_to_response(participant, db)
+    return _participant_response(participant, db)
 
 
 @router.post("/{combat_id}/heal", response_model=CombatParticipantResponse)
@@ -469,7 +533,7 @@ async def heal_endpoint(
         "max_hp": participant.max_hp
     })
 
-    return _participant_to_response(participant, db)
+    return _participant_response(participant, db)
 
 
 # ── New endpoints: next-turn, conditions, death saves ──────────────────────
@@ -488,14 +552,7 @@ async def next_turn_endpoint(
     if combat.game_id != game_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Combat not found")
     combat = next_turn(db, combat_id)
-    participants = combat.participants
-    participant_responses = [_participant_to_response(p, db) for p in participants]
-    response_data = CombatSessionResponse(
-        id=combat.id, game_id=combat.game_id, is_active=combat.is_active,
-        current_turn_index=combat.current_turn_index, round_number=combat.round_number,
-        started_at=combat.started_at, ended_at=combat.ended_at,
-        participants=participant_responses,
-    )
+    response_data = _combat_response(combat, db)
     from ..sockets.game_events import emit_turn_changed
     await emit_turn_changed(game_id, response_data.model_dump())
     return response_data
@@ -522,7 +579,7 @@ async def manage_condition_endpoint(
         participant = remove_condition(db, combat_id, participant_id, request.condition)
     else:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="action must be 'add' or 'remove'")
-    return _participant_to_response(participant, db)
+    return _participant_response(participant, db)
 
 
 @router.post("/{combat_id}/participants/{participant_id}/death-save", response_model=DeathSaveResult)
@@ -539,7 +596,10 @@ async def death_save_endpoint(
     combat = get_combat_session(db, combat_id)
     if combat.game_id != game_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Combat not found")
-    return roll_death_save(db, combat_id, participant_id)
+    result = roll_death_save(db, combat_id, participant_id)
+    # Погибший выбывает из порядка ходов, поэтому событие несет и порядок
+    await emit_death_save(game_id, {"participant_id": str(participant_id), **result, **_turn_state(combat)})
+    return result
 
 
 @router.post("/{combat_id}/saving-throw", response_model=SavingThrowResult)
@@ -573,7 +633,6 @@ async def add_monster_to_combat_endpoint(
     db: Session = Depends(get_db),
 ):
     """Добавить монстра из бестиария в текущий бой (только мастер)."""
-    import random
     import uuid
 
     if not is_master(db, game_id, current_user.id):
@@ -589,16 +648,16 @@ async def add_monster_to_combat_endpoint(
     if not monster:
         raise HTTPException(status_code=404, detail=f"Monster '{monster_slug}' not found")
 
+    # HP и инициатива монстра бросаются из одного номера потока игры
+    rng = get_game_rng(db, game_id)
+
     # Roll or use average HP
     if use_average_hp or not monster.hp_dice:
         hp = monster.hp_average or 10
     else:
         try:
-            parts = monster.hp_dice.lower().split("d")
-            num_dice = int(parts[0])
-            die_size = int(parts[1])
-            hp = sum(random.randint(1, die_size) for _ in range(num_dice))
-        except Exception:
+            hp = max(1, roll_expression(monster.hp_dice, rng=rng).total)
+        except DiceExpressionError:
             hp = monster.hp_average or 10
 
     token = Token(
@@ -612,9 +671,8 @@ async def add_monster_to_combat_endpoint(
     db.flush()
 
     participant = CombatParticipant(
-        combat_id=combat_id,
         token_id=token.id,
-        initiative=random.randint(1, 20) + ((monster.dexterity - 10) // 2),
+        initiative=rng.randint(1, 20) + ((monster.dexterity - 10) // 2),
         current_hp=hp,
         max_hp=hp,
         armor_class=monster.armor_class or 10,
@@ -624,7 +682,13 @@ async def add_monster_to_combat_endpoint(
         damage_immunities=monster.damage_immunities or [],
         damage_vulnerabilities=monster.damage_vulnerabilities or [],
     )
-    db.add(participant)
-    db.commit()
-    db.refresh(participant)
-    return _participant_to_response(participant, db)
+    # Место в порядке ходов по инициативе, текущий ход не меняется
+    participant = add_participant(db, combat_id, participant)
+    update_token_in_redis(game_id, token, lambda: get_game_tokens(db, game_id))
+    response = _participant_response(participant, db)
+    # add_participant выгружает бой из движка, поэтому порядок читается заново
+    await emit_participant_added(game_id, {
+        "participant": response.model_dump(mode="json"),
+        **_turn_state(get_combat_session(db, combat_id)),
+    })
+    return response
@@ -1,9 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Dict, Any, Literal, Optional
 from ..middleware.auth import get_current_user
 from ..models.user import User
-from ..services.dice_service import DiceRoller, get_templates, apply_template
+from ..services.dice_service import (
+    DiceRoller,
+    get_templates,
+    apply_template,
+    roll_group,
+    make_group_history_rows,
+    save_roll_history_batch,
+)
+from ..services.game_service import is_participant
+from ..services.dice_rng import get_game_rngs
+from ..schemas.dice import DiceRollBatchRequest
+from ..sockets.emitters import emit_dice_rolled_batch
+from ..services.dice_expression import DiceExpressionError, compile_expression
+from ..services.dice_distribution import get_distribution
+from ..services.dice_batch import MAX_BATCH_ROLLS, histogram, summarize
 from ..services.character_service import get_character_by_id
 from ..database import get_db
 from sqlalchemy.orm import Session
@@ -15,22 +30,39 @@ dice_roller = DiceRoller(default_faces=12, max_dice=10)
 
 
 class DiceRollRequest(BaseModel):
-    count: int = Field(ge=1, le=10, description="Количество кубиков")
-    faces: int = Field(ge=2, le=20, description="Количество граней")
+    count: Optional[int] = Field(None, ge=1, le=10, description="Количество кубиков")
+    faces: Optional[int] = Field(None, ge=2, le=20, description="Количество граней")
+    expression: Optional[str] = Field(None, max_length=100, description="Выражение кубиков, например 4d6kh3+2d8+5")
     advantage: Optional[bool] = Field(None, description="Преимущество (True) или помеха (False), None = обычный бросок")
 
+    @model_validator(mode="after")
+    def check_dice(self):
+        if self.expression is None and (self.count is None or self.faces is None):
+            raise ValueError("Укажите expression или count и faces")
+        return self
+
 
 class DieRoll(BaseModel):
     die_id: str
     value: int
 
 
+class DiceTermResult(BaseModel):
+    expression: str
+    sign: int
+    rolls: List[int]
+    kept: List[bool]
+    subtotal: int
+
+
 class DiceRollResponse(BaseModel):
     rolls: List[DieRoll]
     total: int
     advantage_rolls: Optional[List[DieRoll]] = None
     selected_roll: Optional[DieRoll] = None
     advantage_type: Optional[str] = None
+    expression: Optional[str] = None
+    terms: Optional[List[DiceTermResult]] = None
 
 
 @router.post("/roll", response_model=DiceRollResponse, status_code=status.HTTP_200_OK)
@@ -41,9 +73,15 @@ async def roll_dice_endpoint(
     """
     Бросок кубиков
     
-    Поддерживает стандартные D&D кубики: d4, d6, d8, d10, d12, d20
+    Поддерживает стандартные D&D кубики: d4, d6, d8, d10, d12, d20,
+    либо выражение `expression` (keep/drop, взрывы, перебросы, константы).
     """
     try:
+        if request.expression is not None:
+            result_dict = compile_expression(request.expression, request.advantage).roll().to_dict()
+            if request.advantage is not None:
+                result_dict["advantage_type"] = "advantage" if request.advantage else "disadvantage"
+            return DiceRollResponse(**result_dict)
         result = dice_roller.roll(request.count, request.faces, request.advantage)
         result_dict = dice_roller.to_dict(result)
         return DiceRollResponse(**result_dict)
@@ -54,6 +92,206 @@ async def roll_dice_endpoint(
         )
 
 
+class DistributionPoint(BaseModel):
+    total: int
+    probability: float
+
+
+class DiceDistributionResponse(BaseModel):
+    """Точное распределение суммы броска"""
+    expression: str
+    min: int
+    max: int
+    mean: float
+    variance: float
+    std: float
+    percentiles: Dict[str, int]
+    pmf: List[DistributionPoint]
+    target: Optional[int] = None
+    probability_at_least: Optional[float] = None
+
+
+@router.get("/distribution", response_model=DiceDistributionResponse)
+async def get_dice_distribution(
+    expr: Optional[str] = Query(None, max_length=100, description="Выражение кубиков, например 4d6kh3+2"),
+    count: Optional[int] = Query(None, description="Количество кубиков (если не указано выражение)"),
+    faces: Optional[int] = Query(None, description="Количество граней (если не указано выражение)"),
+    advantage: Optional[bool] = Query(None, description="Преимущество (True) или помеха (False)"),
+    target: Optional[int] = Query(None, description="Вернуть вероятность выбросить не меньше target"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Точное распределение (PMF), среднее, дисперсия и перцентили для броска
+
+    Без `expr` действуют ограничения `/roll`: стандартные кубики, не больше
+    `max_dice`, преимущество — только для одного кубика.
+    """
+    if expr is None:
+        if count is None or faces is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Укажите expr или count и faces"
+            )
+        if count < 1 or count > dice_roller.max_dice:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Количество кубиков должно быть от 1 до {dice_roller.max_dice}"
+            )
+        if faces not in DiceRoller.ALLOWED_FACES:
+            allowed_str = ", ".join(map(str, DiceRoller.ALLOWED_FACES))
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Недопустимое количество граней: {faces}. Разрешены: {allowed_str}"
+            )
+        expr = f"{count}d{faces}"
+        if count != 1:
+            advantage = None
+
+    try:
+        # Свертка больших пулов занимает заметное время — не блокируем event loop
+        distribution = await run_in_threadpool(get_distribution, expr, advantage)
+    except DiceExpressionError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    response = distribution.to_dict()
+    if target is not None:
+        response["target"] = target
+        response["probability_at_least"] = distribution.probability_at_least(target)
+    return DiceDistributionResponse(**response)
+
+
+class DiceGroupRollResult(BaseModel):
+    label: Optional[str] = None
+    count: int
+    faces: int
+    expression: Optional[str] = None
+    rolls: List[DieRoll]
+    total: int
+    roll_type: Optional[str] = None
+    modifier: Optional[int] = None
+    advantage_type: Optional[str] = None
+    advantage_rolls: Optional[List[DieRoll]] = None
+    selected_roll: Optional[DieRoll] = None
+    terms: Optional[List[DiceTermResult]] = None
+    rng_offset: Optional[int] = None
+
+
+class DiceRollBatchResponse(BaseModel):
+    """Результат группового броска (то же содержимое рассылается в dice:rolled_batch)"""
+    game_id: str
+    user_id: str
+    username: str
+    rolls: List[DiceGroupRollResult]
+
+
+@router.post("/roll-batch", response_model=DiceRollBatchResponse)
+async def roll_dice_batch(
+    request: DiceRollBatchRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Групповой бросок (например, спасброски всей группы)
+
+    Все броски сохраняются в историю одной вставкой и рассылаются
+    одним событием `dice:rolled_batch`.
+    """
+    if not is_participant(db, request.game_id, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Вы не являетесь участником этой игры"
+        )
+
+    try:
+        entries = roll_group(request.rolls, rngs=get_game_rngs(db, request.game_id, len(request.rolls)))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    save_roll_history_batch(db, make_group_history_rows(request.game_id, current_user.id, entries))
+
+    payload = {
+        "game_id": str(request.game_id),
+        "user_id": str(current_user.id),
+        "username": current_user.username,
+        "rolls": entries,
+    }
+    await emit_dice_rolled_batch(request.game_id, payload)
+    return DiceRollBatchResponse(**payload)
+
+
+# Максимум сырых результатов в ответе; для больших пакетов — гистограмма
+MAX_RAW_RESULTS = 10000
+
+
+class DiceSimulateRequest(BaseModel):
+    expression: str = Field(max_length=100, description="Выражение кубиков, например 4d6kh3+2")
+    rolls: int = Field(ge=1, le=MAX_BATCH_ROLLS, description="Количество бросков в пакете")
+    advantage: Optional[bool] = Field(None, description="Преимущество (True) или помеха (False)")
+    mode: Literal["raw", "histogram"] = Field("histogram", description="raw — все суммы, histogram — частоты")
+
+
+class HistogramBin(BaseModel):
+    total: int
+    count: int
+
+
+class DiceSimulateResponse(BaseModel):
+    """Результат пакетного броска"""
+    expression: str
+    rolls: int
+    mode: str
+    min: int
+    max: int
+    mean: float
+    std: float
+    results: Optional[List[int]] = None
+    histogram: Optional[List[HistogramBin]] = None
+
+
+@router.post("/simulate", response_model=DiceSimulateResponse)
+async def simulate_dice(
+    request: DiceSimulateRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Пакетный (Monte Carlo) бросок выражения для аналитики и симуляций
+
+    Все броски выполняются векторизованно; результаты не сохраняются в историю.
+    """
+    if request.mode == "raw" and request.rolls > MAX_RAW_RESULTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Режим raw ограничен {MAX_RAW_RESULTS} бросками, используйте histogram"
+        )
+
+    try:
+        plan = compile_expression(request.expression, request.advantage)
+        totals = await run_in_threadpool(dice_roller.roll_batch, request.expression, request.rolls, request.advantage)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    response = {
+        "expression": plan.expression,
+        "rolls": request.rolls,
+        "mode": request.mode,
+        **summarize(totals),
+    }
+    if request.mode == "raw":
+        response["results"] = totals.tolist()
+    else:
+        response["histogram"] = histogram(totals)
+    return DiceSimulateResponse(**response)
+
+
 class DiceTemplateResponse(BaseModel):
     """Ответ с шаблонами бросков"""
     templates: Dict[str, Dict[str, Any]]
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
 from uuid import UUID
 from typing import List, Optional
 from ..database import get_db
@@ -24,12 +25,17 @@ from ..services.game_service import (
     get_game_participants,
     transfer_master_role
 )
+from ..services.dice_service import get_roll_history_page
+from ..services.dice_stats import get_game_dice_stats
+from ..services.dice_export import EXPORT_FORMATS, iter_history_export
+from ..services.dice_fairness import get_fairness_audit
+from ..schemas.dice import DiceFairnessResponse, GameDiceStatsResponse
 from ..middleware.auth import get_current_user
 from ..models.user import User
 from ..models.dice_roll_history import DiceRollHistory
 from ..models.game_participant import GameParticipant
 from ..sockets.game_events import emit_master_transferred
-from ..sockets.state import started_games
+from ..sockets.state import get_state_store
 
 router = APIRouter(prefix="/api/games", tags=["games"])
 
@@ -54,6 +60,8 @@ class DiceRollHistoryItem(BaseModel):
     advantage_type: Optional[str] = None
     advantage_rolls: Optional[List[DieRollSchema]] = None
     selected_roll: Optional[DieRollSchema] = None
+    expression: Optional[str] = None
+    rng_offset: Optional[int] = None
     created_at: str
 
     class Config:
@@ -298,17 +306,20 @@ async def transfer_master_role_endpoint(
 @router.get("/{game_id}/dice-history", response_model=List[DiceRollHistoryItem])
 async def get_dice_history(
     game_id: UUID,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db),
     user_id: Optional[UUID] = Query(None, description="Фильтр по пользователю"),
     roll_type: Optional[str] = Query(None, description="Фильтр по типу проверки (attack, save, skill, custom)"),
     limit: int = Query(50, ge=1, le=100, description="Количество записей"),
-    offset: int = Query(0, ge=0, description="Смещение")
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из заголовка X-Next-Cursor"),
+    offset: int = Query(0, ge=0, description="Смещение (устарело, используйте cursor)")
 ):
     """
     Получение истории бросков для игры с фильтрацией
     
-    Требуется быть участником игры
+    Требуется быть участником игры. Если есть следующая страница, ее курсор
+    возвращается в заголовке `X-Next-Cursor`.
     """
     # Проверяем, что пользователь является участником игры
     participant = db.query(GameParticipant).filter(
@@ -322,19 +333,17 @@ async def get_dice_history(
             detail="Вы не являетесь участником этой игры"
         )
     
-    # Формируем запрос с фильтрами
-    query = db.query(DiceRollHistory).filter(
-        DiceRollHistory.game_id == game_id
-    )
-    
-    if user_id:
-        query = query.filter(DiceRollHistory.user_id == user_id)
-    
-    if roll_type:
-        query = query.filter(DiceRollHistory.roll_type == roll_type)
-    
-    # Сортируем по дате создания (новые сначала) и применяем пагинацию
-    history = query.order_by(desc(DiceRollHistory.created_at)).offset(offset).limit(limit).all()
+    try:
+        history, next_cursor = get_roll_history_page(
+            db, game_id, limit, cursor=cursor, user_id=user_id, roll_type=roll_type, offset=offset
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     
     # Получаем имена пользователей для всех записей
     user_ids = {entry.user_id for entry in history}
@@ -365,15 +374,145 @@ async def get_dice_history(
             advantage_type=entry.advantage_type,
             advantage_rolls=advantage_rolls_list,
             selected_roll=selected_roll_dict,
+            expression=entry.expression,
+            rng_offset=entry.rng_offset,
             created_at=entry.created_at.isoformat()
         ))
 
     return result
 
 
+@router.get("/{game_id}/dice-history/export")
+async def export_dice_history(
+    game_id: UUID,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="ndjson или csv"),
+    user_id: Optional[UUID] = Query(None, description="Фильтр по пользователю"),
+    roll_type: Optional[str] = Query(None, description="Фильтр по типу проверки")
+):
+    """
+    Потоковая выгрузка всей истории бросков игры (NDJSON или CSV)
+
+    Строки читаются курсором и отдаются порциями, без постраничных запросов;
+    память сервера не зависит от размера истории. Требуется быть участником игры.
+    """
+    participant = db.query(GameParticipant).filter(
+        GameParticipant.game_id == game_id,
+        GameParticipant.user_id == current_user.id
+    ).first()
+    if not participant:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Вы не являетесь участником этой игры"
+        )
+
+    chunks = iter_history_export(db.get_bind(), game_id, format, user_id=user_id, roll_type=roll_type)
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="dice-history-{game_id}.{format}"'}
+    )
+
+
+class DiceRngInfo(BaseModel):
+    """Поток бросков игры: опубликованный хэш seed"""
+    seed_commitment: Optional[str] = None
+    next_offset: int
+
+
+@router.get("/{game_id}/dice-rng", response_model=DiceRngInfo)
+async def get_dice_rng_info(
+    game_id: UUID,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Хэш seed потока бросков для проверки честности
+
+    Seed не отдается никому, включая мастера: вместе с `next_offset` он позволил бы
+    предсказать все следующие броски, а у игры нет момента завершения, после которого
+    его можно раскрыть. Броски сверяются с хэшем на сервере инструментом `replay_dice_rolls.py`.
+    """
+    game = get_game_by_id(db, game_id)
+    role = db.query(GameParticipant.role).filter(
+        GameParticipant.game_id == game_id,
+        GameParticipant.user_id == current_user.id
+    ).scalar()
+    if role is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Вы не являетесь участником этой игры"
+        )
+    return DiceRngInfo(
+        seed_commitment=game.dice_seed_commitment,
+        next_offset=game.dice_rng_offset or 0,
+    )
+
+
+@router.get("/{game_id}/dice-stats", response_model=GameDiceStatsResponse)
+async def get_dice_stats(
+    game_id: UUID,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Статистика бросков игры: кубики по граням, удача игроков, типы проверок
+
+    Читается из агрегатов, которые обновляются при каждом сохранении истории,
+    без сканирования `dice_roll_history`. Требуется быть участником игры.
+    """
+    participant = db.query(GameParticipant).filter(
+        GameParticipant.game_id == game_id,
+        GameParticipant.user_id == current_user.id
+    ).first()
+    if not participant:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Вы не являетесь участником этой игры"
+        )
+
+    stats = get_game_dice_stats(db, game_id)
+    user_ids = [entry["user_id"] for entry in stats["users"]]
+    users = {user.id: user.username for user in db.query(User).filter(User.id.in_(user_ids)).all()}
+    for entry in stats["users"]:
+        entry["username"] = users.get(entry["user_id"])
+    return GameDiceStatsResponse(**stats)
+
+
+@router.get("/{game_id}/dice-audit", response_model=DiceFairnessResponse)
+async def get_dice_audit(
+    game_id: UUID,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Аудит честности кубиков игры: хи-квадрат, Колмогоров–Смирнов и тест серий
+    по каждому виду кубика, для игры в целом и для каждого игрока
+
+    Результат кэшируется до появления новых бросков в игре. Требуется быть участником игры.
+    """
+    participant = db.query(GameParticipant).filter(
+        GameParticipant.game_id == game_id,
+        GameParticipant.user_id == current_user.id
+    ).first()
+    if not participant:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Вы не являетесь участником этой игры"
+        )
+
+    # Пересчет читает всю историю игры — не блокируем event loop
+    audit = await run_in_threadpool(get_fairness_audit, db, game_id)
+    user_ids = [entry["user_id"] for entry in audit["users"]]
+    users = {user.id: user.username for user in db.query(User).filter(User.id.in_(user_ids)).all()}
+    audit["users"] = [dict(entry, username=users.get(entry["user_id"])) for entry in audit["users"]]
+    return DiceFairnessResponse(**audit)
+
+
 @router.get("/{game_id}/status")
 async def get_game_status(
     game_id: UUID,
     current_user: User = Depends(get_current_user),
 ):
-    return {"started": game_id in started_games}
+    return {"started": await get_state_store().is_game_started(game_id)}
@@ -5,6 +5,7 @@ import os
 import uuid
 from ..database import get_db
 from ..services.game_service import get_game_by_id, is_master
+from ..services.game_cache import invalidate_game_state
 from ..middleware.auth import get_current_user
 from ..models.user import User
 from ..config import settings
@@ -59,6 +60,7 @@ async def upload_map(
     map_url = f"/uploads/maps/{filename}"
     game.map_url = map_url
     db.commit()
+    invalidate_game_state(game_id)
     
     return {"map_url": map_url, "message": "Map uploaded successfully"}
 
@@ -26,6 +26,25 @@ class Settings(BaseSettings):
     # Logging
     log_level: str = "INFO"
     
+    # Socket.IO
+    socket_backend: str = "memory"  # "memory" — один воркер, "redis" — общие комнаты и pub/sub между воркерами
+    socket_db_workers: int = 8  # Потоков для запросов к БД из обработчиков (не больше размера пула engine)
+    token_tick_hz: int = 25  # Частота тиков рассылки перемещений токенов в тиковом режиме
+    token_tick_default: bool = False  # Тиковый режим для всех комнат (иначе включается мастером через token_tick_mode)
+    token_write_behind: bool = True  # Позиции токенов из сокетов сохраняются в БД отложенно (write-behind)
+    token_flush_quiet_ms: int = 500  # Сохранение после паузы без перемещений в игре
+    token_flush_max_delay_ms: int = 3000  # Максимальная задержка сохранения при непрерывном перетаскивании
+    user_cache_size: int = 10000  # Профилей пользователей в LRU-кэше воркера
+    user_cache_ttl: int = 300  # Время жизни профиля в кэше, секунды
+    dice_history_write_behind: bool = True  # История бросков из сокетов пишется пакетами, а не на каждый бросок
+    dice_history_batch_size: int = 200  # Строк в одном INSERT; полный пакет записывается сразу
+    dice_history_flush_ms: int = 1000  # Максимальная задержка записи истории
+    dice_history_max_queue: int = 50000  # Предел очереди; при переполнении отбрасываются самые старые строки
+    combat_engine: bool = False  # Состояние активных боев в памяти воркера (нужна sticky-маршрутизация игр по воркерам)
+    combat_flush_ms: int = 1000  # Максимальная задержка сохранения состояния боя в БД
+    combat_idle_ttl_s: int = 600  # Бой без обращений и несохраненных изменений выгружается из памяти через столько секунд
+    metrics_token: Optional[str] = None  # Токен для GET /metrics (Authorization: Bearer); без него эндпоинт отключен
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
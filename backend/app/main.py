@@ -1,13 +1,22 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import socketio as sio_lib
 import os
+import secrets
+from typing import Optional
 import logging
 from .config import settings
 from .database import engine, Base, check_db_connection
 from .api import auth, games, maps, dice, characters, combat, game_data, scenarios
 from .sockets.game_events import register_socket_handlers
+from .services.db_executor import shutdown_executor
+from .sockets.tick import flush_move_coalescer
+from .services.position_buffer import flush_position_buffer
+from .services.combat_engine import flush_combat_engine
+from .sockets.user_cache import get_user_cache
+from .sockets.dice_history_buffer import get_dice_history_buffer, drain_dice_history_buffer
+from .sockets.backends import create_client_manager
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +42,16 @@ async def startup_event():
     else:
         logger.info("✅ Подключение к базе данных успешно установлено")
 
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Освобождение ресурсов Socket.IO при остановке приложения"""
+    await flush_move_coalescer()
+    await flush_position_buffer()
+    await drain_dice_history_buffer()
+    await flush_combat_engine()
+    shutdown_executor()
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -40,6 +59,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # курсор истории бросков
 )
 
 # Создаем директории для загрузок
@@ -52,7 +72,8 @@ app.mount("/uploads", StaticFiles(directory=settings.upload_dir), name="uploads"
 # Socket.IO
 sio = sio_lib.AsyncServer(
     cors_allowed_origins=["http://localhost:5173", "http://localhost:3000"],
-    async_mode="asgi"
+    async_mode="asgi",
+    client_manager=create_client_manager(),
 )
 socket_app = sio_lib.ASGIApp(sio, app)
 
@@ -80,6 +101,20 @@ async def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def metrics(authorization: Optional[str] = Header(None)):
+    """Счетчики кэшей воркера; доступны только с токеном METRICS_TOKEN"""
+    if not settings.metrics_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    expected = f"Bearer {settings.metrics_token}"
+    if not authorization or not secrets.compare_digest(authorization.encode(), expected.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return {
+        "user_cache": get_user_cache().stats(),
+        "dice_history": get_dice_history_buffer().stats(),
+    }
+
+
 # Экспортируем socket_app для запуска через uvicorn
 # Socket.IO требует обертку ASGIApp для интеграции с FastAPI
 # Поэтому экспортируем socket_app вместо app, чтобы uvicorn запускал оба сервера (HTTP и WebSocket)
@@ -4,6 +4,7 @@ from .game_participant import GameParticipant
 from .token import Token
 from .character import Character
 from .dice_roll_history import DiceRollHistory
+from .dice_roll_stats import DiceRollStat, DiceFaceStat
 from .combat_session import CombatSession
 from .combat_participant import CombatParticipant
 from .race import Race, SubRace
@@ -18,7 +19,7 @@ from .scenario import Scenario, ScenarioNPC, ScenarioHiddenItem
 
 __all__ = [
     "User", "GameSession", "GameParticipant", "Token", "Character",
-    "DiceRollHistory", "CombatSession", "CombatParticipant",
+    "DiceRollHistory", "DiceRollStat", "DiceFaceStat", "CombatSession", "CombatParticipant",
     "Race", "SubRace", "Background", "ClassFeature", "Spell", "Weapon", "Armor",
     "CharacterInventory", "CharacterSpell", "SpellSlotTracker",
     "Monster", "MonsterAction",
@@ -1,7 +1,7 @@
 """
 Модель боевой сессии
 """
-from sqlalchemy import Column, Boolean, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, Boolean, Integer, DateTime, ForeignKey, JSON
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import uuid
@@ -16,7 +16,9 @@ class CombatSession(Base):
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
     game_id = Column(GUID(), ForeignKey("game_sessions.id", ondelete="CASCADE"), nullable=False, index=True)
     is_active = Column(Boolean, nullable=False, default=True)
-    current_turn_index = Column(Integer, nullable=False, default=0)  # Индекс текущего хода в порядке инициативы
+    current_turn_index = Column(Integer, nullable=False, default=0)  # Индекс текущего хода в turn_order
+    # Порядок ходов живых участников: [{"id": "<participant_id>", "initiative": 17}, ...] (см. combat_rules)
+    turn_order = Column(JSON, nullable=True)
     round_number = Column(Integer, nullable=False, default=1)
     started_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     ended_at = Column(DateTime(timezone=True), nullable=True)
@@ -1,8 +1,10 @@
 """
 Модель истории бросков кубиков
 """
-from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey
-from sqlalchemy.sql import func
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, JSON, ForeignKey, Index
+from sqlalchemy.sql import func, text
 from sqlalchemy.orm import relationship
 import uuid
 
@@ -13,9 +15,15 @@ from .types import GUID
 class DiceRollHistory(Base):
     """История бросков кубиков для игры"""
     __tablename__ = "dice_roll_history"
+    # Keyset-пагинация истории: (created_at, id) по убыванию внутри игры и фильтра
+    __table_args__ = (
+        Index("ix_dice_roll_history_game_created_id", "game_id", text("created_at DESC"), text("id DESC")),
+        Index("ix_dice_roll_history_game_user_created_id", "game_id", "user_id", text("created_at DESC"), text("id DESC")),
+        Index("ix_dice_roll_history_game_type_created_id", "game_id", "roll_type", text("created_at DESC"), text("id DESC")),
+    )
 
     id = Column(GUID(), primary_key=True, default=uuid.uuid4)
-    game_id = Column(GUID(), ForeignKey("game_sessions.id"), nullable=False, index=True)
+    game_id = Column(GUID(), ForeignKey("game_sessions.id"), nullable=False)
     user_id = Column(GUID(), ForeignKey("users.id"), nullable=False, index=True)
     count = Column(Integer, nullable=False)  # Количество кубиков
     faces = Column(Integer, nullable=False)  # Количество граней
@@ -26,7 +34,15 @@ class DiceRollHistory(Base):
     advantage_type = Column(String, nullable=True)  # "advantage", "disadvantage", или None
     advantage_rolls = Column(JSON, nullable=True)  # Дополнительные броски для advantage/disadvantage
     selected_roll = Column(JSON, nullable=True)  # Выбранный бросок {"die_id": "d1", "value": 15}
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True)
+    expression = Column(String(100), nullable=True)  # Выражение кубиков ("4d6kh3+2"), если бросок по выражению
+    rng_offset = Column(BigInteger, nullable=True)  # Номер броска в потоке игры (для воспроизведения)
+    # Время назначается приложением (как и в буфере истории), чтобы у всех строк была одна точность
+    created_at = Column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now(),
+        nullable=False
+    )
 
     # Relationships
     game = relationship("GameSession", backref="dice_rolls")
@@ -0,0 +1,42 @@
+"""
+Модели агрегатов статистики бросков
+
+Счетчики обновляются инкрементально в той же транзакции, что и вставка истории,
+поэтому статистика игры читается без сканирования `dice_roll_history`.
+Бросок без типа хранится с `roll_type = ""` (столбец входит в первичный ключ).
+"""
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, PrimaryKeyConstraint
+
+from ..database import Base
+from .types import GUID
+
+
+class DiceRollStat(Base):
+    """Число бросков и сумма результатов по (игра, игрок, тип проверки)"""
+    __tablename__ = "dice_roll_stats"
+
+    game_id = Column(GUID(), ForeignKey("game_sessions.id"), nullable=False)
+    user_id = Column(GUID(), ForeignKey("users.id"), nullable=False)
+    roll_type = Column(String(50), nullable=False, default="")
+    rolls = Column(BigInteger, nullable=False, default=0)
+    total_sum = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("game_id", "user_id", "roll_type"),
+    )
+
+
+class DiceFaceStat(Base):
+    """Сколько раз выпало значение `value` на кубике d`faces`"""
+    __tablename__ = "dice_face_stats"
+
+    game_id = Column(GUID(), ForeignKey("game_sessions.id"), nullable=False)
+    user_id = Column(GUID(), ForeignKey("users.id"), nullable=False)
+    roll_type = Column(String(50), nullable=False, default="")
+    faces = Column(Integer, nullable=False)
+    value = Column(Integer, nullable=False)
+    count = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("game_id", "user_id", "roll_type", "faces", "value"),
+    )
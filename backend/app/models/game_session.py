@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, BigInteger
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 import uuid
@@ -16,6 +16,11 @@ class GameSession(Base):
     map_url = Column(String(500), nullable=True)
     story = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Поток бросков игры (см. services/dice_rng.py): секретный seed, его опубликованный хэш
+    # и следующий свободный номер броска
+    dice_seed = Column(String(64), nullable=True)
+    dice_seed_commitment = Column(String(64), nullable=True)
+    dice_rng_offset = Column(BigInteger, nullable=False, default=0, server_default="0")
     
     # Relationships
     master = relationship("User", foreign_keys=[master_id])
@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio
 import logging
 from redis.exceptions import ConnectionError, TimeoutError
 from .config import settings
@@ -25,3 +26,6 @@ except Exception as e:
     logger.error(f"Неожиданная ошибка при подключении к Redis: {e}")
     redis_client = redis.from_url(settings.redis_url, decode_responses=True)
 
+
+# Асинхронный клиент для Socket.IO слоя (не блокирует event loop)
+async_redis_client = redis.asyncio.from_url(settings.redis_url, decode_responses=True)
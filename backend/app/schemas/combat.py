@@ -44,6 +44,8 @@ class CombatSessionResponse(BaseModel):
     started_at: datetime
     ended_at: Optional[datetime] = None
     participants: List[CombatParticipantResponse] = []
+    # ID живых участников в порядке ходов; current_turn_index указывает в этот список
+    turn_order: List[UUID] = []
 
     model_config = {"from_attributes": True}
 
@@ -57,6 +59,21 @@ class RollInitiativeRequest(BaseModel):
     initiative_roll: Optional[int] = Field(None)
 
 
+class InitiativeRoll(BaseModel):
+    participant_id: UUID
+    roll: int
+    modifier: int = 0
+    initiative: int
+    rng_offset: int
+
+
+class InitiativeBatchResult(BaseModel):
+    combat_id: UUID
+    rolls: List[InitiativeRoll] = []
+    turn_order: List[UUID] = []
+    current_turn_index: int
+
+
 class AttackRequest(BaseModel):
     attacker_id: UUID
     target_id: UUID
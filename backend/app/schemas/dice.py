@@ -0,0 +1,121 @@
+from pydantic import BaseModel, Field, model_validator
+from uuid import UUID
+from typing import List, Optional
+
+# Максимум бросков в одном групповом запросе
+MAX_GROUP_ROLLS = 50
+
+
+class DiceRollSpec(BaseModel):
+    """Один бросок в групповом запросе: `expression` или `count` + `faces`"""
+    label: Optional[str] = Field(None, max_length=100, description="Подпись, например «Гоблин 3»")
+    count: Optional[int] = Field(None, ge=1, le=10)
+    faces: Optional[int] = Field(None, ge=2, le=20)
+    expression: Optional[str] = Field(None, max_length=100)
+    advantage: Optional[bool] = None
+    modifier: Optional[int] = None
+    roll_type: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_dice(self):
+        if self.expression is None and (self.count is None or self.faces is None):
+            raise ValueError("Укажите expression или count и faces")
+        return self
+
+
+class DiceRollBatchRequest(BaseModel):
+    """Групповой бросок: все результаты сохраняются одной вставкой"""
+    game_id: UUID
+    rolls: List[DiceRollSpec] = Field(min_length=1, max_length=MAX_GROUP_ROLLS)
+
+
+class DieFaceStats(BaseModel):
+    """Статистика по кубикам одного вида (dN)"""
+    faces: int
+    count: int
+    mean: Optional[float] = None
+    expected_mean: float
+    max_rate: Optional[float] = Field(None, description="Доля максимальных значений (натуральная 20 для d20)")
+    min_rate: Optional[float] = Field(None, description="Доля единиц")
+    frequencies: List[int] = Field(description="Сколько раз выпало 1, 2, …, faces")
+
+
+class UserDiceStats(BaseModel):
+    """Статистика бросков игрока"""
+    user_id: UUID
+    username: Optional[str] = None
+    rolls: int
+    dice: int
+    luck: Optional[float] = Field(None, description="От -1 (всегда 1) до +1 (всегда максимум), 0 — как ожидается")
+
+
+class RollTypeDiceStats(BaseModel):
+    """Статистика по типу проверки"""
+    roll_type: Optional[str] = None
+    rolls: int
+    mean_total: float
+    dice: List[DieFaceStats]
+
+
+class GameDiceStatsResponse(BaseModel):
+    """Статистика бросков игры (из инкрементальных агрегатов)"""
+    game_id: UUID
+    total_rolls: int
+    total_dice: int
+    nat20_rate: Optional[float] = None
+    nat1_rate: Optional[float] = None
+    dice: List[DieFaceStats]
+    users: List[UserDiceStats]
+    roll_types: List[RollTypeDiceStats]
+
+
+class ChiSquareResult(BaseModel):
+    statistic: float
+    df: int
+    p_value: float
+
+
+class KsResult(BaseModel):
+    statistic: float
+    p_value: float
+
+
+class RunsResult(BaseModel):
+    runs: int
+    expected: float
+    z: float
+    p_value: float
+
+
+class DieFairness(BaseModel):
+    """Проверки одного вида кубика (dN)"""
+    faces: int
+    count: int
+    frequencies: List[int] = Field(description="Сколько раз выпало 1, 2, …, faces")
+    expected_per_face: float
+    sufficient: bool = Field(description="Достаточно бросков для хи-квадрат (≥ 5 на грань)")
+    chi_square: Optional[ChiSquareResult] = None
+    ks: Optional[KsResult] = None
+    runs: Optional[RunsResult] = None
+    flagged: bool = Field(description="Хотя бы один p-value ниже alpha при достаточной выборке")
+
+
+class UserFairness(BaseModel):
+    user_id: UUID
+    username: Optional[str] = None
+    dice: List[DieFairness]
+
+
+class HighWaterMark(BaseModel):
+    rows: int
+    last_at: Optional[str] = None
+
+
+class DiceFairnessResponse(BaseModel):
+    """Аудит честности кубиков игры (с разбивкой по игрокам) или всех игр"""
+    game_id: Optional[UUID] = None
+    rows: int
+    alpha: float
+    high_water_mark: HighWaterMark
+    dice: List[DieFairness]
+    users: List[UserFairness]
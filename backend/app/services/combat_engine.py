@@ -0,0 +1,475 @@
+"""
+Авторитетное состояние активных боев в памяти воркера с write-behind в Postgres
+
+Включается `settings.combat_engine`. Бой загружается из БД при первом обращении
+(после перезапуска — так же, из последнего сохраненного состояния), дальше урон,
+исцеление, состояния, инициатива, спасброски от смерти и переход хода меняют только
+объекты в памяти — без SELECT/UPDATE/COMMIT на каждое действие. Правила общие
+с путем через БД (`combat_rules`).
+
+Измененные участники и сессия помечаются грязными; фоновый флашер раз в
+`combat_flush_ms` сохраняет их одним executemany UPDATE по первичному ключу
+(плюс UPDATE сессии). При ошибке изменения остаются грязными и повторяются.
+Перед операциями, которые меняют бой напрямую в БД (начало и завершение боя,
+добавление монстра), бой сбрасывается и выгружается (`release`), при остановке
+приложения сбрасываются все бои. Сохраненные бои, к которым не обращались
+`combat_idle_ttl_s`, и сохраненные завершенные бои (загруженные запросом уже после
+`end_combat`) выгружаются при следующих загрузках, так что память воркера не растет
+с числом когда-либо прочитанных боев.
+
+Состояние принадлежит процессу: при нескольких воркерах запросы одной игры должны
+попадать в один воркер (sticky-маршрутизация), иначе включать движок нельзя.
+При аварийном завершении теряются изменения не дольше `combat_flush_ms`.
+"""
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..models.combat_participant import CombatParticipant
+from ..models.combat_session import CombatSession
+from . import combat_rules
+from .dice_rng import get_game_rng
+
+logger = logging.getLogger(__name__)
+
+# Поля участника, которые меняются действиями боя и сохраняются флашером
+PARTICIPANT_STATE_FIELDS = (
+    "initiative", "current_hp", "conditions", "actions_used", "bonus_actions_used",
+    "reaction_used", "death_saves_success", "death_saves_failure", "is_dead",
+)
+
+
+@dataclass
+class ParticipantState:
+    """Участник боя в памяти; поля совпадают с `CombatParticipant`"""
+    id: UUID
+    combat_id: UUID
+    current_hp: int
+    max_hp: int
+    armor_class: int
+    character_id: Optional[UUID] = None
+    token_id: Optional[UUID] = None
+    name: Optional[str] = None
+    initiative: Optional[int] = None
+    is_player_controlled: bool = True
+    conditions: Optional[List[str]] = None
+    actions_used: int = 0
+    bonus_actions_used: int = 0
+    reaction_used: bool = False
+    death_saves_success: int = 0
+    death_saves_failure: int = 0
+    is_dead: bool = False
+    monster_slug: Optional[str] = None
+    damage_resistances: Optional[List[str]] = None
+    damage_immunities: Optional[List[str]] = None
+    damage_vulnerabilities: Optional[List[str]] = None
+
+    @classmethod
+    def from_row(cls, row: CombatParticipant) -> "ParticipantState":
+        values = {column.key: getattr(row, column.key) for column in CombatParticipant.__table__.columns}
+        for name in ("conditions", "damage_resistances", "damage_immunities", "damage_vulnerabilities"):
+            if values[name] is not None:
+                values[name] = list(values[name])
+        for name in ("actions_used", "bonus_actions_used", "death_saves_success", "death_saves_failure"):
+            values[name] = values[name] or 0
+        for name in ("reaction_used", "is_dead"):
+            values[name] = bool(values[name])
+        return cls(**values)
+
+    def state_values(self) -> Dict[str, Any]:
+        values = {name: getattr(self, name) for name in PARTICIPANT_STATE_FIELDS}
+        if values["conditions"] is not None:
+            values["conditions"] = list(values["conditions"])
+        return values
+
+
+@dataclass
+class CombatState:
+    """Бой в памяти; поля совпадают с `CombatSession`"""
+    id: UUID
+    game_id: UUID
+    is_active: bool
+    current_turn_index: int
+    round_number: int
+    started_at: Optional[datetime]
+    ended_at: Optional[datetime]
+    participants: List[ParticipantState]
+    turn_order: Optional[List[Dict[str, Any]]] = None
+    by_id: Dict[UUID, ParticipantState] = field(init=False, repr=False)
+    last_used: float = field(default_factory=time.monotonic, repr=False)
+    dirty_participants: Set[UUID] = field(default_factory=set, repr=False)
+    session_dirty: bool = field(default=False, repr=False)
+    _order: Optional[List[ParticipantState]] = field(default=None, repr=False)
+
+    def __post_init__(self):
+        self.by_id = {p.id: p for p in self.participants}
+
+    @property
+    def dirty(self) -> bool:
+        return self.session_dirty or bool(self.dirty_participants)
+
+    def order(self) -> List[ParticipantState]:
+        """Порядок инициативы; пересчитывается только после изменения инициативы"""
+        if self._order is None:
+            self._order = combat_rules.initiative_order(self.participants)
+        return self._order
+
+
+class CombatEngine:
+    """Загруженные бои воркера и их отложенное сохранение"""
+
+    def __init__(self, flush_interval: float, idle_ttl: float):
+        self.flush_interval = flush_interval
+        self.idle_ttl = idle_ttl
+        # Состояние меняется в event loop, сохраняется в потоках пула БД
+        self._lock = threading.RLock()
+        # Сохранения выполняются по одному: снимок и запись не переупорядочиваются
+        self._flush_lock = threading.Lock()
+        self._encounters: Dict[UUID, CombatState] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._last_sweep = time.monotonic()
+        self.loads = 0
+        self.flushed_rows = 0
+        self.flush_count = 0
+
+    # ── загрузка ────────────────────────────────────────────────────────────
+
+    def loaded(self, combat_id: UUID) -> Optional[CombatState]:
+        with self._lock:
+            return self._encounters.get(combat_id)
+
+    def load(self, db: Session, combat_id: UUID) -> CombatState:
+        """
+        Бой из памяти или (при первом обращении) из БД
+
+        Raises:
+            HTTPException: Если боя нет
+        """
+        now = time.monotonic()
+        if now - self._last_sweep >= self.flush_interval:
+            self.evict_idle(now)
+        state = self.loaded(combat_id)
+        if state is not None:
+            state.last_used = now
+            return state
+
+        combat = db.query(CombatSession).filter(CombatSession.id == combat_id).first()
+        if not combat:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Combat session not found")
+        rows = db.query(CombatParticipant).filter(
+            CombatParticipant.combat_id == combat_id
+        ).order_by(CombatParticipant.initiative.desc().nulls_last()).all()
+
+        state = CombatState(
+            id=combat.id,
+            game_id=combat.game_id,
+            is_active=combat.is_active,
+            current_turn_index=combat.current_turn_index,
+            round_number=combat.round_number,
+            started_at=combat.started_at,
+            ended_at=combat.ended_at,
+            participants=[ParticipantState.from_row(row) for row in rows],
+            turn_order=[dict(entry) for entry in combat.turn_order] if combat.turn_order is not None else None,
+        )
+        if state.turn_order is None:
+            # Бой начат до появления turn_order: порядок строится один раз и сохраняется
+            # (у завершенного боя — только в памяти, чтобы его можно было сразу выгрузить)
+            state.turn_order = combat_rules.build_turn_order(state.participants)
+            state.session_dirty = state.is_active
+        with self._lock:
+            # Параллельная загрузка того же боя: остается первая
+            state = self._encounters.setdefault(combat_id, state)
+        self.loads += 1
+        return state
+
+    def evict_idle(self, now: Optional[float] = None) -> List[UUID]:
+        """
+        Выгрузка сохраненных боев: завершенных и тех, к которым не обращались `idle_ttl`
+
+        Бои с несохраненными изменениями остаются до сброса.
+
+        Returns:
+            id выгруженных боев
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._last_sweep = now
+            evicted = [
+                combat_id for combat_id, state in self._encounters.items()
+                if not state.dirty and (not state.is_active or now - state.last_used >= self.idle_ttl)
+            ]
+            for combat_id in evicted:
+                del self._encounters[combat_id]
+        if evicted:
+            logger.debug(f"Unloaded {len(evicted)} idle combats")
+        return evicted
+
+    def participant(self, db: Session, combat_id: UUID, participant_id: UUID,
+                    detail: str = "Participant not found in combat") -> ParticipantState:
+        participant = self.load(db, combat_id).by_id.get(participant_id)
+        if participant is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+        return participant
+
+    # ── действия ────────────────────────────────────────────────────────────
+
+    def apply_damage(self, db: Session, combat_id: UUID, participant_id: UUID,
+                     damage: int, damage_type: Optional[str] = None) -> ParticipantState:
+        participant = self.participant(db, combat_id, participant_id)
+        with self._lock:
+            combat_rules.take_damage(participant, damage, damage_type)
+            self._mark(combat_id, participant)
+        return participant
+
+    def apply_healing(self, db: Session, combat_id: UUID, participant_id: UUID, healing: int) -> ParticipantState:
+        participant = self.participant(db, combat_id, participant_id)
+        with self._lock:
+            combat_rules.heal(participant, healing)
+            self._mark(combat_id, participant)
+        return participant
+
+    def apply_condition(self, db: Session, combat_id: UUID, participant_id: UUID, condition: str) -> ParticipantState:
+        participant = self.participant(db, combat_id, participant_id, "Participant not found")
+        with self._lock:
+            combat_rules.add_condition(participant, condition)
+            self._mark(combat_id, participant)
+        return participant
+
+    def remove_condition(self, db: Session, combat_id: UUID, participant_id: UUID, condition: str) -> ParticipantState:
+        participant = self.participant(db, combat_id, participant_id, "Participant not found")
+        with self._lock:
+            combat_rules.remove_condition(participant, condition)
+            self._mark(combat_id, participant)
+        return participant
+
+    def roll_initiative(self, db: Session, combat_id: UUID, participant_id: UUID,
+                        roll_value: Optional[int] = None) -> ParticipantState:
+        state = self.load(db, combat_id)
+        participant = self.participant(db, combat_id, participant_id)
+        if roll_value is None:
+            roll_value = get_game_rng(db, state.game_id).randint(1, 20)
+        with self._lock:
+            participant.initiative = roll_value
+            state._order = None
+            combat_rules.update_initiative(state, participant)
+            self._mark(combat_id, participant, session=True)
+        return participant
+
+    def set_initiatives(self, db: Session, combat_id: UUID, initiatives: Dict[UUID, int]) -> CombatState:
+        """Инициатива нескольких участников сразу (один пересчет порядка ходов)"""
+        state = self.load(db, combat_id)
+        with self._lock:
+            for participant_id, value in initiatives.items():
+                participant = state.by_id[participant_id]
+                participant.initiative = value
+                self._mark(combat_id, participant)
+            state._order = None
+            combat_rules.update_initiatives(state, {str(pid): value for pid, value in initiatives.items()})
+            self._mark(combat_id, session=True)
+        return state
+
+    def next_turn(self, db: Session, combat_id: UUID) -> CombatState:
+        state = self.load(db, combat_id)
+        if not state.is_active:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Combat is not active")
+        with self._lock:
+            if not state.turn_order:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No alive participants")
+            ended = combat_rules.advance_turn(state)
+            participant = state.by_id.get(UUID(ended)) if ended is not None else None
+            if participant is not None:
+                combat_rules.reset_actions(participant)
+                self._mark(combat_id, participant)
+            self._mark(combat_id, session=True)
+        return state
+
+    def roll_death_save(self, db: Session, combat_id: UUID, participant_id: UUID) -> dict:
+        state = self.load(db, combat_id)
+        participant = self.participant(db, combat_id, participant_id, "Participant not found")
+        if participant.current_hp > 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Participant is not unconscious")
+        rng = get_game_rng(db, state.game_id)
+        roll = rng.randint(1, 20)
+        with self._lock:
+            result = combat_rules.resolve_death_save(participant, roll)
+            if result["died"]:
+                combat_rules.remove_from_turn_order(state, participant.id)
+            self._mark(combat_id, participant, session=result["died"])
+        result["rng_offset"] = rng.offset
+        return result
+
+    # ── сохранение ──────────────────────────────────────────────────────────
+
+    def _mark(self, combat_id: UUID, participant: Optional[ParticipantState] = None, session: bool = False) -> None:
+        state = self._encounters.get(combat_id)
+        if state is None:
+            return
+        if participant is not None:
+            state.dirty_participants.add(participant.id)
+        if session:
+            state.session_dirty = True
+        self._schedule()
+
+    def _schedule(self) -> None:
+        """Запуск флашера в текущем event loop (без loop — только явный flush)"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+    def dirty_combats(self) -> List[UUID]:
+        with self._lock:
+            return [combat_id for combat_id, state in self._encounters.items() if state.dirty]
+
+    def _take(self, combat_id: UUID) -> Optional[Dict[str, Any]]:
+        """Снимок грязных полей боя; пометки снимаются"""
+        with self._lock:
+            state = self._encounters.get(combat_id)
+            if state is None or not state.dirty:
+                return None
+            changes = {
+                "participants": [
+                    {"id": pid, **state.by_id[pid].state_values()}
+                    for pid in state.dirty_participants if pid in state.by_id
+                ],
+                "session": (
+                    {
+                        "current_turn_index": state.current_turn_index,
+                        "round_number": state.round_number,
+                        "turn_order": [dict(entry) for entry in state.turn_order or []],
+                    }
+                    if state.session_dirty else None
+                ),
+            }
+            state.dirty_participants.clear()
+            state.session_dirty = False
+            return changes
+
+    def _restore(self, combat_id: UUID, changes: Dict[str, Any]) -> None:
+        """Возврат пометок после неудачного сохранения (значения в памяти не старее снимка)"""
+        with self._lock:
+            state = self._encounters.get(combat_id)
+            if state is None:
+                logger.error(f"Combat {combat_id} was unloaded with unsaved changes: {changes}")
+                return
+            state.dirty_participants.update(row["id"] for row in changes["participants"])
+            if changes["session"] is not None:
+                state.session_dirty = True
+
+    def flush_sync(self, db: Session, combat_id: UUID) -> int:
+        """
+        Сохранение грязного состояния боя в переданной сессии (с commit)
+
+        Returns:
+            Число обновленных строк участников
+        """
+        with self._flush_lock:
+            changes = self._take(combat_id)
+            if changes is None:
+                return 0
+            started = time.perf_counter()
+            try:
+                rows = persist_combat_state(db, combat_id, changes)
+            except Exception:
+                db.rollback()
+                self._restore(combat_id, changes)
+                raise
+        self.flushed_rows += rows
+        self.flush_count += 1
+        logger.debug(
+            f"Flushed {rows} participants of combat {combat_id} "
+            f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+        return rows
+
+    async def flush(self, combat_id: UUID) -> None:
+        """Сохранение боя в пуле потоков БД; ошибка логируется, изменения остаются грязными"""
+        from .db_executor import run_db
+        try:
+            await run_db(self.flush_sync, combat_id)
+        except Exception as e:
+            logger.error(f"Failed to flush combat {combat_id}: {e}", exc_info=True)
+
+    async def flush_all(self) -> None:
+        """Сброс всех боев (при остановке приложения)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for combat_id in self.dirty_combats():
+            await self.flush(combat_id)
+
+    def release(self, db: Session, combat_id: UUID) -> None:
+        """Сохранение и выгрузка боя перед изменением его напрямую в БД"""
+        self.flush_sync(db, combat_id)
+        with self._lock:
+            self._encounters.pop(combat_id, None)
+
+    def release_game(self, db: Session, game_id: UUID) -> None:
+        with self._lock:
+            combat_ids = [cid for cid, state in self._encounters.items() if state.game_id == game_id]
+        for combat_id in combat_ids:
+            self.release(db, combat_id)
+
+    async def _run(self) -> None:
+        """Фоновый флашер; завершается, когда грязных боев нет"""
+        while self.dirty_combats():
+            await asyncio.sleep(self.flush_interval)
+            for combat_id in self.dirty_combats():
+                await self.flush(combat_id)
+
+
+def persist_combat_state(db: Session, combat_id: UUID, changes: Dict[str, Any]) -> int:
+    """
+    Запись снимка боя: executemany UPDATE участников по первичному ключу и UPDATE сессии
+
+    Returns:
+        Число обновленных строк участников
+    """
+    participants = changes["participants"]
+    if participants:
+        db.execute(update(CombatParticipant), participants)
+    if changes["session"] is not None:
+        db.execute(
+            update(CombatSession)
+            .where(CombatSession.id == combat_id)
+            .values(**changes["session"])
+        )
+    db.commit()
+    return len(participants)
+
+
+_engine: Optional[CombatEngine] = None
+
+
+def get_combat_engine() -> CombatEngine:
+    """Движок боев воркера (ленивое создание)"""
+    global _engine
+    if _engine is None:
+        _engine = CombatEngine(
+            flush_interval=settings.combat_flush_ms / 1000,
+            idle_ttl=settings.combat_idle_ttl_s,
+        )
+    return _engine
+
+
+def active_combat_engine() -> Optional[CombatEngine]:
+    """Движок боев, если он включен в настройках"""
+    return get_combat_engine() if settings.combat_engine else None
+
+
+async def flush_combat_engine() -> None:
+    if _engine is not None:
+        await _engine.flush_all()
@@ -0,0 +1,233 @@
+"""
+Правила боя без доступа к БД
+
+Функции меняют переданный объект участника/боя и ничего не сохраняют. Объект —
+ORM-модель (`CombatParticipant`, `CombatSession`) или состояние движка боя в памяти
+(`combat_engine`): у них одинаковые имена полей, поэтому правила общие для обоих путей.
+"""
+from typing import Iterable, Optional
+
+
+def initiative_order(participants: Iterable) -> list:
+    """Участники по инициативе (от большей к меньшей, без инициативы — в конце)"""
+    return sorted(participants, key=lambda p: (p.initiative is None, -(p.initiative or 0)))
+
+
+def damage_after_defenses(participant, damage: int, damage_type: Optional[str] = None) -> int:
+    """Урон с учетом иммунитетов, сопротивлений и уязвимостей участника"""
+    if not damage_type or damage <= 0:
+        return damage
+    dt = damage_type.lower()
+    if dt in [i.lower() for i in (participant.damage_immunities or [])]:
+        return 0
+    if dt in [r.lower() for r in (participant.damage_resistances or [])]:
+        return damage // 2
+    if dt in [v.lower() for v in (participant.damage_vulnerabilities or [])]:
+        return damage * 2
+    return damage
+
+
+def take_damage(participant, damage: int, damage_type: Optional[str] = None) -> int:
+    """
+    Нанесение урона; при 0 HP участник получает состояние "unconscious"
+
+    Returns:
+        Фактически нанесенный урон
+    """
+    damage = damage_after_defenses(participant, damage, damage_type)
+    participant.current_hp = max(0, participant.current_hp - damage)
+    if participant.current_hp <= 0:
+        add_condition(participant, "unconscious")
+    return damage
+
+
+def heal(participant, healing: int) -> None:
+    """Исцеление до максимума HP; пришедший в сознание теряет "unconscious" и спасброски"""
+    participant.current_hp = min(participant.max_hp, participant.current_hp + healing)
+    if participant.current_hp > 0:
+        remove_condition(participant, "unconscious")
+        participant.death_saves_success = 0
+        participant.death_saves_failure = 0
+
+
+def add_condition(participant, condition: str) -> None:
+    conditions = list(participant.conditions or [])
+    if condition not in conditions:
+        conditions.append(condition)
+    participant.conditions = conditions
+
+
+def remove_condition(participant, condition: str) -> None:
+    conditions = [c for c in (participant.conditions or []) if c != condition]
+    participant.conditions = conditions or None
+
+
+def resolve_death_save(participant, roll: int) -> dict:
+    """
+    Применение результата спасброска от смерти (natural 20 — 1 HP, natural 1 — два провала)
+
+    Returns:
+        Словарь результата без `rng_offset`
+    """
+    result = {
+        "roll": roll,
+        "success": False,
+        "failure": False,
+        "stabilized": False,
+        "died": False,
+    }
+
+    if roll == 20:
+        participant.current_hp = 1
+        participant.death_saves_success = 0
+        participant.death_saves_failure = 0
+        remove_condition(participant, "unconscious")
+        result["success"] = True
+        result["stabilized"] = True
+        result["regained_hp"] = 1
+    elif roll == 1:
+        participant.death_saves_failure = min(3, (participant.death_saves_failure or 0) + 2)
+        result["failure"] = True
+    elif roll >= 10:
+        participant.death_saves_success = min(3, (participant.death_saves_success or 0) + 1)
+        result["success"] = True
+    else:
+        participant.death_saves_failure = min(3, (participant.death_saves_failure or 0) + 1)
+        result["failure"] = True
+
+    if (participant.death_saves_success or 0) >= 3 and not result.get("regained_hp"):
+        participant.death_saves_success = 0
+        participant.death_saves_failure = 0
+        result["stabilized"] = True
+
+    if (participant.death_saves_failure or 0) >= 3:
+        participant.is_dead = True
+        add_condition(participant, "unconscious")
+        add_condition(participant, "dead")
+        result["died"] = True
+
+    result["death_saves_success"] = participant.death_saves_success or 0
+    result["death_saves_failure"] = participant.death_saves_failure or 0
+    return result
+
+
+# ── Порядок ходов ────────────────────────────────────────────────────────────
+#
+# `combat.turn_order` — сохраненный порядок живых участников:
+# [{"id": "<participant_id>", "initiative": 17}, ...], `current_turn_index` указывает в него.
+# Порядок меняется только при изменении инициативы, вступлении и гибели участника;
+# переход хода — сдвиг указателя без сортировки.
+
+
+def _sorted_entries(entries: list) -> list:
+    return sorted(entries, key=lambda e: (e["initiative"] is None, -(e["initiative"] or 0)))
+
+
+def build_turn_order(participants: Iterable) -> list:
+    """Порядок ходов живых участников по инициативе"""
+    return [
+        {"id": str(p.id), "initiative": p.initiative}
+        for p in initiative_order(participants) if not p.is_dead
+    ]
+
+
+def current_actor_id(combat) -> Optional[str]:
+    """ID участника, чей сейчас ход (None — в порядке никого нет)"""
+    entries = combat.turn_order or []
+    if 0 <= combat.current_turn_index < len(entries):
+        return entries[combat.current_turn_index]["id"]
+    return None
+
+
+def update_initiative(combat, participant) -> None:
+    """Пересортировка порядка после изменения инициативы участника (см. `update_initiatives`)"""
+    update_initiatives(combat, {str(participant.id): participant.initiative})
+
+
+def update_initiatives(combat, initiatives: dict) -> None:
+    """
+    Пересортировка порядка после изменения инициативы участников
+
+    До первого перехода хода (первый раунд, указатель на начале) ход у первого
+    в новом порядке; в идущем бою ход остается у текущего участника.
+
+    Args:
+        initiatives: {"<participant_id>": инициатива}
+    """
+    entries = [dict(e) for e in combat.turn_order or []]
+    changed = False
+    for entry in entries:
+        if entry["id"] in initiatives:
+            entry["initiative"] = initiatives[entry["id"]]
+            changed = True
+    if not changed:
+        return
+    actor = current_actor_id(combat)
+    entries = _sorted_entries(entries)
+    combat.turn_order = entries
+    if combat.round_number == 1 and combat.current_turn_index == 0:
+        return
+    if actor is not None:
+        combat.current_turn_index = next(i for i, e in enumerate(entries) if e["id"] == actor)
+
+
+def insert_into_turn_order(combat, participant) -> None:
+    """
+    Вступление участника в идущий бой: место по инициативе (после равных),
+    текущий ход не меняется
+    """
+    entries = list(combat.turn_order or [])
+    position = len(entries)
+    if participant.initiative is not None:
+        position = next(
+            (i for i, e in enumerate(entries) if e["initiative"] is None or e["initiative"] < participant.initiative),
+            len(entries),
+        )
+    if position <= combat.current_turn_index < len(entries):
+        combat.current_turn_index += 1
+    entries.insert(position, {"id": str(participant.id), "initiative": participant.initiative})
+    combat.turn_order = entries
+
+
+def remove_from_turn_order(combat, participant_id) -> None:
+    """
+    Выбывание участника (гибель, удаление)
+
+    Если выбыл текущий участник, его ход заканчивается сразу: указатель остается
+    на том же месте, то есть на следующем за выбывшим (после последнего — первый
+    в новом раунде), и ход переходит к нему без `advance_turn`.
+    """
+    entries = list(combat.turn_order or [])
+    position = next((i for i, e in enumerate(entries) if e["id"] == str(participant_id)), None)
+    if position is None:
+        return
+    del entries[position]
+    if position < combat.current_turn_index:
+        combat.current_turn_index -= 1
+    elif position == combat.current_turn_index and position >= len(entries):
+        combat.current_turn_index = 0
+        if entries:
+            combat.round_number += 1
+    combat.turn_order = entries
+
+
+def advance_turn(combat) -> Optional[str]:
+    """
+    Переход хода к следующему в сохраненном порядке; при переходе через конец — новый раунд
+
+    Returns:
+        ID участника, закончившего ход (его действия нужно сбросить)
+    """
+    ended = current_actor_id(combat)
+    next_index = combat.current_turn_index + 1
+    if next_index >= len(combat.turn_order or []):
+        next_index = 0
+        combat.round_number += 1
+    combat.current_turn_index = next_index
+    return ended
+
+
+def reset_actions(participant) -> None:
+    participant.actions_used = 0
+    participant.bonus_actions_used = 0
+    participant.reaction_used = False
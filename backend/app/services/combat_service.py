@@ -1,10 +1,17 @@
 """
 Сервис для управления боевой системой
+
+При включенном `settings.combat_engine` действия над идущим боем выполняются
+движком в памяти (`combat_engine`) и сохраняются в БД отложенно.
 """
 import logging
-import random
+import uuid
+from datetime import datetime
 from typing import Optional
+from sqlalchemy import case, insert, or_
+from sqlalchemy import inspect
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import HTTPException, status
 from uuid import UUID
@@ -12,10 +19,27 @@ from ..models.combat_session import CombatSession
 from ..models.combat_participant import CombatParticipant
 from ..models.character import Character
 from ..models.token import Token
+from ..models.monster import Monster
+from . import combat_rules
+from .combat_engine import active_combat_engine
+from .dice_expression import DiceExpressionError, compile_expression
+from .dice_rng import StreamRng, get_game_rng, get_game_rngs
 
 logger = logging.getLogger(__name__)
 
 
+def _combat_rng(db: Session, combat_id: UUID) -> StreamRng:
+    """Генератор следующего броска из потока игры, к которой относится бой"""
+    engine = active_combat_engine()
+    state = engine.loaded(combat_id) if engine is not None else None
+    if state is not None:
+        return get_game_rng(db, state.game_id)
+    game_id = db.query(CombatSession.game_id).filter(CombatSession.id == combat_id).scalar()
+    if game_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Combat not found")
+    return get_game_rng(db, game_id)
+
+
 def start_combat(
     db: Session,
     game_id: UUID,
@@ -41,29 +65,32 @@ def start_combat(
     Raises:
         HTTPException: При ошибке создания
     """
+    engine = active_combat_engine()
+    if engine is not None:
+        engine.release_game(db, game_id)
+
     try:
-        # Закрываем все активные бои в этой игре
-        active_combats = db.query(CombatSession).filter(
+        # Закрываем все активные бои в этой игре одним UPDATE
+        db.query(CombatSession).filter(
             CombatSession.game_id == game_id,
             CombatSession.is_active == True
-        ).all()
-        
-        for combat in active_combats:
-            combat.is_active = False
-            from datetime import datetime
-            combat.ended_at = datetime.utcnow()
+        ).update(
+            {CombatSession.is_active: False, CombatSession.ended_at: datetime.utcnow()},
+            synchronize_session=False
+        )
         
-        # Создаем новую боевую сессию
+        # Создаем новую боевую сессию (ID генерируется заранее, без отдельного flush)
         combat_session = CombatSession(
+            id=uuid.uuid4(),
             game_id=game_id,
             is_active=True,
             current_turn_index=0,
             round_number=1
         )
         db.add(combat_session)
-        db.flush()  # Получаем ID
         
-        # Создаем участников боя
+        # Строки участников боя
+        rows = []
         for participant_info in participant_data:
             character_id = participant_info.get("character_id")
             token_id = participant_info.get("token_id")
@@ -98,17 +125,26 @@ def start_combat(
                     else:
                         armor_class = participant_info.get("armor_class", 10)
             
-            participant = CombatParticipant(
-                combat_id=combat_session.id,
-                character_id=character_id,
-                token_id=token_id,
-                current_hp=max_hp,
-                max_hp=max_hp,
-                armor_class=armor_class,
-                is_player_controlled=is_player_controlled,
-                initiative=None  # Инициатива еще не брошена
-            )
-            db.add(participant)
+            rows.append({
+                "id": uuid.uuid4(),
+                "combat_id": combat_session.id,
+                "character_id": character_id,
+                "token_id": token_id,
+                "current_hp": max_hp,
+                "max_hp": max_hp,
+                "armor_class": armor_class,
+                "is_player_controlled": is_player_controlled,
+                "initiative": None,  # Инициатива еще не брошена
+            })
+        
+        # Начальный порядок ходов — порядок участников (инициатива еще не брошена)
+        combat_session.turn_order = [{"id": str(row["id"]), "initiative": None} for row in rows]
+        
+        # Сессия вставляется при flush, участники — одним пакетным INSERT
+        # (render_nulls: строки персонажей и токенов не разбиваются на группы по NULL-колонкам)
+        db.flush()
+        if rows:
+            db.execute(insert(CombatParticipant).execution_options(render_nulls=True), rows)
         
         db.commit()
         db.refresh(combat_session)
@@ -141,6 +177,10 @@ def roll_initiative(db: Session, combat_id: UUID, participant_id: UUID, roll_val
     Raises:
         HTTPException: При ошибке
     """
+    engine = active_combat_engine()
+    if engine is not None:
+        return engine.roll_initiative(db, combat_id, participant_id, roll_value)
+
     try:
         participant = db.query(CombatParticipant).filter(
             CombatParticipant.id == participant_id,
@@ -153,11 +193,14 @@ def roll_initiative(db: Session, combat_id: UUID, participant_id: UUID, roll_val
                 detail="Participant not found in combat"
             )
         
-        # Если значение не указано, бросаем 1d20
+        combat = get_combat_session(db, combat_id)
+        
+        # Если значение не указано, бросаем 1d20 из потока игры
         if roll_value is None:
-            roll_value = random.randint(1, 20)
+            roll_value = get_game_rng(db, combat.game_id).randint(1, 20)
         
         participant.initiative = roll_value
+        combat_rules.update_initiative(combat, participant)
         db.commit()
         db.refresh(participant)
         
@@ -175,6 +218,96 @@ def roll_initiative(db: Session, combat_id: UUID, participant_id: UUID, roll_val
         )
 
 
+def roll_initiative_for_uncontrolled(db: Session, combat_id: UUID) -> dict:
+    """
+    Бросок инициативы всем живым участникам под управлением мастера
+
+    Модификатор — модификатор Ловкости монстра из бестиария (`monster_slug`),
+    для остальных 0. Броски идут из потока игры, значения записываются одним
+    UPDATE (CASE по id), порядок ходов пересчитывается один раз.
+
+    Returns:
+        {"combat_id", "rolls": [{"participant_id", "roll", "modifier", "initiative", "rng_offset"}],
+         "turn_order", "current_turn_index"}
+
+    Raises:
+        HTTPException: Если бой не найден или не активен
+    """
+    engine = active_combat_engine()
+    combat = get_combat_session(db, combat_id)
+    if not combat.is_active:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Combat is not active")
+
+    if engine is not None:
+        # Участники и модификаторы — из памяти и бестиария
+        participants = [
+            (p.id, p.monster_slug) for p in combat.participants
+            if not p.is_player_controlled and not p.is_dead
+        ]
+        slugs = {slug for _, slug in participants if slug}
+        dexterity = dict(
+            db.query(Monster.slug, Monster.dexterity).filter(Monster.slug.in_(slugs)).all()
+        ) if slugs else {}
+        participants = [(pid, dexterity.get(slug)) for pid, slug in participants]
+    else:
+        # Участники и Ловкость монстров одним запросом
+        participants = db.query(CombatParticipant.id, Monster.dexterity).outerjoin(
+            Monster, Monster.slug == CombatParticipant.monster_slug
+        ).filter(
+            CombatParticipant.combat_id == combat_id,
+            CombatParticipant.is_player_controlled == False,
+            or_(CombatParticipant.is_dead == False, CombatParticipant.is_dead.is_(None)),
+        ).all()
+
+    rolls = []
+    if participants:
+        rngs = get_game_rngs(db, combat.game_id, len(participants))
+        for (participant_id, dex), rng in zip(participants, rngs):
+            roll = rng.randint(1, 20)
+            modifier = (dex - 10) // 2 if dex is not None else 0
+            rolls.append({
+                "participant_id": participant_id,
+                "roll": roll,
+                "modifier": modifier,
+                "initiative": roll + modifier,
+                "rng_offset": rng.offset,
+            })
+    initiatives = {r["participant_id"]: r["initiative"] for r in rolls}
+
+    if engine is not None:
+        if initiatives:
+            combat = engine.set_initiatives(db, combat_id, initiatives)
+    elif initiatives:
+        try:
+            db.query(CombatParticipant).filter(
+                CombatParticipant.id.in_(list(initiatives))
+            ).update(
+                {CombatParticipant.initiative: case(
+                    *[(CombatParticipant.id == pid, value) for pid, value in initiatives.items()],
+                    else_=CombatParticipant.initiative,
+                )},
+                synchronize_session=False
+            )
+            _ensure_turn_order(db, combat)
+            combat_rules.update_initiatives(combat, {str(pid): value for pid, value in initiatives.items()})
+            db.commit()
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Error rolling initiative batch: {e}", exc_info=True)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Внутренняя ошибка сервера при броске инициативы"
+            )
+
+    logger.info(f"Rolled initiative for {len(rolls)} uncontrolled participants in combat {combat_id}")
+    return {
+        "combat_id": combat_id,
+        "rolls": rolls,
+        "turn_order": [entry["id"] for entry in combat.turn_order or []],
+        "current_turn_index": combat.current_turn_index,
+    }
+
+
 def get_initiative_order(db: Session, combat_id: UUID) -> list[CombatParticipant]:
     """
     Получение порядка ходов по инициативе (сортировка по initiative DESC)
@@ -186,6 +319,10 @@ def get_initiative_order(db: Session, combat_id: UUID) -> list[CombatParticipant
     Returns:
         Список участников, отсортированный по инициативе (от большего к меньшему)
     """
+    engine = active_combat_engine()
+    if engine is not None:
+        return list(engine.load(db, combat_id).order())
+
     participants = db.query(CombatParticipant).filter(
         CombatParticipant.combat_id == combat_id
     ).order_by(CombatParticipant.initiative.desc().nulls_last()).all()
@@ -204,10 +341,15 @@ def get_current_combat(db: Session, game_id: UUID) -> Optional[CombatSession]:
     Returns:
         Активная боевая сессия или None
     """
-    return db.query(CombatSession).filter(
+    combat = db.query(CombatSession).filter(
         CombatSession.game_id == game_id,
         CombatSession.is_active == True
     ).first()
+    engine = active_combat_engine()
+    if combat is not None and engine is not None:
+        # Несохраненные изменения есть только в памяти
+        return engine.loaded(combat.id) or combat
+    return combat
 
 
 def get_combat_session(db: Session, combat_id: UUID) -> CombatSession:
@@ -224,6 +366,10 @@ def get_combat_session(db: Session, combat_id: UUID) -> CombatSession:
     Raises:
         HTTPException: Если сессия не найдена
     """
+    engine = active_combat_engine()
+    if engine is not None:
+        return engine.load(db, combat_id)
+
     combat = db.query(CombatSession).filter(CombatSession.id == combat_id).first()
     
     if not combat:
@@ -250,9 +396,14 @@ def end_combat(db: Session, combat_id: UUID) -> CombatSession:
         HTTPException: При ошибке
     """
     try:
-        combat = get_combat_session(db, combat_id)
+        release_combat_state(db, combat_id)
+        combat = db.query(CombatSession).filter(CombatSession.id == combat_id).first()
+        if not combat:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Combat session not found"
+            )
         combat.is_active = False
-        from datetime import datetime
         combat.ended_at = datetime.utcnow()
         
         db.commit()
@@ -272,6 +423,13 @@ def end_combat(db: Session, combat_id: UUID) -> CombatSession:
         )
 
 
+def release_combat_state(db: Session, combat_id: UUID) -> None:
+    """Сохранение и выгрузка боя из движка перед его изменением напрямую в БД"""
+    engine = active_combat_engine()
+    if engine is not None:
+        engine.release(db, combat_id)
+
+
 def apply_damage(db: Session, combat_id: UUID, participant_id: UUID, damage: int, damage_type: Optional[str] = None) -> CombatParticipant:
     """
     Применение урона к участнику боя
@@ -288,6 +446,10 @@ def apply_damage(db: Session, combat_id: UUID, participant_id: UUID, damage: int
     Raises:
         HTTPException: При ошибке
     """
+    engine = active_combat_engine()
+    if engine is not None:
+        return engine.apply_damage(db, combat_id, participant_id, damage, damage_type)
+
     try:
         participant = db.query(CombatParticipant).filter(
             CombatParticipant.id == participant_id,
@@ -300,28 +462,8 @@ def apply_damage(db: Session, combat_id: UUID, participant_id: UUID, damage: int
                 detail="Participant not found in combat"
             )
         
-        # Apply resistance/immunity/vulnerability if damage_type provided
-        if damage_type and damage > 0:
-            dt = damage_type.lower()
-            immunities = [i.lower() for i in (participant.damage_immunities or [])]
-            resistances = [r.lower() for r in (participant.damage_resistances or [])]
-            vulnerabilities = [v.lower() for v in (participant.damage_vulnerabilities or [])]
-            if dt in immunities:
-                damage = 0
-            elif dt in resistances:
-                damage = damage // 2
-            elif dt in vulnerabilities:
-                damage = damage * 2
-
-        # Уменьшаем HP
-        participant.current_hp = max(0, participant.current_hp - damage)
-        
-        # Если HP <= 0, добавляем условие
-        if participant.current_hp <= 0:
-            conditions = participant.conditions or []
-            if "unconscious" not in conditions:
-                conditions.append("unconscious")
-            participant.conditions = conditions
+        # Сопротивления/иммунитеты/уязвимости; при 0 HP — "unconscious"
+        damage = combat_rules.take_damage(participant, damage, damage_type)
         
         db.commit()
         db.refresh(participant)
@@ -346,6 +488,10 @@ def apply_damage(db: Session, combat_id: UUID, participant_id: UUID, damage: int
 
 def apply_healing(db: Session, combat_id: UUID, participant_id: UUID, healing: int) -> CombatParticipant:
     """Apply healing to a combat participant."""
+    engine = active_combat_engine()
+    if engine is not None:
+        return engine.apply_healing(db, combat_id, participant_id, healing)
+
     try:
         participant = db.query(CombatParticipant).filter(
             CombatParticipant.id == participant_id,
@@ -354,13 +500,7 @@ def apply_healing(db: Session, combat_id: UUID, participant_id: UUID, healing: i
         if not participant:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Participant not found in combat")
 
-        participant.current_hp = min(participant.max_hp, participant.current_hp + healing)
-
-        if participant.current_hp > 0:
-            conditions = [c for c in (participant.conditions or []) if c != "unconscious"]
-            participant.conditions = conditions if conditions else None
-            participant.death_saves_success = 0
-            participant.death_saves_failure = 0
+        combat_rules.heal(participant, healing)
 
         db.commit()
         db.refresh(participant)
@@ -376,35 +516,90 @@ def apply_healing(db: Session, combat_id: UUID, participant_id: UUID, healing: i
 
 def next_turn(db: Session, combat_id: UUID) -> CombatSession:
     """Advance to the next participant in initiative order. Increments round when it wraps."""
+    engine = active_combat_engine()
+    if engine is not None:
+        return engine.next_turn(db, combat_id)
+
     combat = get_combat_session(db, combat_id)
     if not combat.is_active:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Combat is not active")
 
-    participants = get_initiative_order(db, combat_id)
-    alive = [p for p in participants if not p.is_dead]
-    if not alive:
+    _ensure_turn_order(db, combat)
+    if not combat.turn_order:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No alive participants")
 
-    # Reset actions for participant who just ended their turn
-    if 0 <= combat.current_turn_index < len(alive):
-        current = alive[combat.current_turn_index]
-        current.actions_used = 0
-        current.bonus_actions_used = 0
-        current.reaction_used = False
+    # Сдвиг указателя в сохраненном порядке: без выборки и сортировки участников
+    ended = combat_rules.advance_turn(combat)
+    if ended is not None:
+        # Сброс действий закончившего ход (строка меняется, только если действия тратились).
+        # Это отдельный UPDATE другой таблицы: объединить его с UPDATE боя переносимо нельзя
+        db.query(CombatParticipant).filter(
+            CombatParticipant.id == UUID(ended),
+            or_(
+                CombatParticipant.actions_used != 0,
+                CombatParticipant.bonus_actions_used != 0,
+                CombatParticipant.reaction_used == True,
+            )
+        ).update(
+            {
+                CombatParticipant.actions_used: 0,
+                CombatParticipant.bonus_actions_used: 0,
+                CombatParticipant.reaction_used: False,
+            },
+            synchronize_session=False
+        )
+    _commit_keeping_loaded(db, combat)
+    return combat
+
 
-    next_index = combat.current_turn_index + 1
-    if next_index >= len(alive):
-        next_index = 0
-        combat.round_number += 1
+def _commit_keeping_loaded(db: Session, obj) -> None:
+    """
+    Commit без повторного чтения объекта
 
-    combat.current_turn_index = next_index
+    Commit сбрасывает загруженные поля, и первое обращение к ним делает SELECT.
+    Здесь все колонки объекта известны (только что выставлены или прочитаны),
+    поэтому после commit они восстанавливаются как сохраненные.
+    """
+    values = {attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs}
     db.commit()
-    db.refresh(combat)
-    return combat
+    for key, value in values.items():
+        set_committed_value(obj, key, value)
+
+
+def _ensure_turn_order(db: Session, combat: CombatSession) -> None:
+    """Построение порядка ходов для боев, начатых до появления turn_order"""
+    if combat.turn_order is None:
+        participants = db.query(CombatParticipant).filter(CombatParticipant.combat_id == combat.id).all()
+        combat.turn_order = combat_rules.build_turn_order(participants)
+
+
+def add_participant(db: Session, combat_id: UUID, participant: CombatParticipant) -> CombatParticipant:
+    """
+    Вступление участника в идущий бой
+
+    Участник занимает место в порядке ходов по инициативе; чей сейчас ход, не меняется.
+    Бой из движка в памяти предварительно сохраняется и выгружается.
+    """
+    release_combat_state(db, combat_id)
+    combat = db.query(CombatSession).filter(CombatSession.id == combat_id).first()
+    if not combat:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Combat session not found")
+    _ensure_turn_order(db, combat)
+    participant.combat_id = combat_id
+    db.add(participant)
+    db.flush()
+    combat_rules.insert_into_turn_order(combat, participant)
+    db.commit()
+    db.refresh(participant)
+    return participant
 
 
 def apply_condition(db: Session, combat_id: UUID, participant_id: UUID, condition: str) -> CombatParticipant:
     """Add a condition to a participant."""
+    engine = active_combat_engine()
+    if engine is not None:
+        return engine.apply_condition(db, combat_id, participant_id, condition)
+
     participant = db.query(CombatParticipant).filter(
         CombatParticipant.id == participant_id,
         CombatParticipant.combat_id == combat_id
@@ -412,10 +607,7 @@ def apply_condition(db: Session, combat_id: UUID, participant_id: UUID, conditio
     if not participant:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Participant not found")
 
-    conditions = list(participant.conditions or [])
-    if condition not in conditions:
-        conditions.append(condition)
-    participant.conditions = conditions
+    combat_rules.add_condition(participant, condition)
     db.commit()
     db.refresh(participant)
     return participant
@@ -423,6 +615,10 @@ def apply_condition(db: Session, combat_id: UUID, participant_id: UUID, conditio
 
 def remove_condition(db: Session, combat_id: UUID, participant_id: UUID, condition: str) -> CombatParticipant:
     """Remove a condition from a participant."""
+    engine = active_combat_engine()
+    if engine is not None:
+        return engine.remove_condition(db, combat_id, participant_id, condition)
+
     participant = db.query(CombatParticipant).filter(
         CombatParticipant.id == participant_id,
         CombatParticipant.combat_id == combat_id
@@ -430,8 +626,7 @@ def remove_condition(db: Session, combat_id: UUID, participant_id: UUID, conditi
     if not participant:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Participant not found")
 
-    conditions = [c for c in (participant.conditions or []) if c != condition]
-    participant.conditions = conditions if conditions else None
+    combat_rules.remove_condition(participant, condition)
     db.commit()
     db.refresh(participant)
     return participant
@@ -439,6 +634,10 @@ def remove_condition(db: Session, combat_id: UUID, participant_id: UUID, conditi
 
 def roll_death_save(db: Session, combat_id: UUID, participant_id: UUID) -> dict:
     """Roll a death saving throw for an unconscious participant."""
+    engine = active_combat_engine()
+    if engine is not None:
+        return engine.roll_death_save(db, combat_id, participant_id)
+
     participant = db.query(CombatParticipant).filter(
         CombatParticipant.id == participant_id,
         CombatParticipant.combat_id == combat_id
@@ -448,47 +647,12 @@ def roll_death_save(db: Session, combat_id: UUID, participant_id: UUID) -> dict:
     if participant.current_hp > 0:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Participant is not unconscious")
 
-    roll = random.randint(1, 20)
-    result = {"roll": roll, "success": False, "failure": False, "stabilized": False, "died": False}
-
-    if roll == 20:
-        # Natural 20: regain 1 HP, remove unconscious
-        participant.current_hp = 1
-        participant.death_saves_success = 0
-        participant.death_saves_failure = 0
-        conditions = [c for c in (participant.conditions or []) if c != "unconscious"]
-        participant.conditions = conditions or None
-        result["success"] = True
-        result["stabilized"] = True
-        result["regained_hp"] = 1
-    elif roll == 1:
-        # Natural 1: count as 2 failures
-        participant.death_saves_failure = min(3, (participant.death_saves_failure or 0) + 2)
-        result["failure"] = True
-    elif roll >= 10:
-        participant.death_saves_success = min(3, (participant.death_saves_success or 0) + 1)
-        result["success"] = True
-    else:
-        participant.death_saves_failure = min(3, (participant.death_saves_failure or 0) + 1)
-        result["failure"] = True
-
-    if (participant.death_saves_success or 0) >= 3 and not result.get("regained_hp"):
-        participant.death_saves_success = 0
-        participant.death_saves_failure = 0
-        result["stabilized"] = True
-
-    if (participant.death_saves_failure or 0) >= 3:
-        participant.is_dead = True
-        conditions = list(participant.conditions or [])
-        if "unconscious" not in conditions:
-            conditions.append("unconscious")
-        if "dead" not in conditions:
-            conditions.append("dead")
-        participant.conditions = conditions
-        result["died"] = True
-
-    result["death_saves_success"] = participant.death_saves_success or 0
-    result["death_saves_failure"] = participant.death_saves_failure or 0
+    combat = get_combat_session(db, combat_id)
+    rng = get_game_rng(db, combat.game_id)
+    result = combat_rules.resolve_death_save(participant, rng.randint(1, 20))
+    result["rng_offset"] = rng.offset
+    if result["died"]:
+        combat_rules.remove_from_turn_order(combat, participant_id)
     db.commit()
     db.refresh(participant)
     return result
@@ -506,23 +670,29 @@ def perform_attack(
     damage_modifier: int = 0,
 ) -> dict:
     """Roll an attack against a target and compute damage on hit."""
-    target = db.query(CombatParticipant).filter(
-        CombatParticipant.id == target_id,
-        CombatParticipant.combat_id == combat_id,
-    ).first()
+    engine = active_combat_engine()
+    if engine is not None:
+        target = engine.load(db, combat_id).by_id.get(target_id)
+    else:
+        target = db.query(CombatParticipant).filter(
+            CombatParticipant.id == target_id,
+            CombatParticipant.combat_id == combat_id,
+        ).first()
     if not target:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Target not found in combat")
 
+    rng = _combat_rng(db, combat_id)
+
     # Determine roll(s)
     if attack_roll is not None:
         rolls = [attack_roll]
     else:
         if advantage == "advantage":
-            rolls = [random.randint(1, 20), random.randint(1, 20)]
+            rolls = [rng.randint(1, 20), rng.randint(1, 20)]
         elif advantage == "disadvantage":
-            rolls = [random.randint(1, 20), random.randint(1, 20)]
+            rolls = [rng.randint(1, 20), rng.randint(1, 20)]
         else:
-            rolls = [random.randint(1, 20)]
+            rolls = [rng.randint(1, 20)]
 
     if advantage == "advantage":
         natural_roll = max(rolls)
@@ -539,14 +709,13 @@ def perform_attack(
     damage = None
     if hit:
         try:
-            parts = damage_dice.lower().split("d")
-            num_dice = int(parts[0]) if parts[0] else 1
-            die_size = int(parts[1])
-        except Exception:
-            num_dice, die_size = 1, 6
+            plan = compile_expression(damage_dice)
+        except DiceExpressionError:
+            plan = compile_expression("1d6")
 
-        dice_count = num_dice * 2 if critical else num_dice
-        damage = max(0, sum(random.randint(1, die_size) for _ in range(dice_count)) + damage_modifier)
+        if critical:
+            plan = plan.critical()
+        damage = max(0, plan.roll(rng).total + damage_modifier)
 
     return {
         "hit": hit,
@@ -560,6 +729,7 @@ def perform_attack(
         "advantage": advantage,
         "damage": damage,
         "damage_dice": damage_dice,
+        "rng_offset": rng.offset,
     }
 
 
@@ -583,10 +753,14 @@ def roll_saving_throw(
     """Roll a saving throw for a combat participant."""
     from ..models.character import Character
 
-    participant = db.query(CombatParticipant).filter(
-        CombatParticipant.id == participant_id,
-        CombatParticipant.combat_id == combat_id
-    ).first()
+    engine = active_combat_engine()
+    if engine is not None:
+        participant = engine.load(db, combat_id).by_id.get(participant_id)
+    else:
+        participant = db.query(CombatParticipant).filter(
+            CombatParticipant.id == participant_id,
+            CombatParticipant.combat_id == combat_id
+        ).first()
     if not participant:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Participant not found")
 
@@ -610,7 +784,8 @@ def roll_saving_throw(
     if has_proficiency:
         modifier += proficiency_bonus
 
-    roll = random.randint(1, 20)
+    rng = _combat_rng(db, combat_id)
+    roll = rng.randint(1, 20)
     total = roll + modifier
 
     return {
@@ -621,5 +796,6 @@ def roll_saving_throw(
         "modifier": modifier,
         "total": total,
         "success": total >= dc,
+        "rng_offset": rng.offset,
     }
 
@@ -0,0 +1,66 @@
+"""
+Неблокирующий доступ к БД из async-кода (обработчики Socket.IO, фоновые флашеры)
+
+SQLAlchemy-сессии синхронные, поэтому вся работа с БД из event loop
+выполняется в отдельном ограниченном пуле потоков. Event loop при этом
+продолжает обслуживать остальные сокеты, даже если запрос к Postgres медленный.
+"""
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+from .. import database
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Получение (ленивое создание) пула потоков для работы с БД"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.socket_db_workers,
+            thread_name_prefix="socket-db",
+        )
+    return _executor
+
+
+def _call_with_session(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Выполнение функции с собственной сессией БД (в потоке пула)"""
+    db = database.SessionLocal()
+    try:
+        return func(db, *args, **kwargs)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Выполнение синхронной функции `func(db, *args, **kwargs)` вне event loop
+
+    Функция получает новую сессию и должна вернуть данные, не привязанные к ней
+    (словари, примитивы): после возврата сессия закрывается.
+    Размер пула ограничен `settings.socket_db_workers`, поэтому одновременно
+    к БД обращается не больше этого числа обработчиков, остальные ждут в очереди.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(_call_with_session, func, *args, **kwargs)
+    return await loop.run_in_executor(get_executor(), call)
+
+
+def shutdown_executor(wait: bool = True) -> None:
+    """Остановка пула потоков (при завершении приложения)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
+        logger.info("Socket DB executor stopped")
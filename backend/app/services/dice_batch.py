@@ -0,0 +1,122 @@
+"""
+Векторизованные пакетные броски по скомпилированному выражению
+
+Вместо цикла `random.randint` на каждый кубик весь пакет бросается вызовами
+NumPy-генератора на массив (n бросков x кубики терма): перебросы и взрывы
+перебрасывают только подходящие элементы, keep/drop — сортировка по строкам.
+Пакет обрабатывается частями, чтобы память не росла с размером пакета.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .dice_expression import (
+    MAX_EXPLOSIONS,
+    MAX_REROLLS,
+    Comparison,
+    ConstantTerm,
+    DiceExpressionError,
+    DicePlan,
+    DiceTerm,
+)
+
+MAX_BATCH_ROLLS = 1_000_000
+MAX_BATCH_DICE = 50_000_000
+# Сколько кубиков бросается за один проход (ограничивает пиковую память)
+CHUNK_DICE = 1_000_000
+
+
+def _matches(comparison: Comparison, values: np.ndarray) -> np.ndarray:
+    if comparison.op == "<":
+        return values <= comparison.value
+    if comparison.op == ">":
+        return values >= comparison.value
+    return values == comparison.value
+
+
+def _draw(term: DiceTerm, rng: np.random.Generator, size) -> np.ndarray:
+    """Бросок массива кубиков терма с учетом перебросов"""
+    values = rng.integers(1, term.faces + 1, size=size, dtype=np.int32)
+    if term.reroll is not None:
+        for _ in range(1 if term.reroll_once else MAX_REROLLS):
+            mask = _matches(term.reroll, values)
+            count = int(mask.sum())
+            if not count:
+                break
+            values[mask] = rng.integers(1, term.faces + 1, size=count, dtype=np.int32)
+    return values
+
+
+def _roll_term_batch(term: DiceTerm, n: int, rng: np.random.Generator) -> np.ndarray:
+    values = _draw(term, rng, (n, term.count))
+
+    if term.explode is not None:
+        if term.keep is not None:
+            raise DiceExpressionError("Пакетный бросок взрывов вместе с keep/drop не поддерживается")
+        # Каждый кубик копит свою цепочку взрывов; перебрасываются только взорвавшиеся
+        sums = values.astype(np.int64)
+        active = np.flatnonzero(_matches(term.explode, values))
+        depth = 0
+        while active.size and depth < MAX_EXPLOSIONS:
+            extra = _draw(term, rng, active.size)
+            sums.flat[active] += extra
+            active = active[_matches(term.explode, extra)]
+            depth += 1
+        return sums.sum(axis=1)
+
+    if term.keep is not None:
+        mode, k = term.keep
+        values.sort(axis=1)
+        if mode == "kh":
+            values = values[:, term.count - k:]
+        elif mode == "kl":
+            values = values[:, :k]
+        elif mode == "dh":
+            values = values[:, :term.count - k]
+        else:
+            values = values[:, k:]
+    return values.sum(axis=1, dtype=np.int64)
+
+
+def roll_plan_batch(plan: DicePlan, n: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    n независимых бросков плана
+
+    Returns:
+        Массив сумм длины n (int64)
+
+    Raises:
+        DiceExpressionError: Если пакет превышает ограничения
+    """
+    if n < 1 or n > MAX_BATCH_ROLLS:
+        raise DiceExpressionError(f"Количество бросков должно быть от 1 до {MAX_BATCH_ROLLS}")
+    dice_per_roll = max(plan.dice_count, 1)
+    if n * dice_per_roll > MAX_BATCH_DICE:
+        raise DiceExpressionError(f"Пакет превышает {MAX_BATCH_DICE} кубиков")
+
+    rng = rng if rng is not None else np.random.default_rng()
+    totals = np.full(n, plan.constant, dtype=np.int64)
+    chunk = max(CHUNK_DICE // dice_per_roll, 1)
+    for start in range(0, n, chunk):
+        stop = min(start + chunk, n)
+        for term in plan.terms:
+            if isinstance(term, ConstantTerm):
+                continue
+            totals[start:stop] += term.sign * _roll_term_batch(term, stop - start, rng)
+    return totals
+
+
+def histogram(totals: np.ndarray) -> List[Dict[str, int]]:
+    """Гистограмма сумм: [{"total": t, "count": n}, ...] по возрастанию t"""
+    values, counts = np.unique(totals, return_counts=True)
+    return [{"total": int(v), "count": int(c)} for v, c in zip(values, counts)]
+
+
+def summarize(totals: np.ndarray) -> Dict[str, float]:
+    """Выборочные статистики пакета"""
+    return {
+        "min": int(totals.min()),
+        "max": int(totals.max()),
+        "mean": float(totals.mean()),
+        "std": float(totals.std()),
+    }
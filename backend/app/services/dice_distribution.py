@@ -0,0 +1,259 @@
+"""
+Точное распределение суммы для выражений кубиков
+
+Распределение считается сверткой, а не сэмплированием:
+- `NdM` — возведение PMF одного кубика в степень свертки (двоичное возведение,
+  большие массивы сворачиваются через FFT)
+- перебросы меняют PMF одного кубика, взрывы дают составной кубик
+  (цепочка обрывается, когда оставшаяся вероятность пренебрежимо мала)
+- keep/drop — динамика по граням от старшей к младшей (порядковые статистики)
+- константы и вычитание — сдвиг и отражение
+
+Вероятности ниже машинной точности (дальние хвосты больших пулов) обнуляются,
+поэтому `min`/`max` — границы значимой части распределения.
+Результаты мемоизируются по нормализованному выражению в LRU ограниченного размера.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from math import comb
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .dice_expression import (
+    MAX_EXPLOSIONS,
+    MAX_REROLLS,
+    ConstantTerm,
+    DiceExpressionError,
+    DicePlan,
+    DiceTerm,
+    normalize_expression,
+    compile_expression,
+)
+
+DISTRIBUTION_CACHE_SIZE = 256
+PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+
+# Свертка через FFT выгоднее прямой начиная с такого произведения длин
+FFT_THRESHOLD = 50_000
+# Обрыв цепочки взрывов: остаток вероятности меньше этого порога
+EXPLOSION_TAIL = 1e-12
+# Ограничение на сложность динамики keep/drop: кубики^2 * грани
+MAX_KEEP_COMPLEXITY = 2_000_000
+
+
+@dataclass(frozen=True)
+class Distribution:
+    """PMF суммы: `pmf[i]` — вероятность значения `offset + i`"""
+    expression: str
+    offset: int
+    pmf: np.ndarray
+
+    @property
+    def min(self) -> int:
+        return self.offset + int(np.flatnonzero(self.pmf)[0])
+
+    @property
+    def max(self) -> int:
+        return self.offset + int(np.flatnonzero(self.pmf)[-1])
+
+    @property
+    def mean(self) -> float:
+        values = np.arange(self.offset, self.offset + len(self.pmf))
+        return float(np.dot(values, self.pmf))
+
+    @property
+    def variance(self) -> float:
+        values = np.arange(self.offset, self.offset + len(self.pmf))
+        mean = self.mean
+        return float(np.dot((values - mean) ** 2, self.pmf))
+
+    def percentile(self, q: float) -> int:
+        """Наименьшее значение, для которого P(X <= значение) >= q / 100"""
+        cdf = np.cumsum(self.pmf)
+        index = int(np.searchsorted(cdf, q / 100 - 1e-12))
+        return self.offset + min(index, len(self.pmf) - 1)
+
+    def probability_at_least(self, value: int) -> float:
+        """P(X >= value)"""
+        index = max(value - self.offset, 0)
+        return float(self.pmf[index:].sum())
+
+    def points(self) -> List[Tuple[int, float]]:
+        """Ненулевые точки PMF: [(сумма, вероятность), ...]"""
+        return [(self.offset + int(i), float(self.pmf[i])) for i in np.flatnonzero(self.pmf)]
+
+    def to_dict(self) -> Dict:
+        return {
+            "expression": self.expression,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "variance": self.variance,
+            "std": self.variance ** 0.5,
+            "percentiles": {str(q): self.percentile(q) for q in PERCENTILES},
+            "pmf": [{"total": total, "probability": p} for total, p in self.points()],
+        }
+
+
+def _convolve(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Свертка двух PMF (через FFT для больших массивов)"""
+    if len(a) * len(b) < FFT_THRESHOLD:
+        return np.convolve(a, b)
+    size = len(a) + len(b) - 1
+    result = np.fft.irfft(np.fft.rfft(a, size) * np.fft.rfft(b, size), size)
+    # Погрешность FFT — порядка eps от максимума (в том числе отрицательные значения):
+    # такие точки обнуляются, иначе они расширили бы носитель распределения
+    result[result < np.finfo(float).eps * result.max()] = 0.0
+    return result
+
+
+def _convolve_power(pmf: np.ndarray, n: int) -> np.ndarray:
+    """Свертка PMF самой с собой n раз (двоичное возведение)"""
+    result = np.array([1.0])
+    base = pmf
+    while n:
+        if n & 1:
+            result = _convolve(result, base)
+        n >>= 1
+        if n:
+            base = _convolve(base, base)
+    return result
+
+
+def _die_pmf(term: DiceTerm) -> np.ndarray:
+    """PMF одного кубика с учетом перебросов: индекс = значение (индекс 0 не используется)"""
+    faces = term.faces
+    pmf = np.zeros(faces + 1)
+    pmf[1:] = 1.0 / faces
+    if term.reroll is None:
+        return pmf
+
+    matching = np.array([term.reroll.matches(v) for v in range(1, faces + 1)])
+    p_match = matching.sum() / faces
+    attempts = 1 if term.reroll_once else MAX_REROLLS
+    # Неподходящее значение принимается на любой из attempts + 1 попыток,
+    # подходящее остается, только если подошли все попытки
+    accepted = sum(p_match ** j for j in range(attempts + 1)) / faces
+    pmf[1:] = np.where(matching, p_match ** attempts / faces, accepted)
+    return pmf
+
+
+def _exploding_pmf(term: DiceTerm, die: np.ndarray) -> np.ndarray:
+    """PMF суммы одного взрывающегося кубика (кубик плюс все его взрывы)"""
+    matching = np.array([False] + [term.explode.matches(v) for v in range(1, term.faces + 1)])
+    stop = np.where(matching, 0.0, die)
+    carry = np.where(matching, die, 0.0)
+
+    result = stop.copy()
+    chain = carry
+    depth = 1
+    while chain.sum() > EXPLOSION_TAIL and depth <= MAX_EXPLOSIONS:
+        # Взорвавшаяся часть: к уже накопленной сумме добавляется следующий бросок
+        next_result = _convolve(chain, stop)
+        chain = _convolve(chain, carry)
+        if len(next_result) > len(result):
+            result = np.pad(result, (0, len(next_result) - len(result)))
+        result[:len(next_result)] += next_result
+        depth += 1
+    return result
+
+
+def _keep_pmf(term: DiceTerm, die: np.ndarray) -> np.ndarray:
+    """
+    PMF суммы оставленных кубиков (keep/drop)
+
+    Грани перебираются от «лучшей» к «худшей» (по убыванию для kh/dl, по возрастанию
+    для kl/dh); состояние — сколько кубиков уже распределено и сумма оставленных.
+    Вероятность набора кратностей — произведение биномиальных множителей.
+    """
+    n = term.count
+    mode, k = term.keep
+    keep = {"kh": k, "kl": k, "dh": n - k, "dl": n - k}[mode]
+    descending = mode in ("kh", "dl")
+    faces = term.faces
+    if n * n * faces > MAX_KEEP_COMPLEXITY:
+        raise DiceExpressionError("Слишком большой пул кубиков для точного расчета keep/drop")
+
+    max_sum = keep * faces
+    # state[c, s]: распределено c кубиков, сумма оставленных s
+    state = np.zeros((n + 1, max_sum + 1))
+    state[0, 0] = 1.0
+    values = range(faces, 0, -1) if descending else range(1, faces + 1)
+    for v in values:
+        p = die[v]
+        if p == 0:
+            continue
+        new_state = np.zeros_like(state)
+        for c in range(n + 1):
+            row = state[c]
+            if not row.any():
+                continue
+            remaining = n - c
+            for m in range(remaining + 1):
+                weight = comb(remaining, m) * p ** m
+                if weight == 0:
+                    break
+                kept = min(m, max(keep - c, 0))
+                shift = kept * v
+                if shift:
+                    new_state[c + m, shift:] += row[:max_sum + 1 - shift] * weight
+                else:
+                    new_state[c + m] += row * weight
+        state = new_state
+    return state[n]
+
+
+def _term_pmf(term: DiceTerm) -> np.ndarray:
+    die = _die_pmf(term)
+    if term.explode is not None:
+        if term.keep is not None:
+            raise DiceExpressionError("Точное распределение для взрывов вместе с keep/drop не поддерживается")
+        die = _exploding_pmf(term, die)
+    if term.keep is not None:
+        return _keep_pmf(term, die)
+    return _convolve_power(die, term.count)
+
+
+def compute_distribution(plan: DicePlan) -> Distribution:
+    """Точное распределение суммы для скомпилированного плана"""
+    offset = 0
+    pmf = np.array([1.0])
+    for term in plan.terms:
+        if isinstance(term, ConstantTerm):
+            offset += term.sign * term.value
+            continue
+        term_pmf = _term_pmf(term)
+        if term.sign < 0:
+            # Значения 0..L-1 превращаются в -(L-1)..0
+            offset -= len(term_pmf) - 1
+            term_pmf = term_pmf[::-1]
+        pmf = _convolve(pmf, term_pmf)
+
+    # Отбрасываем нулевые хвосты
+    nonzero = np.flatnonzero(pmf > 0)
+    pmf = pmf[nonzero[0]:nonzero[-1] + 1] / pmf.sum()
+    offset += int(nonzero[0])
+    pmf.flags.writeable = False
+    return Distribution(expression=plan.expression, offset=offset, pmf=pmf)
+
+
+@lru_cache(maxsize=DISTRIBUTION_CACHE_SIZE)
+def _distribution_normalized(text: str, advantage: Optional[bool]) -> Distribution:
+    return compute_distribution(compile_expression(text, advantage))
+
+
+def get_distribution(expression: str, advantage: Optional[bool] = None) -> Distribution:
+    """
+    Распределение выражения (мемоизировано по нормализованному выражению)
+
+    Raises:
+        DiceExpressionError: Если выражение некорректно или его нельзя посчитать точно
+    """
+    return _distribution_normalized(normalize_expression(expression), advantage)
+
+
+def distribution_cache_info() -> Dict[str, int]:
+    """Статистика LRU распределений"""
+    info = _distribution_normalized.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
@@ -0,0 +1,134 @@
+"""
+Потоковая выгрузка истории бросков в NDJSON и CSV
+
+Строки читаются курсором на стороне сервера (`yield_per`) без создания ORM-объектов
+и Pydantic-моделей; готовый текст отдается порциями по `EXPORT_CHUNK_ROWS` строк.
+Память не зависит от размера истории.
+
+Генератор открывает собственную сессию на переданном engine: сессия запроса
+закрывается до того, как ответ начнет передаваться.
+"""
+import csv
+import io
+import json
+from typing import Iterator, Optional
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..models.dice_roll_history import DiceRollHistory
+from ..models.user import User
+
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+EXPORT_COLUMNS = (
+    "id", "created_at", "user_id", "username", "roll_type", "count", "faces", "expression",
+    "rolls", "total", "modifier", "advantage_type", "advantage_rolls", "selected_roll", "rng_offset",
+)
+
+
+def _export_query(game_id: UUID, user_id: Optional[UUID], roll_type: Optional[str]):
+    stmt = (
+        select(
+            DiceRollHistory.id,
+            DiceRollHistory.created_at,
+            DiceRollHistory.user_id,
+            User.username,
+            DiceRollHistory.roll_type,
+            DiceRollHistory.count,
+            DiceRollHistory.faces,
+            DiceRollHistory.expression,
+            DiceRollHistory.rolls,
+            DiceRollHistory.total,
+            DiceRollHistory.modifier,
+            DiceRollHistory.advantage_type,
+            DiceRollHistory.advantage_rolls,
+            DiceRollHistory.selected_roll,
+            DiceRollHistory.rng_offset,
+        )
+        .outerjoin(User, User.id == DiceRollHistory.user_id)
+        .where(DiceRollHistory.game_id == game_id)
+    )
+    if user_id:
+        stmt = stmt.where(DiceRollHistory.user_id == user_id)
+    if roll_type:
+        stmt = stmt.where(DiceRollHistory.roll_type == roll_type)
+    # Хронологический порядок; индекс (game_id, created_at DESC, id DESC) читается в обратную сторону
+    return stmt.order_by(DiceRollHistory.created_at, DiceRollHistory.id)
+
+
+def _ndjson_line(row) -> str:
+    item = dict(row._mapping)
+    item["id"] = str(item["id"])
+    item["user_id"] = str(item["user_id"])
+    item["created_at"] = item["created_at"].isoformat()
+    return json.dumps(item, ensure_ascii=False) + "\n"
+
+
+def _csv_values(row) -> list:
+    item = row._mapping
+    values = []
+    for column in EXPORT_COLUMNS:
+        value = item[column]
+        if column == "created_at":
+            value = value.isoformat()
+        elif column in ("rolls", "advantage_rolls", "selected_roll") and value is not None:
+            value = json.dumps(value, ensure_ascii=False)
+        values.append("" if value is None else value)
+    return values
+
+
+def iter_history_export(
+    bind: Engine,
+    game_id: UUID,
+    fmt: str = "ndjson",
+    user_id: Optional[UUID] = None,
+    roll_type: Optional[str] = None,
+    chunk_rows: int = EXPORT_CHUNK_ROWS,
+) -> Iterator[str]:
+    """
+    Порции текста выгрузки истории игры
+
+    Args:
+        bind: Engine (например, `db.get_bind()` сессии запроса)
+        fmt: "ndjson" или "csv" (с заголовком)
+
+    Raises:
+        ValueError: Если формат не поддерживается
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неподдерживаемый формат: {fmt}")
+    return _iter_export(bind, game_id, fmt, user_id, roll_type, chunk_rows)
+
+
+def _iter_export(bind, game_id, fmt, user_id, roll_type, chunk_rows) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(EXPORT_COLUMNS)
+
+    with Session(bind=bind) as db:
+        result = db.execute(
+            _export_query(game_id, user_id, roll_type),
+            execution_options={"yield_per": chunk_rows},
+        )
+        for partition in result.partitions():
+            for row in partition:
+                if writer is not None:
+                    writer.writerow(_csv_values(row))
+                else:
+                    buffer.write(_ndjson_line(row))
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    tail = buffer.getvalue()
+    if tail:
+        # Только заголовок CSV для пустой истории
+        yield tail
@@ -0,0 +1,409 @@
+"""
+Компилятор выражений кубиков D&D
+
+Поддерживаемый синтаксис (регистр и пробелы не важны):
+- `NdM` — N кубиков с M гранями (`d20` = `1d20`, `d%` = `d100`)
+- `khN` / `kN`, `klN` — оставить N старших / младших кубиков
+- `dhN`, `dlN` — отбросить N старших / младших кубиков
+- `!`, `!>N`, `!<N`, `!=N` — взрывающиеся кубики (по умолчанию — на максимальной грани),
+  каждый взрыв добавляет в пул новый кубик
+- `rN`, `r<N`, `r>N` — перебрасывать, пока условие выполняется; `ro...` — перебросить один раз
+- целые константы и сложение/вычитание термов: `4d6kh3+2d8-1d4+5`
+
+Сравнения как в Roll20: `<N` означает «не больше N», `>N` — «не меньше N».
+
+Выражение разбирается один раз в неизменяемый план (`DicePlan`), планы кэшируются
+в LRU по нормализованной строке выражения — повторные броски не парсят строку заново.
+"""
+import random
+import re
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+# Ограничения против злоупотреблений (выражения приходят от клиентов)
+MAX_EXPRESSION_LENGTH = 100
+MAX_TERMS = 20
+MAX_DICE_PER_TERM = 100
+MAX_TOTAL_DICE = 200
+MAX_FACES = 1000
+MAX_CONSTANT = 10000
+MAX_EXPLOSIONS = 100
+MAX_REROLLS = 100
+
+EXPRESSION_CACHE_SIZE = 1024
+
+
+class DiceExpressionError(ValueError):
+    """Некорректное выражение кубиков"""
+
+
+@dataclass(frozen=True)
+class Comparison:
+    """Условие для взрыва/переброса: `=`, `<` (не больше) или `>` (не меньше)"""
+    op: str
+    value: int
+
+    def matches(self, roll: int) -> bool:
+        if self.op == "<":
+            return roll <= self.value
+        if self.op == ">":
+            return roll >= self.value
+        return roll == self.value
+
+    def count_matching(self, faces: int) -> int:
+        """Сколько граней из 1..faces удовлетворяют условию"""
+        return sum(1 for face in range(1, faces + 1) if self.matches(face))
+
+    def __str__(self) -> str:
+        return f"{'' if self.op == '=' else self.op}{self.value}"
+
+
+@dataclass(frozen=True)
+class DiceTerm:
+    """Терм `NdM` с модификаторами"""
+    count: int
+    faces: int
+    sign: int = 1
+    keep: Optional[Tuple[str, int]] = None  # ("kh" | "kl" | "dh" | "dl", N)
+    explode: Optional[Comparison] = None
+    reroll: Optional[Comparison] = None
+    reroll_once: bool = False
+
+    def __str__(self) -> str:
+        text = f"{self.count}d{self.faces}"
+        if self.reroll is not None:
+            text += f"{'ro' if self.reroll_once else 'r'}{self.reroll}"
+        if self.explode is not None:
+            text += "!" if self.explode == Comparison("=", self.faces) else f"!{self.explode}"
+        if self.keep is not None:
+            text += f"{self.keep[0]}{self.keep[1]}"
+        return text
+
+
+@dataclass(frozen=True)
+class ConstantTerm:
+    """Целая константа"""
+    value: int
+    sign: int = 1
+
+    def __str__(self) -> str:
+        return str(self.value)
+
+
+@dataclass
+class TermResult:
+    """Результат одного терма"""
+    expression: str
+    sign: int
+    rolls: List[int] = field(default_factory=list)  # все выпавшие кубики в порядке броска
+    kept: List[bool] = field(default_factory=list)  # флаг «учтен в сумме» для каждого кубика
+    subtotal: int = 0  # сумма терма без учета знака
+    faces: Optional[int] = None
+
+    @property
+    def kept_rolls(self) -> List[int]:
+        return [value for value, kept in zip(self.rolls, self.kept) if kept]
+
+
+@dataclass
+class ExpressionResult:
+    """Результат вычисления выражения"""
+    expression: str
+    total: int
+    terms: List[TermResult]
+
+    @property
+    def constant(self) -> int:
+        """Сумма константных термов (модификатор выражения)"""
+        return sum(term.sign * term.subtotal for term in self.terms if term.faces is None)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Представление для API в формате `DiceRoller.to_dict`
+
+        `rolls` — учтенные в сумме кубики, подробности по каждому терму — в `terms`.
+        """
+        rolls = []
+        for term in self.terms:
+            for value in term.kept_rolls:
+                rolls.append({"die_id": f"d{len(rolls) + 1}", "value": value})
+        return {
+            "expression": self.expression,
+            "rolls": rolls,
+            "total": self.total,
+            "terms": [
+                {
+                    "expression": term.expression,
+                    "sign": term.sign,
+                    "rolls": term.rolls,
+                    "kept": term.kept,
+                    "subtotal": term.subtotal,
+                }
+                for term in self.terms
+            ],
+        }
+
+
+@dataclass(frozen=True)
+class DicePlan:
+    """Скомпилированное выражение: неизменяемый список термов"""
+    terms: Tuple[Any, ...]
+
+    @property
+    def expression(self) -> str:
+        """Каноническая запись выражения"""
+        text = ""
+        for term in self.terms:
+            if text or term.sign < 0:
+                text += "+" if term.sign > 0 else "-"
+            text += str(term)
+        return text
+
+    @property
+    def dice_terms(self) -> List[DiceTerm]:
+        return [term for term in self.terms if isinstance(term, DiceTerm)]
+
+    @property
+    def dice_count(self) -> int:
+        return sum(term.count for term in self.dice_terms)
+
+    @property
+    def constant(self) -> int:
+        return sum(term.sign * term.value for term in self.terms if isinstance(term, ConstantTerm))
+
+    def critical(self) -> "DicePlan":
+        """План критического попадания: количество кубиков (и keep/drop) удваивается"""
+        terms = []
+        for term in self.terms:
+            if isinstance(term, DiceTerm):
+                keep = (term.keep[0], term.keep[1] * 2) if term.keep else None
+                term = replace(term, count=term.count * 2, keep=keep)
+            terms.append(term)
+        return DicePlan(tuple(terms))
+
+    def with_advantage(self, advantage: bool) -> "DicePlan":
+        """
+        План с преимуществом (True) или помехой (False)
+
+        Первый одиночный кубик без keep/drop превращается в `2dMkh1` / `2dMkl1`.
+        """
+        terms = list(self.terms)
+        for i, term in enumerate(terms):
+            if isinstance(term, DiceTerm) and term.count == 1 and term.keep is None:
+                terms[i] = replace(term, count=2, keep=("kh" if advantage else "kl", 1))
+                return DicePlan(tuple(terms))
+        raise DiceExpressionError("Преимущество и помеха применимы только к выражению с одиночным кубиком")
+
+    def roll(self, rng: Any = None) -> ExpressionResult:
+        """
+        Вычисление плана
+
+        Args:
+            rng: Источник случайности с методом `randint(a, b)` (по умолчанию модуль `random`)
+        """
+        rng = rng or random
+        total = 0
+        results = []
+        for term in self.terms:
+            if isinstance(term, ConstantTerm):
+                result = TermResult(expression=str(term), sign=term.sign, subtotal=term.value)
+            else:
+                result = _roll_term(term, rng)
+            total += term.sign * result.subtotal
+            results.append(result)
+        return ExpressionResult(expression=self.expression, total=total, terms=results)
+
+
+def _roll_die(term: DiceTerm, rng: Any) -> int:
+    value = rng.randint(1, term.faces)
+    if term.reroll is not None:
+        attempts = 1 if term.reroll_once else MAX_REROLLS
+        while attempts and term.reroll.matches(value):
+            value = rng.randint(1, term.faces)
+            attempts -= 1
+    return value
+
+
+def _roll_term(term: DiceTerm, rng: Any) -> TermResult:
+    rolls = []
+    explosions = 0
+    for _ in range(term.count):
+        value = _roll_die(term, rng)
+        rolls.append(value)
+        while term.explode is not None and term.explode.matches(value) and explosions < MAX_EXPLOSIONS:
+            explosions += 1
+            value = _roll_die(term, rng)
+            rolls.append(value)
+
+    kept = [True] * len(rolls)
+    if term.keep is not None:
+        mode, n = term.keep
+        order = sorted(range(len(rolls)), key=lambda i: rolls[i])  # по возрастанию, стабильно
+        if mode == "kh":
+            dropped = order[:max(len(rolls) - n, 0)]
+        elif mode == "kl":
+            dropped = order[n:]
+        elif mode == "dh":
+            dropped = order[max(len(rolls) - n, 0):]
+        else:
+            dropped = order[:n]
+        for i in dropped:
+            kept[i] = False
+
+    subtotal = sum(value for value, is_kept in zip(rolls, kept) if is_kept)
+    return TermResult(
+        expression=str(term),
+        sign=term.sign,
+        rolls=rolls,
+        kept=kept,
+        subtotal=subtotal,
+        faces=term.faces,
+    )
+
+
+_TERM_RE = re.compile(r"(\d*)d(\d+|%)|(\d+)")
+_MODIFIER_RE = re.compile(r"(kh|kl|dh|dl|k|ro|r|!)([<>=]?)(\d*)")
+
+
+def _parse_dice_modifiers(text: str, pos: int, count: int, faces: int, sign: int) -> Tuple[DiceTerm, int]:
+    keep = None
+    explode = None
+    reroll = None
+    reroll_once = False
+
+    while pos < len(text) and text[pos] not in "+-":
+        match = _MODIFIER_RE.match(text, pos)
+        if not match:
+            raise DiceExpressionError(f"Неизвестный модификатор в позиции {pos + 1}: '{text[pos:]}'")
+        name, op, number = match.groups()
+        pos = match.end()
+
+        if name in ("kh", "kl", "dh", "dl", "k"):
+            if keep is not None:
+                raise DiceExpressionError("Допускается только один модификатор keep/drop на терм")
+            if op or not number:
+                raise DiceExpressionError(f"Модификатор '{name}' требует число")
+            keep = ("kh" if name == "k" else name, int(number))
+            if keep[1] > count:
+                raise DiceExpressionError(f"Нельзя оставить или отбросить {keep[1]} из {count} кубиков")
+        elif name == "!":
+            if explode is not None:
+                raise DiceExpressionError("Модификатор '!' указан дважды")
+            if op and not number:
+                raise DiceExpressionError("Условие взрыва требует число")
+            explode = Comparison(op or "=", int(number)) if number else Comparison("=", faces)
+            if explode.count_matching(faces) >= faces:
+                raise DiceExpressionError("Условие взрыва выполняется на всех гранях")
+        else:
+            if reroll is not None:
+                raise DiceExpressionError("Допускается только один модификатор переброса на терм")
+            if not number:
+                raise DiceExpressionError(f"Модификатор '{name}' требует число")
+            reroll = Comparison(op or "=", int(number))
+            reroll_once = name == "ro"
+            if reroll.count_matching(faces) >= faces:
+                raise DiceExpressionError("Условие переброса выполняется на всех гранях")
+
+    return DiceTerm(
+        count=count,
+        faces=faces,
+        sign=sign,
+        keep=keep,
+        explode=explode,
+        reroll=reroll,
+        reroll_once=reroll_once,
+    ), pos
+
+
+def _parse(text: str) -> DicePlan:
+    if not text:
+        raise DiceExpressionError("Пустое выражение")
+    if len(text) > MAX_EXPRESSION_LENGTH:
+        raise DiceExpressionError(f"Выражение длиннее {MAX_EXPRESSION_LENGTH} символов")
+
+    terms = []
+    pos = 0
+    sign = 1
+    if text[0] in "+-":
+        sign = -1 if text[0] == "-" else 1
+        pos = 1
+
+    while True:
+        match = _TERM_RE.match(text, pos)
+        if not match:
+            raise DiceExpressionError(f"Ожидался кубик или число в позиции {pos + 1}: '{text}'")
+        pos = match.end()
+
+        if match.group(3) is not None:
+            value = int(match.group(3))
+            if value > MAX_CONSTANT:
+                raise DiceExpressionError(f"Константа превышает {MAX_CONSTANT}")
+            terms.append(ConstantTerm(value=value, sign=sign))
+        else:
+            count = int(match.group(1)) if match.group(1) else 1
+            faces = 100 if match.group(2) == "%" else int(match.group(2))
+            if count < 1:
+                raise DiceExpressionError("Количество кубиков должно быть положительным")
+            if count > MAX_DICE_PER_TERM:
+                raise DiceExpressionError(f"Количество кубиков в терме превышает {MAX_DICE_PER_TERM}")
+            if faces < 2 or faces > MAX_FACES:
+                raise DiceExpressionError(f"Количество граней должно быть от 2 до {MAX_FACES}")
+            term, pos = _parse_dice_modifiers(text, pos, count, faces, sign)
+            terms.append(term)
+
+        if len(terms) > MAX_TERMS:
+            raise DiceExpressionError(f"Выражение содержит больше {MAX_TERMS} термов")
+        if pos == len(text):
+            break
+        if text[pos] not in "+-":
+            raise DiceExpressionError(f"Ожидался '+' или '-' в позиции {pos + 1}")
+        sign = -1 if text[pos] == "-" else 1
+        pos += 1
+        if pos == len(text):
+            raise DiceExpressionError("Выражение не может заканчиваться знаком")
+
+    plan = DicePlan(tuple(terms))
+    if plan.dice_count > MAX_TOTAL_DICE:
+        raise DiceExpressionError(f"Общее количество кубиков превышает {MAX_TOTAL_DICE}")
+    return plan
+
+
+def normalize_expression(expression: str) -> str:
+    """Нормализация строки выражения (ключ кэша): нижний регистр, без пробелов"""
+    return "".join(expression.split()).lower()
+
+
+@lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def _compile_normalized(text: str, advantage: Optional[bool]) -> DicePlan:
+    plan = _parse(text)
+    if advantage is not None:
+        plan = plan.with_advantage(advantage)
+    return plan
+
+
+def compile_expression(expression: str, advantage: Optional[bool] = None) -> DicePlan:
+    """
+    Компиляция выражения в план (с кэшированием)
+
+    Args:
+        expression: Выражение, например `4d6kh3+2d8+5`
+        advantage: True = преимущество, False = помеха, None = без изменений
+
+    Raises:
+        DiceExpressionError: Если выражение некорректно
+    """
+    if not isinstance(expression, str):
+        raise DiceExpressionError("Выражение должно быть строкой")
+    return _compile_normalized(normalize_expression(expression), advantage)
+
+
+def roll_expression(expression: str, advantage: Optional[bool] = None, rng: Any = None) -> ExpressionResult:
+    """Компиляция (из кэша) и вычисление выражения"""
+    return compile_expression(expression, advantage).roll(rng)
+
+
+def expression_cache_info() -> Dict[str, int]:
+    """Статистика LRU скомпилированных выражений"""
+    info = _compile_normalized.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
@@ -0,0 +1,351 @@
+"""
+Аудит честности кубиков по истории бросков
+
+Для каждого вида кубика (dN) в области аудита (игра, игрок в игре или все игры):
+
+- хи-квадрат: частоты граней против равномерного распределения (df = N - 1);
+- Колмогоров–Смирнов: максимум отклонения эмпирической функции распределения
+  от равномерной; для дискретного кубика асимптотический p-value консервативен;
+- тест серий (Вальда–Вольфовица): последовательность «выше/ниже середины» в порядке
+  бросков; слишком мало или слишком много серий — признак зависимости соседних бросков.
+
+История читается потоково (`yield_per`) в хронологическом порядке, статистика
+считается векторно по порциям и накапливается в ограниченном состоянии (частоты и
+счетчики серий), поэтому память не зависит от размера истории.
+
+Проверяются только кубики, которые у честного генератора равномерны: при
+преимуществе/помехе — оба кубика из `advantage_rolls`, а не выбранный; строки выражений
+с keep/drop, перебросом или взрывом пропускаются, так как в истории хранятся лишь
+учтенные (или переброшенные) кубики и их распределение смещено.
+
+Результат кэшируется в памяти воркера по «высокой отметке» истории области
+(число строк и время последней): пока история не изменилась, аудит не пересчитывается.
+"""
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models.dice_roll_history import DiceRollHistory
+from .dice_expression import DiceExpressionError, compile_expression
+
+AUDIT_CHUNK_ROWS = 5000
+AUDIT_CACHE_SIZE = 128
+# Порог p-value, ниже которого кубик помечается как подозрительный
+AUDIT_ALPHA = 0.001
+# Минимум ожидаемых попаданий на грань для корректного хи-квадрат
+MIN_EXPECTED_PER_FACE = 5
+
+
+def _gamma_q(a: float, x: float) -> float:
+    """Регуляризованная верхняя неполная гамма-функция Q(a, x)"""
+    if x <= 0:
+        return 1.0
+    log_prefix = -x + a * math.log(x) - math.lgamma(a)
+    if x < a + 1:
+        # Ряд для P(a, x)
+        term = total = 1.0 / a
+        n = a
+        for _ in range(1000):
+            n += 1
+            term *= x / n
+            total += term
+            if abs(term) < abs(total) * 1e-15:
+                break
+        return max(0.0, 1.0 - total * math.exp(log_prefix))
+    # Цепная дробь (метод Ленца) для Q(a, x)
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return min(1.0, math.exp(log_prefix) * h)
+
+
+def chi_square_sf(statistic: float, df: int) -> float:
+    """P(χ²(df) ≥ statistic)"""
+    return _gamma_q(df / 2, statistic / 2)
+
+
+def kolmogorov_sf(statistic: float, n: int) -> float:
+    """Асимптотический p-value статистики Колмогорова D (с поправкой Стивенса)"""
+    if n == 0:
+        return 1.0
+    root = math.sqrt(n)
+    lam = (root + 0.12 + 0.11 / root) * statistic
+    if lam < 0.3:
+        return 1.0
+    j = np.arange(1, 101)
+    terms = 2 * (-1.0) ** (j - 1) * np.exp(-2 * j ** 2 * lam ** 2)
+    return float(min(1.0, max(0.0, terms.sum())))
+
+
+def uniform_faces(faces: Optional[int], expression: Optional[str]) -> Optional[int]:
+    """Грани кубиков строки истории или None, если значения в ней не должны быть равномерны"""
+    if not expression:
+        return faces
+    try:
+        terms = compile_expression(expression).dice_terms
+    except DiceExpressionError:
+        return None
+    if any(term.keep or term.reroll or term.explode for term in terms):
+        return None
+    kinds = {term.faces for term in terms}
+    return kinds.pop() if len(kinds) == 1 else None
+
+
+class FaceAccumulator:
+    """Накопленные частоты граней и счетчики серий одного вида кубика в одной области"""
+
+    def __init__(self, faces: int):
+        self.faces = faces
+        self.counts = np.zeros(faces + 1, dtype=np.int64)
+        self.high = 0
+        self.low = 0
+        self.runs = 0
+        self.last: Optional[bool] = None
+
+    def update(self, values: np.ndarray) -> None:
+        """Учет значений в порядке бросков"""
+        self.counts += np.bincount(values, minlength=self.faces + 1)
+        # Середина d(N) — (N + 1) / 2; значения ровно на середине (нечетные N) не входят в серии
+        doubled = 2 * values
+        symbols = doubled[doubled != self.faces + 1] > self.faces + 1
+        if symbols.size == 0:
+            return
+        high = int(np.count_nonzero(symbols))
+        self.high += high
+        self.low += symbols.size - high
+        self.runs += int(np.count_nonzero(symbols[1:] != symbols[:-1]))
+        if self.last is None or bool(symbols[0]) != self.last:
+            self.runs += 1
+        self.last = bool(symbols[-1])
+
+    def result(self) -> Dict[str, Any]:
+        frequencies = self.counts[1:]
+        n = int(frequencies.sum())
+        expected = n / self.faces
+        chi_square = ks = runs = None
+        if n:
+            statistic = float(((frequencies - expected) ** 2).sum() / expected)
+            chi_square = {
+                "statistic": statistic,
+                "df": self.faces - 1,
+                "p_value": chi_square_sf(statistic, self.faces - 1),
+            }
+            empirical = np.cumsum(frequencies) / n
+            uniform = np.arange(1, self.faces + 1) / self.faces
+            d = float(np.abs(empirical - uniform).max())
+            ks = {"statistic": d, "p_value": kolmogorov_sf(d, n)}
+        if self.high and self.low:
+            m = self.high + self.low
+            product = 2 * self.high * self.low
+            mean = product / m + 1
+            variance = product * (product - m) / (m ** 2 * (m - 1)) if m > 1 else 0.0
+            if variance > 0:
+                z = (self.runs - mean) / math.sqrt(variance)
+                runs = {
+                    "runs": self.runs,
+                    "expected": mean,
+                    "z": z,
+                    "p_value": math.erfc(abs(z) / math.sqrt(2)),
+                }
+        p_values = [test["p_value"] for test in (chi_square, ks, runs) if test]
+        return {
+            "faces": self.faces,
+            "count": n,
+            "frequencies": frequencies.tolist(),
+            "expected_per_face": expected,
+            "sufficient": n >= MIN_EXPECTED_PER_FACE * self.faces,
+            "chi_square": chi_square,
+            "ks": ks,
+            "runs": runs,
+            "flagged": bool(p_values) and n >= MIN_EXPECTED_PER_FACE * self.faces and min(p_values) < AUDIT_ALPHA,
+        }
+
+
+class FairnessAudit:
+    """Потоковый аудит: порции строк истории → аккумуляторы по (область, грани)"""
+
+    def __init__(self, per_user: bool):
+        self.per_user = per_user
+        self.rows = 0
+        self._accumulators: Dict[Tuple[Hashable, int], FaceAccumulator] = {}
+
+    def _accumulator(self, scope: Hashable, faces: int) -> FaceAccumulator:
+        key = (scope, faces)
+        accumulator = self._accumulators.get(key)
+        if accumulator is None:
+            accumulator = self._accumulators[key] = FaceAccumulator(faces)
+        return accumulator
+
+    def add_chunk(self, rows: List[Any]) -> None:
+        """Строки (user_id, faces, expression, rolls, advantage_type, advantage_rolls) в хронологическом порядке"""
+        users: List[Hashable] = []
+        faces: List[int] = []
+        values: List[int] = []
+        for row in rows:
+            self.rows += 1
+            if row.advantage_rolls:
+                dice = row.advantage_rolls
+            elif row.advantage_type:
+                # Выражение с преимуществом: отброшенный кубик не сохранен
+                continue
+            else:
+                dice = row.rolls
+            kind = uniform_faces(row.faces, row.expression)
+            if kind is None or kind < 2:
+                continue
+            for die in dice or ():
+                value = die.get("value") if isinstance(die, dict) else None
+                if isinstance(value, int) and 1 <= value <= kind:
+                    users.append(row.user_id)
+                    faces.append(kind)
+                    values.append(value)
+        if not values:
+            return
+
+        faces_arr = np.asarray(faces, dtype=np.int64)
+        values_arr = np.asarray(values, dtype=np.int64)
+        self._update_groups(None, faces_arr, values_arr)
+        if self.per_user:
+            user_index: Dict[Hashable, int] = {}
+            codes = np.fromiter((user_index.setdefault(u, len(user_index)) for u in users), dtype=np.int64, count=len(users))
+            by_code = list(user_index)
+            order = np.argsort(codes, kind="stable")
+            codes, sorted_faces, sorted_values = codes[order], faces_arr[order], values_arr[order]
+            bounds = np.flatnonzero(np.diff(codes)) + 1
+            for start, end in zip(np.r_[0, bounds], np.r_[bounds, codes.size]):
+                self._update_groups(by_code[codes[start]], sorted_faces[start:end], sorted_values[start:end])
+
+    def _update_groups(self, scope: Hashable, faces: np.ndarray, values: np.ndarray) -> None:
+        # Стабильная сортировка сохраняет порядок бросков внутри каждого вида кубика
+        order = np.argsort(faces, kind="stable")
+        faces, values = faces[order], values[order]
+        bounds = np.flatnonzero(np.diff(faces)) + 1
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, faces.size]):
+            self._accumulator(scope, int(faces[start])).update(values[start:end])
+
+    def results(self, scope: Hashable) -> List[Dict[str, Any]]:
+        return [
+            accumulator.result()
+            for (key, faces), accumulator in sorted(self._accumulators.items(), key=lambda item: item[0][1])
+            if key == scope
+        ]
+
+    def scopes(self) -> List[Hashable]:
+        return list(dict.fromkeys(key for key, _ in self._accumulators if key is not None))
+
+
+def _scoped(query, game_id: Optional[UUID]):
+    return query.filter(DiceRollHistory.game_id == game_id) if game_id is not None else query
+
+
+def history_high_water_mark(db: Session, game_id: Optional[UUID] = None) -> Tuple[int, Optional[datetime]]:
+    """(число строк, время последней строки) истории области — одним агрегатным запросом"""
+    count, last_at = _scoped(
+        db.query(func.count(DiceRollHistory.id), func.max(DiceRollHistory.created_at)), game_id
+    ).one()
+    return int(count), last_at
+
+
+def compute_fairness_audit(db: Session, game_id: Optional[UUID] = None, chunk_rows: int = AUDIT_CHUNK_ROWS) -> Dict[str, Any]:
+    """
+    Аудит истории игры (с разбивкой по игрокам) или всех игр
+
+    Returns:
+        {"game_id", "rows", "dice": [по граням], "users": [{"user_id", "dice"}]}
+    """
+    audit = FairnessAudit(per_user=game_id is not None)
+    query = _scoped(
+        db.query(
+            DiceRollHistory.user_id, DiceRollHistory.faces, DiceRollHistory.expression, DiceRollHistory.rolls,
+            DiceRollHistory.advantage_type, DiceRollHistory.advantage_rolls,
+        ),
+        game_id,
+    ).order_by(DiceRollHistory.created_at, DiceRollHistory.id)
+
+    chunk = []
+    for row in query.yield_per(chunk_rows):
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            audit.add_chunk(chunk)
+            chunk = []
+    audit.add_chunk(chunk)
+
+    return {
+        "game_id": game_id,
+        "rows": audit.rows,
+        "alpha": AUDIT_ALPHA,
+        "dice": audit.results(None),
+        "users": [{"user_id": user_id, "dice": audit.results(user_id)} for user_id in audit.scopes()],
+    }
+
+
+class FairnessAuditCache:
+    """Результаты аудита по области, действительные до изменения высокой отметки истории"""
+
+    def __init__(self, max_size: int = AUDIT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Optional[UUID], Tuple[Tuple, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, scope: Optional[UUID], mark: Tuple) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(scope)
+            if entry is None or entry[0] != mark:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(scope)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, scope: Optional[UUID], mark: Tuple, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[scope] = (mark, result)
+            self._entries.move_to_end(scope)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+_cache: Optional[FairnessAuditCache] = None
+
+
+def get_audit_cache() -> FairnessAuditCache:
+    """Получение (ленивое создание) кэша аудита"""
+    global _cache
+    if _cache is None:
+        _cache = FairnessAuditCache()
+    return _cache
+
+
+def get_fairness_audit(db: Session, game_id: Optional[UUID] = None) -> Dict[str, Any]:
+    """Аудит с кэшем: пересчет только если история области изменилась"""
+    count, last_at = history_high_water_mark(db, game_id)
+    mark = (count, last_at.isoformat() if last_at else None)
+    cache = get_audit_cache()
+    result = cache.get(game_id, mark)
+    if result is None:
+        result = compute_fairness_audit(db, game_id)
+        cache.put(game_id, mark, result)
+    return dict(result, high_water_mark={"rows": mark[0], "last_at": mark[1]})
@@ -0,0 +1,252 @@
+"""
+Воспроизводимые потоки случайных чисел для игр
+
+У каждой игры свой секретный seed; публикуется только его хэш (`dice_seed_commitment`),
+поэтому мастер не может подменить seed задним числом, а игроки — предсказать броски.
+Каждый бросок получает порядковый номер в потоке игры (`rng_offset`) и бросается
+генератором Philox со счетчиком, начинающимся с этого номера: любой бросок можно
+пересчитать по (seed, offset) без повторения предыдущих.
+
+Гарантия воспроизведения относится к броскам из истории (`dice_roll_history`):
+`dice_roll`, `dice_roll_batch` и `/api/dice/roll-batch`. Боевые броски (атаки,
+спасброски, спасброски от смерти, инициатива, HP и инициатива добавленного монстра)
+тоже берут номера из потока, но в историю не пишутся и `replay_game_rolls` их
+не проверяет: номер возвращается в ответе, где он есть, а пропуски номеров в истории
+ожидаемы.
+
+Номера выделяются блоками через счетчик `game_sessions.dice_rng_offset`
+(один UPDATE ... RETURNING на блок в отдельной транзакции, как `nextval` у
+последовательностей), поэтому воркеры не пересекаются, а транзакция вызывающего
+кода не коммитится; неиспользованный остаток блока при перезапуске воркера
+или откате вызывающего просто пропускается.
+"""
+import hashlib
+import logging
+import secrets
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from ..models.dice_roll_history import DiceRollHistory
+from ..models.game_session import GameSession
+from .dice_expression import compile_expression
+from .dice_service import DiceRoller
+
+logger = logging.getLogger(__name__)
+
+RNG_BLOCK_SIZE = 64
+
+
+def new_seed() -> str:
+    """Новый секретный seed игры (256 бит)"""
+    return secrets.token_hex(32)
+
+
+def seed_commitment(seed: str) -> str:
+    """Публикуемый хэш seed"""
+    return hashlib.sha256(seed.encode()).hexdigest()
+
+
+def stream_key(seed: str) -> int:
+    """128-битный ключ Philox (не выводится из опубликованного хэша)"""
+    return int.from_bytes(hashlib.sha256(b"dice-stream:" + seed.encode()).digest()[:16], "big")
+
+
+class StreamRng:
+    """Генератор одного броска: интерфейс `randint(a, b)` поверх NumPy Philox"""
+
+    def __init__(self, key: int, offset: int):
+        self.offset = offset
+        # Старшее слово счетчика — номер броска; младшие слова расходуются самим броском
+        self.generator = np.random.Generator(np.random.Philox(key=key, counter=[0, 0, 0, offset]))
+
+    def randint(self, a: int, b: int) -> int:
+        return int(self.generator.integers(a, b + 1))
+
+
+def rng_for(seed: str, offset: int) -> StreamRng:
+    """Генератор броска с номером `offset` в потоке игры с данным seed"""
+    return StreamRng(stream_key(seed), offset)
+
+
+def reserve_rng_offsets(db: Session, game_id: UUID, count: int) -> Tuple[str, int]:
+    """
+    Резервирование `count` номеров в потоке игры
+
+    Seed создается при первом обращении. Резервирование выполняется в собственной
+    сессии на том же engine и коммитится сразу: номера не должны вернуться в поток
+    при откате транзакции вызывающего (их уже могли получить другие броски),
+    а сессия `db` не коммитится и не сбрасывается.
+
+    Returns:
+        (seed, первый зарезервированный номер)
+
+    Raises:
+        ValueError: Если игра не найдена
+    """
+    seed = new_seed()
+    with Session(bind=db.get_bind()) as own:
+        own.execute(
+            update(GameSession)
+            .where(GameSession.id == game_id, GameSession.dice_seed.is_(None))
+            .values(dice_seed=seed, dice_seed_commitment=seed_commitment(seed))
+            .execution_options(synchronize_session=False)
+        )
+        row = own.execute(
+            update(GameSession)
+            .where(GameSession.id == game_id)
+            .values(dice_rng_offset=GameSession.dice_rng_offset + count)
+            .returning(GameSession.dice_seed, GameSession.dice_rng_offset)
+            .execution_options(synchronize_session=False)
+        ).one_or_none()
+        own.commit()
+    if row is None:
+        raise ValueError("Игра не найдена")
+    return row.dice_seed, row.dice_rng_offset - count
+
+
+@dataclass
+class _Block:
+    seed: str
+    key: int
+    next: int
+    end: int
+
+
+class GameRngRegistry:
+    """
+    Зарезервированные блоки номеров по играм (в памяти воркера)
+
+    Блокировка — своя у каждой игры: резервирование нового блока (запрос к БД)
+    задерживает только броски той же игры.
+    """
+
+    def __init__(self, block_size: int = RNG_BLOCK_SIZE):
+        self.block_size = block_size
+        self._blocks: Dict[UUID, _Block] = {}
+        self._locks: Dict[UUID, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.reservations = 0
+
+    def _game_lock(self, game_id: UUID) -> threading.Lock:
+        with self._lock:
+            lock = self._locks.get(game_id)
+            if lock is None:
+                lock = self._locks[game_id] = threading.Lock()
+            return lock
+
+    def allocate(self, db: Session, game_id: UUID, count: int = 1) -> List[StreamRng]:
+        """Генераторы для `count` следующих бросков игры"""
+        rngs = []
+        with self._game_lock(game_id):
+            while len(rngs) < count:
+                block = self._blocks.get(game_id)
+                if block is None or block.next >= block.end:
+                    size = max(self.block_size, count - len(rngs))
+                    seed, start = reserve_rng_offsets(db, game_id, size)
+                    self.reservations += 1
+                    block = _Block(seed=seed, key=stream_key(seed), next=start, end=start + size)
+                    self._blocks[game_id] = block
+                rngs.append(StreamRng(block.key, block.next))
+                block.next += 1
+        return rngs
+
+    def forget(self, game_id: UUID) -> None:
+        with self._game_lock(game_id):
+            self._blocks.pop(game_id, None)
+
+
+_registry: Optional[GameRngRegistry] = None
+
+
+def get_rng_registry() -> GameRngRegistry:
+    """Получение (ленивое создание) реестра потоков"""
+    global _registry
+    if _registry is None:
+        _registry = GameRngRegistry()
+    return _registry
+
+
+def get_game_rng(db: Session, game_id: UUID) -> StreamRng:
+    """Генератор следующего броска игры (номер — в `.offset`)"""
+    return get_rng_registry().allocate(db, game_id, 1)[0]
+
+
+def get_game_rngs(db: Session, game_id: UUID, count: int) -> List[StreamRng]:
+    """Генераторы для нескольких бросков игры (группового броска)"""
+    return get_rng_registry().allocate(db, game_id, count)
+
+
+def replay_roll(seed: str, entry: Any) -> Dict[str, Any]:
+    """
+    Повторный бросок по записи истории (`DiceRollHistory` или строка истории)
+
+    Returns:
+        {"rolls": [...], "total": ...} в формате истории
+    """
+    get = entry.get if isinstance(entry, dict) else lambda name: getattr(entry, name)
+    rng = rng_for(seed, get("rng_offset"))
+    if get("expression"):
+        result = compile_expression(get("expression")).roll(rng).to_dict()
+    else:
+        advantage_type = get("advantage_type")
+        advantage = None if advantage_type is None else advantage_type == "advantage"
+        roller = DiceRoller(default_faces=12, max_dice=10)
+        result = roller.to_dict(roller.roll(get("count"), get("faces"), advantage, rng=rng))
+    modifier = get("modifier")
+    if modifier is not None:
+        result["total"] += modifier
+    return {"rolls": result["rolls"], "total": result["total"]}
+
+
+def replay_game_rolls(db: Session, game_id: UUID, seed: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Пересчет всех бросков игры из истории и сверка с сохраненными результатами
+
+    Args:
+        seed: Seed игры; по умолчанию берется из БД. Переданный seed
+              проверяется по опубликованному хэшу.
+
+    Returns:
+        {"checked": N, "skipped": N, "mismatches": [{"id", "rng_offset", "stored", "replayed"}],
+         "commitment_ok": bool}
+    """
+    game = db.query(GameSession).filter(GameSession.id == game_id).first()
+    if game is None:
+        raise ValueError("Игра не найдена")
+    seed = seed or game.dice_seed
+    if seed is None:
+        raise ValueError("У игры еще нет потока бросков")
+
+    report = {
+        "checked": 0,
+        "skipped": 0,
+        "mismatches": [],
+        "commitment_ok": seed_commitment(seed) == game.dice_seed_commitment,
+    }
+    query = (
+        db.query(DiceRollHistory)
+        .filter(DiceRollHistory.game_id == game_id)
+        .order_by(DiceRollHistory.rng_offset)
+        .yield_per(1000)
+    )
+    for entry in query:
+        if entry.rng_offset is None:
+            # Броски до появления потоков игры воспроизвести нельзя
+            report["skipped"] += 1
+            continue
+        replayed = replay_roll(seed, entry)
+        report["checked"] += 1
+        if replayed["total"] != entry.total or replayed["rolls"] != entry.rolls:
+            report["mismatches"].append({
+                "id": str(entry.id),
+                "rng_offset": entry.rng_offset,
+                "stored": {"rolls": entry.rolls, "total": entry.total},
+                "replayed": replayed,
+            })
+    return report
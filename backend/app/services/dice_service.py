@@ -2,15 +2,28 @@
 Доменный сервис для броска кубиков D&D
 Основан на логике из Example/roll-dice
 """
+import base64
+import hashlib
 import json
+import logging
 import os
 import random
-from typing import List, Dict, Optional, Any
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Any, Tuple
 from dataclasses import dataclass
 from uuid import UUID
+from sqlalchemy import insert, literal, tuple_
 from sqlalchemy.orm import Session
 from pathlib import Path
 from ..models.dice_roll_history import DiceRollHistory
+from .dice_batch import roll_plan_batch
+from .dice_expression import compile_expression
+from .dice_stats import record_roll_stats
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -51,7 +64,13 @@ class DiceRoller:
         self.default_faces = default_faces
         self.max_dice = max_dice
     
-    def roll(self, count: int, faces: Optional[int] = None, advantage: Optional[bool] = None) -> RollResult:
+    def roll(
+        self,
+        count: int,
+        faces: Optional[int] = None,
+        advantage: Optional[bool] = None,
+        rng: Optional[Any] = None,
+    ) -> RollResult:
         """
         Бросок кубиков
         
@@ -60,6 +79,8 @@ class DiceRoller:
             faces: Количество граней (если не указано, используется default_faces)
             advantage: True = преимущество, False = помеха, None = обычный бросок
                       Применяется только если count=1
+            rng: Источник случайности с методом `randint(a, b)`, например поток игры
+                 из `dice_rng` (по умолчанию модуль `random`)
             
         Returns:
             RollResult с результатами броска
@@ -94,8 +115,8 @@ class DiceRoller:
         
         if advantage is not None and count == 1:
             # Бросаем два кубика
-            roll1 = DieRoll(die_id="d1", value=self._generate_roll(actual_faces))
-            roll2 = DieRoll(die_id="d2", value=self._generate_roll(actual_faces))
+            roll1 = DieRoll(die_id="d1", value=self._generate_roll(actual_faces, rng))
+            roll2 = DieRoll(die_id="d2", value=self._generate_roll(actual_faces, rng))
             advantage_rolls = [roll1, roll2]
             
             if advantage:  # Преимущество - выбираем максимальное
@@ -112,7 +133,7 @@ class DiceRoller:
             # Обычный бросок
             rolls: List[DieRoll] = []
             for i in range(count):
-                value = self._generate_roll(actual_faces)
+                value = self._generate_roll(actual_faces, rng)
                 rolls.append(DieRoll(
                     die_id=f"d{i + 1}",
                     value=value
@@ -129,17 +150,45 @@ class DiceRoller:
             advantage_type=advantage_type
         )
     
-    def _generate_roll(self, faces: int) -> int:
+    def roll_batch(
+        self,
+        expression: str,
+        rolls: int,
+        advantage: Optional[bool] = None,
+        rng: Optional[Any] = None,
+    ):
+        """
+        Пакетный бросок: `rolls` независимых бросков выражения одним вызовом NumPy
+
+        В отличие от `roll`, ограничение `max_dice` не действует — пакет ограничен
+        лимитами `dice_batch` (число бросков и общее число кубиков).
+
+        Args:
+            expression: Выражение кубиков, например `1d20+5` или `4d6kh3`
+            rolls: Количество бросков в пакете
+            advantage: True = преимущество, False = помеха, None = обычный бросок
+            rng: `numpy.random.Generator` (по умолчанию — новый генератор)
+
+        Returns:
+            numpy-массив сумм длины `rolls`
+
+        Raises:
+            ValueError: Если выражение или размер пакета невалидны
+        """
+        return roll_plan_batch(compile_expression(expression, advantage), rolls, rng)
+
+    def _generate_roll(self, faces: int, rng: Optional[Any] = None) -> int:
         """
         Генерация случайного значения для одного кубика
         
         Args:
             faces: Количество граней
+            rng: Источник случайности (по умолчанию модуль `random`)
             
         Returns:
             Случайное значение от 1 до faces (включительно)
         """
-        return random.randint(1, faces)
+        return (rng or random).randint(1, faces)
     
     def to_dict(self, result: RollResult) -> Dict:
         """
@@ -190,23 +239,180 @@ def get_ability_modifier(ability_score: int) -> int:
     return (ability_score - 10) // 2
 
 
+# Шаблоны бросков: файл проверяется не чаще раза в TEMPLATES_CHECK_INTERVAL секунд
+TEMPLATES_PATH = Path(__file__).parent.parent.parent / "data" / "dice_templates.json"
+TEMPLATES_CHECK_INTERVAL = 1.0
+
+
+@dataclass(frozen=True)
+class DiceTemplate:
+    """Проверенный шаблон броска"""
+    name: str
+    label: str
+    count: int
+    faces: int
+    roll_type: str
+    modifier_source: Optional[str]
+
+    @classmethod
+    def from_dict(cls, name: str, data: Any) -> "DiceTemplate":
+        """
+        Raises:
+            ValueError: Если шаблон некорректен
+        """
+        if not isinstance(data, dict):
+            raise ValueError(f"Шаблон '{name}': ожидается объект")
+        count, faces = data.get("count"), data.get("faces")
+        if not isinstance(count, int) or not isinstance(faces, int) or count < 1 or faces < 2:
+            raise ValueError(f"Шаблон '{name}': некорректные count/faces")
+        roll_type = data.get("roll_type")
+        if not isinstance(roll_type, str) or not roll_type:
+            raise ValueError(f"Шаблон '{name}': не указан roll_type")
+        modifier_source = data.get("modifier_source")
+        if modifier_source is not None and not isinstance(modifier_source, str):
+            raise ValueError(f"Шаблон '{name}': modifier_source должен быть строкой")
+        # Те же пределы числа кубиков и граней, что и у выражений бросков
+        compile_expression(f"{count}d{faces}")
+        return cls(
+            name=name,
+            label=str(data.get("label", name)),
+            count=count,
+            faces=faces,
+            roll_type=roll_type,
+            modifier_source=modifier_source,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Шаблон в формате JSON файла"""
+        data = {"label": self.label, "count": self.count, "faces": self.faces, "roll_type": self.roll_type}
+        if self.modifier_source is not None:
+            data["modifier_source"] = self.modifier_source
+        return data
+
+
+class DiceTemplateStore:
+    """
+    Шаблоны бросков в памяти с перезагрузкой при изменении файла
+
+    Изменение определяется по (mtime, size) и подтверждается хэшем содержимого.
+    Если новый файл некорректен, остаются последние валидные шаблоны.
+    Результаты `apply` кэшируются по (шаблон, значение характеристики): любое
+    изменение характеристики персонажа дает новый ключ, поэтому отдельная
+    инвалидация при редактировании персонажа не нужна.
+    """
+
+    def __init__(self, path: Path = TEMPLATES_PATH, check_interval: float = TEMPLATES_CHECK_INTERVAL):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self.version = 0
+        self.loads = 0
+        self._templates: Dict[str, DiceTemplate] = {}
+        self._raw: Dict[str, Dict[str, Any]] = {}
+        self._stat: Optional[tuple] = None
+        self._digest: Optional[str] = None
+        self._checked_at: Optional[float] = None
+        self._applied: Dict[tuple, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                st = self.path.stat()
+            except FileNotFoundError:
+                if self._stat is not None or self.version == 0:
+                    self._replace({}, None, None)
+                return
+            stat_key = (st.st_mtime_ns, st.st_size)
+            if stat_key == self._stat:
+                return
+            content = self.path.read_bytes()
+            digest = hashlib.sha256(content).hexdigest()
+            if digest == self._digest:
+                # Файл «тронут», но содержимое то же
+                self._stat = stat_key
+                return
+            try:
+                raw = json.loads(content)
+                if not isinstance(raw, dict):
+                    raise ValueError("ожидается объект шаблонов")
+                templates = {name: DiceTemplate.from_dict(name, data) for name, data in raw.items()}
+            except ValueError as e:
+                logger.error("Шаблоны бросков %s не загружены: %s", self.path, e)
+                self._stat, self._digest = stat_key, digest
+                return
+            self._replace(templates, stat_key, digest)
+
+    def _replace(self, templates: Dict[str, DiceTemplate], stat_key: Optional[tuple], digest: Optional[str]) -> None:
+        self._templates = templates
+        self._raw = {name: template.to_dict() for name, template in templates.items()}
+        self._applied = {}
+        self._stat, self._digest = stat_key, digest
+        self.version += 1
+        self.loads += 1
+
+    def templates(self) -> Dict[str, DiceTemplate]:
+        self._refresh()
+        return self._templates
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        """Шаблоны в формате JSON файла (общий объект, не изменять)"""
+        self._refresh()
+        return self._raw
+
+    def get(self, name: str) -> DiceTemplate:
+        """
+        Raises:
+            ValueError: Если шаблон не найден
+        """
+        template = self.templates().get(name)
+        if template is None:
+            raise ValueError(f"Шаблон '{name}' не найден")
+        return template
+
+    def apply(self, name: str, character: Optional[Any] = None) -> Dict[str, Any]:
+        template = self.get(name)
+        score = None
+        if template.modifier_source is not None and character:
+            if not hasattr(character, template.modifier_source):
+                raise ValueError(f"У персонажа отсутствует характеристика '{template.modifier_source}'")
+            score = getattr(character, template.modifier_source)
+
+        key = (name, score)
+        result = self._applied.get(key)
+        if result is None:
+            result = {
+                "count": template.count,
+                "faces": template.faces,
+                "roll_type": template.roll_type,
+                "modifier": None if score is None else get_ability_modifier(score),
+            }
+            self._applied[key] = result
+        return dict(result)
+
+
+_template_store: Optional[DiceTemplateStore] = None
+
+
+def get_template_store() -> DiceTemplateStore:
+    """Получение (ленивое создание) хранилища шаблонов"""
+    global _template_store
+    if _template_store is None:
+        _template_store = DiceTemplateStore()
+    return _template_store
+
+
 def get_templates() -> Dict[str, Dict[str, Any]]:
     """
-    Загрузка шаблонов бросков из JSON файла
+    Шаблоны бросков из JSON файла (из кэша, файл перечитывается только при изменении)
     
     Returns:
         Словарь шаблонов, где ключ - имя шаблона, значение - данные шаблона
     """
-    # Путь к файлу с шаблонами
-    base_dir = Path(__file__).parent.parent.parent
-    templates_path = base_dir / "data" / "dice_templates.json"
-    
-    if not templates_path.exists():
-        # Если файл не найден, возвращаем пустой словарь
-        return {}
-    
-    with open(templates_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return get_template_store().as_dict()
 
 
 def apply_template(template_name: str, character: Optional[Any] = None) -> Dict[str, Any]:
@@ -227,31 +433,7 @@ def apply_template(template_name: str, character: Optional[Any] = None) -> Dict[
     Raises:
         ValueError: Если шаблон не найден или у персонажа нет требуемой характеристики
     """
-    templates = get_templates()
-    
-    if template_name not in templates:
-        raise ValueError(f"Шаблон '{template_name}' не найден")
-    
-    template = templates[template_name]
-    result = {
-        "count": template["count"],
-        "faces": template["faces"],
-        "roll_type": template["roll_type"],
-        "modifier": None
-    }
-    
-    # Если указан источник модификатора и есть персонаж, рассчитываем модификатор
-    if "modifier_source" in template and character:
-        ability_name = template["modifier_source"]
-        
-        # Получаем значение характеристики из персонажа
-        if hasattr(character, ability_name):
-            ability_score = getattr(character, ability_name)
-            result["modifier"] = get_ability_modifier(ability_score)
-        else:
-            raise ValueError(f"У персонажа отсутствует характеристика '{ability_name}'")
-    
-    return result
+    return get_template_store().apply(template_name, character)
 
 
 def save_roll_history(
@@ -302,7 +484,227 @@ def save_roll_history(
         selected_roll=selected_roll
     )
     db.add(history_entry)
+    record_roll_stats(db, [history_entry])
     db.commit()
     db.refresh(history_entry)
     return history_entry
 
+
+def make_roll_history_row(
+    game_id: UUID,
+    user_id: UUID,
+    count: int,
+    faces: int,
+    rolls: List[Dict],
+    total: int,
+    roll_type: Optional[str] = None,
+    modifier: Optional[int] = None,
+    advantage_type: Optional[str] = None,
+    advantage_rolls: Optional[List[Dict]] = None,
+    selected_roll: Optional[Dict] = None,
+    expression: Optional[str] = None,
+    rng_offset: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Строка истории броска для пакетной вставки
+
+    id и created_at назначаются сразу, в момент броска, а не при записи в БД:
+    отложенная вставка не меняет порядок истории.
+    """
+    return {
+        "id": uuid.uuid4(),
+        "game_id": game_id,
+        "user_id": user_id,
+        "count": count,
+        "faces": faces,
+        "rolls": rolls,
+        "total": total,
+        "roll_type": roll_type,
+        "modifier": modifier,
+        "advantage_type": advantage_type,
+        "advantage_rolls": advantage_rolls,
+        "selected_roll": selected_roll,
+        "expression": expression,
+        "rng_offset": rng_offset,
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+def save_roll_history_batch(db: Session, rows: List[Dict[str, Any]]) -> int:
+    """
+    Пакетное сохранение истории бросков одним INSERT (executemany) и одним commit
+
+    Агрегаты статистики (`dice_stats`) обновляются в той же транзакции.
+
+    Args:
+        db: Сессия базы данных
+        rows: Строки из make_roll_history_row
+
+    Returns:
+        Количество сохраненных записей
+    """
+    if not rows:
+        return 0
+    db.execute(insert(DiceRollHistory), rows)
+    record_roll_stats(db, rows)
+    db.commit()
+    return len(rows)
+
+
+def encode_history_cursor(entry: DiceRollHistory) -> str:
+    """Непрозрачный курсор истории: позиция записи (created_at, id)"""
+    payload = json.dumps({"t": entry.created_at.isoformat(), "id": str(entry.id)})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """
+    Raises:
+        ValueError: Если курсор поврежден
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(payload["t"]), UUID(payload["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("Некорректный курсор") from e
+
+
+def get_roll_history_page(
+    db: Session,
+    game_id: UUID,
+    limit: int,
+    cursor: Optional[str] = None,
+    user_id: Optional[UUID] = None,
+    roll_type: Optional[str] = None,
+    offset: int = 0
+) -> Tuple[List[DiceRollHistory], Optional[str]]:
+    """
+    Страница истории бросков (новые сначала)
+
+    С курсором используется keyset-условие (created_at, id) < курсора: стоимость
+    страницы не зависит от глубины, запрос идет по составному индексу
+    (game_id[, user_id | roll_type], created_at DESC, id DESC). `offset` оставлен
+    для старых клиентов и применяется только без курсора.
+
+    Returns:
+        (записи, курсор следующей страницы или None, если записей больше нет)
+
+    Raises:
+        ValueError: Если курсор поврежден
+    """
+    query = db.query(DiceRollHistory).filter(DiceRollHistory.game_id == game_id)
+    if user_id:
+        query = query.filter(DiceRollHistory.user_id == user_id)
+    if roll_type:
+        query = query.filter(DiceRollHistory.roll_type == roll_type)
+
+    if cursor:
+        created_at, entry_id = decode_history_cursor(cursor)
+        query = query.filter(
+            tuple_(DiceRollHistory.created_at, DiceRollHistory.id)
+            < tuple_(literal(created_at, DiceRollHistory.created_at.type), literal(entry_id, DiceRollHistory.id.type))
+        )
+    query = query.order_by(DiceRollHistory.created_at.desc(), DiceRollHistory.id.desc())
+    if offset and not cursor:
+        query = query.offset(offset)
+
+    # Одна лишняя запись показывает, есть ли следующая страница
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_history_cursor(rows[-1])
+
+
+def roll_group(
+    specs: List[Any],
+    roller: Optional[DiceRoller] = None,
+    rngs: Optional[List[Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Групповой бросок (например, скрытность для всех гоблинов)
+
+    Args:
+        specs: Описания бросков (`DiceRollSpec`): expression или count + faces,
+               advantage, modifier, roll_type, label
+        roller: DiceRoller для бросков без выражения
+        rngs: Генераторы по одному на бросок (поток игры из `dice_rng`);
+              номер броска в потоке попадает в `rng_offset`
+
+    Returns:
+        Результаты в порядке specs; `count`/`faces` для выражений — общее число
+        кубиков и грани первого терма (как в истории бросков)
+
+    Raises:
+        ValueError: Если какой-либо бросок невалиден (не выполняется ни один)
+    """
+    roller = roller or DiceRoller(default_faces=12, max_dice=10)
+    plans = []
+    for i, spec in enumerate(specs):
+        if spec.expression is None:
+            plans.append(None)
+            continue
+        try:
+            plan = compile_expression(spec.expression, spec.advantage)
+        except ValueError as e:
+            raise ValueError(f"Бросок {i + 1}: {e}")
+        if not plan.dice_terms:
+            raise ValueError(f"Бросок {i + 1}: выражение должно содержать кубики")
+        plans.append(plan)
+
+    entries = []
+    for i, (spec, plan) in enumerate(zip(specs, plans)):
+        rng = rngs[i] if rngs is not None else None
+        if plan is not None:
+            result_dict = plan.roll(rng).to_dict()
+            count, faces = plan.dice_count, plan.dice_terms[0].faces
+            if spec.advantage is not None:
+                result_dict["advantage_type"] = "advantage" if spec.advantage else "disadvantage"
+        else:
+            try:
+                result_dict = roller.to_dict(roller.roll(spec.count, spec.faces, spec.advantage, rng=rng))
+            except ValueError as e:
+                raise ValueError(f"Бросок {i + 1}: {e}")
+            count, faces = spec.count, spec.faces
+
+        if spec.modifier is not None:
+            result_dict["total"] = result_dict["total"] + spec.modifier
+
+        entries.append({
+            "label": spec.label,
+            "count": count,
+            "faces": faces,
+            "expression": result_dict.get("expression"),
+            "rolls": result_dict["rolls"],
+            "total": result_dict["total"],
+            "roll_type": spec.roll_type,
+            "modifier": spec.modifier,
+            "advantage_type": result_dict.get("advantage_type"),
+            "advantage_rolls": result_dict.get("advantage_rolls"),
+            "selected_roll": result_dict.get("selected_roll"),
+            "terms": result_dict.get("terms"),
+            "rng_offset": getattr(rng, "offset", None),
+        })
+    return entries
+
+
+def make_group_history_rows(game_id: UUID, user_id: UUID, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Строки истории для результатов roll_group (для одной пакетной вставки)"""
+    return [
+        make_roll_history_row(
+            game_id=game_id,
+            user_id=user_id,
+            count=entry["count"],
+            faces=entry["faces"],
+            rolls=entry["rolls"],
+            total=entry["total"],
+            roll_type=entry["roll_type"],
+            modifier=entry["modifier"],
+            advantage_type=entry["advantage_type"],
+            advantage_rolls=entry["advantage_rolls"],
+            selected_roll=entry["selected_roll"],
+            expression=entry["expression"],
+            rng_offset=entry["rng_offset"],
+        )
+        for entry in entries
+    ]
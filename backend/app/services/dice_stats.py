@@ -0,0 +1,269 @@
+"""
+Инкрементальная статистика бросков по играм и игрокам
+
+`record_roll_stats` вызывается из путей сохранения истории (`save_roll_history`,
+`save_roll_history_batch`) в той же транзакции: строки пакета сворачиваются в
+счетчики в памяти и применяются одним UPSERT на таблицу (`count = count + excluded.count`).
+
+Учитываются только решающие кубики (`rolls`): при преимуществе/помехе — выбранный.
+Для выражений со смешанными кубиками ("1d8+1d6") значения по граням не учитываются,
+так как в истории не хранится, какой кубик какой; сам бросок учитывается.
+
+`rebuild_roll_stats` пересчитывает агрегаты из истории потоково, пакетами `yield_per`.
+"""
+import logging
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import delete
+from sqlalchemy.orm import Session
+
+from ..models.dice_roll_history import DiceRollHistory
+from ..models.dice_roll_stats import DiceFaceStat, DiceRollStat
+from .dice_expression import DiceExpressionError, compile_expression
+
+logger = logging.getLogger(__name__)
+
+ROLL_TYPE_MAX_LENGTH = 50
+REBUILD_BATCH_SIZE = 5000
+
+
+class RollStatsCounter:
+    """Свертка строк истории в приращения счетчиков"""
+
+    def __init__(self):
+        self.rolls: Counter = Counter()
+        self.totals: Counter = Counter()
+        self.faces: Counter = Counter()
+
+    def add(self, row: Any) -> None:
+        get = row.get if isinstance(row, dict) else lambda name: getattr(row, name)
+        key = (get("game_id"), get("user_id"), normalize_roll_type(get("roll_type")))
+        self.rolls[key] += 1
+        total = get("total")
+        self.totals[key] += total if isinstance(total, int) else 0
+
+        faces = roll_faces(get("faces"), get("expression"))
+        if faces is None or faces < 2:
+            return
+        for die in get("rolls") or ():
+            value = die.get("value") if isinstance(die, dict) else None
+            if isinstance(value, int) and 1 <= value <= faces:
+                self.faces[key + (faces, value)] += 1
+
+    def flush(self, db: Session) -> None:
+        """Применение приращений (без commit) и очистка"""
+        if self.rolls:
+            _upsert_increment(db, DiceRollStat, [
+                {"game_id": g, "user_id": u, "roll_type": t, "rolls": n, "total_sum": self.totals[(g, u, t)]}
+                for (g, u, t), n in self.rolls.items()
+            ], ("rolls", "total_sum"))
+        if self.faces:
+            _upsert_increment(db, DiceFaceStat, [
+                {"game_id": g, "user_id": u, "roll_type": t, "faces": f, "value": v, "count": n}
+                for (g, u, t, f, v), n in self.faces.items()
+            ], ("count",))
+        self.rolls.clear()
+        self.totals.clear()
+        self.faces.clear()
+
+
+def normalize_roll_type(value: Any) -> str:
+    """Ключ типа проверки: строка не длиннее колонки, пустая строка — без типа
+
+    Счетчики пишутся в одной транзакции с историей, поэтому неожиданный тип
+    не должен приводить к ошибке и откату строк истории.
+    """
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        value = str(value)
+    return value[:ROLL_TYPE_MAX_LENGTH]
+
+
+def roll_faces(faces: Optional[int], expression: Optional[str]) -> Optional[int]:
+    """Число граней всех кубиков броска или None, если кубики разные"""
+    if not expression:
+        return faces
+    try:
+        kinds = {term.faces for term in compile_expression(expression).dice_terms}
+    except DiceExpressionError:
+        return None
+    return kinds.pop() if len(kinds) == 1 else None
+
+
+def _upsert_increment(db: Session, model, rows: List[Dict[str, Any]], counters: Tuple[str, ...]) -> None:
+    """INSERT ... ON CONFLICT DO UPDATE SET c = c + excluded.c (PostgreSQL/SQLite)"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        _merge_increment(db, model, rows, counters)
+        return
+
+    stmt = insert(model)
+    keys = [column.name for column in model.__table__.primary_key.columns]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={name: getattr(model, name) + getattr(stmt.excluded, name) for name in counters}
+    )
+    db.execute(stmt, rows)
+
+
+def _merge_increment(db: Session, model, rows: List[Dict[str, Any]], counters: Tuple[str, ...]) -> None:
+    """Запасной путь для СУБД без ON CONFLICT: чтение и обновление по ключу"""
+    keys = [column.name for column in model.__table__.primary_key.columns]
+    for row in rows:
+        existing = db.get(model, tuple(row[k] for k in keys))
+        if existing is None:
+            db.add(model(**row))
+        else:
+            for name in counters:
+                setattr(existing, name, getattr(existing, name) + row[name])
+    db.flush()
+
+
+def record_roll_stats(db: Session, rows: Iterable[Any]) -> None:
+    """
+    Учет сохраняемых строк истории в агрегатах (без commit)
+
+    Args:
+        rows: Словари из `make_roll_history_row` или объекты `DiceRollHistory`
+    """
+    counter = RollStatsCounter()
+    for row in rows:
+        counter.add(row)
+    counter.flush(db)
+
+
+def rebuild_roll_stats(db: Session, game_id: Optional[UUID] = None, batch_size: int = REBUILD_BATCH_SIZE) -> int:
+    """
+    Пересчет агрегатов из истории (одной игры или всех)
+
+    История читается потоково (`yield_per`), приращения сбрасываются в БД каждые
+    `batch_size` строк, поэтому память не зависит от размера истории.
+    Удаление и пересчет выполняются в одной транзакции.
+
+    Returns:
+        Количество учтенных строк истории
+    """
+    for model in (DiceRollStat, DiceFaceStat):
+        stmt = delete(model)
+        if game_id is not None:
+            stmt = stmt.where(model.game_id == game_id)
+        db.execute(stmt)
+
+    query = db.query(
+        DiceRollHistory.game_id,
+        DiceRollHistory.user_id,
+        DiceRollHistory.roll_type,
+        DiceRollHistory.faces,
+        DiceRollHistory.expression,
+        DiceRollHistory.rolls,
+        DiceRollHistory.total,
+    )
+    if game_id is not None:
+        query = query.filter(DiceRollHistory.game_id == game_id)
+
+    counter = RollStatsCounter()
+    processed = 0
+    for row in query.yield_per(batch_size):
+        counter.add(row)
+        processed += 1
+        if processed % batch_size == 0:
+            counter.flush(db)
+    counter.flush(db)
+    db.commit()
+    logger.info(f"Rebuilt dice stats from {processed} history rows")
+    return processed
+
+
+def _face_summary(faces: int, frequencies: Dict[int, int]) -> Dict[str, Any]:
+    count = sum(frequencies.values())
+    total = sum(value * n for value, n in frequencies.items())
+    return {
+        "faces": faces,
+        "count": count,
+        "mean": total / count if count else None,
+        "expected_mean": (faces + 1) / 2,
+        "max_rate": frequencies.get(faces, 0) / count if count else None,
+        "min_rate": frequencies.get(1, 0) / count if count else None,
+        "frequencies": [frequencies.get(value, 0) for value in range(1, faces + 1)],
+    }
+
+
+def _luck(by_faces: Dict[int, Dict[int, int]]) -> Optional[float]:
+    """
+    Удача: среднее нормированное отклонение кубика от ожидания, от -1 (всегда 1)
+    до +1 (всегда максимум); 0 — ровно как ожидается
+    """
+    deviation, dice = 0.0, 0
+    for faces, frequencies in by_faces.items():
+        half_range = (faces - 1) / 2
+        for value, n in frequencies.items():
+            deviation += n * (value - (faces + 1) / 2) / half_range
+            dice += n
+    return deviation / dice if dice else None
+
+
+def get_game_dice_stats(db: Session, game_id: UUID) -> Dict[str, Any]:
+    """
+    Статистика бросков игры из агрегатов
+
+    Returns:
+        {"game_id", "total_rolls", "total_dice", "nat20_rate", "nat1_rate",
+         "dice": [по граням], "users": [по игрокам], "roll_types": [по типам проверок]}
+    """
+    roll_rows = db.query(DiceRollStat).filter(DiceRollStat.game_id == game_id).all()
+    face_rows = db.query(DiceFaceStat).filter(DiceFaceStat.game_id == game_id).all()
+
+    # faces -> value -> count в трех разрезах
+    game_faces: Dict[int, Counter] = {}
+    user_faces: Dict[UUID, Dict[int, Counter]] = {}
+    type_faces: Dict[str, Dict[int, Counter]] = {}
+    for row in face_rows:
+        game_faces.setdefault(row.faces, Counter())[row.value] += row.count
+        user_faces.setdefault(row.user_id, {}).setdefault(row.faces, Counter())[row.value] += row.count
+        type_faces.setdefault(row.roll_type, {}).setdefault(row.faces, Counter())[row.value] += row.count
+
+    user_rolls: Counter = Counter()
+    type_rolls: Counter = Counter()
+    type_totals: Counter = Counter()
+    for row in roll_rows:
+        user_rolls[row.user_id] += row.rolls
+        type_rolls[row.roll_type] += row.rolls
+        type_totals[row.roll_type] += row.total_sum
+
+    d20 = _face_summary(20, game_faces.get(20, {}))
+    return {
+        "game_id": game_id,
+        "total_rolls": sum(user_rolls.values()),
+        "total_dice": sum(sum(f.values()) for f in game_faces.values()),
+        "nat20_rate": d20["max_rate"],
+        "nat1_rate": d20["min_rate"],
+        "dice": [_face_summary(faces, game_faces[faces]) for faces in sorted(game_faces)],
+        "users": [
+            {
+                "user_id": user_id,
+                "rolls": rolls,
+                "dice": sum(sum(f.values()) for f in user_faces.get(user_id, {}).values()),
+                "luck": _luck(user_faces.get(user_id, {})),
+            }
+            for user_id, rolls in user_rolls.most_common()
+        ],
+        "roll_types": [
+            {
+                "roll_type": roll_type or None,
+                "rolls": rolls,
+                "mean_total": type_totals[roll_type] / rolls,
+                "dice": [
+                    _face_summary(faces, frequencies)
+                    for faces, frequencies in sorted(type_faces.get(roll_type, {}).items())
+                ],
+            }
+            for roll_type, rolls in type_rolls.most_common()
+        ],
+    }
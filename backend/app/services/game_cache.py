@@ -0,0 +1,349 @@
+"""
+Кэш состояния игры в Redis
+
+- `game:{id}:tokens` — хэш токенов (включая скрытые), обновляется точечно при каждом изменении;
+  поле-маркер `CACHED_MARKER_FIELD` есть всегда, поэтому игра без токенов тоже кэшируется
+- `game:{id}:tokens_version` — счетчик точечных записей и удалений токенов: перестройка хэша
+  из БД записывается, только если хэша все еще нет и счетчик не изменился с момента,
+  предшествующего чтению БД (иначе прочитанный список мог устареть)
+- `game:{id}:snapshot` — метаданные игры и список игроков с номером версии
+- `game:{id}:version` — счетчик версии, увеличивается при любом изменении участников/игры
+- `game:{id}:members` — роли участников для авторизации событий сокетов
+  (запись помечена версией, при которой роль была прочитана из БД, и живет
+  не дольше `MEMBER_ROLE_TTL`)
+- `game:{id}:positions` — живые позиции перетаскиваемых токенов, еще не сохраненные в БД
+  (write-behind, см. `position_buffer.py`); при чтении накладываются поверх токенов
+
+Снимок считается актуальным, только если его версия совпадает с текущим счетчиком.
+Это защищает от записи устаревшего снимка, собранного параллельно с изменением.
+"""
+import json
+import logging
+import time
+from typing import Callable, Iterable, Optional
+from uuid import UUID
+from redis.exceptions import RedisError
+from ..models.token import Token
+from ..redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+GAME_STATE_TTL = 86400
+# Срок доверия к закэшированной роли: если инвалидация не дошла до Redis
+# (например, после передачи мастера), устаревшая роль действует не дольше этого
+MEMBER_ROLE_TTL = 60
+# Поле хэша токенов, отличающее закэшированную игру без токенов от отсутствующего кэша
+CACHED_MARKER_FIELD = "__cached__"
+
+
+def _tokens_key(game_id: UUID) -> str:
+    return f"game:{game_id}:tokens"
+
+
+def _snapshot_key(game_id: UUID) -> str:
+    return f"game:{game_id}:snapshot"
+
+
+def _version_key(game_id: UUID) -> str:
+    return f"game:{game_id}:version"
+
+
+def _tokens_version_key(game_id: UUID) -> str:
+    return f"game:{game_id}:tokens_version"
+
+
+def _positions_key(game_id: UUID) -> str:
+    return f"game:{game_id}:positions"
+
+
+def _members_key(game_id: UUID) -> str:
+    return f"game:{game_id}:members"
+
+
+def serialize_token(token: Token) -> dict:
+    """Представление токена в кэше"""
+    return {
+        "id": str(token.id),
+        "name": token.name,
+        "x": token.x,
+        "y": token.y,
+        "image_url": token.image_url,
+        "is_hidden": token.is_hidden,
+        "token_type": token.token_type,
+        "token_metadata": token.token_metadata,
+    }
+
+
+# Перестройка хэша токенов из БД. KEYS[1] — хэш токенов, KEYS[2] — счетчик записей токенов;
+# ARGV[1] — значение счетчика до чтения БД, ARGV[2] — TTL, далее пары id/токен (с маркером).
+# Ничего не пишет, если хэш уже построен или после чтения БД токены менялись. Возвращает 1/0.
+REBUILD_TOKENS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+if tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+def save_game_state_to_redis(game_id: UUID, tokens: Iterable[Token], tokens_version: int) -> bool:
+    """
+    Запись токенов игры, прочитанных из БД, в отсутствующий хэш (холодный старт)
+
+    Args:
+        tokens_version: Значение счетчика записей токенов, прочитанное до запроса к БД
+
+    Returns:
+        True, если хэш записан; False, если он уже есть или токены успели измениться
+    """
+    args = [tokens_version, GAME_STATE_TTL, CACHED_MARKER_FIELD, "1"]
+    for token in tokens:
+        args += [str(token.id), json.dumps(serialize_token(token))]
+    try:
+        return bool(redis_client.eval(
+            REBUILD_TOKENS_SCRIPT, 2, _tokens_key(game_id), _tokens_version_key(game_id), *args
+        ))
+    except RedisError as e:
+        logger.warning(f"Failed to save game {game_id} tokens to Redis: {e}")
+        return False
+
+
+# Точечная запись токенов только в существующий хэш: на холодном кэше HSET создал бы
+# хэш из одного токена, и параллельный `get_game_state` отдал бы неполный список.
+# KEYS[1] — хэш токенов, KEYS[2] — живые позиции, KEYS[3] — счетчик записей токенов;
+# ARGV[1] — TTL, далее пары id/токен.
+# Возвращает {1, версия}, если хэш обновлен, и {0, версия}, если хэша нет
+# (его нужно построить заново целиком с этой версией).
+UPDATE_TOKENS_SCRIPT = """
+for i = 2, #ARGV, 2 do
+    redis.call('HDEL', KEYS[2], ARGV[i])
+end
+local version = redis.call('INCR', KEYS[3])
+redis.call('EXPIRE', KEYS[3], ARGV[1])
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {0, version}
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return {1, version}
+"""
+
+
+def update_token_in_redis(game_id: UUID, token: Token, load_tokens: Callable[[], Iterable[Token]]) -> None:
+    """
+    Точечное обновление одного токена (HSET одного поля) за один round trip
+
+    Если хэша игры еще нет (холодный старт или истек TTL), он строится заново
+    из `load_tokens()` — только в этом случае выполняется запрос всех токенов.
+    """
+    update_tokens_in_redis(game_id, [serialize_token(token)], load_tokens)
+
+
+def update_tokens_in_redis(game_id: UUID, payloads: list[dict], load_tokens: Callable[[], Iterable[Token]]) -> None:
+    """
+    Точечное обновление нескольких токенов одним скриптом (один round trip)
+
+    `payloads` — уже сериализованные токены (`serialize_token`). Проверка наличия
+    хэша и запись атомарны; если хэша нет, он целиком строится из `load_tokens()`
+    (запись вызывается после commit, поэтому прочитанный список уже содержит изменение).
+    """
+    if not payloads:
+        return
+    args = [GAME_STATE_TTL]
+    for payload in payloads:
+        args += [payload["id"], json.dumps(payload)]
+    try:
+        existed, version = redis_client.eval(
+            UPDATE_TOKENS_SCRIPT, 3,
+            _tokens_key(game_id), _positions_key(game_id), _tokens_version_key(game_id), *args
+        )
+    except RedisError as e:
+        logger.warning(f"Failed to update tokens of game {game_id} in Redis: {e}")
+        return
+
+    if not existed:
+        save_game_state_to_redis(game_id, load_tokens(), int(version))
+
+
+def remove_token_from_redis(game_id: UUID, token_id: UUID) -> None:
+    """Удаление одного токена из кэша (HDEL); счетчик записей отменяет перестройку по старому списку"""
+    try:
+        with redis_client.pipeline(transaction=False) as pipe:
+            pipe.hdel(_tokens_key(game_id), str(token_id))
+            pipe.hdel(_positions_key(game_id), str(token_id))
+            pipe.incr(_tokens_version_key(game_id))
+            pipe.expire(_tokens_version_key(game_id), GAME_STATE_TTL)
+            pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Failed to remove token {token_id} from Redis: {e}")
+
+
+# Живые позиции принимаются только для токенов из хэша игры: клиент не может
+# разослать перемещение чужого или несуществующего токена.
+# KEYS[1] — хэш токенов, KEYS[2] — живые позиции; ARGV[1] — TTL, далее пары id/позиция.
+# Возвращает id записанных токенов или nil, если хэша токенов нет.
+STAGE_POSITIONS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+local staged = {}
+for i = 2, #ARGV, 2 do
+    if redis.call('HEXISTS', KEYS[1], ARGV[i]) == 1 then
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+        staged[#staged + 1] = ARGV[i]
+    end
+end
+if #staged > 0 then
+    redis.call('EXPIRE', KEYS[2], ARGV[1])
+end
+return staged
+"""
+
+
+def set_live_positions_in_redis(
+    game_id: UUID,
+    positions: dict[UUID, tuple[float, float]],
+    load_token_ids: Callable[[list[UUID]], Iterable[UUID]],
+) -> list[UUID]:
+    """
+    Запись живых позиций токенов игры за один round trip, без чтения самих токенов
+
+    Принадлежность токенов игре проверяется в том же скрипте по хэшу токенов.
+    Если хэша нет или Redis недоступен, она проверяется через `load_token_ids(ids)`.
+
+    Returns:
+        id токенов этой игры, позиции которых приняты
+    """
+    if not positions:
+        return []
+    args = [GAME_STATE_TTL]
+    for token_id, xy in positions.items():
+        args += [str(token_id), json.dumps(list(xy))]
+    try:
+        staged = redis_client.eval(STAGE_POSITIONS_SCRIPT, 2, _tokens_key(game_id), _positions_key(game_id), *args)
+    except RedisError as e:
+        logger.warning(f"Failed to save live token positions of game {game_id} to Redis: {e}")
+        owned = set(load_token_ids(list(positions)))
+        return [token_id for token_id in positions if token_id in owned]
+    if staged is not None:
+        return [UUID(token_id) for token_id in staged]
+
+    owned = set(load_token_ids(list(positions)))
+    mapping = {str(token_id): json.dumps(list(xy)) for token_id, xy in positions.items() if token_id in owned}
+    if mapping:
+        positions_key = _positions_key(game_id)
+        try:
+            with redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(positions_key, mapping=mapping)
+                pipe.expire(positions_key, GAME_STATE_TTL)
+                pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Failed to save live token positions of game {game_id} to Redis: {e}")
+    return [token_id for token_id in positions if token_id in owned]
+
+
+def apply_positions(tokens: list[dict], positions: dict[str, tuple[float, float]]) -> list[dict]:
+    """Наложение живых позиций на сериализованные токены"""
+    if not positions:
+        return tokens
+    result = []
+    for token in tokens:
+        position = positions.get(token["id"])
+        if position is not None:
+            token = {**token, "x": position[0], "y": position[1]}
+        result.append(token)
+    return result
+
+
+def invalidate_game_state(game_id: UUID) -> None:
+    """Сброс снимка игры и кэша ролей после изменения участников или метаданных игры"""
+    try:
+        with redis_client.pipeline(transaction=True) as pipe:
+            pipe.incr(_version_key(game_id))
+            pipe.expire(_version_key(game_id), GAME_STATE_TTL)
+            pipe.delete(_snapshot_key(game_id), _members_key(game_id))
+            pipe.execute()
+    except RedisError as e:
+        logger.error(
+            f"Failed to invalidate game {game_id} state in Redis: {e}; "
+            f"cached roles may stay stale for up to {MEMBER_ROLE_TTL}s"
+        )
+
+
+def read_game_snapshot(game_id: UUID) -> tuple[Optional[dict], list[dict] | None, dict, int, int]:
+    """
+    Чтение снимка игры, токенов и живых позиций за один round trip
+
+    Returns:
+        (снимок или None, если он отсутствует/устарел; токены или None;
+         живые позиции {token_id: (x, y)}; текущая версия; счетчик записей токенов
+         для `save_game_state_to_redis`)
+    """
+    with redis_client.pipeline(transaction=False) as pipe:
+        pipe.get(_version_key(game_id))
+        pipe.get(_tokens_version_key(game_id))
+        pipe.get(_snapshot_key(game_id))
+        pipe.hgetall(_tokens_key(game_id))
+        pipe.hgetall(_positions_key(game_id))
+        version_raw, tokens_version_raw, snapshot_raw, tokens_raw, positions_raw = pipe.execute()
+
+    version = int(version_raw or 0)
+    snapshot = json.loads(snapshot_raw) if snapshot_raw else None
+    if snapshot is not None and snapshot.get("version") != version:
+        snapshot = None
+    tokens = None
+    if tokens_raw:
+        tokens = [json.loads(t) for field, t in tokens_raw.items() if field != CACHED_MARKER_FIELD]
+    positions = {token_id: tuple(json.loads(p)) for token_id, p in (positions_raw or {}).items()}
+    return snapshot, tokens, positions, version, int(tokens_version_raw or 0)
+
+
+def write_game_snapshot(game_id: UUID, version: int, game: dict, players: list[dict]) -> None:
+    """Сохранение снимка, собранного из БД при версии `version`"""
+    snapshot = {"version": version, "game": game, "players": players}
+    try:
+        redis_client.set(_snapshot_key(game_id), json.dumps(snapshot), ex=GAME_STATE_TTL)
+    except RedisError as e:
+        logger.warning(f"Failed to save game {game_id} snapshot to Redis: {e}")
+
+
+def get_member_role(game_id: UUID, user_id: UUID, load_role: Callable[[], Optional[str]]) -> Optional[str]:
+    """
+    Роль пользователя в игре (None — не участник) с кэшем в Redis
+
+    В установившемся режиме — один round trip без запросов к БД. При промахе роль
+    читается через `load_role()` и запоминается с версией, прочитанной до запроса:
+    если параллельно случилась инвалидация, такая запись просто не совпадет по версии.
+    Запись старше `MEMBER_ROLE_TTL` перечитывается, даже если версия совпадает.
+    """
+    version = None
+    try:
+        with redis_client.pipeline(transaction=False) as pipe:
+            pipe.get(_version_key(game_id))
+            pipe.hget(_members_key(game_id), str(user_id))
+            version_raw, entry_raw = pipe.execute()
+        version = int(version_raw or 0)
+        if entry_raw:
+            entry = json.loads(entry_raw)
+            if entry["version"] == version and entry.get("expires_at", 0) > time.time():
+                return entry["role"]
+    except RedisError as e:
+        logger.warning(f"Failed to read member role for game {game_id} from Redis: {e}")
+
+    role = load_role()
+    if role is not None and version is not None:
+        members_key = _members_key(game_id)
+        try:
+            with redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(members_key, str(user_id), json.dumps({
+                    "version": version, "role": role, "expires_at": time.time() + MEMBER_ROLE_TTL,
+                }))
+                pipe.expire(members_key, GAME_STATE_TTL)
+                pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Failed to save member role for game {game_id} to Redis: {e}")
+    return role
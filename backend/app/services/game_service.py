@@ -1,5 +1,6 @@
 import string
 import random
+from sqlalchemy import case, update
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
 from uuid import UUID
@@ -9,6 +10,16 @@ from ..models.token import Token
 from ..models.inventory import CharacterInventory
 from ..schemas.game import GameCreate
 from ..schemas.token import TokenCreate, TokenUpdate
+from .dice_rng import new_seed, seed_commitment
+from .game_cache import (
+    update_token_in_redis,
+    update_tokens_in_redis,
+    set_live_positions_in_redis,
+    remove_token_from_redis,
+    invalidate_game_state,
+    serialize_token,
+)
+from .position_buffer import get_position_buffer
 
 
 def generate_invite_code(length: int = 6) -> str:
@@ -24,13 +35,16 @@ def create_game(db: Session, game_data: GameCreate, master_id: UUID) -> GameSess
     while db.query(GameSession).filter(GameSession.invite_code == invite_code).first():
         invite_code = generate_invite_code()
     
-    # Создаем игру
+    # Создаем игру; хэш seed потока бросков публикуется сразу, до первого броска
+    dice_seed = new_seed()
     game = GameSession(
         name=game_data.name,
         invite_code=invite_code,
         master_id=master_id,
         story=game_data.story,
-        map_url=game_data.map_url
+        map_url=game_data.map_url,
+        dice_seed=dice_seed,
+        dice_seed_commitment=seed_commitment(dice_seed)
     )
     db.add(game)
     db.flush()
@@ -91,6 +105,7 @@ def join_game(db: Session, game_id: UUID, user_id: UUID) -> GameSession:
     db.add(participant)
     db.commit()
     db.refresh(game)
+    invalidate_game_state(game_id)
     return game
 
 
@@ -128,6 +143,7 @@ def create_token(db: Session, game_id: UUID, token_data: TokenCreate) -> Token:
     db.add(token)
     db.commit()
     db.refresh(token)
+    update_token_in_redis(game_id, token, lambda: get_game_tokens(db, game_id))
     return token
 
 
@@ -143,10 +159,73 @@ def update_token_position(db: Session, token_id: UUID, token_data: TokenUpdate)
     token.x = token_data.x
     token.y = token_data.y
     db.commit()
+    get_position_buffer().discard(token_id)
     db.refresh(token)
+    update_token_in_redis(token.game_id, token, lambda: get_game_tokens(db, token.game_id))
     return token
 
 
+def update_token_positions(db: Session, game_id: UUID, positions: dict[UUID, tuple[float, float]]) -> list[UUID]:
+    """
+    Пакетное обновление позиций токенов игры одной транзакцией
+
+    Отсутствующие (удаленные) токены пропускаются. Возвращает id обновленных токенов.
+    """
+    if not positions:
+        return []
+    tokens = db.query(Token).filter(
+        Token.game_id == game_id,
+        Token.id.in_(list(positions))
+    ).all()
+    for token in tokens:
+        token.x, token.y = positions[token.id]
+    updated_ids = [token.id for token in tokens]
+    payloads = [serialize_token(token) for token in tokens]
+    db.commit()
+    update_tokens_in_redis(game_id, payloads, lambda: get_game_tokens(db, game_id))
+    return updated_ids
+
+
+def get_game_token_ids(db: Session, game_id: UUID, token_ids: list[UUID]) -> list[UUID]:
+    """Токены из `token_ids`, принадлежащие игре"""
+    if not token_ids:
+        return []
+    rows = db.query(Token.id).filter(Token.game_id == game_id, Token.id.in_(token_ids)).all()
+    return [row.id for row in rows]
+
+
+def stage_token_positions(db: Session, game_id: UUID, positions: dict[UUID, tuple[float, float]]) -> list[UUID]:
+    """
+    Живые позиции токенов игры (write-behind) без записи в БД
+
+    Токены других игр и несуществующие пропускаются. Возвращает id принятых токенов.
+    """
+    return set_live_positions_in_redis(
+        game_id, positions, lambda token_ids: get_game_token_ids(db, game_id, token_ids)
+    )
+
+
+def persist_token_positions(db: Session, game_id: UUID, positions: dict[UUID, tuple[float, float]]) -> int:
+    """
+    Сохранение позиций из write-behind буфера одним UPDATE ... CASE по id
+
+    Кэш Redis не трогается: живые позиции там уже записаны. Возвращает число строк.
+    """
+    if not positions:
+        return 0
+    token_ids = list(positions)
+    stmt = update(Token).where(
+        Token.game_id == game_id,
+        Token.id.in_(token_ids)
+    ).values(
+        x=case(*[(Token.id == token_id, xy[0]) for token_id, xy in positions.items()], else_=Token.x),
+        y=case(*[(Token.id == token_id, xy[1]) for token_id, xy in positions.items()], else_=Token.y),
+    ).execution_options(synchronize_session=False)
+    result = db.execute(stmt)
+    db.commit()
+    return result.rowcount
+
+
 def delete_token(db: Session, token_id: UUID) -> None:
     """Удаление токена"""
     token = db.query(Token).filter(Token.id == token_id).first()
@@ -155,8 +234,11 @@ def delete_token(db: Session, token_id: UUID) -> None:
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Token not found"
         )
+    game_id = token.game_id
     db.delete(token)
     db.commit()
+    get_position_buffer().discard(token_id)
+    remove_token_from_redis(game_id, token_id)
 
 
 def get_game_tokens(db: Session, game_id: UUID, include_hidden: bool = True) -> list[Token]:
@@ -175,6 +257,7 @@ def reveal_token(db: Session, token_id: UUID, game_id: UUID) -> Token:
     token.is_hidden = False
     db.commit()
     db.refresh(token)
+    update_token_in_redis(game_id, token, lambda: get_game_tokens(db, game_id))
     return token
 
 
@@ -215,6 +298,7 @@ def set_participant_ready(db: Session, game_id: UUID, user_id: UUID, is_ready: b
     participant.is_ready = is_ready
     db.commit()
     db.refresh(participant)
+    invalidate_game_state(game_id)
     return participant
 
 
@@ -234,30 +318,40 @@ def set_participant_character(db: Session, game_id: UUID, user_id: UUID, charact
     participant.character_id = character_id
     db.commit()
     db.refresh(participant)
+    invalidate_game_state(game_id)
     return participant
 
 
 def get_game_participants(db: Session, game_id: UUID) -> list[dict]:
-    """Получение списка участников игры с информацией о готовности и выбранном персонаже"""
+    """
+    Получение списка участников игры с информацией о готовности и выбранном персонаже
+
+    Один запрос: участники JOIN пользователи, выбираются только нужные колонки.
+    """
     from ..models.user import User
-    
-    participants = db.query(GameParticipant).filter(
+
+    rows = db.query(
+        GameParticipant.user_id,
+        User.username,
+        GameParticipant.role,
+        GameParticipant.is_ready,
+        GameParticipant.character_id,
+    ).join(
+        User, User.id == GameParticipant.user_id
+    ).filter(
         GameParticipant.game_id == game_id
     ).all()
-    
-    result = []
-    for participant in participants:
-        user = db.query(User).filter(User.id == participant.user_id).first()
-        if user:
-            result.append({
-                "user_id": str(user.id),
-                "username": user.username,
-                "role": participant.role,
-                "is_ready": participant.is_ready,
-                "character_id": str(participant.character_id) if participant.character_id else None
-            })
-    
-    return result
+
+    return [
+        {
+            "user_id": str(row.user_id),
+            "username": row.username,
+            "role": row.role,
+            "is_ready": row.is_ready,
+            "character_id": str(row.character_id) if row.character_id else None
+        }
+        for row in rows
+    ]
 
 
 def join_as_spectator(db: Session, game_id: UUID, user_id: UUID) -> GameSession:
@@ -283,6 +377,7 @@ def join_as_spectator(db: Session, game_id: UUID, user_id: UUID) -> GameSession:
     db.add(participant)
     db.commit()
     db.refresh(game)
+    invalidate_game_state(game_id)
     return game
 
 
@@ -332,4 +427,5 @@ def transfer_master_role(db: Session, game_id: UUID, from_user_id: UUID, to_user
     
     db.commit()
     db.refresh(game)
+    invalidate_game_state(game_id)
     return game
\ No newline at end of file
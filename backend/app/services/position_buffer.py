@@ -0,0 +1,164 @@
+"""
+Write-behind буфер позиций токенов
+
+Промежуточные позиции при перетаскивании не пишутся в Postgres. Живая позиция
+сразу уходит в Redis (`game:{id}:positions`, см. `game_cache.py`) и в этот буфер,
+а фоновый флашер сохраняет итоговую позицию:
+
+- после паузы `token_flush_quiet_ms` без новых перемещений в игре;
+- не реже чем раз в `token_flush_max_delay_ms`, даже если перетаскивание не прекращается.
+
+Все грязные токены игры сохраняются одним UPDATE (CASE по id). При отключении сокета
+сбрасываются игры, в которых он был, при остановке приложения — все игры.
+
+Буфер — память воркера: отключение сбрасывает только позиции, принятые этим воркером.
+Без sticky-маршрутизации игр позиции из других воркеров сохраняют их флашеры по таймерам.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+from uuid import UUID
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# persist(game_id, {token_id: (x, y)}) -> число обновленных строк
+PersistPositions = Callable[[UUID, Dict[UUID, tuple]], Awaitable[int]]
+
+
+class TokenPositionBuffer:
+    """Грязные позиции токенов по играм с отложенным пакетным сохранением"""
+
+    def __init__(self, persist: PersistPositions, quiet_period: float, max_delay: float):
+        self.persist = persist
+        self.quiet_period = quiet_period
+        self.max_delay = max_delay
+        self.poll_interval = min(quiet_period, max_delay) / 2
+        # discard() вызывается из потоков пула БД, поэтому доступ под блокировкой
+        self._lock = threading.Lock()
+        self._dirty: Dict[UUID, Dict[UUID, tuple]] = {}
+        self._first_change: Dict[UUID, float] = {}
+        self._last_change: Dict[UUID, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.flushed_rows = 0
+        self.flush_count = 0
+
+    def record(self, game_id: UUID, token_id: UUID, x: float, y: float) -> None:
+        """Запись живой позиции; сохранение в БД — позже, флашером"""
+        now = time.monotonic()
+        with self._lock:
+            self._dirty.setdefault(game_id, {})[token_id] = (x, y)
+            self._first_change.setdefault(game_id, now)
+            self._last_change[game_id] = now
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def discard(self, token_id: UUID) -> None:
+        """Отмена несохраненной позиции (токен обновлен напрямую или удален)"""
+        with self._lock:
+            for game_id, positions in list(self._dirty.items()):
+                if positions.pop(token_id, None) is not None and not positions:
+                    self._forget(game_id)
+
+    def pending_positions(self, game_id: UUID) -> Dict[UUID, tuple]:
+        with self._lock:
+            return dict(self._dirty.get(game_id, {}))
+
+    def pending_games(self) -> list[UUID]:
+        with self._lock:
+            return list(self._dirty)
+
+    def _forget(self, game_id: UUID) -> None:
+        self._dirty.pop(game_id, None)
+        self._first_change.pop(game_id, None)
+        self._last_change.pop(game_id, None)
+
+    def _take(self, game_id: UUID) -> Dict[UUID, tuple]:
+        with self._lock:
+            positions = self._dirty.get(game_id, {})
+            self._forget(game_id)
+            return positions
+
+    def _restore(self, game_id: UUID, positions: Dict[UUID, tuple]) -> None:
+        """Возврат не сохраненных позиций в буфер (более новые не перезаписываются)"""
+        now = time.monotonic()
+        with self._lock:
+            dirty = self._dirty.setdefault(game_id, {})
+            for token_id, position in positions.items():
+                dirty.setdefault(token_id, position)
+            self._first_change.setdefault(game_id, now)
+            self._last_change.setdefault(game_id, now)
+
+    def _due_games(self, now: float) -> list[UUID]:
+        with self._lock:
+            return [
+                game_id for game_id in self._dirty
+                if now - self._last_change[game_id] >= self.quiet_period
+                or now - self._first_change[game_id] >= self.max_delay
+            ]
+
+    async def flush(self, game_id: UUID) -> None:
+        """Сохранение всех грязных позиций игры одним UPDATE"""
+        positions = self._take(game_id)
+        if not positions:
+            return
+        started = time.perf_counter()
+        try:
+            rows = await self.persist(game_id, positions)
+        except Exception as e:
+            logger.error(f"Failed to flush token positions for game {game_id}: {e}", exc_info=True)
+            self._restore(game_id, positions)
+            return
+        self.flushed_rows += rows
+        self.flush_count += 1
+        logger.debug(
+            f"Flushed {rows} token positions for game {game_id} "
+            f"in {(time.perf_counter() - started) * 1000:.1f} ms"
+        )
+
+    async def flush_games(self, game_ids: Iterable[UUID]) -> None:
+        for game_id in game_ids:
+            await self.flush(game_id)
+
+    async def flush_all(self) -> None:
+        """Сброс всех игр (при остановке приложения)"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush_games(self.pending_games())
+
+    async def _run(self) -> None:
+        """Фоновый флашер; завершается, когда буфер пуст"""
+        while self.pending_games():
+            await asyncio.sleep(self.poll_interval)
+            for game_id in self._due_games(time.monotonic()):
+                await self.flush(game_id)
+
+
+async def _persist_positions(game_id: UUID, positions: Dict[UUID, tuple]) -> int:
+    from .game_service import persist_token_positions
+    from .db_executor import run_db
+    return await run_db(persist_token_positions, game_id, positions)
+
+
+_buffer: Optional[TokenPositionBuffer] = None
+
+
+def get_position_buffer() -> TokenPositionBuffer:
+    """Буфер позиций воркера (ленивое создание)"""
+    global _buffer
+    if _buffer is None:
+        _buffer = TokenPositionBuffer(
+            _persist_positions,
+            quiet_period=settings.token_flush_quiet_ms / 1000,
+            max_delay=settings.token_flush_max_delay_ms / 1000,
+        )
+    return _buffer
+
+
+async def flush_position_buffer() -> None:
+    if _buffer is not None:
+        await _buffer.flush_all()
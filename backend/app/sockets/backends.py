@@ -0,0 +1,162 @@
+"""
+Общие бэкенды Socket.IO для работы в нескольких воркерах
+
+- client manager: доставка `sio.emit` во все воркеры (Redis pub/sub)
+- state store: членство сокетов в комнатах игр, флаги запущенных игр и режим
+  тиковой рассылки комнат
+
+`SOCKET_BACKEND=memory` (по умолчанию) — всё в памяти процесса, для одного воркера и тестов.
+`SOCKET_BACKEND=redis` — состояние и сообщения идут через Redis из `REDIS_URL`.
+"""
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Set
+from uuid import UUID
+import socketio
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+# Время жизни ключей сокетов в Redis: страховка от «осиротевших» записей упавшего воркера
+SOCKET_KEY_TTL = 86400
+
+
+class SocketStateStore(ABC):
+    """Интерфейс общего состояния Socket.IO"""
+
+    @abstractmethod
+    async def remove_connection(self, sid: str) -> list[UUID]:
+        """Удаление сокета из всех комнат. Возвращает игры, где он был."""
+
+    @abstractmethod
+    async def join_room(self, game_id: UUID, sid: str) -> None:
+        """Добавление сокета в комнату игры"""
+
+    @abstractmethod
+    async def mark_game_started(self, game_id: UUID) -> None:
+        """Флаг запущенной игры"""
+
+    @abstractmethod
+    async def is_game_started(self, game_id: UUID) -> bool:
+        """Запущена ли игра"""
+
+    @abstractmethod
+    async def set_tick_mode(self, game_id: UUID, enabled: bool) -> None:
+        """Режим тиковой рассылки комнаты (сбрасывается, когда комната пустеет)"""
+
+    @abstractmethod
+    async def get_tick_mode(self, game_id: UUID) -> Optional[bool]:
+        """Режим тиковой рассылки комнаты или None, если мастер его не задавал"""
+
+
+class InMemoryStateStore(SocketStateStore):
+    """Состояние в памяти процесса (один воркер, тесты)"""
+
+    def __init__(
+        self,
+        game_rooms: Optional[Dict[UUID, set]] = None,
+        started_games: Optional[Set[UUID]] = None,
+        tick_modes: Optional[Dict[UUID, bool]] = None,
+    ):
+        self.game_rooms: Dict[UUID, set] = game_rooms if game_rooms is not None else {}
+        self.started_games: Set[UUID] = started_games if started_games is not None else set()
+        self.tick_modes: Dict[UUID, bool] = tick_modes if tick_modes is not None else {}
+
+    async def remove_connection(self, sid: str) -> list[UUID]:
+        left_games = []
+        for game_id, socket_ids in list(self.game_rooms.items()):
+            if sid in socket_ids:
+                left_games.append(game_id)
+                socket_ids.discard(sid)
+            if not socket_ids:
+                self.game_rooms.pop(game_id, None)
+                self.tick_modes.pop(game_id, None)
+                logger.debug(f"Game room {game_id} is now empty")
+        return left_games
+
+    async def join_room(self, game_id: UUID, sid: str) -> None:
+        self.game_rooms.setdefault(game_id, set()).add(sid)
+
+    async def mark_game_started(self, game_id: UUID) -> None:
+        self.started_games.add(game_id)
+
+    async def is_game_started(self, game_id: UUID) -> bool:
+        return game_id in self.started_games
+
+    async def set_tick_mode(self, game_id: UUID, enabled: bool) -> None:
+        self.tick_modes[game_id] = enabled
+
+    async def get_tick_mode(self, game_id: UUID) -> Optional[bool]:
+        return self.tick_modes.get(game_id)
+
+
+class RedisStateStore(SocketStateStore):
+    """
+    Состояние в Redis, общее для всех воркеров
+
+    Ключи:
+    - `socket:{sid}:games` — игры, в комнатах которых состоит сокет
+    - `socket:room:{game_id}` — сокеты в комнате игры
+    - `game:{game_id}:started` — флаг запущенной игры
+    - `game:{game_id}:tick_mode` — режим тиковой рассылки ("1"/"0"), удаляется вместе с комнатой
+    """
+
+    def __init__(self, client):
+        self.redis = client
+
+    async def remove_connection(self, sid: str) -> list[UUID]:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.smembers(f"socket:{sid}:games")
+            pipe.delete(f"socket:{sid}:games")
+            game_ids, _ = await pipe.execute()
+
+        if game_ids:
+            game_ids = list(game_ids)
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for game_id in game_ids:
+                    pipe.srem(f"socket:room:{game_id}", sid)
+                    pipe.scard(f"socket:room:{game_id}")
+                results = await pipe.execute()
+            empty = [game_id for game_id, size in zip(game_ids, results[1::2]) if not size]
+            if empty:
+                await self.redis.delete(*(f"game:{game_id}:tick_mode" for game_id in empty))
+        return [UUID(game_id) for game_id in game_ids]
+
+    async def join_room(self, game_id: UUID, sid: str) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(f"socket:room:{game_id}", sid)
+            pipe.expire(f"socket:room:{game_id}", SOCKET_KEY_TTL)
+            pipe.sadd(f"socket:{sid}:games", str(game_id))
+            pipe.expire(f"socket:{sid}:games", SOCKET_KEY_TTL)
+            await pipe.execute()
+
+    async def mark_game_started(self, game_id: UUID) -> None:
+        await self.redis.set(f"game:{game_id}:started", "1", ex=SOCKET_KEY_TTL)
+
+    async def is_game_started(self, game_id: UUID) -> bool:
+        return bool(await self.redis.exists(f"game:{game_id}:started"))
+
+    async def set_tick_mode(self, game_id: UUID, enabled: bool) -> None:
+        await self.redis.set(f"game:{game_id}:tick_mode", "1" if enabled else "0", ex=SOCKET_KEY_TTL)
+
+    async def get_tick_mode(self, game_id: UUID) -> Optional[bool]:
+        value = await self.redis.get(f"game:{game_id}:tick_mode")
+        return None if value is None else value == "1"
+
+
+def create_client_manager() -> Optional[socketio.AsyncManager]:
+    """Client manager для AsyncServer: Redis pub/sub или стандартный in-memory"""
+    if settings.socket_backend == "redis":
+        logger.info("Socket.IO: using Redis client manager")
+        return socketio.AsyncRedisManager(settings.redis_url, channel="dnd-socketio")
+    return socketio.AsyncManager()
+
+
+def create_state_store() -> SocketStateStore:
+    """Хранилище состояния Socket.IO в соответствии с `settings.socket_backend`"""
+    if settings.socket_backend == "redis":
+        from ..redis_client import async_redis_client
+        return RedisStateStore(async_redis_client)
+
+    from . import state
+    return InMemoryStateStore(state.game_rooms, state.started_games, state.tick_modes)
@@ -0,0 +1,17 @@
+"""
+Доступ к БД из Socket.IO обработчиков
+
+Пул потоков и `run_db` — в `services/db_executor.py`; здесь ошибка события,
+которую обработчик отправляет клиенту.
+"""
+from ..services.db_executor import run_db
+
+__all__ = ["run_db", "SocketEventError"]
+
+
+class SocketEventError(Exception):
+    """Ошибка обработки события, которую нужно отправить клиенту как `error`"""
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
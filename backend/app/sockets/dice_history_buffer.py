@@ -0,0 +1,206 @@
+"""
+Write-behind очередь истории бросков кубиков
+
+Бросок рассылается сразу, а строка истории ставится в очередь воркера. Очередь
+сохраняется пакетными INSERT (`save_roll_history_batch`):
+
+- как только набралось `dice_history_batch_size` строк;
+- не реже чем раз в `dice_history_flush_ms`.
+
+Если БД недоступна (ошибка соединения), пакет возвращается в начало очереди и
+повторяется на следующем тике. Любая другая ошибка пакета — признак плохой строки:
+пакет повторяется построчно, и строки, которые не записываются и по одной,
+откладываются (логируются целиком как ошибка и больше не повторяются), чтобы одна
+строка не блокировала очередь. При переполнении очереди и при остановке приложения
+потерянные строки тоже логируются целиком (JSON), чтобы их можно было восстановить вручную.
+
+Очередь используется только из event loop (обработчики сокетов), вставка — в пуле потоков БД.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+PersistRows = Callable[[List[Dict[str, Any]]], Awaitable[int]]
+
+
+def _is_transient(error: Exception) -> bool:
+    """Ошибка связи с БД (повторить позже), а не ошибка данных конкретной строки"""
+    if isinstance(error, (OperationalError, InterfaceError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class DiceHistoryBuffer:
+    """Очередь строк истории бросков с пакетной записью по размеру или по времени"""
+
+    def __init__(self, persist: PersistRows, batch_size: int, flush_interval: float, max_queue: int):
+        self.persist = persist
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: deque = deque()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._timer: Optional[asyncio.Task] = None
+        self._size_flush: Optional[asyncio.Task] = None
+        # Метрики
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.dead_lettered = 0
+        self.flushes = 0
+        self.failures = 0
+        self.max_queue_depth = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, row: Dict[str, Any]) -> None:
+        self.enqueue_many([row])
+
+    def enqueue_many(self, rows: List[Dict[str, Any]]) -> None:
+        """Постановка строк в очередь; запись в БД — пакетом, позже"""
+        self._queue.extend(rows)
+        self.enqueued += len(rows)
+        overflow = len(self._queue) - self.max_queue
+        if overflow > 0:
+            lost = [self._queue.popleft() for _ in range(overflow)]
+            self.dropped += overflow
+            logger.error(
+                f"Dice history queue overflow: dropped {overflow} oldest rows: "
+                f"{json.dumps(lost, default=str)}"
+            )
+        self.max_queue_depth = max(self.max_queue_depth, len(self._queue))
+
+        if len(self._queue) >= self.batch_size and (self._size_flush is None or self._size_flush.done()):
+            self._size_flush = asyncio.create_task(self.flush())
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._run())
+
+    def _lock(self) -> asyncio.Lock:
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        return self._flush_lock
+
+    async def flush(self) -> bool:
+        """Запись всей очереди пакетами по batch_size. False — если БД вернула ошибку."""
+        async with self._lock():
+            while self._queue:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                started = time.perf_counter()
+                try:
+                    await self.persist(batch)
+                except Exception as e:
+                    self.failures += 1
+                    if _is_transient(e):
+                        self._queue.extendleft(reversed(batch))
+                        logger.error(f"Failed to flush {len(batch)} dice history rows: {e}", exc_info=True)
+                        return False
+                    logger.error(f"Failed to flush {len(batch)} dice history rows, retrying one by one: {e}")
+                    if not await self._flush_rows(batch):
+                        return False
+                    continue
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self.flushes += 1
+                self.flushed += len(batch)
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                self._total_flush_ms += elapsed_ms
+        return True
+
+    async def _flush_rows(self, batch: List[Dict[str, Any]]) -> bool:
+        """Построчная запись пакета; строки с ошибкой данных откладываются. False — БД недоступна."""
+        for i, row in enumerate(batch):
+            try:
+                await self.persist([row])
+            except Exception as e:
+                if _is_transient(e):
+                    self._queue.extendleft(reversed(batch[i:]))
+                    logger.error(f"Failed to flush dice history rows: {e}", exc_info=True)
+                    return False
+                self.dead_lettered += 1
+                logger.error(
+                    f"Dice history row rejected, not saved: {e}; "
+                    f"row: {json.dumps(row, default=str)}"
+                )
+                continue
+            self.flushed += 1
+        return True
+
+    async def _run(self) -> None:
+        """Периодическая запись; завершается, когда очередь пуста"""
+        while self._queue:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def drain(self, retries: int = 3, retry_delay: float = 0.5) -> None:
+        """Дренирование очереди при остановке приложения"""
+        for task in (self._timer, self._size_flush):
+            if task is not None and not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._timer = self._size_flush = None
+
+        for attempt in range(retries):
+            if await self.flush():
+                return
+            await asyncio.sleep(retry_delay * (attempt + 1))
+
+        lost = list(self._queue)
+        self._queue.clear()
+        logger.error(
+            f"Dice history drain failed, {len(lost)} rows not saved: "
+            f"{json.dumps(lost, default=str)}"
+        )
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "dead_lettered": self.dead_lettered,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else None,
+        }
+
+
+async def _persist_rows(rows: List[Dict[str, Any]]) -> int:
+    from ..services.dice_service import save_roll_history_batch
+    from .db import run_db
+    return await run_db(save_roll_history_batch, rows)
+
+
+_buffer: Optional[DiceHistoryBuffer] = None
+
+
+def get_dice_history_buffer() -> DiceHistoryBuffer:
+    """Очередь истории бросков воркера (ленивое создание)"""
+    global _buffer
+    if _buffer is None:
+        _buffer = DiceHistoryBuffer(
+            _persist_rows,
+            batch_size=settings.dice_history_batch_size,
+            flush_interval=settings.dice_history_flush_ms / 1000,
+            max_queue=settings.dice_history_max_queue,
+        )
+    return _buffer
+
+
+async def drain_dice_history_buffer() -> None:
+    if _buffer is not None:
+        await _buffer.drain()
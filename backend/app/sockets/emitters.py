@@ -15,7 +15,7 @@ def get_sio() -> Optional[AsyncServer]:
 async def emit_combat_started(game_id: UUID, combat_data: dict):
     """Эмиссия события начала боя"""
     if state._sio_instance:
-        room_name = str(game_id)
+        room_name = f"game:{game_id}"
         await state._sio_instance.emit("combat:started", combat_data, room=room_name)
         logger.info(f"Emitted combat:started for game {game_id}")
 
@@ -28,6 +28,30 @@ async def emit_initiative_rolled(game_id: UUID, participant_data: dict):
         logger.info(f"Emitted combat:initiative_rolled for game {game_id}")
 
 
+async def emit_initiative_batch(game_id: UUID, batch_data: dict):
+    """Эмиссия события группового броска инициативы"""
+    if state._sio_instance:
+        room_name = f"game:{game_id}"
+        await state._sio_instance.emit("combat:initiative_batch", batch_data, room=room_name)
+        logger.info(f"Emitted combat:initiative_batch for game {game_id}")
+
+
+async def emit_death_save(game_id: UUID, death_save_data: dict):
+    """Эмиссия результата спасброска от смерти (с порядком ходов: погибший из него выбывает)"""
+    if state._sio_instance:
+        room_name = f"game:{game_id}"
+        await state._sio_instance.emit("combat:death_save", death_save_data, room=room_name)
+        logger.info(f"Emitted combat:death_save for game {game_id}")
+
+
+async def emit_participant_added(game_id: UUID, participant_data: dict):
+    """Эмиссия вступления участника в идущий бой (с порядком ходов)"""
+    if state._sio_instance:
+        room_name = f"game:{game_id}"
+        await state._sio_instance.emit("combat:participant_added", participant_data, room=room_name)
+        logger.info(f"Emitted combat:participant_added for game {game_id}")
+
+
 async def emit_combat_ended(game_id: UUID):
     """Эмиссия события завершения боя"""
     if state._sio_instance:
@@ -92,3 +116,10 @@ async def emit_token_revealed(game_id: UUID, token_data: dict):
     if state._sio_instance:
         await state._sio_instance.emit("token:revealed", token_data, room=f"game:{game_id}")
         logger.info(f"Emitted token:revealed for game {game_id}, token {token_data.get('token_id')}")
+
+
+async def emit_dice_rolled_batch(game_id: UUID, batch_data: dict):
+    """Эмиссия группового броска кубиков"""
+    if state._sio_instance:
+        await state._sio_instance.emit("dice:rolled_batch", batch_data, room=f"game:{game_id}")
+        logger.info(f"Emitted dice:rolled_batch for game {game_id}")
@@ -6,6 +6,9 @@ from .emitters import (
     get_sio,
     emit_combat_started,
     emit_initiative_rolled,
+    emit_initiative_batch,
+    emit_death_save,
+    emit_participant_added,
     emit_combat_ended,
     emit_combat_attack,
     emit_combat_damage,
@@ -41,6 +44,9 @@ __all__ = [
     "get_sio",
     "emit_combat_started",
     "emit_initiative_rolled",
+    "emit_initiative_batch",
+    "emit_death_save",
+    "emit_participant_added",
     "emit_combat_ended",
     "emit_combat_attack",
     "emit_combat_damage",
@@ -2,14 +2,22 @@ import logging
 import uuid
 from datetime import datetime, timezone
 from uuid import UUID
-from ...database import SessionLocal
-from ...models.game_participant import GameParticipant
+from sqlalchemy.orm import Session
+from ..db import run_db, SocketEventError
 from ..state import connected_users
-from ..utils import get_user_from_db
+from ..utils import get_username, get_participant_role
 
 logger = logging.getLogger(__name__)
 
 
+def _load_chat_sender(db: Session, game_id: UUID, user_id: UUID) -> str:
+    """Проверка участия в игре и получение имени отправителя"""
+    if get_participant_role(db, game_id, user_id) is None:
+        raise SocketEventError("Not a participant")
+
+    return get_username(db, user_id) or "Unknown"
+
+
 def register_chat_handlers(sio):
     @sio.event
     async def game_send_message(sid, data):
@@ -43,33 +51,22 @@ def register_chat_handlers(sio):
                 await sio.emit("error", {"message": "Invalid game_id format"}, room=sid)
                 return
 
-            db = SessionLocal()
             try:
-                participant = db.query(GameParticipant).filter(
-                    GameParticipant.game_id == game_id,
-                    GameParticipant.user_id == user_id
-                ).first()
-
-                if not participant:
-                    await sio.emit("error", {"message": "Not a participant"}, room=sid)
-                    return
-
-                user = get_user_from_db(user_id)
-                username = user.username if user else "Unknown"
-
-                await sio.emit("game:chat_message", {
-                    "id": str(uuid.uuid4()),
-                    "user_id": str(user_id),
-                    "username": username,
-                    "message": message,
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                    "is_ooc": is_ooc,
-                }, room=f"game:{game_id}")
-
-                logger.info(f"User {username} sent {'OOC' if is_ooc else 'IC'} message in game {game_id}")
-
-            finally:
-                db.close()
+                username = await run_db(_load_chat_sender, game_id, user_id)
+            except SocketEventError as e:
+                await sio.emit("error", {"message": e.message}, room=sid)
+                return
+
+            await sio.emit("game:chat_message", {
+                "id": str(uuid.uuid4()),
+                "user_id": str(user_id),
+                "username": username,
+                "message": message,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "is_ooc": is_ooc,
+            }, room=f"game:{game_id}")
+
+            logger.info(f"User {username} sent {'OOC' if is_ooc else 'IC'} message in game {game_id}")
 
         except Exception as e:
             logger.error(f"Error in game_send_message for sid {sid}: {e}", exc_info=True)
@@ -1,5 +1,6 @@
 import logging
-from ..state import connected_users, game_rooms
+from ..state import connected_users, get_state_store
+from ...services.position_buffer import get_position_buffer
 from ..utils import get_user_from_token
 
 logger = logging.getLogger(__name__)
@@ -42,10 +43,8 @@ def register_connection_handlers(sio):
             if user_id:
                 logger.info(f"User {user_id} disconnected (socket {sid})")
 
-            for game_id, socket_ids in list(game_rooms.items()):
-                socket_ids.discard(sid)
-                if not socket_ids:
-                    game_rooms.pop(game_id, None)
-                    logger.debug(f"Game room {game_id} is now empty")
+            left_games = await get_state_store().remove_connection(sid)
+            # Несохраненные позиции токенов этих игр пишутся в БД сразу
+            await get_position_buffer().flush_games(left_games)
         except Exception as e:
             logger.error(f"Error in disconnect for sid {sid}: {e}", exc_info=True)
@@ -1,13 +1,128 @@
 import logging
 from uuid import UUID
-from ...database import SessionLocal
-from ...models.game_participant import GameParticipant
+from typing import Optional
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from ...config import settings
+from ...schemas.dice import DiceRollBatchRequest
+from ...services.dice_service import (
+    DiceRoller,
+    make_roll_history_row,
+    save_roll_history_batch,
+    roll_group,
+    make_group_history_rows,
+)
+from ...services.dice_expression import DicePlan, DiceExpressionError, compile_expression
+from ...services.dice_rng import get_game_rng, get_game_rngs
+from ..db import run_db, SocketEventError
+from ..dice_history_buffer import get_dice_history_buffer
 from ..state import connected_users
-from ..utils import get_user_from_db
+from ..utils import get_username, get_participant_role
 
 logger = logging.getLogger(__name__)
 
 
+def _roll_and_save(
+    db: Session,
+    game_id: UUID,
+    user_id: UUID,
+    count: int,
+    faces: int,
+    advantage: Optional[bool],
+    roll_type: Optional[str],
+    modifier: Optional[int],
+    plan: Optional[DicePlan] = None,
+) -> dict:
+    """
+    Проверка участия и бросок кубиков (выполняется в пуле потоков)
+
+    Если передан скомпилированный `plan`, бросок выполняется по выражению,
+    а `count`/`faces` в истории — общее число кубиков и грани первого терма.
+    Бросок идет из потока игры, его номер сохраняется в `rng_offset`.
+
+    Строка истории возвращается в `history` для очереди write-behind; при выключенном
+    `dice_history_write_behind` она сохраняется здесь же и `history` равен None.
+    """
+    if get_participant_role(db, game_id, user_id) is None:
+        logger.warning(f"User {user_id} is not a participant of game {game_id}")
+        raise SocketEventError("Not a participant")
+
+    rng = get_game_rng(db, game_id)
+    if plan is not None:
+        result_dict = plan.roll(rng).to_dict()
+        if advantage is not None:
+            result_dict["advantage_type"] = "advantage" if advantage else "disadvantage"
+    else:
+        dice_roller = DiceRoller(default_faces=12, max_dice=10)
+        try:
+            result = dice_roller.roll(count, faces, advantage, rng=rng)
+            result_dict = dice_roller.to_dict(result)
+        except ValueError as e:
+            logger.warning(f"Dice roll validation error: {e}")
+            raise SocketEventError(str(e))
+
+    if modifier is not None:
+        result_dict["total"] = result_dict["total"] + modifier
+
+    history = make_roll_history_row(
+        game_id=game_id,
+        user_id=user_id,
+        count=count,
+        faces=faces,
+        rolls=result_dict["rolls"],
+        total=result_dict["total"],
+        roll_type=roll_type,
+        modifier=modifier,
+        advantage_type=result_dict.get("advantage_type"),
+        advantage_rolls=result_dict.get("advantage_rolls"),
+        selected_roll=result_dict.get("selected_roll"),
+        expression=result_dict.get("expression"),
+        rng_offset=rng.offset
+    )
+    if not settings.dice_history_write_behind:
+        try:
+            save_roll_history_batch(db, [history])
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error saving dice roll history: {e}", exc_info=True)
+        history = None
+
+    result_dict["rng_offset"] = rng.offset
+    return {
+        "result": result_dict,
+        "username": get_username(db, user_id) or "Unknown",
+        "history": history,
+    }
+
+
+def _roll_batch_and_save(db: Session, game_id: UUID, user_id: UUID, specs: list) -> dict:
+    """Групповой бросок: проверка участия, все броски и одна пакетная вставка истории"""
+    if get_participant_role(db, game_id, user_id) is None:
+        logger.warning(f"User {user_id} is not a participant of game {game_id}")
+        raise SocketEventError("Not a participant")
+
+    try:
+        entries = roll_group(specs, rngs=get_game_rngs(db, game_id, len(specs)))
+    except ValueError as e:
+        logger.warning(f"Dice roll batch validation error: {e}")
+        raise SocketEventError(str(e))
+
+    history = make_group_history_rows(game_id, user_id, entries)
+    if not settings.dice_history_write_behind:
+        try:
+            save_roll_history_batch(db, history)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error saving dice roll history batch: {e}", exc_info=True)
+        history = None
+
+    return {
+        "entries": entries,
+        "username": get_username(db, user_id) or "Unknown",
+        "history": history,
+    }
+
+
 def register_dice_handlers(sio):
     @sio.event
     async def dice_roll(sid, data):
@@ -36,84 +151,122 @@ def register_dice_handlers(sio):
                 await sio.emit("error", {"message": "Invalid dice_roll data"}, room=sid)
                 return
 
-            if count < 1 or count > 10:
+            plan = None
+            expression = data.get("expression")
+            if expression is not None:
+                try:
+                    plan = compile_expression(expression, advantage)
+                except DiceExpressionError as e:
+                    logger.warning(f"Invalid dice expression {expression!r}: {e}")
+                    await sio.emit("error", {"message": str(e)}, room=sid)
+                    return
+                if not plan.dice_terms:
+                    await sio.emit("error", {"message": "Expression must contain dice"}, room=sid)
+                    return
+                count = plan.dice_count
+                faces = plan.dice_terms[0].faces
+
+            if plan is None and (count < 1 or count > 10):
                 logger.warning(f"Invalid dice count: {count}")
                 await sio.emit("error", {"message": "Dice count must be between 1 and 10"}, room=sid)
                 return
 
-            if faces not in [4, 6, 8, 10, 12, 20]:
+            if plan is None and faces not in [4, 6, 8, 10, 12, 20]:
                 logger.warning(f"Invalid dice faces: {faces}")
                 await sio.emit("error", {"message": "Invalid dice faces. Allowed: 4, 6, 8, 10, 12, 20"}, room=sid)
                 return
 
-            db = SessionLocal()
+            roll_type = data.get("roll_type")
+            if roll_type is not None and not isinstance(roll_type, str):
+                logger.warning(f"Invalid roll_type: {roll_type!r}")
+                await sio.emit("error", {"message": "Invalid dice_roll data"}, room=sid)
+                return
+            modifier = data.get("modifier")
             try:
-                participant = db.query(GameParticipant).filter(
-                    GameParticipant.game_id == game_id,
-                    GameParticipant.user_id == user_id
-                ).first()
-
-                if not participant:
-                    logger.warning(f"User {user_id} is not a participant of game {game_id}")
-                    await sio.emit("error", {"message": "Not a participant"}, room=sid)
-                    return
-
-                from ...services.dice_service import DiceRoller, save_roll_history
-                dice_roller = DiceRoller(default_faces=12, max_dice=10)
-                try:
-                    result = dice_roller.roll(count, faces, advantage)
-                    result_dict = dice_roller.to_dict(result)
-                except ValueError as e:
-                    logger.warning(f"Dice roll validation error: {e}")
-                    await sio.emit("error", {"message": str(e)}, room=sid)
-                    return
-
-                roll_type = data.get("roll_type")
-                modifier = data.get("modifier")
                 if modifier is not None:
                     modifier = int(modifier)
-                    result_dict["total"] = result_dict["total"] + modifier
+            except (ValueError, TypeError):
+                await sio.emit("error", {"message": "Invalid dice_roll data"}, room=sid)
+                return
+
+            try:
+                roll = await run_db(
+                    _roll_and_save, game_id, user_id, count, faces, advantage, roll_type, modifier, plan
+                )
+            except SocketEventError as e:
+                await sio.emit("error", {"message": e.message}, room=sid)
+                return
+
+            result_dict = roll["result"]
+            username = roll["username"]
+            if roll["history"] is not None:
+                get_dice_history_buffer().enqueue(roll["history"])
+
+            rolled = result_dict.get("expression") or f"{count}d{faces}"
+            logger.info(f"User {username} ({user_id}) rolled {rolled} = {result_dict['total']} (modifier: {modifier}) in game {game_id}")
+
+            await sio.emit("dice:rolled", {
+                "game_id": str(game_id),
+                "user_id": str(user_id),
+                "username": username,
+                "count": count,
+                "faces": faces,
+                "rolls": result_dict["rolls"],
+                "total": result_dict["total"],
+                "roll_type": roll_type,
+                "modifier": modifier,
+                "advantage_type": result_dict.get("advantage_type"),
+                "advantage_rolls": result_dict.get("advantage_rolls"),
+                "selected_roll": result_dict.get("selected_roll"),
+                "expression": result_dict.get("expression"),
+                "terms": result_dict.get("terms"),
+                "rng_offset": result_dict["rng_offset"]
+            }, room=f"game:{game_id}")
 
-                try:
-                    save_roll_history(
-                        db=db,
-                        game_id=game_id,
-                        user_id=user_id,
-                        count=count,
-                        faces=faces,
-                        rolls=result_dict["rolls"],
-                        total=result_dict["total"],
-                        roll_type=roll_type,
-                        modifier=modifier,
-                        advantage_type=result_dict.get("advantage_type"),
-                        advantage_rolls=result_dict.get("advantage_rolls"),
-                        selected_roll=result_dict.get("selected_roll")
-                    )
-                except Exception as e:
-                    logger.error(f"Error saving dice roll history: {e}", exc_info=True)
-
-                user = get_user_from_db(user_id)
-                username = user.username if user else "Unknown"
-
-                logger.info(f"User {username} ({user_id}) rolled {count}d{faces} = {result_dict['total']} (modifier: {modifier}) in game {game_id}")
-
-                await sio.emit("dice:rolled", {
-                    "game_id": str(game_id),
-                    "user_id": str(user_id),
-                    "username": username,
-                    "count": count,
-                    "faces": faces,
-                    "rolls": result_dict["rolls"],
-                    "total": result_dict["total"],
-                    "roll_type": roll_type,
-                    "modifier": modifier,
-                    "advantage_type": result_dict.get("advantage_type"),
-                    "advantage_rolls": result_dict.get("advantage_rolls"),
-                    "selected_roll": result_dict.get("selected_roll")
-                }, room=f"game:{game_id}")
-
-            finally:
-                db.close()
         except Exception as e:
             logger.error(f"Error in dice_roll for sid {sid}: {e}", exc_info=True)
             await sio.emit("error", {"message": "Internal server error"}, room=sid)
+
+    @sio.event
+    async def dice_roll_batch(sid, data):
+        """Групповой бросок: одно событие, одна вставка истории, одна рассылка"""
+        try:
+            if sid not in connected_users:
+                logger.warning(f"Unauthenticated dice_roll_batch attempt: {sid}")
+                return
+
+            user_id = connected_users[sid]
+
+            if not data or not isinstance(data, dict):
+                logger.warning(f"Invalid data format for dice_roll_batch: {sid}")
+                await sio.emit("error", {"message": "Invalid data format"}, room=sid)
+                return
+
+            try:
+                request = DiceRollBatchRequest.model_validate(data)
+            except ValidationError as e:
+                logger.warning(f"Invalid dice_roll_batch data: {e}")
+                await sio.emit("error", {"message": "Invalid dice_roll_batch data"}, room=sid)
+                return
+
+            try:
+                batch = await run_db(_roll_batch_and_save, request.game_id, user_id, request.rolls)
+            except SocketEventError as e:
+                await sio.emit("error", {"message": e.message}, room=sid)
+                return
+
+            if batch["history"] is not None:
+                get_dice_history_buffer().enqueue_many(batch["history"])
+
+            logger.info(f"User {batch['username']} ({user_id}) rolled a batch of {len(batch['entries'])} in game {request.game_id}")
+
+            await sio.emit("dice:rolled_batch", {
+                "game_id": str(request.game_id),
+                "user_id": str(user_id),
+                "username": batch["username"],
+                "rolls": batch["entries"],
+            }, room=f"game:{request.game_id}")
+
+        except Exception as e:
+            logger.error(f"Error in dice_roll_batch for sid {sid}: {e}", exc_info=True)
+            await sio.emit("error", {"message": "Internal server error"}, room=sid)
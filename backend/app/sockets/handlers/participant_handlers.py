@@ -1,14 +1,61 @@
 import logging
 from uuid import UUID
-from ...database import SessionLocal
-from ...models.game_participant import GameParticipant
-from ...services.game_service import get_game_by_id, is_master, set_participant_ready, set_participant_character
-from ..state import connected_users, game_rooms, started_games
-from ..utils import get_user_from_db, get_game_state
+from sqlalchemy.orm import Session
+from ...services.game_service import get_game_by_id, set_participant_ready, set_participant_character
+from ..db import run_db, SocketEventError
+from ..state import connected_users, get_state_store
+from ..utils import get_username, get_game_state, get_participant_role
 
 logger = logging.getLogger(__name__)
 
 
+def _require_participant(db: Session, game_id: UUID, user_id: UUID) -> str:
+    """Роль участника игры или ошибка `Not a participant`"""
+    role = get_participant_role(db, game_id, user_id)
+    if role is None:
+        logger.warning(f"User {user_id} is not a participant of game {game_id}")
+        raise SocketEventError("Not a participant")
+    return role
+
+
+def _get_username(db: Session, user_id: UUID) -> str:
+    return get_username(db, user_id) or "Unknown"
+
+
+def _load_join_state(db: Session, game_id: UUID, user_id: UUID) -> dict:
+    """Проверка участия и загрузка состояния игры для game_join"""
+    get_game_by_id(db, game_id)
+    _is_master = _require_participant(db, game_id, user_id) == "master"
+    return {
+        "game_state": get_game_state(db, game_id, include_hidden=_is_master),
+        "username": get_username(db, user_id),
+    }
+
+
+def _update_ready(db: Session, game_id: UUID, user_id: UUID, is_ready: bool) -> str:
+    _require_participant(db, game_id, user_id)
+    set_participant_ready(db, game_id, user_id, is_ready)
+    logger.info(f"User {user_id} set ready status to {is_ready} in game {game_id}")
+    return _get_username(db, user_id)
+
+
+def _update_character(db: Session, game_id: UUID, user_id: UUID, character_id: UUID | None) -> str:
+    _require_participant(db, game_id, user_id)
+    set_participant_character(db, game_id, user_id, character_id)
+    logger.info(f"User {user_id} set character {character_id} in game {game_id}")
+    return _get_username(db, user_id)
+
+
+def _check_scene_author(db: Session, game_id: UUID, user_id: UUID) -> None:
+    if _require_participant(db, game_id, user_id) != "master":
+        raise SocketEventError("Only master can send scene descriptions")
+
+
+def _check_game_starter(db: Session, game_id: UUID, user_id: UUID) -> None:
+    if get_participant_role(db, game_id, user_id) != "master":
+        raise SocketEventError("Only master can start the game")
+
+
 def register_participant_handlers(sio):
     @sio.event
     async def game_join(sid, data):
@@ -39,40 +86,26 @@ def register_participant_handlers(sio):
                 await sio.emit("error", {"message": "Invalid game_id format"}, room=sid)
                 return
 
-            db = SessionLocal()
+            logger.info(f"User {user_id} joining game {game_id}")
             try:
-                get_game_by_id(db, game_id)
-                logger.info(f"User {user_id} joining game {game_id}")
-
-                participant = db.query(GameParticipant).filter(
-                    GameParticipant.game_id == game_id,
-                    GameParticipant.user_id == user_id
-                ).first()
-
-                if not participant:
-                    logger.warning(f"User {user_id} is not a participant of game {game_id}")
-                    await sio.emit("error", {"message": "Not a participant"}, room=sid)
-                    return
-
-                if game_id not in game_rooms:
-                    game_rooms[game_id] = set()
-                game_rooms[game_id].add(sid)
-                await sio.enter_room(sid, f"game:{game_id}")
-
-                _is_master = participant.role == "master"
-                game_state = get_game_state(db, game_id, include_hidden=_is_master)
-                await sio.emit("game:state", game_state, room=sid)
-
-                user = get_user_from_db(user_id)
-                if user:
-                    await sio.emit("player:joined", {
-                        "user_id": str(user_id),
-                        "username": user.username
-                    }, room=f"game:{game_id}", skip_sid=sid)
-                    logger.info(f"User {user.username} ({user_id}) joined game {game_id}")
-
-            finally:
-                db.close()
+                joined = await run_db(_load_join_state, game_id, user_id)
+            except SocketEventError as e:
+                await sio.emit("error", {"message": e.message}, room=sid)
+                return
+
+            await get_state_store().join_room(game_id, sid)
+            await sio.enter_room(sid, f"game:{game_id}")
+
+            await sio.emit("game:state", joined["game_state"], room=sid)
+
+            username = joined["username"]
+            if username:
+                await sio.emit("player:joined", {
+                    "user_id": str(user_id),
+                    "username": username
+                }, room=f"game:{game_id}", skip_sid=sid)
+                logger.info(f"User {username} ({user_id}) joined game {game_id}")
+
         except Exception as e:
             logger.error(f"Error in game_join for sid {sid}: {e}", exc_info=True)
             await sio.emit("error", {"message": "Internal server error"}, room=sid)
@@ -100,32 +133,18 @@ def register_participant_handlers(sio):
                 await sio.emit("error", {"message": "Invalid participant_ready data"}, room=sid)
                 return
 
-            db = SessionLocal()
             try:
-                participant = db.query(GameParticipant).filter(
-                    GameParticipant.game_id == game_id,
-                    GameParticipant.user_id == user_id
-                ).first()
-
-                if not participant:
-                    logger.warning(f"User {user_id} is not a participant of game {game_id}")
-                    await sio.emit("error", {"message": "Not a participant"}, room=sid)
-                    return
-
-                set_participant_ready(db, game_id, user_id, is_ready)
-                logger.info(f"User {user_id} set ready status to {is_ready} in game {game_id}")
+                username = await run_db(_update_ready, game_id, user_id, is_ready)
+            except SocketEventError as e:
+                await sio.emit("error", {"message": e.message}, room=sid)
+                return
 
-                user = get_user_from_db(user_id)
-                username = user.username if user else "Unknown"
+            await sio.emit("participant:ready_changed", {
+                "user_id": str(user_id),
+                "username": username,
+                "is_ready": is_ready
+            }, room=f"game:{game_id}")
 
-                await sio.emit("participant:ready_changed", {
-                    "user_id": str(user_id),
-                    "username": username,
-                    "is_ready": is_ready
-                }, room=f"game:{game_id}")
-
-            finally:
-                db.close()
         except Exception as e:
             logger.error(f"Error in participant_ready for sid {sid}: {e}", exc_info=True)
             await sio.emit("error", {"message": "Internal server error"}, room=sid)
@@ -160,32 +179,20 @@ def register_participant_handlers(sio):
                 await sio.emit("error", {"message": "Description is required"}, room=sid)
                 return
 
-            db = SessionLocal()
             try:
-                participant = db.query(GameParticipant).filter(
-                    GameParticipant.game_id == game_id,
-                    GameParticipant.user_id == user_id
-                ).first()
-
-                if not participant:
-                    await sio.emit("error", {"message": "Not a participant"}, room=sid)
-                    return
-
-                if not is_master(db, game_id, user_id):
-                    await sio.emit("error", {"message": "Only master can send scene descriptions"}, room=sid)
-                    return
-
-                await sio.emit("scene:description_received", {
-                    "game_id": str(game_id),
-                    "user_id": str(user_id),
-                    "description": description,
-                    "title": title
-                }, room=f"game:{game_id}")
+                await run_db(_check_scene_author, game_id, user_id)
+            except SocketEventError as e:
+                await sio.emit("error", {"message": e.message}, room=sid)
+                return
 
-                logger.info(f"Master {user_id} sent scene description to game {game_id}")
+            await sio.emit("scene:description_received", {
+                "game_id": str(game_id),
+                "user_id": str(user_id),
+                "description": description,
+                "title": title
+            }, room=f"game:{game_id}")
 
-            finally:
-                db.close()
+            logger.info(f"Master {user_id} sent scene description to game {game_id}")
 
         except Exception as e:
             logger.error(f"Error in scene_description handler: {e}", exc_info=True)
@@ -207,17 +214,15 @@ def register_participant_handlers(sio):
                 await sio.emit("error", {"message": "Invalid game_id"}, room=sid)
                 return
 
-            db = SessionLocal()
             try:
-                if not is_master(db, game_id, user_id):
-                    await sio.emit("error", {"message": "Only master can start the game"}, room=sid)
-                    return
-
-                started_games.add(game_id)
-                await sio.emit("game:started", {"game_id": str(game_id)}, room=f"game:{game_id}")
-                logger.info(f"Master {user_id} started game {game_id}")
-            finally:
-                db.close()
+                await run_db(_check_game_starter, game_id, user_id)
+            except SocketEventError as e:
+                await sio.emit("error", {"message": e.message}, room=sid)
+                return
+
+            await get_state_store().mark_game_started(game_id)
+            await sio.emit("game:started", {"game_id": str(game_id)}, room=f"game:{game_id}")
+            logger.info(f"Master {user_id} started game {game_id}")
         except Exception as e:
             logger.error(f"Error in game_start for sid {sid}: {e}", exc_info=True)
             await sio.emit("error", {"message": "Internal server error"}, room=sid)
@@ -246,32 +251,18 @@ def register_participant_handlers(sio):
                 await sio.emit("error", {"message": "Invalid participant_character data"}, room=sid)
                 return
 
-            db = SessionLocal()
             try:
-                participant = db.query(GameParticipant).filter(
-                    GameParticipant.game_id == game_id,
-                    GameParticipant.user_id == user_id
-                ).first()
-
-                if not participant:
-                    logger.warning(f"User {user_id} is not a participant of game {game_id}")
-                    await sio.emit("error", {"message": "Not a participant"}, room=sid)
-                    return
-
-                set_participant_character(db, game_id, user_id, character_id)
-                logger.info(f"User {user_id} set character {character_id} in game {game_id}")
-
-                user = get_user_from_db(user_id)
-                username = user.username if user else "Unknown"
+                username = await run_db(_update_character, game_id, user_id, character_id)
+            except SocketEventError as e:
+                await sio.emit("error", {"message": e.message}, room=sid)
+                return
 
-                await sio.emit("participant:character_changed", {
-                    "user_id": str(user_id),
-                    "username": username,
-                    "character_id": str(character_id) if character_id else None
-                }, room=f"game:{game_id}")
+            await sio.emit("participant:character_changed", {
+                "user_id": str(user_id),
+                "username": username,
+                "character_id": str(character_id) if character_id else None
+            }, room=f"game:{game_id}")
 
-            finally:
-                db.close()
         except Exception as e:
             logger.error(f"Error in participant_character for sid {sid}: {e}", exc_info=True)
             await sio.emit("error", {"message": "Internal server error"}, room=sid)
@@ -1,14 +1,78 @@
 import logging
 from uuid import UUID
-from ...database import SessionLocal
-from ...services.game_service import is_master, create_token, update_token_position, delete_token, get_game_tokens
+from sqlalchemy.orm import Session
+from ...config import settings
+from ...schemas.token import TokenCreate
+from ...services.game_service import (
+    create_token,
+    update_token_positions,
+    stage_token_positions,
+    delete_token,
+)
+from ..db import run_db, SocketEventError
 from ..state import connected_users
-from ..cache import save_game_state_to_redis
+from ...services.position_buffer import get_position_buffer
+from ..tick import configure_move_coalescer
+from ..utils import get_participant_role
 
 logger = logging.getLogger(__name__)
 
 
+def _require_master(db: Session, game_id: UUID, user_id: UUID, action: str) -> None:
+    if get_participant_role(db, game_id, user_id) != "master":
+        logger.warning(f"User {user_id} attempted to {action} token without master rights")
+        raise SocketEventError(f"Only master can {action} tokens")
+
+
+def _move_token(db: Session, game_id: UUID, token_id: UUID, user_id: UUID, x: float, y: float) -> None:
+    _require_master(db, game_id, user_id, "move")
+    if settings.token_write_behind:
+        # В БД позицию сохранит буфер позиций после окончания перетаскивания
+        moved = stage_token_positions(db, game_id, {token_id: (x, y)})
+    else:
+        moved = update_token_positions(db, game_id, {token_id: (x, y)})
+    if not moved:
+        logger.warning(f"User {user_id} attempted to move token {token_id} outside game {game_id}")
+        raise SocketEventError("Token not found in this game")
+
+
+def _create_token(db: Session, game_id: UUID, user_id: UUID, token_data: TokenCreate) -> dict:
+    _require_master(db, game_id, user_id, "create")
+    token = create_token(db, game_id, token_data)
+    logger.info(f"Token {token.id} ({token.name}) created by user {user_id} in game {game_id}")
+
+    token_payload = {
+        "id": str(token.id),
+        "name": token.name,
+        "x": token.x,
+        "y": token.y,
+        "image_url": token.image_url,
+        "is_hidden": token.is_hidden,
+        "token_type": token.token_type,
+    }
+    return token_payload
+
+
+def _delete_token(db: Session, game_id: UUID, token_id: UUID, user_id: UUID) -> None:
+    _require_master(db, game_id, user_id, "delete")
+    delete_token(db, token_id)
+    logger.info(f"Token {token_id} deleted by user {user_id} in game {game_id}")
+
+
+async def _persist_moves(game_id: UUID, positions: dict) -> list[UUID]:
+    if settings.token_write_behind:
+        token_ids = await run_db(stage_token_positions, game_id, positions)
+        buffer = get_position_buffer()
+        for token_id in token_ids:
+            x, y = positions[token_id]
+            buffer.record(game_id, token_id, x, y)
+        return token_ids
+    return await run_db(update_token_positions, game_id, positions)
+
+
 def register_token_handlers(sio):
+    coalescer = configure_move_coalescer(sio, _persist_moves)
+
     @sio.event
     async def token_move(sid, data):
         """Перемещение токена"""
@@ -39,30 +103,32 @@ def register_token_handlers(sio):
                 await sio.emit("error", {"message": "Coordinates must be between 0 and 100"}, room=sid)
                 return
 
-            db = SessionLocal()
-            try:
-                if not is_master(db, game_id, user_id):
-                    logger.warning(f"User {user_id} attempted to move token without master rights")
-                    await sio.emit("error", {"message": "Only master can move tokens"}, room=sid)
+            if await coalescer.is_enabled(game_id):
+                try:
+                    await run_db(_require_master, game_id, user_id, "move")
+                except SocketEventError as e:
+                    await sio.emit("error", {"message": e.message}, room=sid)
                     return
+                # Сохранение и рассылка — в ближайший тик комнаты (token:moved_batch)
+                coalescer.add(game_id, token_id, x, y, user_id)
+                return
 
-                from ...schemas.token import TokenUpdate
-                token_update = TokenUpdate(x=x, y=y)
-                update_token_position(db, token_id, token_update)
-
-                tokens = get_game_tokens(db, game_id)
-                save_game_state_to_redis(game_id, tokens)
+            try:
+                await run_db(_move_token, game_id, token_id, user_id, x, y)
+            except SocketEventError as e:
+                await sio.emit("error", {"message": e.message}, room=sid)
+                return
+            if settings.token_write_behind:
+                get_position_buffer().record(game_id, token_id, x, y)
 
-                await sio.emit("token:moved", {
-                    "token_id": str(token_id),
-                    "x": x,
-                    "y": y,
-                    "moved_by": str(user_id)
-                }, room=f"game:{game_id}")
-                logger.debug(f"Token {token_id} moved to ({x}, {y}) by user {user_id}")
+            await sio.emit("token:moved", {
+                "token_id": str(token_id),
+                "x": x,
+                "y": y,
+                "moved_by": str(user_id)
+            }, room=f"game:{game_id}")
+            logger.debug(f"Token {token_id} moved to ({x}, {y}) by user {user_id}")
 
-            finally:
-                db.close()
         except Exception as e:
             logger.error(f"Error in token_move for sid {sid}: {e}", exc_info=True)
             await sio.emit("error", {"message": "Internal server error"}, room=sid)
@@ -105,41 +171,20 @@ def register_token_handlers(sio):
                 await sio.emit("error", {"message": "Coordinates must be between 0 and 100"}, room=sid)
                 return
 
-            db = SessionLocal()
+            token_data = TokenCreate(name=name, x=x, y=y, image_url=image_url,
+                                     is_hidden=is_hidden, token_type=token_type)
             try:
-                if not is_master(db, game_id, user_id):
-                    logger.warning(f"User {user_id} attempted to create token without master rights")
-                    await sio.emit("error", {"message": "Only master can create tokens"}, room=sid)
-                    return
+                token_payload = {"token": await run_db(_create_token, game_id, user_id, token_data)}
+            except SocketEventError as e:
+                await sio.emit("error", {"message": e.message}, room=sid)
+                return
+
+            if is_hidden:
+                # Скрытый токен — только мастеру
+                await sio.emit("token:created", token_payload, room=sid)
+            else:
+                await sio.emit("token:created", token_payload, room=f"game:{game_id}")
 
-                from ...schemas.token import TokenCreate
-                token_data = TokenCreate(name=name, x=x, y=y, image_url=image_url,
-                                         is_hidden=is_hidden, token_type=token_type)
-                token = create_token(db, game_id, token_data)
-                logger.info(f"Token {token.id} ({name}) created by user {user_id} in game {game_id}")
-
-                tokens = get_game_tokens(db, game_id)
-                save_game_state_to_redis(game_id, tokens)
-
-                token_payload = {
-                    "token": {
-                        "id": str(token.id),
-                        "name": token.name,
-                        "x": token.x,
-                        "y": token.y,
-                        "image_url": token.image_url,
-                        "is_hidden": token.is_hidden,
-                        "token_type": token.token_type,
-                    }
-                }
-                if is_hidden:
-                    # Скрытый токен — только мастеру
-                    await sio.emit("token:created", token_payload, room=sid)
-                else:
-                    await sio.emit("token:created", token_payload, room=f"game:{game_id}")
-
-            finally:
-                db.close()
         except Exception as e:
             logger.error(f"Error in token_create for sid {sid}: {e}", exc_info=True)
             await sio.emit("error", {"message": "Internal server error"}, room=sid)
@@ -167,25 +212,58 @@ def register_token_handlers(sio):
                 await sio.emit("error", {"message": "Invalid token_delete data"}, room=sid)
                 return
 
-            db = SessionLocal()
             try:
-                if not is_master(db, game_id, user_id):
-                    logger.warning(f"User {user_id} attempted to delete token without master rights")
-                    await sio.emit("error", {"message": "Only master can delete tokens"}, room=sid)
-                    return
+                await run_db(_delete_token, game_id, token_id, user_id)
+            except SocketEventError as e:
+                await sio.emit("error", {"message": e.message}, room=sid)
+                return
 
-                delete_token(db, token_id)
-                logger.info(f"Token {token_id} deleted by user {user_id} in game {game_id}")
+            await sio.emit("token:deleted", {
+                "token_id": str(token_id)
+            }, room=f"game:{game_id}")
 
-                tokens = get_game_tokens(db, game_id)
-                save_game_state_to_redis(game_id, tokens)
+        except Exception as e:
+            logger.error(f"Error in token_delete for sid {sid}: {e}", exc_info=True)
+            await sio.emit("error", {"message": "Internal server error"}, room=sid)
+
+    @sio.event
+    async def token_tick_mode(sid, data):
+        """Включение/выключение тиковой рассылки перемещений для комнаты (только мастер)"""
+        try:
+            if sid not in connected_users:
+                logger.warning(f"Unauthenticated token_tick_mode attempt: {sid}")
+                return
+
+            user_id = connected_users[sid]
+
+            if not data or not isinstance(data, dict):
+                logger.warning(f"Invalid data format for token_tick_mode: {sid}")
+                await sio.emit("error", {"message": "Invalid data format"}, room=sid)
+                return
 
-                await sio.emit("token:deleted", {
-                    "token_id": str(token_id)
-                }, room=f"game:{game_id}")
+            try:
+                game_id = UUID(data.get("game_id"))
+                enabled = bool(data.get("enabled", True))
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Invalid token_tick_mode data: {e}")
+                await sio.emit("error", {"message": "Invalid token_tick_mode data"}, room=sid)
+                return
+
+            try:
+                await run_db(_require_master, game_id, user_id, "configure")
+            except SocketEventError as e:
+                await sio.emit("error", {"message": e.message}, room=sid)
+                return
+
+            if not enabled:
+                await coalescer.flush(game_id)
+            await coalescer.set_enabled(game_id, enabled)
+            await sio.emit("token:tick_mode", {
+                "enabled": enabled,
+                "tick_hz": settings.token_tick_hz,
+            }, room=f"game:{game_id}")
+            logger.info(f"Token tick mode {'enabled' if enabled else 'disabled'} in game {game_id} by user {user_id}")
 
-            finally:
-                db.close()
         except Exception as e:
-            logger.error(f"Error in token_delete for sid {sid}: {e}", exc_info=True)
+            logger.error(f"Error in token_tick_mode for sid {sid}: {e}", exc_info=True)
             await sio.emit("error", {"message": "Internal server error"}, room=sid)
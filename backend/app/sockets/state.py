@@ -1,7 +1,20 @@
-from typing import Dict, Set
+from typing import Dict, Optional, Set
 from uuid import UUID
+from .backends import SocketStateStore, create_state_store
 
+# Сокеты, подключенные к этому воркеру: sid -> user_id
 connected_users: Dict[str, UUID] = {}
+# Хранилище in-memory бэкенда (при SOCKET_BACKEND=redis не используются)
 game_rooms: Dict[UUID, set] = {}
 started_games: Set[UUID] = set()
+tick_modes: Dict[UUID, bool] = {}
 _sio_instance = None
+_store: Optional[SocketStateStore] = None
+
+
+def get_state_store() -> SocketStateStore:
+    """Общее состояние комнат, запущенных игр и режимов тиковой рассылки"""
+    global _store
+    if _store is None:
+        _store = create_state_store()
+    return _store
@@ -0,0 +1,122 @@
+"""
+Тиковая рассылка перемещений токенов
+
+При перетаскивании мастер шлет десятки `token_move` в секунду. В тиковом режиме
+перемещения, пришедшие в пределах одного тика, сливаются (для каждого токена
+побеждает последняя позиция), сохраняются одной транзакцией и рассылаются одним
+событием `token:moved_batch`. Стоимость рассылки на комнату ограничена частотой тика,
+а не частотой, с которой клиенты шлют события.
+
+Режим включается для комнаты событием `token_tick_mode` или для всех комнат
+настройкой `token_tick_default`. Режим комнаты хранится в общем хранилище состояния
+сокетов (`SocketStateStore`), поэтому действует на всех воркерах, и сбрасывается,
+когда комната пустеет. Буфер — в памяти воркера, к которому подключен отправитель;
+рассылка уходит через client manager и доходит до всех воркеров.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+from uuid import UUID
+from ..config import settings
+from .state import get_state_store
+
+logger = logging.getLogger(__name__)
+
+# persist(game_id, {token_id: (x, y)}) -> id реально обновленных токенов
+PersistMoves = Callable[[UUID, Dict[UUID, tuple]], Awaitable[list]]
+
+
+class TokenMoveCoalescer:
+    """Слияние перемещений токенов по комнатам с рассылкой раз в тик"""
+
+    def __init__(self, sio, persist: PersistMoves, tick_hz: int, default_enabled: bool = False):
+        self.sio = sio
+        self.persist = persist
+        self.interval = 1.0 / tick_hz
+        self.default_enabled = default_enabled
+        self._pending: Dict[UUID, Dict[UUID, dict]] = {}
+        self._tasks: Dict[UUID, asyncio.Task] = {}
+
+    async def is_enabled(self, game_id: UUID) -> bool:
+        enabled = await get_state_store().get_tick_mode(game_id)
+        return self.default_enabled if enabled is None else enabled
+
+    async def set_enabled(self, game_id: UUID, enabled: bool) -> None:
+        await get_state_store().set_tick_mode(game_id, enabled)
+
+    def add(self, game_id: UUID, token_id: UUID, x: float, y: float, moved_by: UUID) -> None:
+        """Постановка перемещения в текущий тик комнаты (последняя позиция токена побеждает)"""
+        self._pending.setdefault(game_id, {})[token_id] = {
+            "token_id": str(token_id),
+            "x": x,
+            "y": y,
+            "moved_by": str(moved_by),
+        }
+        task = self._tasks.get(game_id)
+        if task is None or task.done():
+            self._tasks[game_id] = asyncio.create_task(self._run(game_id))
+
+    def pending_count(self, game_id: UUID) -> int:
+        return len(self._pending.get(game_id, {}))
+
+    async def _run(self, game_id: UUID) -> None:
+        """Цикл тиков комнаты; завершается, когда перемещений больше нет"""
+        try:
+            while self._pending.get(game_id):
+                await asyncio.sleep(self.interval)
+                await self.flush(game_id)
+        finally:
+            if self._tasks.get(game_id) is asyncio.current_task():
+                self._tasks.pop(game_id, None)
+
+    async def flush(self, game_id: UUID) -> None:
+        """Сохранение и рассылка накопленных перемещений комнаты"""
+        moves = self._pending.pop(game_id, None)
+        if not moves:
+            return
+
+        positions = {token_id: (move["x"], move["y"]) for token_id, move in moves.items()}
+        try:
+            updated = set(await self.persist(game_id, positions))
+        except Exception as e:
+            logger.error(f"Failed to persist token moves for game {game_id}: {e}", exc_info=True)
+            return
+
+        batch = [move for token_id, move in moves.items() if token_id in updated]
+        if batch:
+            await self.sio.emit("token:moved_batch", {"moves": batch}, room=f"game:{game_id}")
+            logger.debug(f"Token batch of {len(batch)} moves sent to game {game_id}")
+
+    async def flush_all(self) -> None:
+        """Сброс всех комнат (при остановке приложения)"""
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for game_id in list(self._pending):
+            await self.flush(game_id)
+
+
+_coalescer: Optional[TokenMoveCoalescer] = None
+
+
+def configure_move_coalescer(sio, persist: PersistMoves) -> TokenMoveCoalescer:
+    """Создание коалесцера для сервера `sio` (при регистрации обработчиков)"""
+    global _coalescer
+    _coalescer = TokenMoveCoalescer(
+        sio,
+        persist,
+        tick_hz=settings.token_tick_hz,
+        default_enabled=settings.token_tick_default,
+    )
+    return _coalescer
+
+
+def get_move_coalescer() -> Optional[TokenMoveCoalescer]:
+    return _coalescer
+
+
+async def flush_move_coalescer() -> None:
+    if _coalescer is not None:
+        await _coalescer.flush_all()
@@ -0,0 +1,122 @@
+"""
+Кэш профилей пользователей для рассылок Socket.IO
+
+Броски, чат, готовность и вход в игру показывают имя пользователя. Вместо запроса
+к `users` на каждое событие профиль берется из LRU-кэша воркера с TTL, при промахе —
+из Redis (если включен общий кэш), и только затем из БД.
+
+Профили не инвалидируются: имя пользователя после регистрации не меняется (API для
+этого нет). Если такое изменение появится, устаревшее имя живет не дольше `user_cache_ttl`.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+from uuid import UUID
+from redis.exceptions import RedisError
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _profile_key(user_id: UUID) -> str:
+    return f"user:{user_id}:profile"
+
+
+class UserProfileCache:
+    """Ограниченный LRU-кэш профилей с TTL и счетчиками попаданий"""
+
+    def __init__(self, max_size: int, ttl: float, redis=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.redis = redis
+        # Кэш читается из потоков пула БД, поэтому доступ под блокировкой
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[UUID, tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_local(self, user_id: UUID) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, profile = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return profile
+
+    def _put_local(self, user_id: UUID, profile: dict) -> None:
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, profile)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, user_id: UUID, load: Callable[[], Optional[dict]]) -> Optional[dict]:
+        """Профиль пользователя; `load()` вызывается только при промахе всех уровней"""
+        profile = self._get_local(user_id)
+        if profile is not None:
+            return profile
+
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(_profile_key(user_id))
+            except RedisError as e:
+                logger.warning(f"Failed to read user {user_id} profile from Redis: {e}")
+                raw = None
+            if raw:
+                profile = json.loads(raw)
+                with self._lock:
+                    self.redis_hits += 1
+                self._put_local(user_id, profile)
+                return profile
+
+        with self._lock:
+            self.misses += 1
+        profile = load()
+        if profile is None:
+            return None
+        self._put_local(user_id, profile)
+        if self.redis is not None:
+            try:
+                self.redis.set(_profile_key(user_id), json.dumps(profile), ex=int(self.ttl))
+            except RedisError as e:
+                logger.warning(f"Failed to save user {user_id} profile to Redis: {e}")
+        return profile
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.redis_hits) / lookups, 4) if lookups else None,
+            }
+
+
+_cache: Optional[UserProfileCache] = None
+
+
+def get_user_cache() -> UserProfileCache:
+    """Кэш профилей воркера (ленивое создание); общий уровень Redis — при SOCKET_BACKEND=redis"""
+    global _cache
+    if _cache is None:
+        redis = None
+        if settings.socket_backend == "redis":
+            from ..redis_client import redis_client
+            redis = redis_client
+        _cache = UserProfileCache(settings.user_cache_size, settings.user_cache_ttl, redis)
+    return _cache
@@ -1,11 +1,21 @@
 import logging
 from uuid import UUID
+from redis.exceptions import RedisError
 from sqlalchemy.orm import Session
-from ..database import SessionLocal
 from ..models.user import User
 from ..models.game_participant import GameParticipant
-from ..services.game_service import get_game_by_id, get_game_tokens
+from ..services.game_service import get_game_by_id, get_game_tokens, get_game_participants
 from ..utils.jwt import decode_access_token
+from ..services.game_cache import (
+    read_game_snapshot,
+    write_game_snapshot,
+    save_game_state_to_redis,
+    serialize_token,
+    apply_positions,
+    get_member_role,
+)
+from ..services.position_buffer import get_position_buffer
+from .user_cache import get_user_cache
 
 logger = logging.getLogger(__name__)
 
@@ -18,54 +28,77 @@ def get_user_from_token(token: str) -> UUID | None:
     return None
 
 
-def get_user_from_db(user_id: UUID) -> User | None:
-    """Получение пользователя из БД"""
-    db = SessionLocal()
-    try:
-        return db.query(User).filter(User.id == user_id).first()
-    finally:
-        db.close()
+def get_username(db: Session, user_id: UUID) -> str | None:
+    """Имя пользователя для рассылок (LRU-кэш профилей, при промахе — БД)"""
+    def load_profile() -> dict | None:
+        username = db.query(User.username).filter(User.id == user_id).scalar()
+        return {"username": username} if username is not None else None
 
+    profile = get_user_cache().get(user_id, load_profile)
+    return profile["username"] if profile else None
 
-def get_game_state(db: Session, game_id: UUID, include_hidden: bool = False) -> dict:
-    """Получение полного состояния игры. include_hidden=True только для мастера."""
+
+def get_participant_role(db: Session, game_id: UUID, user_id: UUID) -> str | None:
+    """Роль участника игры для авторизации событий (кэш Redis, при промахе — БД)"""
+    def load_role() -> str | None:
+        return db.query(GameParticipant.role).filter(
+            GameParticipant.game_id == game_id,
+            GameParticipant.user_id == user_id
+        ).scalar()
+
+    return get_member_role(game_id, user_id, load_role)
+
+
+def _load_game_snapshot(db: Session, game_id: UUID) -> tuple[dict, list[dict]]:
+    """Метаданные игры и список игроков из БД"""
     game = get_game_by_id(db, game_id)
-    tokens = get_game_tokens(db, game_id, include_hidden=include_hidden)
-    participants = db.query(GameParticipant).filter(
-        GameParticipant.game_id == game_id
-    ).all()
-
-    players = []
-    for participant in participants:
-        user = db.query(User).filter(User.id == participant.user_id).first()
-        if user:
-            players.append({
-                "user_id": str(user.id),
-                "username": user.username,
-                "role": participant.role,
-                "is_ready": participant.is_ready,
-                "character_id": str(participant.character_id) if participant.character_id else None
-            })
+    players = get_game_participants(db, game_id)
+
+    game_data = {
+        "id": str(game.id),
+        "name": game.name,
+        "invite_code": game.invite_code,
+        "map_url": game.map_url
+    }
+    return game_data, players
+
+
+def get_game_state(db: Session, game_id: UUID, include_hidden: bool = False) -> dict:
+    """
+    Получение полного состояния игры. include_hidden=True только для мастера.
+
+    Сначала читается кэш Redis (снимок игры + хэш токенов одним pipeline).
+    При промахе недостающая часть собирается из БД и записывается обратно.
+    """
+    # Позиции, еще не сохраненные write-behind буфером этого воркера
+    positions = {str(token_id): xy for token_id, xy in get_position_buffer().pending_positions(game_id).items()}
+    try:
+        snapshot, tokens, live_positions, version, tokens_version = read_game_snapshot(game_id)
+        positions.update(live_positions)
+    except RedisError as e:
+        logger.warning(f"Failed to read game {game_id} state from Redis: {e}")
+        snapshot, tokens, version, tokens_version = None, None, None, None
+
+    if snapshot is not None:
+        game_data, players = snapshot["game"], snapshot["players"]
+    else:
+        game_data, players = _load_game_snapshot(db, game_id)
+        if version is not None:
+            write_game_snapshot(game_id, version, game_data, players)
+
+    if tokens is None:
+        db_tokens = get_game_tokens(db, game_id, include_hidden=True)
+        if tokens_version is not None:
+            # Запишется, только если токены не менялись после чтения счетчика
+            save_game_state_to_redis(game_id, db_tokens, tokens_version)
+        tokens = [serialize_token(token) for token in db_tokens]
+    tokens = apply_positions(tokens, positions)
+
+    if not include_hidden:
+        tokens = [token for token in tokens if not token["is_hidden"]]
 
     return {
-        "game": {
-            "id": str(game.id),
-            "name": game.name,
-            "invite_code": game.invite_code,
-            "map_url": game.map_url
-        },
-        "tokens": [
-            {
-                "id": str(token.id),
-                "name": token.name,
-                "x": token.x,
-                "y": token.y,
-                "image_url": token.image_url,
-                "is_hidden": token.is_hidden,
-                "token_type": token.token_type,
-                "token_metadata": token.token_metadata,
-            }
-            for token in tokens
-        ],
+        "game": game_data,
+        "tokens": tokens,
         "players": players
     }
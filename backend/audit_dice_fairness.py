@@ -0,0 +1,66 @@
+"""
+Аудит честности кубиков по истории бросков
+Использование: python audit_dice_fairness.py [game_id] [--json]
+
+Без game_id проверяется вся история сервера. Код выхода 1, если хотя бы
+один вид кубика помечен как подозрительный (p-value ниже порога при достаточной выборке).
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from uuid import UUID
+
+# Добавляем путь к app
+backend_path = Path(__file__).parent
+sys.path.insert(0, str(backend_path))
+
+# Загружаем переменные окружения
+from dotenv import load_dotenv
+env_path = backend_path / '.env'
+if env_path.exists():
+    load_dotenv(env_path)
+
+from app.database import SessionLocal
+from app.services.dice_fairness import compute_fairness_audit
+
+
+def _print_dice(title: str, dice: list) -> bool:
+    flagged = False
+    print(title)
+    for die in dice:
+        p_values = ", ".join(
+            f"{name}={die[name]['p_value']:.4g}" for name in ("chi_square", "ks", "runs") if die[name]
+        )
+        mark = "❌" if die["flagged"] else ("✅" if die["sufficient"] else "…")
+        print(f"  {mark} d{die['faces']}: {die['count']} кубиков, {p_values}")
+        flagged = flagged or die["flagged"]
+    return flagged
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Аудит честности кубиков")
+    parser.add_argument("game_id", type=UUID, nargs="?", help="Игра (по умолчанию — все)")
+    parser.add_argument("--json", action="store_true", help="Вывести полный отчет в JSON")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = compute_fairness_audit(db, args.game_id)
+    finally:
+        db.close()
+
+    flagged = any(die["flagged"] for scope in [report] + report["users"] for die in scope["dice"])
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+    else:
+        print(f"Проверено бросков: {report['rows']}, порог p-value: {report['alpha']}")
+        _print_dice("Все кубики:", report["dice"])
+        for user in report["users"]:
+            _print_dice(f"Игрок {user['user_id']}:", user["dice"])
+
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк действий боя: путь через БД против движка боев в памяти
+
+Одна встреча с N участниками; цикл действий — урон, исцеление, наложение и снятие
+состояния, переход хода — выполняется через `combat_service`:
+
+- db: как было — SELECT участника, UPDATE и COMMIT на каждое действие;
+- engine: `settings.combat_engine`, действия меняют состояние в памяти, в конце
+  один сброс грязного состояния (время сброса входит в результат).
+
+База — SQLite в памяти, поэтому выигрыш занижен: у Postgres на каждое действие
+добавляется сетевой round trip.
+
+Запуск:
+    python -m benchmarks.combat_engine_throughput --participants 8 --actions 5000
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import User, GameSession, CombatSession, CombatParticipant  # noqa: E402
+from app.services import combat_service  # noqa: E402
+from app.services.combat_engine import get_combat_engine  # noqa: E402
+
+
+def _make_session():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+def _seed(db, participants: int):
+    user = User(id=uuid.uuid4(), email="bench@example.com", username="bench", password_hash="x")
+    game = GameSession(id=uuid.uuid4(), name="bench", invite_code="BENCH1", master_id=user.id)
+    combat = CombatSession(id=uuid.uuid4(), game_id=game.id, is_active=True, current_turn_index=0, round_number=1)
+    rows = [
+        CombatParticipant(
+            id=uuid.uuid4(), combat_id=combat.id, name=f"p{i}", initiative=20 - i,
+            current_hp=10_000, max_hp=10_000, armor_class=12, is_player_controlled=False,
+        )
+        for i in range(participants)
+    ]
+    db.add_all([user, game, combat, *rows])
+    db.commit()
+    return combat.id, [row.id for row in rows]
+
+
+def _run_actions(db, combat_id, ids, actions: int) -> None:
+    for i in range(actions):
+        target = ids[i % len(ids)]
+        step = i % 5
+        if step == 0:
+            combat_service.apply_damage(db, combat_id, target, 3, "fire")
+        elif step == 1:
+            combat_service.apply_healing(db, combat_id, target, 2)
+        elif step == 2:
+            combat_service.apply_condition(db, combat_id, target, "prone")
+        elif step == 3:
+            combat_service.remove_condition(db, combat_id, target, "prone")
+        else:
+            combat_service.next_turn(db, combat_id)
+
+
+def _measure(use_engine: bool, participants: int, actions: int) -> tuple:
+    db = _make_session()
+    combat_id, ids = _seed(db, participants)
+    settings.combat_engine = use_engine
+    engine = get_combat_engine()
+    if use_engine:
+        # Загрузка встречи — разовая, как при первом действии после старта воркера
+        engine.load(db, combat_id)
+
+    started = time.perf_counter()
+    _run_actions(db, combat_id, ids, actions)
+    acting = time.perf_counter() - started
+    flush_ms = 0.0
+    if use_engine:
+        flush_started = time.perf_counter()
+        engine.flush_sync(db, combat_id)
+        flush_ms = (time.perf_counter() - flush_started) * 1000
+    elapsed = time.perf_counter() - started
+    db.close()
+    return actions / elapsed, acting / actions * 1e6, flush_ms
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--participants", type=int, default=8)
+    parser.add_argument("--actions", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{'path':>8}{'actions/s':>14}{'us/action':>12}{'flush ms':>10}")
+    results = {}
+    for name, use_engine in (("db", False), ("engine", True)):
+        rate, per_action_us, flush_ms = _measure(use_engine, args.participants, args.actions)
+        results[name] = rate
+        print(f"{name:>8}{rate:>14,.0f}{per_action_us:>12.1f}{flush_ms:>10.2f}")
+    print(f"speedup: {results['engine'] / results['db']:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пропускной способности бросков: скалярный путь против пакетного
+
+Сравниваются:
+- scalar: `DiceRoller.roll` / `DicePlan.roll` в цикле (random.randint на каждый кубик)
+- batch: `DiceRoller.roll_batch` — весь пакет одним векторизованным проходом NumPy
+
+Результат — кубиков в секунду на одном ядре.
+
+Запуск:
+    python -m benchmarks.dice_batch_throughput --rolls 1000000 --expressions 1d20 10d6 4d6kh3
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+from app.services.dice_expression import compile_expression  # noqa: E402
+from app.services.dice_service import DiceRoller  # noqa: E402
+
+
+def _measure_scalar(expression: str, rolls: int) -> float:
+    plan = compile_expression(expression)
+    started = time.perf_counter()
+    for _ in range(rolls):
+        plan.roll()
+    return time.perf_counter() - started
+
+
+def _measure_batch(roller: DiceRoller, expression: str, rolls: int) -> float:
+    started = time.perf_counter()
+    roller.roll_batch(expression, rolls)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--expressions", nargs="+", default=["1d20", "10d6", "4d6kh3", "2d6!+3"])
+    parser.add_argument("--rolls", type=int, default=1_000_000, help="Размер пакета для batch")
+    parser.add_argument("--scalar-rolls", type=int, default=50_000, help="Бросков для скалярного пути")
+    args = parser.parse_args()
+
+    roller = DiceRoller()
+    print(f"{'expression':<14}{'mode':<8}{'rolls':>10}{'seconds':>10}{'Mdice/s':>10}{'speedup':>10}")
+    for expression in args.expressions:
+        dice = compile_expression(expression).dice_count
+        scalar = _measure_scalar(expression, args.scalar_rolls)
+        scalar_rate = args.scalar_rolls * dice / scalar / 1e6
+        batch = _measure_batch(roller, expression, args.rolls)
+        batch_rate = args.rolls * dice / batch / 1e6
+        print(f"{expression:<14}{'scalar':<8}{args.scalar_rolls:>10}{scalar:>10.3f}{scalar_rate:>10.2f}{'':>10}")
+        print(f"{expression:<14}{'batch':<8}{args.rolls:>10}{batch:>10.3f}{batch_rate:>10.2f}{batch_rate / scalar_rate:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
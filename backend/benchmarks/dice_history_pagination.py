@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк глубоких страниц истории бросков: OFFSET против keyset-курсора
+
+Сравниваются:
+- offset: как было — одиночные индексы game_id/created_at, ORDER BY created_at DESC OFFSET N LIMIT 50
+- keyset: составной индекс (game_id, created_at DESC, id DESC), условие (created_at, id) < курсора
+
+Обе схемы — отдельные SQLite в памяти с одинаковыми данными: одна длинная кампания
+и шумовые броски других игр. Время — медиана по повторам на страницу.
+
+Запуск:
+    python -m benchmarks.dice_history_pagination --rolls 100000 --pages 1 100 500 1000 1900
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+from sqlalchemy import create_engine, desc, insert, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import User, GameSession  # noqa: E402
+from app.models.dice_roll_history import DiceRollHistory  # noqa: E402
+from app.services.dice_service import encode_history_cursor, get_roll_history_page  # noqa: E402
+
+LIMIT = 50
+LEGACY_INDEXES = [
+    "CREATE INDEX ix_dice_roll_history_game_id ON dice_roll_history (game_id)",
+    "CREATE INDEX ix_dice_roll_history_created_at ON dice_roll_history (created_at)",
+]
+
+
+def _make_session(legacy: bool):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    if legacy:
+        with engine.begin() as conn:
+            for index in DiceRollHistory.__table__.indexes:
+                if index.name != "ix_dice_roll_history_user_id":
+                    conn.execute(text(f"DROP INDEX {index.name}"))
+            for ddl in LEGACY_INDEXES:
+                conn.execute(text(ddl))
+    return sessionmaker(bind=engine)()
+
+
+def _seed(db, rolls: int, noise_games: int):
+    user = User(id=uuid.uuid4(), email="bench@example.com", username="bench", password_hash="x")
+    games = [GameSession(id=uuid.uuid4(), name=f"g{i}", invite_code=f"B{i:05d}", master_id=user.id)
+             for i in range(noise_games + 1)]
+    db.add(user)
+    db.add_all(games)
+    db.commit()
+
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    batch = []
+    for i in range(rolls * (noise_games + 1)):
+        game = games[i % (noise_games + 1)]
+        batch.append({
+            "id": uuid.uuid4(), "game_id": game.id, "user_id": user.id, "count": 1, "faces": 20,
+            "rolls": [{"die_id": "d1", "value": 10}], "total": 10, "roll_type": "attack",
+            "created_at": base + timedelta(milliseconds=i),
+        })
+        if len(batch) == 10000:
+            db.execute(insert(DiceRollHistory), batch)
+            batch = []
+    if batch:
+        db.execute(insert(DiceRollHistory), batch)
+    db.commit()
+    return games[0].id
+
+
+def _median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rolls", type=int, default=100_000, help="Бросков в длинной кампании")
+    parser.add_argument("--noise-games", type=int, default=1, help="Игр с таким же числом бросков")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 100, 500, 1000, 1900])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    legacy_db, keyset_db = _make_session(legacy=True), _make_session(legacy=False)
+    legacy_game = _seed(legacy_db, args.rolls, args.noise_games)
+    keyset_game = _seed(keyset_db, args.rolls, args.noise_games)
+
+    print(f"{'page':>6}{'offset ms':>12}{'keyset ms':>12}{'speedup':>10}")
+    for page in args.pages:
+        skip = (page - 1) * LIMIT
+        if skip >= args.rolls:
+            continue
+
+        def legacy_page():
+            legacy_db.query(DiceRollHistory).filter(
+                DiceRollHistory.game_id == legacy_game
+            ).order_by(desc(DiceRollHistory.created_at)).offset(skip).limit(LIMIT).all()
+
+        cursor = None
+        if skip:
+            previous = keyset_db.query(DiceRollHistory).filter(
+                DiceRollHistory.game_id == keyset_game
+            ).order_by(DiceRollHistory.created_at.desc(), DiceRollHistory.id.desc()).offset(skip - 1).first()
+            cursor = encode_history_cursor(previous)
+
+        def keyset_page():
+            get_roll_history_page(keyset_db, keyset_game, LIMIT, cursor=cursor)
+
+        offset_ms = _median_ms(legacy_page, args.repeat)
+        keyset_ms = _median_ms(keyset_page, args.repeat)
+        print(f"{page:>6}{offset_ms:>12.2f}{keyset_ms:>12.2f}{offset_ms / keyset_ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк задержки Socket.IO событий при медленной БД
+
+Каждая «комната» шлёт события с фиксированной частотой; обработчик события
+выполняет запрос к БД (эмулируется через time.sleep). Параллельно измеряется
+задержка лёгкого события, которое БД не трогает (пинг/чат из кэша).
+
+Режимы:
+- blocking: синхронный запрос прямо внутри async-обработчика (как было раньше)
+- executor: запрос через app.services.db_executor.run_db
+
+Запуск:
+    python -m benchmarks.socket_event_latency --rooms 1 5 20 50 --db-ms 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+from app.sockets import db as socket_db  # noqa: E402
+
+
+class _DummySession:
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _slow_query(db, delay: float):
+    time.sleep(delay)
+    return True
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _run(mode: str, rooms: int, db_delay: float, duration: float, rate: float) -> dict:
+    latencies: list[float] = []
+    stop_at = time.perf_counter() + duration
+
+    async def handle_db_event():
+        if mode == "blocking":
+            _slow_query(_DummySession(), db_delay)
+        else:
+            await socket_db.run_db(_slow_query, db_delay)
+
+    async def room_client():
+        pending = set()
+        while time.perf_counter() < stop_at:
+            pending.add(asyncio.create_task(handle_db_event()))
+            pending = {t for t in pending if not t.done()}
+            await asyncio.sleep(1 / rate)
+        await asyncio.gather(*pending)
+
+    async def probe():
+        # Лёгкое событие без БД: меряем, насколько позже запланированного оно обработано
+        interval = 0.002
+        while time.perf_counter() < stop_at:
+            sent = time.perf_counter()
+            await asyncio.sleep(interval)
+            latencies.append((time.perf_counter() - sent - interval) * 1000)
+
+    await asyncio.gather(probe(), *(room_client() for _ in range(rooms)))
+    return {
+        "p50": statistics.median(latencies),
+        "p99": _percentile(latencies, 99),
+        "samples": len(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, nargs="+", default=[1, 5, 20, 50])
+    parser.add_argument("--db-ms", type=float, default=5.0, help="Эмулируемая задержка запроса к БД, мс")
+    parser.add_argument("--rate", type=float, default=5.0, help="Событий в секунду на комнату")
+    parser.add_argument("--duration", type=float, default=2.0, help="Длительность прогона, с")
+    args = parser.parse_args()
+
+    with patch.object(socket_db.database, "SessionLocal", _DummySession):
+        print(f"{'mode':<10}{'rooms':>7}{'p50, ms':>12}{'p99, ms':>12}{'samples':>10}")
+        for mode in ("blocking", "executor"):
+            for rooms in args.rooms:
+                stats = asyncio.run(_run(mode, rooms, args.db_ms / 1000, args.duration, args.rate))
+                print(f"{mode:<10}{rooms:>7}{stats['p50']:>12.3f}{stats['p99']:>12.3f}{stats['samples']:>10}")
+    socket_db.shutdown_executor()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк стоимости одного token_move в зависимости от числа токенов на карте
+
+Сравниваются:
+- legacy: UPDATE + SELECT всех токенов + DELETE и HSET на каждый токен (как было)
+- delta: UPDATE + один скрипт (EXISTS, HSET поля, EXPIRE, HDEL живой позиции)
+- live: write-behind — только скрипт живой позиции в Redis (с проверкой, что токен из
+  этой игры), UPDATE откладывается буфером
+
+БД — SQLite в памяти, Redis — in-memory клиент с эмулируемой задержкой round trip.
+
+Запуск:
+    python -m benchmarks.token_move_cost --tokens 10 100 300 1000 --rtt-ms 0.2
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+from app.database import Base  # noqa: E402
+from app.models import User, GameSession, Token  # noqa: E402
+from app.schemas.token import TokenUpdate  # noqa: E402
+from app.services.game_service import update_token_position, get_game_tokens  # noqa: E402
+from app.services import game_service  # noqa: E402
+from app.services import game_cache as cache  # noqa: E402
+
+
+class LatencyRedis:
+    """Хэши в памяти; каждый round trip стоит `rtt` секунд"""
+
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.data: dict = {}
+        self.round_trips = 0
+
+    def _trip(self):
+        self.round_trips += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+
+    def delete(self, key, _trip=True):
+        _trip and self._trip()
+        return int(self.data.pop(key, None) is not None)
+
+    def exists(self, key, _trip=True):
+        _trip and self._trip()
+        return int(key in self.data)
+
+    def expire(self, key, seconds, _trip=True):
+        _trip and self._trip()
+        return key in self.data
+
+    def hset(self, key, field=None, value=None, mapping=None, _trip=True):
+        _trip and self._trip()
+        bucket = self.data.setdefault(key, {})
+        if mapping:
+            bucket.update(mapping)
+        if field is not None:
+            bucket[field] = value
+        return 1
+
+    def hdel(self, key, *fields, _trip=True):
+        _trip and self._trip()
+        return sum(1 for f in fields if self.data.get(key, {}).pop(f, None) is not None)
+
+    def eval(self, script, numkeys, *keys_and_args, _trip=True):
+        """Скрипты `cache` (перестройка и точечная запись токенов, живые позиции) — одним round trip"""
+        _trip and self._trip()
+        keys, args = keys_and_args[:numkeys], keys_and_args[numkeys:]
+        if script == cache.REBUILD_TOKENS_SCRIPT:
+            tokens_key, version_key = keys
+            if tokens_key in self.data or int(self.data.get(version_key, 0)) != int(args[0]):
+                return 0
+            self.data[tokens_key] = dict(zip(args[2::2], args[3::2]))
+            return 1
+        tokens_key, positions_key = keys[:2]
+        fields, values = args[1::2], args[2::2]
+        tokens = self.data.get(tokens_key)
+        if script == cache.UPDATE_TOKENS_SCRIPT:
+            for field in fields:
+                self.data.get(positions_key, {}).pop(field, None)
+            version = int(self.data.get(keys[2], 0)) + 1
+            self.data[keys[2]] = version
+            if tokens is None:
+                return [0, version]
+            tokens.update(zip(fields, values))
+            return [1, version]
+        if tokens is None:
+            return None
+        staged = [(f, v) for f, v in zip(fields, values) if f in tokens]
+        self.data.setdefault(positions_key, {}).update(staged)
+        return [f for f, _ in staged]
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+
+class _Pipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.queue = []
+
+    def __getattr__(self, name):
+        def _queue(*args, **kwargs):
+            self.queue.append((name, args, kwargs))
+        return _queue
+
+    def execute(self):
+        self.redis._trip()
+        return [getattr(self.redis, n)(*a, _trip=False, **kw) for n, a, kw in self.queue]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def legacy_save(redis, game_id, tokens):
+    """Старая реализация save_game_state_to_redis"""
+    tokens_key = f"game:{game_id}:tokens"
+    redis.delete(tokens_key)
+    for token in tokens:
+        redis.hset(tokens_key, str(token.id), json.dumps(cache.serialize_token(token)))
+    redis.expire(tokens_key, 86400)
+
+
+def _setup(token_count: int):
+    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    user = User(id=uuid.uuid4(), email="bench@example.com", username="bench", password_hash="x")
+    game = GameSession(id=uuid.uuid4(), name="Bench", invite_code="BENCH1", master_id=user.id)
+    db.add_all([user, game])
+    tokens = [Token(id=uuid.uuid4(), game_id=game.id, name=f"T{i}", x=1.0, y=1.0) for i in range(token_count)]
+    db.add_all(tokens)
+    db.commit()
+    return db, game, tokens
+
+
+def _measure(mode: str, token_count: int, moves: int, rtt: float) -> tuple[float, float]:
+    db, game, tokens = _setup(token_count)
+    redis = LatencyRedis(rtt)
+    with patch.object(cache, "redis_client", redis):
+        cache.save_game_state_to_redis(game.id, tokens, 0)
+        redis.round_trips = 0
+        started = time.perf_counter()
+        for i in range(moves):
+            token_id = tokens[i % token_count].id
+            position = TokenUpdate(x=float(i % 100), y=5.0)
+            if mode == "legacy":
+                with patch.object(game_service, "update_token_in_redis"):
+                    update_token_position(db, token_id, position)
+                legacy_save(redis, game.id, get_game_tokens(db, game.id))
+            elif mode == "delta":
+                update_token_position(db, token_id, position)
+            else:
+                game_service.stage_token_positions(db, game.id, {token_id: (position.x, position.y)})
+        elapsed = time.perf_counter() - started
+    db.close()
+    return elapsed / moves * 1000, redis.round_trips / moves
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, nargs="+", default=[10, 100, 300, 1000])
+    parser.add_argument("--moves", type=int, default=100)
+    parser.add_argument("--rtt-ms", type=float, default=0.2, help="Задержка одного round trip до Redis, мс")
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'tokens':>8}{'ms/move':>12}{'redis RTT/move':>16}")
+    for mode in ("legacy", "delta", "live"):
+        for count in args.tokens:
+            ms, trips = _measure(mode, count, args.moves, args.rtt_ms / 1000)
+            print(f"{mode:<8}{count:>8}{ms:>12.3f}{trips:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
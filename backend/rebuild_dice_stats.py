@@ -0,0 +1,45 @@
+"""
+Пересчет агрегатов статистики бросков из истории
+Использование: python rebuild_dice_stats.py [game_id] [--batch-size N]
+
+Без game_id пересчитываются все игры. История читается потоково, пакетами,
+поэтому память не зависит от ее размера. Нужен после миграции, добавившей агрегаты,
+или если счетчики разошлись с историей (например, после ручной правки строк).
+"""
+import argparse
+import sys
+from pathlib import Path
+from uuid import UUID
+
+# Добавляем путь к app
+backend_path = Path(__file__).parent
+sys.path.insert(0, str(backend_path))
+
+# Загружаем переменные окружения
+from dotenv import load_dotenv
+env_path = backend_path / '.env'
+if env_path.exists():
+    load_dotenv(env_path)
+
+from app.database import SessionLocal
+from app.services.dice_stats import REBUILD_BATCH_SIZE, rebuild_roll_stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Пересчет статистики бросков")
+    parser.add_argument("game_id", type=UUID, nargs="?", help="Игра (по умолчанию — все)")
+    parser.add_argument("--batch-size", type=int, default=REBUILD_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        processed = rebuild_roll_stats(db, args.game_id, args.batch_size)
+    finally:
+        db.close()
+
+    print(f"✅ Статистика пересчитана, учтено бросков: {processed}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
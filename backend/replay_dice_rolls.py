@@ -0,0 +1,61 @@
+"""
+Воспроизведение бросков игры по seed потока и сверка с историей
+Использование: python replay_dice_rolls.py <game_id> [--seed SEED]
+
+Без --seed используется seed из БД. Переданный seed проверяется по опубликованному хэшу.
+Проверяются только броски из истории; боевые броски (атаки, спасброски, инициатива,
+HP монстров) в историю не пишутся и не проверяются.
+Код выхода 1, если хотя бы один бросок не совпал или seed не соответствует хэшу.
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from uuid import UUID
+
+# Добавляем путь к app
+backend_path = Path(__file__).parent
+sys.path.insert(0, str(backend_path))
+
+# Загружаем переменные окружения
+from dotenv import load_dotenv
+env_path = backend_path / '.env'
+if env_path.exists():
+    load_dotenv(env_path)
+
+from app.database import SessionLocal
+from app.services.dice_rng import replay_game_rolls
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Воспроизведение бросков игры")
+    parser.add_argument("game_id", type=UUID)
+    parser.add_argument("--seed", help="Seed потока (по умолчанию — из БД)")
+    parser.add_argument("--json", action="store_true", help="Вывести полный отчет в JSON")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = replay_game_rolls(db, args.game_id, args.seed)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        db.close()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"Seed соответствует хэшу: {'да' if report['commitment_ok'] else 'НЕТ'}")
+        print(f"Проверено бросков: {report['checked']}, пропущено (без номера в потоке): {report['skipped']}")
+        for mismatch in report["mismatches"]:
+            print(f"❌ #{mismatch['rng_offset']} ({mismatch['id']}): "
+                  f"в истории {mismatch['stored']['total']}, пересчитано {mismatch['replayed']['total']}")
+        if not report["mismatches"]:
+            print("✅ Все броски совпадают")
+
+    return 0 if report["commitment_ok"] and not report["mismatches"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,6 +15,7 @@ from app.database import Base, get_db
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import auth, games, maps, dice, characters, combat, game_data
+from app.services import game_cache
 import os
 
 # Устанавливаем тестовые переменные окружения перед импортом настроек
@@ -267,3 +268,337 @@ def test_user_id(test_user):
     """ID тестового пользователя"""
     return test_user.id
 
+
+
+class FakeSocketServer:
+    """Минимальная замена socketio.AsyncServer: собирает обработчики и эмиты"""
+
+    def __init__(self):
+        self.handlers = {}
+        self.emitted = []
+        self.rooms = {}
+
+    def event(self, func):
+        self.handlers[func.__name__] = func
+        return func
+
+    async def emit(self, event, data=None, room=None, skip_sid=None, **kwargs):
+        self.emitted.append((event, data, room))
+
+    async def enter_room(self, sid, room, namespace=None):
+        self.rooms.setdefault(room, set()).add(sid)
+
+    async def leave_room(self, sid, room, namespace=None):
+        self.rooms.get(room, set()).discard(sid)
+
+    def events(self, name):
+        """Все payload'ы отправленного события `name`"""
+        return [data for event, data, _ in self.emitted if event == name]
+
+
+@pytest.fixture
+def fake_sio():
+    """Фейковый Socket.IO сервер с зарегистрированными обработчиками"""
+    from app.sockets.game_events import register_socket_handlers
+    sio = FakeSocketServer()
+    register_socket_handlers(sio)
+    return sio
+
+
+@pytest.fixture(autouse=True)
+def reset_socket_caches():
+    """Отдельные буферы write-behind, кэш профилей, потоки бросков, шаблоны, аудит и движок боев для каждого теста"""
+    yield
+    from app.sockets import user_cache, dice_history_buffer
+    from app.services import combat_engine, dice_fairness, dice_rng, dice_service, position_buffer
+    user_cache._cache = None
+    dice_rng._registry = None
+    dice_fairness._cache = None
+    dice_service._template_store = None
+    tasks = []
+    if position_buffer._buffer is not None:
+        tasks.append(position_buffer._buffer._task)
+    if dice_history_buffer._buffer is not None:
+        tasks += [dice_history_buffer._buffer._timer, dice_history_buffer._buffer._size_flush]
+    if combat_engine._engine is not None:
+        tasks.append(combat_engine._engine._task)
+    position_buffer._buffer = None
+    dice_history_buffer._buffer = None
+    combat_engine._engine = None
+    for task in tasks:
+        if task is None:
+            continue
+        try:
+            task.cancel()
+        except RuntimeError:
+            # event loop теста уже закрыт
+            pass
+
+
+@pytest.fixture
+def socket_db(db_session):
+    """Переключает сессии Socket.IO слоя на тестовую БД"""
+    with patch("app.database.SessionLocal", TestingSessionLocal):
+        yield db_session
+
+
+class FakeRedis:
+    """
+    In-memory замена redis.Redis для тестов (строки, хэши, множества, pipeline).
+    `commands` считает отправленные команды, `round_trips` — обращения к серверу.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.commands = 0
+        self.round_trips = 0
+
+    # --- служебное ---
+    def _hit(self):
+        self.commands += 1
+
+    def pipeline(self, transaction=True):
+        return FakeRedisPipeline(self)
+
+    def _call(self, name, *args, **kwargs):
+        self.round_trips += 1
+        return getattr(self, name)(*args, **kwargs)
+
+    # --- ключи и строки ---
+    def get(self, key):
+        self._hit()
+        value = self.data.get(key)
+        return value if isinstance(value, str) else None
+
+    def set(self, key, value, ex=None, nx=False):
+        self._hit()
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        return True
+
+    def incr(self, key, amount=1):
+        self._hit()
+        value = int(self.data.get(key, 0)) + amount
+        self.data[key] = str(value)
+        return value
+
+    def delete(self, *keys):
+        self._hit()
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    def exists(self, *keys):
+        self._hit()
+        return sum(1 for key in keys if key in self.data)
+
+    def expire(self, key, seconds):
+        self._hit()
+        return key in self.data
+
+    # --- хэши ---
+    def hset(self, key, field=None, value=None, mapping=None):
+        self._hit()
+        bucket = self.data.setdefault(key, {})
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        added = sum(1 for f in items if f not in bucket)
+        bucket.update({f: str(v) for f, v in items.items()})
+        return added
+
+    def hget(self, key, field):
+        self._hit()
+        return self.data.get(key, {}).get(field)
+
+    def hgetall(self, key):
+        self._hit()
+        return dict(self.data.get(key, {}))
+
+    def hdel(self, key, *fields):
+        self._hit()
+        bucket = self.data.get(key, {})
+        removed = sum(1 for f in fields if bucket.pop(f, None) is not None)
+        if key in self.data and not bucket:
+            self.data.pop(key)
+        return removed
+
+    def hincrby(self, key, field, amount=1):
+        self._hit()
+        bucket = self.data.setdefault(key, {})
+        bucket[field] = str(int(bucket.get(field, 0)) + amount)
+        return int(bucket[field])
+
+    # --- Lua-скрипты (эмулируются на Python, см. FAKE_SCRIPTS) ---
+    def eval(self, script, numkeys, *keys_and_args):
+        # Скрипт вызывается вне pipeline: отдельное обращение к серверу
+        self.round_trips += 1
+        self._hit()
+        keys, args = keys_and_args[:numkeys], keys_and_args[numkeys:]
+        return FAKE_SCRIPTS[script](self.data, keys, args)
+
+    # --- множества ---
+    def sadd(self, key, *members):
+        self._hit()
+        bucket = self.data.setdefault(key, set())
+        added = sum(1 for m in members if m not in bucket)
+        bucket.update(members)
+        return added
+
+    def srem(self, key, *members):
+        self._hit()
+        bucket = self.data.get(key, set())
+        removed = sum(1 for m in members if m in bucket)
+        bucket.difference_update(members)
+        if key in self.data and not bucket:
+            self.data.pop(key)
+        return removed
+
+    def smembers(self, key):
+        self._hit()
+        return set(self.data.get(key, set()))
+
+    def scard(self, key):
+        self._hit()
+        return len(self.data.get(key, set()))
+
+
+def _fake_update_tokens(data, keys, args):
+    tokens_key, positions_key, version_key = keys
+    fields = args[1::2]
+    positions = data.get(positions_key, {})
+    for field in fields:
+        positions.pop(field, None)
+    if positions_key in data and not positions:
+        data.pop(positions_key)
+    version = int(data.get(version_key, 0)) + 1
+    data[version_key] = str(version)
+    if tokens_key not in data:
+        return [0, version]
+    data[tokens_key].update({field: str(value) for field, value in zip(fields, args[2::2])})
+    return [1, version]
+
+
+def _fake_rebuild_tokens(data, keys, args):
+    tokens_key, version_key = keys
+    if tokens_key in data or int(data.get(version_key, 0)) != int(args[0]):
+        return 0
+    data[tokens_key] = {field: str(value) for field, value in zip(args[2::2], args[3::2])}
+    return 1
+
+
+def _fake_stage_positions(data, keys, args):
+    tokens_key, positions_key = keys
+    if tokens_key not in data:
+        return None
+    staged = [field for field in args[1::2] if field in data[tokens_key]]
+    values = dict(zip(args[1::2], args[2::2]))
+    if staged:
+        data.setdefault(positions_key, {}).update({field: str(values[field]) for field in staged})
+    return staged
+
+
+FAKE_SCRIPTS = {
+    game_cache.UPDATE_TOKENS_SCRIPT: _fake_update_tokens,
+    game_cache.REBUILD_TOKENS_SCRIPT: _fake_rebuild_tokens,
+    game_cache.STAGE_POSITIONS_SCRIPT: _fake_stage_positions,
+}
+
+
+class FakeRedisPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.queue = []
+
+    def __getattr__(self, name):
+        def _queue(*args, **kwargs):
+            self.queue.append((name, args, kwargs))
+            return self
+        return _queue
+
+    def execute(self):
+        self.redis.round_trips += 1
+        results = [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.queue]
+        self.queue = []
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeAsyncRedis:
+    """Асинхронная обертка над FakeRedis (интерфейс redis.asyncio.Redis)"""
+
+    def __init__(self, redis=None):
+        self.sync = redis or FakeRedis()
+
+    def pipeline(self, transaction=True):
+        return FakeAsyncRedisPipeline(self.sync.pipeline(transaction))
+
+    def __getattr__(self, name):
+        method = getattr(self.sync, name)
+
+        async def _call(*args, **kwargs):
+            self.sync.round_trips += 1
+            return method(*args, **kwargs)
+        return _call
+
+
+class FakeAsyncRedisPipeline:
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    def __getattr__(self, name):
+        return getattr(self.pipeline, name)
+
+    async def execute(self):
+        return self.pipeline.execute()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def fake_redis():
+    """In-memory Redis для тестов кэшей"""
+    return FakeRedis()
+
+
+@pytest.fixture
+def fake_async_redis(fake_redis):
+    """Асинхронный in-memory Redis поверх fake_redis"""
+    return FakeAsyncRedis(fake_redis)
+
+
+class QueryCounter:
+    """Счетчик SQL-запросов, выполненных через test_engine"""
+
+    def __init__(self):
+        self.statements: list[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def reset(self) -> None:
+        self.statements.clear()
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@pytest.fixture
+def query_counter():
+    """Подсчет запросов к тестовой БД (для проверок N+1)"""
+    from sqlalchemy import event
+    counter = QueryCounter()
+    event.listen(test_engine, "before_cursor_execute", counter._on_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(test_engine, "before_cursor_execute", counter._on_execute)
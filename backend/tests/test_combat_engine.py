@@ -0,0 +1,184 @@
+"""
+Тесты движка боев в памяти (write-behind состояния боя)
+"""
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.models.combat_participant import CombatParticipant
+from app.models.combat_session import CombatSession
+from app.services import combat_service
+from app.services.combat_engine import CombatEngine, get_combat_engine
+
+
+def seed_combat(db, game_id, initiatives=(15, 10, 5)):
+    combat = CombatSession(game_id=game_id, is_active=True, current_turn_index=0, round_number=1)
+    db.add(combat)
+    db.flush()
+    participants = [
+        CombatParticipant(
+            combat_id=combat.id, name=f"p{i}", initiative=initiative, current_hp=20, max_hp=20,
+            armor_class=12, is_player_controlled=False, damage_resistances=["fire"],
+        )
+        for i, initiative in enumerate(initiatives)
+    ]
+    db.add_all(participants)
+    db.commit()
+    return combat.id, [p.id for p in participants]
+
+
+def play_round(db, combat_id, ids):
+    combat_service.apply_damage(db, combat_id, ids[0], 30, "fire")
+    combat_service.apply_damage(db, combat_id, ids[1], 25)
+    combat_service.apply_healing(db, combat_id, ids[1], 4)
+    combat_service.apply_condition(db, combat_id, ids[2], "prone")
+    combat_service.roll_initiative(db, combat_id, ids[2], 18)
+    for _ in range(4):
+        combat_service.next_turn(db, combat_id)
+    combat_service.remove_condition(db, combat_id, ids[2], "prone")
+
+
+def snapshot(db, combat_id):
+    db.expire_all()
+    combat = db.query(CombatSession).filter(CombatSession.id == combat_id).one()
+    rows = db.query(CombatParticipant).filter(CombatParticipant.combat_id == combat_id).all()
+    return (combat.current_turn_index, combat.round_number), sorted(
+        (p.name, p.initiative, p.current_hp, p.conditions, p.death_saves_failure, p.is_dead) for p in rows
+    )
+
+
+@pytest.fixture
+def engine_enabled():
+    with patch.object(settings, "combat_engine", True):
+        yield get_combat_engine()
+
+
+def test_actions_touch_no_sql_until_flush(db_session, test_game, engine_enabled, query_counter):
+    combat_id, ids = seed_combat(db_session, test_game.id)
+    engine_enabled.load(db_session, combat_id)
+
+    query_counter.reset()
+    play_round(db_session, combat_id, ids)
+    assert query_counter.count == 0
+
+    rows = engine_enabled.flush_sync(db_session, combat_id)
+    assert rows == 3
+    updates = [s for s in query_counter.statements if s.startswith("UPDATE")]
+    # executemany по участникам и одна строка сессии
+    assert len(updates) == 2
+
+
+def test_engine_matches_database_path(db_session, test_game):
+    expected_id, expected_ids = seed_combat(db_session, test_game.id)
+    play_round(db_session, expected_id, expected_ids)
+    expected = snapshot(db_session, expected_id)
+
+    with patch.object(settings, "combat_engine", True):
+        combat_id, ids = seed_combat(db_session, test_game.id)
+        play_round(db_session, combat_id, ids)
+        get_combat_engine().flush_sync(db_session, combat_id)
+
+    assert snapshot(db_session, combat_id) == expected
+    assert expected[1][0][2] == 5  # p0: 30 огненного урона при сопротивлении
+
+
+def test_recovery_after_restart(db_session, test_game, engine_enabled):
+    combat_id, ids = seed_combat(db_session, test_game.id)
+    combat_service.apply_damage(db_session, combat_id, ids[0], 7)
+    combat_service.next_turn(db_session, combat_id)
+    engine_enabled.flush_sync(db_session, combat_id)
+
+    # Новый процесс: пустая память, состояние читается из БД
+    with patch("app.services.combat_engine._engine", None):
+        restarted = get_combat_engine()
+        state = restarted.load(db_session, combat_id)
+        assert state.by_id[ids[0]].current_hp == 13
+        assert state.current_turn_index == 1
+
+
+def test_failed_flush_keeps_changes_dirty(db_session, test_game, engine_enabled):
+    combat_id, ids = seed_combat(db_session, test_game.id)
+    combat_service.apply_damage(db_session, combat_id, ids[0], 3)
+
+    with patch("app.services.combat_engine.persist_combat_state", side_effect=RuntimeError("db down")):
+        with pytest.raises(RuntimeError):
+            engine_enabled.flush_sync(db_session, combat_id)
+    assert engine_enabled.dirty_combats() == [combat_id]
+
+    engine_enabled.flush_sync(db_session, combat_id)
+    assert engine_enabled.dirty_combats() == []
+    assert snapshot(db_session, combat_id)[1][0][2] == 17
+
+
+def test_idle_and_ended_combats_are_unloaded(db_session, test_game):
+    # Свой движок: выгрузка, которую запускает load, не вмешивается в проверку
+    engine = CombatEngine(flush_interval=3600, idle_ttl=600)
+    idle_id, _ = seed_combat(db_session, test_game.id)
+    dirty_id, dirty_ids = seed_combat(db_session, test_game.id)
+    active_id, _ = seed_combat(db_session, test_game.id)
+    ended_id, _ = seed_combat(db_session, test_game.id)
+
+    with patch.object(settings, "combat_engine", True), patch("app.services.combat_engine._engine", engine):
+        combat_service.end_combat(db_session, ended_id)
+        assert combat_service.get_combat_session(db_session, ended_id).is_active is False
+        engine.load(db_session, idle_id)
+        now = engine.load(db_session, active_id).last_used
+        for combat_id in engine.dirty_combats():
+            engine.flush_sync(db_session, combat_id)  # построенный при загрузке turn_order
+        combat_service.apply_damage(db_session, dirty_id, dirty_ids[0], 3)
+
+        # Завершенный бой не остается в памяти после чтения
+        assert engine.evict_idle(now + engine.idle_ttl - 1) == [ended_id]
+        # Бой с несохраненными изменениями ждет сброса
+        assert sorted(engine.evict_idle(now + engine.idle_ttl)) == sorted([idle_id, active_id])
+        assert engine.loaded(dirty_id) is not None
+
+        engine.flush_sync(db_session, dirty_id)
+        assert engine.evict_idle(now + 2 * engine.idle_ttl) == [dirty_id]
+    assert snapshot(db_session, dirty_id)[1][0][2] == 17
+
+
+def test_death_save_uses_game_stream(db_session, test_game, engine_enabled):
+    combat_id, ids = seed_combat(db_session, test_game.id)
+    combat_service.apply_damage(db_session, combat_id, ids[0], 20)
+
+    result = combat_service.roll_death_save(db_session, combat_id, ids[0])
+
+    participant = engine_enabled.loaded(combat_id).by_id[ids[0]]
+    assert result["death_saves_success"] == participant.death_saves_success
+    assert result["death_saves_failure"] == participant.death_saves_failure
+    assert result["rng_offset"] == 0  # первый бросок в потоке игры
+    assert engine_enabled.dirty_combats() == [combat_id]
+
+
+@pytest.mark.asyncio
+async def test_background_flush(socket_db, test_game):
+    combat_id, ids = seed_combat(socket_db, test_game.id)
+    with patch.object(settings, "combat_engine", True):
+        engine = get_combat_engine()
+        engine.flush_interval = 0.01
+        combat_service.apply_damage(socket_db, combat_id, ids[1], 6)
+        await engine._task
+
+    assert engine.dirty_combats() == []
+    assert snapshot(socket_db, combat_id)[1][1][2] == 14
+
+
+def test_endpoints_with_engine(client: TestClient, auth_headers: dict, db_session, test_game, engine_enabled):
+    combat_id, ids = seed_combat(db_session, test_game.id)
+    base = f"/api/games/{test_game.id}/combat/{combat_id}"
+
+    response = client.post(f"{base}/damage", json={"target_id": str(ids[0]), "damage": 8}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["current_hp"] == 12
+
+    current = client.get(f"/api/games/{test_game.id}/combat/current", headers=auth_headers).json()
+    assert next(p for p in current["participants"] if p["id"] == str(ids[0]))["current_hp"] == 12
+
+    # Завершение боя сохраняет состояние и выгружает бой из памяти
+    response = client.post(f"{base}/end", headers=auth_headers)
+    assert response.status_code == 200
+    assert engine_enabled.loaded(combat_id) is None
+    assert snapshot(db_session, combat_id)[1][0][2] == 12
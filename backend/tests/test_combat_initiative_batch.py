@@ -0,0 +1,96 @@
+"""
+Тесты группового броска инициативы участникам без игрока
+"""
+import uuid
+from unittest.mock import patch
+
+import pytest
+
+from app.config import settings
+from app.models.combat_participant import CombatParticipant
+from app.models.combat_session import CombatSession
+from app.models.monster import Monster
+from app.services import combat_service
+from app.services.combat_engine import get_combat_engine
+
+
+@pytest.fixture(params=[False, True], ids=["db", "engine"])
+def engine_mode(request):
+    with patch.object(settings, "combat_engine", request.param):
+        yield request.param
+
+
+def setup_combat(db, game_id):
+    """Бой: герой игрока, гоблин (DEX 14), огр (DEX 8) и токен без бестиария"""
+    db.add_all([
+        Monster(slug="goblin", name="Гоблин", dexterity=14),
+        Monster(slug="ogre", name="Огр", dexterity=8),
+    ])
+    db.commit()
+    combat = CombatSession(game_id=game_id, is_active=True, current_turn_index=0, round_number=1, turn_order=[])
+    db.add(combat)
+    db.commit()
+    rows = {}
+    for key, slug, controlled in (("hero", None, True), ("goblin", "goblin", False),
+                                  ("ogre", "ogre", False), ("crate", None, False)):
+        rows[key] = combat_service.add_participant(db, combat.id, CombatParticipant(
+            id=uuid.uuid4(), monster_slug=slug, current_hp=10, max_hp=10, armor_class=12,
+            is_player_controlled=controlled,
+        ))
+    return combat.id, {key: row.id for key, row in rows.items()}
+
+
+def initiatives(db, combat_id):
+    if settings.combat_engine:
+        get_combat_engine().flush_sync(db, combat_id)
+    db.expire_all()
+    return dict(db.query(CombatParticipant.id, CombatParticipant.initiative).filter(
+        CombatParticipant.combat_id == combat_id
+    ).all())
+
+
+def test_monster_dexterity_modifiers(db_session, test_game, engine_mode):
+    combat_id, ids = setup_combat(db_session, test_game.id)
+
+    with patch("app.services.dice_rng.StreamRng.randint", return_value=10):
+        result = combat_service.roll_initiative_for_uncontrolled(db_session, combat_id)
+
+    by_id = {r["participant_id"]: r for r in result["rolls"]}
+    assert set(by_id) == {ids["goblin"], ids["ogre"], ids["crate"]}
+    assert by_id[ids["goblin"]]["modifier"] == 2
+    assert by_id[ids["ogre"]]["modifier"] == -1
+    assert by_id[ids["crate"]]["modifier"] == 0
+    assert len({r["rng_offset"] for r in result["rolls"]}) == 3
+
+    stored = initiatives(db_session, combat_id)
+    assert stored == {ids["hero"]: None, ids["goblin"]: 12, ids["ogre"]: 9, ids["crate"]: 10}
+    # Без инициативы — в конце порядка
+    assert result["turn_order"] == [str(ids[k]) for k in ("goblin", "crate", "ogre", "hero")]
+    assert result["current_turn_index"] == 0
+
+
+def test_single_update_statement(db_session, test_game, query_counter):
+    combat_id, ids = setup_combat(db_session, test_game.id)
+    db_session.expire_all()
+
+    query_counter.reset()
+    combat_service.roll_initiative_for_uncontrolled(db_session, combat_id)
+
+    updates = [s for s in query_counter.statements if s.startswith("UPDATE combat_participants")]
+    assert len(updates) == 1
+    # Участники и Ловкость монстров читаются одним запросом
+    assert len([s for s in query_counter.statements if "FROM combat_participants" in s]) == 1
+
+
+def test_endpoint_broadcasts_one_event(client, auth_headers, db_session, test_game, fake_sio):
+    combat_id, ids = setup_combat(db_session, test_game.id)
+
+    response = client.post(f"/api/games/{test_game.id}/combat/{combat_id}/roll-initiative-all", headers=auth_headers)
+
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert len(data["rolls"]) == 3
+    events = fake_sio.events("combat:initiative_batch")
+    assert len(events) == 1
+    assert not fake_sio.events("combat:initiative_rolled")
+    assert {str(r["participant_id"]) for r in events[0]["rolls"]} == {r["participant_id"] for r in data["rolls"]}
@@ -0,0 +1,110 @@
+"""
+Регрессионные тесты на N+1 в эндпоинтах боя: число запросов не зависит от числа участников
+"""
+import uuid
+
+from app.models.character import Character
+from app.models.combat_participant import CombatParticipant
+from app.models.combat_session import CombatSession
+from app.models.token import Token
+from app.services.combat_service import add_participant
+
+
+def _start(db_session, game):
+    combat = CombatSession(game_id=game.id, is_active=True, current_turn_index=0, round_number=1, turn_order=[])
+    db_session.add(combat)
+    db_session.commit()
+    return combat.id
+
+
+def _add_combatants(db_session, game, user, combat_id, count):
+    """Половина — персонажи, половина — токены"""
+    ids = []
+    for i in range(count):
+        participant = CombatParticipant(
+            id=uuid.uuid4(), initiative=20 - i, current_hp=10, max_hp=10, armor_class=12,
+            is_player_controlled=i % 2 == 0,
+        )
+        if i % 2 == 0:
+            character = Character(id=uuid.uuid4(), user_id=user.id, name=f"hero{i}", race="Human", char_class="Fighter")
+            db_session.add(character)
+            participant.character_id = character.id
+        else:
+            token = Token(id=uuid.uuid4(), game_id=game.id, name=f"goblin{i}", x=0, y=0)
+            db_session.add(token)
+            participant.token_id = token.id
+        add_participant(db_session, combat_id, participant)
+        ids.append(participant.id)
+    return ids
+
+
+def _count(query_counter, request):
+    query_counter.reset()
+    response = request()
+    assert response.status_code == 200, response.text
+    return query_counter.count, response.json()
+
+
+def test_combat_endpoints_constant_queries(client, auth_headers, db_session, test_game, test_user, query_counter):
+    game_id = test_game.id
+    combat_id = _start(db_session, test_game)
+    base = f"/api/games/{game_id}/combat"
+
+    def current():
+        return client.get(f"{base}/current", headers=auth_headers)
+
+    def damage(target):
+        return lambda: client.post(
+            f"{base}/{combat_id}/damage", json={"target_id": str(target), "damage": 1}, headers=auth_headers
+        )
+
+    def next_turn():
+        return client.post(f"{base}/{combat_id}/next-turn", headers=auth_headers)
+
+    ids = _add_combatants(db_session, test_game, test_user, combat_id, 2)
+    small = [_count(query_counter, current)[0], _count(query_counter, damage(ids[1]))[0],
+             _count(query_counter, next_turn)[0]]
+
+    _add_combatants(db_session, test_game, test_user, combat_id, 20)
+    large_current, data = _count(query_counter, current)
+    large_damage, target = _count(query_counter, damage(ids[1]))
+    large_next, _ = _count(query_counter, next_turn)
+
+    assert [large_current, large_damage, large_next] == small
+    assert len(data["participants"]) == 22
+    names = {p["character_name"] or p["token_name"] for p in data["participants"]}
+    assert {"hero0", "goblin1", "hero18", "goblin19"} <= names
+    assert target["token_name"] == "goblin1"
+
+
+def test_start_combat_constant_round_trips(client, auth_headers, db_session, test_game, test_user, query_counter):
+    game_id = test_game.id
+
+    def start(count):
+        characters = [
+            Character(id=uuid.uuid4(), user_id=test_user.id, name=f"hero{i}", race="Human", char_class="Fighter")
+            for i in range(count // 2)
+        ]
+        tokens = [Token(id=uuid.uuid4(), game_id=game_id, name=f"goblin{i}", x=0, y=0) for i in range(count - count // 2)]
+        db_session.add_all(characters + tokens)
+        db_session.commit()
+        ids = [str(c.id) for c in characters] + [str(t.id) for t in tokens]
+        query_counter.reset()
+        response = client.post(f"/api/games/{game_id}/combat/start", json={"participant_ids": ids}, headers=auth_headers)
+        assert response.status_code == 201, response.text
+        return query_counter.statements[:], response.json()
+
+    small, _ = start(2)
+    # Второй бой закрывает первый
+    large, data = start(40)
+
+    assert len(large) == len(small)
+    assert len(data["participants"]) == 40
+    inserts = [s for s in large if s.startswith("INSERT INTO combat_participants")]
+    assert len(inserts) == 1
+    closes = [s for s in large if s.startswith("UPDATE combat_sessions")]
+    assert len(closes) == 1
+
+    db_session.expire_all()
+    active = db_session.query(CombatSession).filter(CombatSession.game_id == game_id, CombatSession.is_active == True).all()
+    assert [c.id for c in active] == [uuid.UUID(data["id"])]
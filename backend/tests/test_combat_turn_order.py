@@ -0,0 +1,189 @@
+"""
+Тесты сохраненного порядка ходов
+"""
+import uuid
+from unittest.mock import patch
+
+import pytest
+
+from app.config import settings
+from app.models.combat_participant import CombatParticipant
+from app.models.combat_session import CombatSession
+from app.models.monster import Monster
+from app.services import combat_service
+from app.services.combat_engine import get_combat_engine
+
+
+@pytest.fixture(params=[False, True], ids=["db", "engine"])
+def engine_mode(request):
+    with patch.object(settings, "combat_engine", request.param):
+        yield request.param
+
+
+def start(db, game_id, count=3):
+    combat_service.start_combat(db, game_id, [
+        {"token_id": None, "max_hp": 10, "armor_class": 10, "is_player_controlled": False}
+        for _ in range(count)
+    ])
+    combat = db.query(CombatSession).filter(CombatSession.game_id == game_id, CombatSession.is_active == True).one()
+    return combat.id, [uuid.UUID(entry["id"]) for entry in combat.turn_order]
+
+
+def state(db, combat_id):
+    """Порядок и указатель (из памяти движка или из БД)"""
+    engine = get_combat_engine()
+    combat = engine.loaded(combat_id) if settings.combat_engine else None
+    if combat is None:
+        db.expire_all()
+        combat = db.query(CombatSession).filter(CombatSession.id == combat_id).one()
+    return [uuid.UUID(e["id"]) for e in combat.turn_order], combat.current_turn_index, combat.round_number
+
+
+def actor(db, combat_id):
+    order, index, _ = state(db, combat_id)
+    return order[index] if 0 <= index < len(order) else None
+
+
+def test_initiative_sorts_order_before_first_turn(db_session, test_game, engine_mode):
+    combat_id, (a, b, c) = start(db_session, test_game.id)
+    assert state(db_session, combat_id) == ([a, b, c], 0, 1)
+
+    for participant_id, value in ((a, 5), (b, 18), (c, 11)):
+        combat_service.roll_initiative(db_session, combat_id, participant_id, value)
+
+    assert state(db_session, combat_id) == ([b, c, a], 0, 1)
+    combat_service.next_turn(db_session, combat_id)
+    combat_service.next_turn(db_session, combat_id)
+    combat_service.next_turn(db_session, combat_id)
+    assert state(db_session, combat_id) == ([b, c, a], 0, 2)
+
+
+def test_reroll_mid_combat_keeps_current_actor(db_session, test_game, engine_mode):
+    combat_id, (a, b, c) = start(db_session, test_game.id)
+    for participant_id, value in ((a, 15), (b, 10), (c, 5)):
+        combat_service.roll_initiative(db_session, combat_id, participant_id, value)
+    combat_service.next_turn(db_session, combat_id)
+    assert actor(db_session, combat_id) == b
+
+    combat_service.roll_initiative(db_session, combat_id, c, 20)
+
+    assert state(db_session, combat_id)[0] == [c, a, b]
+    assert actor(db_session, combat_id) == b
+
+
+def test_late_joiner_does_not_take_current_turn(db_session, test_game, engine_mode):
+    combat_id, (a, b, c) = start(db_session, test_game.id)
+    for participant_id, value in ((a, 15), (b, 10), (c, 5)):
+        combat_service.roll_initiative(db_session, combat_id, participant_id, value)
+    combat_service.next_turn(db_session, combat_id)
+
+    fast = combat_service.add_participant(db_session, combat_id, CombatParticipant(
+        initiative=19, current_hp=7, max_hp=7, armor_class=13, is_player_controlled=False,
+    ))
+    slow = combat_service.add_participant(db_session, combat_id, CombatParticipant(
+        initiative=8, current_hp=7, max_hp=7, armor_class=13, is_player_controlled=False,
+    ))
+
+    order, index, _ = state(db_session, combat_id)
+    assert order == [fast.id, a, b, slow.id, c]
+    assert order[index] == b
+
+    turns = []
+    for _ in range(4):
+        combat_service.next_turn(db_session, combat_id)
+        turns.append(actor(db_session, combat_id))
+    # Медленный ходит в этом же раунде, быстрый — с начала следующего
+    assert turns == [slow.id, c, fast.id, a]
+
+
+def test_dead_participant_leaves_order(db_session, test_game, engine_mode):
+    combat_id, (a, b, c) = start(db_session, test_game.id)
+    for participant_id, value in ((a, 15), (b, 10), (c, 5)):
+        combat_service.roll_initiative(db_session, combat_id, participant_id, value)
+    combat_service.next_turn(db_session, combat_id)
+    combat_service.apply_damage(db_session, combat_id, b, 10)
+
+    # Три провала подряд на ходу умирающего
+    rolls = iter([5, 5, 5])
+    with patch("app.services.dice_rng.StreamRng.randint", side_effect=lambda *_: next(rolls)):
+        for _ in range(3):
+            result = combat_service.roll_death_save(db_session, combat_id, b)
+    assert result["died"] is True
+
+    # Ход погибшего закончен сразу: до перехода хода ходит следующий за ним
+    assert state(db_session, combat_id) == ([a, c], 1, 1)
+    assert actor(db_session, combat_id) == c
+    combat_service.next_turn(db_session, combat_id)
+    assert state(db_session, combat_id) == ([a, c], 0, 2)
+    assert actor(db_session, combat_id) == a
+
+
+@pytest.mark.parametrize("dying, expected", [(0, (1, 0, 1)), (2, (0, 0, 2))], ids=["first", "last"])
+def test_dead_actor_at_order_edges(db_session, test_game, engine_mode, dying, expected):
+    combat_id, order = start(db_session, test_game.id)
+    for participant_id, value in zip(order, (15, 10, 5)):
+        combat_service.roll_initiative(db_session, combat_id, participant_id, value)
+    for _ in range(dying):
+        combat_service.next_turn(db_session, combat_id)
+    combat_service.apply_damage(db_session, combat_id, order[dying], 10)
+
+    with patch("app.services.dice_rng.StreamRng.randint", return_value=1):
+        combat_service.roll_death_save(db_session, combat_id, order[dying])
+        result = combat_service.roll_death_save(db_session, combat_id, order[dying])
+    assert result["died"] is True
+
+    next_actor, index, round_number = expected
+    assert state(db_session, combat_id)[1:] == (index, round_number)
+    assert actor(db_session, combat_id) == order[next_actor]
+
+
+def test_order_changes_reach_clients(client, auth_headers, db_session, test_game, fake_sio, engine_mode):
+    combat_id, (a, b, c) = start(db_session, test_game.id)
+    url = f"/api/games/{test_game.id}/combat/{combat_id}"
+    for participant_id, value in ((a, 15), (b, 10), (c, 5)):
+        response = client.post(f"{url}/roll-initiative", headers=auth_headers,
+                               json={"participant_id": str(participant_id), "initiative_roll": value})
+        assert response.status_code == 200, response.text
+    event = fake_sio.events("combat:initiative_rolled")[-1]
+    assert event["turn_order"] == [str(a), str(b), str(c)]
+    assert event["current_turn_index"] == 0
+
+    # Гибель текущего участника: ход переходит к следующему
+    combat_service.next_turn(db_session, combat_id)
+    combat_service.apply_damage(db_session, combat_id, b, 10)
+    with patch("app.services.dice_rng.StreamRng.randint", return_value=1):
+        for _ in range(2):
+            assert client.post(f"{url}/participants/{b}/death-save", headers=auth_headers).status_code == 200
+    event = fake_sio.events("combat:death_save")[-1]
+    assert event["died"] is True
+    assert event["participant_id"] == str(b)
+    assert event["turn_order"] == [str(a), str(c)]
+    assert event["turn_order"][event["current_turn_index"]] == str(c)
+
+    db_session.add(Monster(slug="wolf", name="Волк", dexterity=15, hp_average=11, armor_class=13))
+    db_session.commit()
+    with patch("app.services.dice_rng.StreamRng.randint", return_value=20):
+        response = client.post(f"{url}/add-monster", headers=auth_headers, params={"monster_slug": "wolf"})
+    assert response.status_code == 201, response.text
+    event = fake_sio.events("combat:participant_added")[-1]
+    assert event["participant"]["id"] == response.json()["id"]
+    assert event["turn_order"] == [response.json()["id"], str(a), str(c)]
+    assert event["turn_order"][event["current_turn_index"]] == str(c)
+
+
+def test_next_turn_is_pointer_move(db_session, test_game, query_counter):
+    combat_id, _ = start(db_session, test_game.id, count=20)
+    db_session.expire_all()
+
+    query_counter.reset()
+    combat = combat_service.next_turn(db_session, combat_id)
+
+    statements = query_counter.statements
+    assert not any("FROM combat_participants" in s for s in statements)
+    assert len([s for s in statements if s.startswith("UPDATE combat_sessions")]) == 1
+    # Одно чтение боя до сдвига; ответ строится без повторного SELECT
+    assert len([s for s in statements if "FROM combat_sessions" in s]) == 1
+    query_counter.reset()
+    assert (combat.current_turn_index, combat.round_number, len(combat.turn_order)) == (1, 1, 20)
+    assert combat.id == combat_id and combat.is_active and combat.started_at is not None
+    assert query_counter.statements == []
@@ -0,0 +1,82 @@
+"""
+Тесты пакетных (векторизованных) бросков
+"""
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.dice_batch import histogram, roll_plan_batch
+from app.services.dice_distribution import get_distribution
+from app.services.dice_expression import DiceExpressionError, compile_expression
+from app.services.dice_service import DiceRoller
+
+
+@pytest.mark.parametrize("expression", ["1d20", "4d6kh3", "3d6dl1-1d4+2", "2d6r<2", "1d6!", "2d20kl1"])
+def test_batch_matches_exact_distribution(expression):
+    """Средние пакета совпадают с точным распределением"""
+    totals = roll_plan_batch(compile_expression(expression), 200_000, np.random.default_rng(42))
+    distribution = get_distribution(expression)
+
+    assert totals.min() >= distribution.min
+    assert totals.mean() == pytest.approx(distribution.mean, abs=4 * (distribution.variance / 200_000) ** 0.5 + 1e-9)
+
+
+def test_batch_is_reproducible_with_seeded_generator():
+    roller = DiceRoller()
+    first = roller.roll_batch("4d6kh3", 1000, rng=np.random.default_rng(7))
+    second = roller.roll_batch("4d6kh3", 1000, rng=np.random.default_rng(7))
+
+    assert np.array_equal(first, second)
+
+
+def test_batch_ignores_max_dice_but_enforces_limits():
+    roller = DiceRoller(max_dice=10)
+
+    assert len(roller.roll_batch("50d6", 100)) == 100
+    with pytest.raises(DiceExpressionError):
+        roller.roll_batch("1d6", 0)
+    with pytest.raises(DiceExpressionError):
+        roller.roll_batch("4d6!kh3", 10)
+
+
+def test_histogram_counts_every_roll():
+    totals = np.array([3, 5, 3, 7])
+    assert histogram(totals) == [
+        {"total": 3, "count": 2},
+        {"total": 5, "count": 1},
+        {"total": 7, "count": 1},
+    ]
+
+
+def test_simulate_endpoint_histogram(client: TestClient, auth_headers: dict):
+    response = client.post(
+        "/api/dice/simulate",
+        json={"expression": "2d6", "rolls": 50000},
+        headers=auth_headers
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["mode"] == "histogram"
+    assert data["results"] is None
+    assert sum(b["count"] for b in data["histogram"]) == 50000
+    assert 2 <= data["min"] and data["max"] <= 12
+
+
+def test_simulate_endpoint_raw_and_limits(client: TestClient, auth_headers: dict):
+    response = client.post(
+        "/api/dice/simulate",
+        json={"expression": "1d20", "rolls": 100, "advantage": True, "mode": "raw"},
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["expression"] == "2d20kh1"
+    assert len(data["results"]) == 100
+
+    response = client.post(
+        "/api/dice/simulate",
+        json={"expression": "1d20", "rolls": 20000, "mode": "raw"},
+        headers=auth_headers
+    )
+    assert response.status_code == 400
@@ -0,0 +1,114 @@
+"""
+Тесты точного распределения выражений кубиков
+"""
+from fractions import Fraction
+from itertools import product
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.dice_distribution import distribution_cache_info, get_distribution
+from app.services.dice_expression import DiceExpressionError
+
+
+def _brute_force(faces_list, keep=None):
+    """Перебор всех исходов: {сумма: вероятность}"""
+    outcomes = {}
+    total_cases = 0
+    for rolls in product(*[range(1, f + 1) for f in faces_list]):
+        values = sorted(rolls, reverse=True)
+        if keep is not None:
+            values = values[:keep]
+        outcomes[sum(values)] = outcomes.get(sum(values), 0) + 1
+        total_cases += 1
+    return {total: Fraction(n, total_cases) for total, n in outcomes.items()}
+
+
+def _assert_matches(distribution, expected):
+    points = dict(distribution.points())
+    assert set(points) == set(expected)
+    for total, probability in expected.items():
+        assert points[total] == pytest.approx(float(probability), abs=1e-12)
+
+
+def test_plain_sum_matches_enumeration():
+    _assert_matches(get_distribution("3d6"), _brute_force([6, 6, 6]))
+
+
+def test_keep_highest_matches_enumeration():
+    _assert_matches(get_distribution("4d6kh3"), _brute_force([6, 6, 6, 6], keep=3))
+
+
+def test_advantage_and_constants():
+    distribution = get_distribution("1d20+5", advantage=True)
+    expected = {total + 5: p for total, p in _brute_force([20, 20], keep=1).items()}
+
+    _assert_matches(distribution, expected)
+    assert distribution.expression == "2d20kh1+5"
+    assert distribution.mean == pytest.approx(13.825 + 5)
+
+
+def test_subtraction_and_mixed_dice():
+    distribution = get_distribution("1d8-1d4")
+
+    assert distribution.min == -3
+    assert distribution.max == 7
+    assert distribution.mean == pytest.approx(4.5 - 2.5)
+    assert distribution.variance == pytest.approx((64 - 1) / 12 + (16 - 1) / 12)
+
+
+def test_rerolls_and_explosions():
+    # Переброс единиц до успеха: равномерно на 2..6
+    assert get_distribution("1d6r1").mean == pytest.approx(4.0)
+    # Взрывающийся d6: E = 3.5 * 6 / 5
+    assert get_distribution("1d6!").mean == pytest.approx(4.2, abs=1e-9)
+    with pytest.raises(DiceExpressionError):
+        get_distribution("4d6!kh3")
+
+
+def test_large_pool_uses_fft_and_stays_normalized():
+    distribution = get_distribution("100d100")
+
+    assert float(distribution.pmf.sum()) == pytest.approx(1.0)
+    assert distribution.mean == pytest.approx(5050)
+    assert distribution.percentile(50) == 5050
+
+
+def test_distribution_is_memoized_by_normalized_expression():
+    first = get_distribution("2d10 + 3")
+    hits = distribution_cache_info()["hits"]
+
+    assert get_distribution("2D10+3") is first
+    assert distribution_cache_info()["hits"] == hits + 1
+
+
+def test_distribution_endpoint(client: TestClient, auth_headers: dict):
+    response = client.get(
+        "/api/dice/distribution",
+        params={"expr": "2d6", "target": 7},
+        headers=auth_headers
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["min"] == 2 and data["max"] == 12
+    assert data["mean"] == pytest.approx(7)
+    assert data["percentiles"]["50"] == 7
+    assert len(data["pmf"]) == 11
+    assert data["probability_at_least"] == pytest.approx(21 / 36)
+
+
+def test_distribution_endpoint_legacy_params(client: TestClient, auth_headers: dict):
+    response = client.get(
+        "/api/dice/distribution",
+        params={"count": 1, "faces": 20, "advantage": "false"},
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.json()["expression"] == "2d20kl1"
+
+    response = client.get("/api/dice/distribution", params={"count": 1, "faces": 7}, headers=auth_headers)
+    assert response.status_code == 400
+
+    response = client.get("/api/dice/distribution", params={"expr": "1d6kh2"}, headers=auth_headers)
+    assert response.status_code == 400
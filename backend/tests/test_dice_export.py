@@ -0,0 +1,84 @@
+"""
+Тесты потоковой выгрузки истории бросков
+"""
+import csv
+import io
+import json
+
+from fastapi.testclient import TestClient
+
+from app.services.dice_export import EXPORT_COLUMNS, iter_history_export
+from app.services.dice_service import make_roll_history_row, save_roll_history_batch
+from tests.conftest import test_engine
+
+
+def seed(db, game_id, user_id, count):
+    rows = [
+        make_roll_history_row(game_id, user_id, 1, 20, [{"die_id": "d1", "value": i % 20 + 1}], i % 20 + 1,
+                              roll_type="attack" if i % 2 else "save", expression="1d20" if i == 0 else None)
+        for i in range(count)
+    ]
+    save_roll_history_batch(db, rows)
+    return rows
+
+
+def test_ndjson_export(client: TestClient, auth_headers: dict, db_session, test_game, test_user):
+    game_id = test_game.id
+    rows = seed(db_session, game_id, test_user.id, 7)
+
+    response = client.get(f"/api/games/{game_id}/dice-history/export", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert "attachment" in response.headers["content-disposition"]
+    items = [json.loads(line) for line in response.text.splitlines()]
+    assert [item["id"] for item in items] == [str(r["id"]) for r in rows]
+    assert items[0]["username"] == test_user.username
+    assert items[0]["expression"] == "1d20"
+    assert items[0]["rolls"] == [{"die_id": "d1", "value": 1}]
+
+
+def test_csv_export_with_filter(client: TestClient, auth_headers: dict, db_session, test_game, test_user):
+    game_id = test_game.id
+    seed(db_session, game_id, test_user.id, 6)
+
+    response = client.get(
+        f"/api/games/{game_id}/dice-history/export",
+        params={"format": "csv", "roll_type": "attack"},
+        headers=auth_headers
+    )
+
+    assert response.status_code == 200
+    table = list(csv.reader(io.StringIO(response.text)))
+    assert tuple(table[0]) == EXPORT_COLUMNS
+    assert len(table) == 4
+    assert {row[EXPORT_COLUMNS.index("roll_type")] for row in table[1:]} == {"attack"}
+    assert json.loads(table[1][EXPORT_COLUMNS.index("rolls")]) == [{"die_id": "d1", "value": 2}]
+
+
+def test_export_is_chunked(db_session, test_game, test_user):
+    seed(db_session, test_game.id, test_user.id, 5)
+
+    chunks = list(iter_history_export(test_engine, test_game.id, "ndjson", chunk_rows=2))
+
+    assert [chunk.count("\n") for chunk in chunks] == [2, 2, 1]
+
+
+def test_empty_csv_has_header_only(db_session, test_game):
+    chunks = list(iter_history_export(test_engine, test_game.id, "csv"))
+    assert "".join(chunks).strip() == ",".join(EXPORT_COLUMNS)
+
+
+def test_export_forbidden_and_bad_format(client: TestClient, auth_headers: dict, test_user2_token, test_game):
+    response = client.get(
+        f"/api/games/{test_game.id}/dice-history/export",
+        headers={"Authorization": f"Bearer {test_user2_token}"}
+    )
+    assert response.status_code == 403
+
+    response = client.get(
+        f"/api/games/{test_game.id}/dice-history/export",
+        params={"format": "xml"},
+        headers=auth_headers
+    )
+    assert response.status_code == 422
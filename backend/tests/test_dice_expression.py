@@ -0,0 +1,123 @@
+"""
+Тесты компилятора выражений кубиков
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.dice_expression import (
+    DiceExpressionError,
+    compile_expression,
+    expression_cache_info,
+)
+from app.sockets.dice_history_buffer import get_dice_history_buffer
+from app.sockets.state import connected_users
+from app.models.dice_roll_history import DiceRollHistory
+
+
+class SequenceRng:
+    """Детерминированный источник: выдает значения по порядку"""
+
+    def __init__(self, values):
+        self.values = list(values)
+
+    def randint(self, a, b):
+        value = self.values.pop(0)
+        assert a <= value <= b
+        return value
+
+
+class TestCompileExpression:
+    def test_canonical_form_and_cache(self):
+        """Нормализованные варианты записи дают один и тот же план из кэша"""
+        plan = compile_expression("4d6KH3 + 2d8 + 5")
+        misses = expression_cache_info()["misses"]
+
+        assert compile_expression("4d6kh3+2d8+5") is plan
+        assert expression_cache_info()["misses"] == misses
+        assert plan.expression == "4d6kh3+2d8+5"
+        assert plan.dice_count == 6
+        assert plan.constant == 5
+
+    @pytest.mark.parametrize("expression", [
+        "", "d", "1d1", "abc", "1d6+", "4d6kh5", "101d6", "1d6!<6", "1d6r<6", "1d6kh1dl1", "1d20x",
+    ])
+    def test_invalid_expressions(self, expression):
+        with pytest.raises(DiceExpressionError):
+            compile_expression(expression)
+
+    def test_advantage_rewrites_single_die(self):
+        assert compile_expression("1d20+5", advantage=True).expression == "2d20kh1+5"
+        assert compile_expression("d20-1", advantage=False).expression == "2d20kl1-1"
+        with pytest.raises(DiceExpressionError):
+            compile_expression("2d6", advantage=True)
+
+    def test_critical_doubles_dice_only(self):
+        assert compile_expression("2d6+3").critical().expression == "4d6+3"
+
+
+class TestRollExpression:
+    def test_keep_highest_with_constants(self):
+        result = compile_expression("4d6kh3+2d8+5").roll(SequenceRng([1, 4, 6, 3, 2, 7]))
+
+        assert result.total == (4 + 6 + 3) + (2 + 7) + 5
+        assert result.terms[0].kept == [False, True, True, True]
+        assert result.constant == 5
+        assert [r["value"] for r in result.to_dict()["rolls"]] == [4, 6, 3, 2, 7]
+
+    def test_drop_lowest_and_subtraction(self):
+        result = compile_expression("3d6dl1-1d4").roll(SequenceRng([5, 2, 2, 3]))
+
+        assert result.terms[0].kept == [True, False, True]
+        assert result.total == 7 - 3
+
+    def test_exploding_adds_dice(self):
+        result = compile_expression("2d6!").roll(SequenceRng([6, 6, 2, 3]))
+
+        assert result.terms[0].rolls == [6, 6, 2, 3]
+        assert result.total == 17
+
+    def test_rerolls(self):
+        assert compile_expression("1d6r<2").roll(SequenceRng([1, 2, 1, 5])).total == 5
+        assert compile_expression("1d6ro1").roll(SequenceRng([1, 1])).total == 1
+
+
+def test_roll_endpoint_with_expression(client: TestClient, auth_headers: dict):
+    response = client.post("/api/dice/roll", json={"expression": "3d6kh2+4"}, headers=auth_headers)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["expression"] == "3d6kh2+4"
+    assert len(data["rolls"]) == 2
+    assert data["total"] == sum(r["value"] for r in data["rolls"]) + 4
+    assert data["terms"][0]["kept"].count(False) == 1
+
+
+def test_roll_endpoint_rejects_bad_expression(client: TestClient, auth_headers: dict):
+    response = client.post("/api/dice/roll", json={"expression": "4d6kh9"}, headers=auth_headers)
+    assert response.status_code == 400
+
+    response = client.post("/api/dice/roll", json={}, headers=auth_headers)
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_socket_dice_roll_with_expression(fake_sio, socket_db, test_user, test_game):
+    connected_users["sid-expr"] = test_user.id
+    try:
+        await fake_sio.handlers["dice_roll"]("sid-expr", {
+            "game_id": str(test_game.id),
+            "expression": "2d8+1d4+2",
+        })
+    finally:
+        connected_users.pop("sid-expr", None)
+
+    rolled = fake_sio.events("dice:rolled")
+    assert len(rolled) == 1
+    assert rolled[0]["expression"] == "2d8+1d4+2"
+    assert rolled[0]["count"] == 3
+    assert rolled[0]["total"] == sum(r["value"] for r in rolled[0]["rolls"]) + 2
+
+    await get_dice_history_buffer().drain()
+    entry = socket_db.query(DiceRollHistory).one()
+    assert entry.expression == "2d8+1d4+2"
+    assert entry.faces == 8
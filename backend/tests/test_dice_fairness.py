@@ -0,0 +1,131 @@
+"""
+Тесты аудита честности кубиков
+"""
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.dice_fairness import (
+    chi_square_sf,
+    compute_fairness_audit,
+    get_audit_cache,
+    get_fairness_audit,
+    kolmogorov_sf,
+)
+from app.services.dice_service import make_roll_history_row, save_roll_history_batch
+
+
+def save_d20s(db, game_id, user_id, values):
+    rows = [
+        make_roll_history_row(game_id, user_id, 1, 20, [{"die_id": "d1", "value": int(v)}], int(v))
+        for v in values
+    ]
+    save_roll_history_batch(db, rows)
+
+
+def test_p_values_match_reference_tables():
+    assert chi_square_sf(3.841458820694124, 1) == pytest.approx(0.05)
+    assert chi_square_sf(30.14352720564616, 19) == pytest.approx(0.05)
+    assert chi_square_sf(10, 5) == pytest.approx(0.0752352)
+    assert kolmogorov_sf(1.358 / 100, 10000) == pytest.approx(0.05, abs=2e-3)
+
+
+def test_rigged_player_flagged_fair_player_not(db_session, test_game, test_user, test_user2):
+    game_id = test_game.id
+    fair = np.random.default_rng(3).integers(1, 21, 2000)
+    save_d20s(db_session, game_id, test_user.id, fair)
+    # Подкрученный кубик: высокие грани вдвое чаще
+    save_d20s(db_session, game_id, test_user2.id, list(range(1, 21)) * 50 + list(range(11, 21)) * 50)
+
+    audit = compute_fairness_audit(db_session, game_id)
+
+    users = {entry["user_id"]: entry["dice"][0] for entry in audit["users"]}
+    assert users[test_user.id]["flagged"] is False
+    assert users[test_user2.id]["flagged"] is True
+    assert users[test_user2.id]["chi_square"]["p_value"] < 1e-10
+    assert audit["rows"] == 3500
+    assert sum(audit["dice"][0]["frequencies"]) == 3500
+
+
+def test_advantage_rows_use_both_dice(db_session, test_game, test_user):
+    pairs = np.random.default_rng(11).integers(1, 21, (2000, 2))
+    rows = []
+    for first, second in pairs.tolist():
+        dice = [{"die_id": "d1", "value": first}, {"die_id": "d2", "value": second}]
+        selected = dice[0] if first >= second else dice[1]
+        rows.append(make_roll_history_row(
+            test_game.id, test_user.id, 1, 20, [selected], selected["value"],
+            advantage_type="advantage", advantage_rolls=dice, selected_roll=selected,
+        ))
+    # Учтенные кубики выражений с keep/drop и взрывом смещены и не проверяются
+    rows += [
+        make_roll_history_row(test_game.id, test_user.id, 4, 6, [{"die_id": f"d{i}", "value": 6} for i in range(1, 4)], 18,
+                              expression="4d6kh3"),
+        make_roll_history_row(test_game.id, test_user.id, 1, 6, [{"die_id": "d1", "value": 6}, {"die_id": "d2", "value": 2}], 8,
+                              expression="1d6!"),
+    ]
+    save_roll_history_batch(db_session, rows)
+
+    audit = compute_fairness_audit(db_session, test_game.id)
+
+    assert [die["faces"] for die in audit["dice"]] == [20]
+    die = audit["dice"][0]
+    assert die["count"] == 4000
+    assert die["flagged"] is False
+
+
+def test_runs_test_detects_serial_pattern(db_session, test_game, test_user):
+    # Частоты идеальны, но низкие и высокие значения строго чередуются
+    save_d20s(db_session, test_game.id, test_user.id, [1, 20, 2, 19, 3, 18, 4, 17, 5, 16, 6, 15, 7, 14, 8, 13, 9, 12, 10, 11] * 20)
+
+    die = compute_fairness_audit(db_session, test_game.id)["dice"][0]
+
+    assert die["chi_square"]["p_value"] == pytest.approx(1.0)
+    assert die["runs"]["runs"] == 400
+    assert die["runs"]["p_value"] < 1e-10
+    assert die["flagged"] is True
+
+
+def test_chunked_stream_matches_single_pass(db_session, test_game, test_user):
+    save_d20s(db_session, test_game.id, test_user.id, np.random.default_rng(5).integers(1, 21, 500))
+
+    single = compute_fairness_audit(db_session, test_game.id, chunk_rows=10_000)
+    chunked = compute_fairness_audit(db_session, test_game.id, chunk_rows=7)
+
+    assert chunked["dice"] == single["dice"]
+    assert chunked["users"] == single["users"]
+
+
+def test_cached_until_history_changes(db_session, test_game, test_user):
+    game_id = test_game.id
+    save_d20s(db_session, game_id, test_user.id, [1, 2, 3])
+
+    first = get_fairness_audit(db_session, game_id)
+    second = get_fairness_audit(db_session, game_id)
+    assert get_audit_cache().hits == 1
+    assert second["dice"] == first["dice"]
+
+    save_d20s(db_session, game_id, test_user.id, [20])
+    third = get_fairness_audit(db_session, game_id)
+    assert third["rows"] == 4
+    assert third["high_water_mark"]["rows"] == 4
+
+
+def test_audit_endpoints(client: TestClient, auth_headers: dict, test_user2_token, db_session, test_game, test_user):
+    game_id = test_game.id
+    save_d20s(db_session, game_id, test_user.id, range(1, 21))
+
+    response = client.get(f"/api/games/{game_id}/dice-audit", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["dice"][0]["frequencies"] == [1] * 20
+    assert data["users"][0]["username"] == test_user.username
+
+    response = client.get(
+        f"/api/games/{game_id}/dice-audit",
+        headers={"Authorization": f"Bearer {test_user2_token}"}
+    )
+    assert response.status_code == 403
+
+    # Аудит всего сервера — только из консоли (audit_dice_fairness.py)
+    assert client.get("/api/dice/audit", headers=auth_headers).status_code == 404
@@ -0,0 +1,189 @@
+"""
+Тесты write-behind очереди истории бросков
+"""
+import asyncio
+import pytest
+import uuid
+from unittest.mock import patch
+from sqlalchemy.exc import OperationalError
+from app.models.dice_roll_history import DiceRollHistory
+from app.services.dice_service import make_roll_history_row, save_roll_history_batch
+from app.services import game_cache as cache
+from app.sockets.dice_history_buffer import DiceHistoryBuffer, get_dice_history_buffer
+from app.sockets.state import connected_users
+
+
+class RecordingPersist:
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.fail_times = fail_times
+
+    async def __call__(self, rows):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise OperationalError("INSERT", {}, Exception("db down"))
+        self.batches.append(list(rows))
+        return len(rows)
+
+
+def _row(total=10):
+    return make_roll_history_row(
+        game_id=uuid.uuid4(), user_id=uuid.uuid4(), count=1, faces=20,
+        rolls=[{"die_id": "d1", "value": total}], total=total,
+    )
+
+
+@pytest.mark.asyncio
+async def test_full_batch_flushed_immediately():
+    persist = RecordingPersist()
+    buffer = DiceHistoryBuffer(persist, batch_size=5, flush_interval=60, max_queue=100)
+
+    buffer.enqueue_many([_row(i) for i in range(5)])
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    assert [len(b) for b in persist.batches] == [5]
+    assert buffer.queue_depth == 0
+    await buffer.drain()
+
+
+@pytest.mark.asyncio
+async def test_partial_batch_flushed_by_timer():
+    persist = RecordingPersist()
+    buffer = DiceHistoryBuffer(persist, batch_size=100, flush_interval=0.02, max_queue=1000)
+
+    for i in range(3):
+        buffer.enqueue(_row(i))
+    assert buffer.queue_depth == 3
+    await asyncio.sleep(0.1)
+
+    assert [len(b) for b in persist.batches] == [3]
+    stats = buffer.stats()
+    assert stats["flushes"] == 1
+    assert stats["max_queue_depth"] == 3
+    assert stats["avg_flush_ms"] is not None
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_order_and_retries():
+    persist = RecordingPersist(fail_times=1)
+    buffer = DiceHistoryBuffer(persist, batch_size=100, flush_interval=60, max_queue=1000)
+    rows = [_row(i) for i in range(4)]
+    buffer.enqueue_many(rows)
+
+    assert await buffer.flush() is False
+    assert buffer.queue_depth == 4
+    await buffer.drain(retry_delay=0)
+
+    assert persist.batches == [rows]
+    assert buffer.stats()["failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_drain_logs_unsaved_rows(caplog):
+    persist = RecordingPersist(fail_times=10)
+    buffer = DiceHistoryBuffer(persist, batch_size=100, flush_interval=60, max_queue=1000)
+    row = _row(17)
+    buffer.enqueue(row)
+
+    await buffer.drain(retries=2, retry_delay=0)
+
+    assert buffer.queue_depth == 0
+    assert str(row["id"]) in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_bad_row_is_set_aside_without_blocking_queue(caplog):
+    """Ошибка данных в одной строке: остальные записываются, плохая не повторяется"""
+    rows = [_row(i) for i in range(5)]
+    bad = rows[2]
+    saved = []
+
+    async def persist(batch):
+        if any(row is bad for row in batch):
+            raise TypeError("'int' object is not subscriptable")
+        saved.extend(batch)
+        return len(batch)
+
+    buffer = DiceHistoryBuffer(persist, batch_size=100, flush_interval=60, max_queue=1000)
+    buffer.enqueue_many(rows)
+
+    assert await buffer.flush() is True
+    assert saved == [row for row in rows if row is not bad]
+    assert buffer.queue_depth == 0
+    assert buffer.stats()["dead_lettered"] == 1
+    assert str(bad["id"]) in caplog.text
+
+    buffer.enqueue(_row(99))
+    assert await buffer.flush() is True
+    assert len(saved) == 5
+
+
+@pytest.mark.asyncio
+async def test_overflow_drops_oldest(caplog):
+    buffer = DiceHistoryBuffer(RecordingPersist(), batch_size=100, flush_interval=60, max_queue=3)
+    rows = [_row(i) for i in range(5)]
+    buffer.enqueue_many(rows)
+
+    assert list(buffer._queue) == rows[2:]
+    assert buffer.stats()["dropped"] == 2
+    # Потерянные строки в логе целиком, как ошибка
+    assert str(rows[0]["id"]) in caplog.text
+    assert any(r.levelname == "ERROR" for r in caplog.records)
+    await buffer.drain()
+
+
+def test_batch_insert_single_statement(db_session, test_game, test_user, query_counter):
+    rows = [
+        make_roll_history_row(
+            game_id=test_game.id, user_id=test_user.id, count=1, faces=20,
+            rolls=[{"die_id": "d1", "value": i + 1}], total=i + 1, roll_type="attack",
+        )
+        for i in range(50)
+    ]
+    query_counter.reset()
+    assert save_roll_history_batch(db_session, rows) == 50
+
+    # Одна вставка истории и по одному UPSERT в агрегаты статистики
+    assert [" ".join(s.split()[:3]) for s in query_counter.statements] == [
+        "INSERT INTO dice_roll_history", "INSERT INTO dice_roll_stats", "INSERT INTO dice_face_stats"
+    ]
+    saved = db_session.query(DiceRollHistory).order_by(DiceRollHistory.created_at).all()
+    assert [h.total for h in saved] == list(range(1, 51))
+    assert saved[0].rolls == [{"die_id": "d1", "value": 1}]
+
+
+@pytest.mark.asyncio
+async def test_dice_roll_emits_before_history_write(fake_sio, socket_db, fake_redis, test_user, test_game):
+    game_id = test_game.id
+    connected_users["sid-dice"] = test_user.id
+    try:
+        with patch.object(cache, "redis_client", fake_redis):
+            for _ in range(3):
+                await fake_sio.handlers["dice_roll"]("sid-dice", {"game_id": str(game_id), "count": 2, "faces": 6})
+    finally:
+        connected_users.pop("sid-dice", None)
+
+    assert len(fake_sio.events("dice:rolled")) == 3
+    assert socket_db.query(DiceRollHistory).count() == 0
+    assert get_dice_history_buffer().queue_depth == 3
+
+    await get_dice_history_buffer().drain()
+    totals = [h.total for h in socket_db.query(DiceRollHistory).order_by(DiceRollHistory.created_at)]
+    assert totals == [e["total"] for e in fake_sio.events("dice:rolled")]
+
+
+@pytest.mark.asyncio
+async def test_dice_roll_rejects_non_string_roll_type(fake_sio, socket_db, fake_redis, test_user, test_game):
+    connected_users["sid-dice"] = test_user.id
+    try:
+        with patch.object(cache, "redis_client", fake_redis):
+            await fake_sio.handlers["dice_roll"]("sid-dice", {
+                "game_id": str(test_game.id), "count": 1, "faces": 20, "roll_type": 5,
+            })
+    finally:
+        connected_users.pop("sid-dice", None)
+
+    assert fake_sio.events("error") == [{"message": "Invalid dice_roll data"}]
+    assert fake_sio.events("dice:rolled") == []
+    assert get_dice_history_buffer().queue_depth == 0
@@ -0,0 +1,74 @@
+"""
+Тесты keyset-пагинации истории бросков
+"""
+from datetime import datetime, timedelta, timezone
+
+from fastapi.testclient import TestClient
+
+from app.services.dice_service import make_roll_history_row, save_roll_history_batch
+
+
+def seed_history(db, game_id, user_id, count, roll_type="attack"):
+    """Записи с попарно одинаковым created_at — порядок внутри пары задает id"""
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(count):
+        row = make_roll_history_row(game_id, user_id, 1, 20, [{"die_id": "d1", "value": 10}], 10, roll_type=roll_type)
+        row["created_at"] = base + timedelta(seconds=i // 2)
+        rows.append(row)
+    save_roll_history_batch(db, rows)
+    return sorted(rows, key=lambda r: (r["created_at"], str(r["id"])), reverse=True)
+
+
+def fetch_all(client: TestClient, game_id, headers, **params):
+    ids, cursor, pages = [], None, 0
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        response = client.get(f"/api/games/{game_id}/dice-history", params=query, headers=headers)
+        assert response.status_code == 200
+        pages += 1
+        ids += [item["id"] for item in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return ids, pages
+
+
+def test_cursor_walks_every_entry_once(client: TestClient, auth_headers: dict, db_session, test_game, test_user):
+    game_id = test_game.id
+    expected = [str(r["id"]) for r in seed_history(db_session, game_id, test_user.id, 25)]
+
+    ids, pages = fetch_all(client, game_id, auth_headers, limit=10)
+
+    assert ids == expected
+    assert pages == 3
+
+
+def test_cursor_with_filter_and_exact_last_page(client: TestClient, auth_headers: dict, db_session, test_game, test_user):
+    game_id = test_game.id
+    seed_history(db_session, game_id, test_user.id, 6, roll_type="save")
+    expected = [str(r["id"]) for r in seed_history(db_session, game_id, test_user.id, 10, roll_type="attack")]
+
+    ids, pages = fetch_all(client, game_id, auth_headers, limit=5, roll_type="attack")
+
+    # Ровно две полные страницы: лишней пустой страницы нет
+    assert ids == expected
+    assert pages == 2
+
+
+def test_offset_still_supported(client: TestClient, auth_headers: dict, db_session, test_game, test_user):
+    game_id = test_game.id
+    expected = [str(r["id"]) for r in seed_history(db_session, game_id, test_user.id, 8)]
+
+    response = client.get(f"/api/games/{game_id}/dice-history", params={"limit": 3, "offset": 3}, headers=auth_headers)
+
+    assert [item["id"] for item in response.json()] == expected[3:6]
+
+
+def test_invalid_cursor(client: TestClient, auth_headers: dict, test_game):
+    response = client.get(
+        f"/api/games/{test_game.id}/dice-history",
+        params={"cursor": "not-a-cursor"},
+        headers=auth_headers
+    )
+    assert response.status_code == 400
+
@@ -0,0 +1,143 @@
+"""
+Тесты потоков бросков игр: seed, номера бросков и воспроизведение
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.models.dice_roll_history import DiceRollHistory
+from app.models.game_session import GameSession
+from app.services.dice_rng import (
+    GameRngRegistry,
+    get_game_rng,
+    replay_game_rolls,
+    rng_for,
+    seed_commitment,
+)
+from app.sockets.dice_history_buffer import get_dice_history_buffer
+from app.sockets.state import connected_users
+
+
+def test_stream_is_reproducible_per_offset():
+    first, second = rng_for("seed", 5), rng_for("seed", 5)
+    assert [first.randint(1, 20) for _ in range(10)] == [second.randint(1, 20) for _ in range(10)]
+
+    sequences = {tuple(rng_for("seed", offset).generator.integers(1, 21, 8)) for offset in range(50)}
+    assert len(sequences) == 50
+
+
+def test_registry_reserves_blocks_and_creates_seed_lazily(db_session, test_game):
+    assert test_game.dice_seed is None
+    registry = GameRngRegistry(block_size=64)
+
+    offsets = [rng.offset for rng in registry.allocate(db_session, test_game.id, 100)]
+    offsets += [rng.offset for rng in registry.allocate(db_session, test_game.id, 10)]
+
+    assert offsets == list(range(110))
+    assert registry.reservations == 2
+    db_session.refresh(test_game)
+    assert test_game.dice_rng_offset == 164
+    assert test_game.dice_seed_commitment == seed_commitment(test_game.dice_seed)
+
+    # Новый воркер (реестр) продолжает с конца зарезервированного, не пересекаясь
+    other = GameRngRegistry(block_size=64)
+    assert other.allocate(db_session, test_game.id)[0].offset == 164
+
+
+def test_reservation_leaves_caller_session_alone(db_session, test_game):
+    test_game.name = "Renamed"
+    registry = GameRngRegistry(block_size=8)
+
+    registry.allocate(db_session, test_game.id, 3)
+
+    # Изменения вызывающего не сброшены и не закоммичены
+    assert test_game in db_session.dirty
+    db_session.rollback()
+    assert db_session.get(GameSession, test_game.id).name != "Renamed"
+    assert db_session.get(GameSession, test_game.id).dice_rng_offset == 8
+
+
+def test_registry_lock_is_per_game(db_session, test_game):
+    other_game = GameSession(name="Other", invite_code="OTHER1", master_id=test_game.master_id)
+    db_session.add(other_game)
+    db_session.commit()
+    registry = GameRngRegistry(block_size=8)
+
+    # Пока блок одной игры резервируется, броски другой не ждут
+    with registry._game_lock(test_game.id):
+        assert registry.allocate(db_session, other_game.id)[0].offset == 0
+
+
+def test_create_game_publishes_commitment(client: TestClient, auth_headers: dict, db_session):
+    response = client.post("/api/games", json={"name": "Seeded"}, headers=auth_headers)
+    game = db_session.query(GameSession).filter(GameSession.id == response.json()["id"]).one()
+
+    assert game.dice_seed is not None
+    assert game.dice_seed_commitment == seed_commitment(game.dice_seed)
+
+    info = client.get(f"/api/games/{game.id}/dice-rng", headers=auth_headers).json()
+    assert info["seed_commitment"] == game.dice_seed_commitment
+    assert "seed" not in info
+
+
+def test_dice_rng_info_hidden_from_non_participants(client: TestClient, test_user2_token, test_game):
+    response = client.get(
+        f"/api/games/{test_game.id}/dice-rng",
+        headers={"Authorization": f"Bearer {test_user2_token}"}
+    )
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_socket_rolls_replay_from_history(fake_sio, socket_db, test_user, test_game):
+    game_id = test_game.id
+    connected_users["sid-rng"] = test_user.id
+    try:
+        for payload in (
+            {"count": 3, "faces": 6, "modifier": 2},
+            {"count": 1, "faces": 20, "advantage": True},
+            {"expression": "4d6kh3+1d8!"},
+        ):
+            await fake_sio.handlers["dice_roll"]("sid-rng", {"game_id": str(game_id), **payload})
+        await fake_sio.handlers["dice_roll_batch"]("sid-rng", {
+            "game_id": str(game_id),
+            "rolls": [{"expression": "1d20+3"}, {"count": 2, "faces": 10}],
+        })
+    finally:
+        connected_users.pop("sid-rng", None)
+    await get_dice_history_buffer().drain()
+    socket_db.expire_all()
+
+    rolled = fake_sio.events("dice:rolled")
+    assert [r["rng_offset"] for r in rolled] == [0, 1, 2]
+    assert [r["rng_offset"] for r in fake_sio.events("dice:rolled_batch")[0]["rolls"]] == [3, 4]
+
+    report = replay_game_rolls(socket_db, game_id)
+    assert report["commitment_ok"] is True
+    assert report["checked"] == 5
+    assert report["mismatches"] == []
+
+    # Подмена результата обнаруживается
+    entry = socket_db.query(DiceRollHistory).filter(DiceRollHistory.rng_offset == 2).one()
+    entry.total += 1
+    socket_db.commit()
+    report = replay_game_rolls(socket_db, game_id)
+    assert [m["rng_offset"] for m in report["mismatches"]] == [2]
+
+    assert replay_game_rolls(socket_db, game_id, seed="forged")["commitment_ok"] is False
+
+
+def test_combat_rolls_use_game_stream(db_session, test_game):
+    from app.services.combat_service import perform_attack, start_combat
+
+    combat = start_combat(db_session, test_game.id, [
+        {"name": "A", "max_hp": 10, "armor_class": 1, "is_player_controlled": False},
+        {"name": "B", "max_hp": 10, "armor_class": 1, "is_player_controlled": False},
+    ])
+    attacker_id, target_id = combat.participants[0].id, combat.participants[1].id
+
+    result = perform_attack(db_session, combat.id, attacker_id, target_id, damage_dice="2d6")
+
+    db_session.refresh(test_game)
+    assert result["rng_offset"] == 0
+    assert rng_for(test_game.dice_seed, 0).randint(1, 20) == result["attack_roll"]
+    assert get_game_rng(db_session, test_game.id).offset == 1
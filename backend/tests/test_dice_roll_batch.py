@@ -0,0 +1,106 @@
+"""
+Тесты группового броска: одно событие, одна вставка истории, одна рассылка
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.models.dice_roll_history import DiceRollHistory
+from app.sockets.dice_history_buffer import get_dice_history_buffer
+from app.sockets.state import connected_users
+
+
+GOBLIN_STEALTH = [
+    {"label": f"Гоблин {i}", "expression": "1d20+6", "roll_type": "skill"}
+    for i in range(1, 9)
+]
+
+
+@pytest.mark.asyncio
+async def test_socket_batch_single_broadcast_and_insert(fake_sio, socket_db, test_user, test_game):
+    connected_users["sid-batch"] = test_user.id
+    try:
+        await fake_sio.handlers["dice_roll_batch"]("sid-batch", {
+            "game_id": str(test_game.id),
+            "rolls": GOBLIN_STEALTH + [{"label": "Вор", "count": 1, "faces": 20, "advantage": True, "modifier": 2}],
+        })
+    finally:
+        connected_users.pop("sid-batch", None)
+
+    batches = fake_sio.events("dice:rolled_batch")
+    assert len(batches) == 1
+    assert fake_sio.events("dice:rolled") == []
+    rolls = batches[0]["rolls"]
+    assert [r["label"] for r in rolls] == [f"Гоблин {i}" for i in range(1, 9)] + ["Вор"]
+    assert all(7 <= r["total"] <= 26 for r in rolls[:8])
+    assert rolls[8]["advantage_type"] == "advantage"
+    assert rolls[8]["total"] == rolls[8]["selected_roll"]["value"] + 2
+
+    buffer = get_dice_history_buffer()
+    assert buffer.stats()["queue_depth"] == 9
+    await buffer.drain()
+    assert buffer.stats()["flushes"] == 1
+    assert socket_db.query(DiceRollHistory).count() == 9
+
+
+@pytest.mark.asyncio
+async def test_socket_batch_rejects_invalid_entry_without_rolling(fake_sio, socket_db, test_user, test_game):
+    connected_users["sid-batch"] = test_user.id
+    try:
+        await fake_sio.handlers["dice_roll_batch"]("sid-batch", {
+            "game_id": str(test_game.id),
+            "rolls": [{"expression": "1d20"}, {"expression": "4d6kh9"}],
+        })
+        await fake_sio.handlers["dice_roll_batch"]("sid-batch", {"game_id": str(test_game.id), "rolls": []})
+    finally:
+        connected_users.pop("sid-batch", None)
+
+    errors = fake_sio.events("error")
+    assert len(errors) == 2
+    assert errors[0]["message"].startswith("Бросок 2")
+    assert errors[1]["message"] == "Invalid dice_roll_batch data"
+    assert fake_sio.events("dice:rolled_batch") == []
+    assert get_dice_history_buffer().stats()["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_socket_batch_requires_participant(fake_sio, socket_db, test_user2, test_game):
+    connected_users["sid-batch"] = test_user2.id
+    try:
+        await fake_sio.handlers["dice_roll_batch"]("sid-batch", {
+            "game_id": str(test_game.id),
+            "rolls": GOBLIN_STEALTH,
+        })
+    finally:
+        connected_users.pop("sid-batch", None)
+
+    assert fake_sio.events("error") == [{"message": "Not a participant"}]
+
+
+def test_roll_batch_endpoint(client: TestClient, auth_headers: dict, fake_sio, db_session, test_game, query_counter):
+    game_id = test_game.id
+    query_counter.reset()
+    response = client.post(
+        "/api/dice/roll-batch",
+        json={"game_id": str(game_id), "rolls": GOBLIN_STEALTH},
+        headers=auth_headers
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data["rolls"]) == 8
+    assert data["rolls"][0]["expression"] == "1d20+6"
+    assert len(fake_sio.events("dice:rolled_batch")) == 1
+    inserts = [s for s in query_counter.statements if s.lstrip().upper().startswith("INSERT INTO DICE_ROLL_HISTORY")]
+    assert len(inserts) == 1
+    assert db_session.query(DiceRollHistory).filter(DiceRollHistory.game_id == game_id).count() == 8
+
+
+def test_roll_batch_endpoint_forbidden_for_non_participant(client: TestClient, test_user2_token, test_game):
+    headers = {"Authorization": f"Bearer {test_user2_token}"}
+
+    response = client.post(
+        "/api/dice/roll-batch",
+        json={"game_id": str(test_game.id), "rolls": GOBLIN_STEALTH},
+        headers=headers
+    )
+    assert response.status_code == 403
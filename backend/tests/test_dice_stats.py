@@ -0,0 +1,118 @@
+"""
+Тесты инкрементальной статистики бросков
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.models.dice_roll_history import DiceRollHistory
+from app.models.dice_roll_stats import DiceFaceStat, DiceRollStat
+from app.services.dice_service import make_roll_history_row, save_roll_history, save_roll_history_batch
+from app.services.dice_stats import get_game_dice_stats, rebuild_roll_stats
+from app.sockets.dice_history_buffer import get_dice_history_buffer
+from app.sockets.state import connected_users
+
+
+def d20(value):
+    return [{"die_id": "d1", "value": value}]
+
+
+def seed_rolls(db, game_id, user_id):
+    save_roll_history_batch(db, [
+        make_roll_history_row(game_id, user_id, 1, 20, d20(20), 25, roll_type="attack", modifier=5),
+        make_roll_history_row(game_id, user_id, 1, 20, d20(1), 6, roll_type="attack", modifier=5),
+        make_roll_history_row(game_id, user_id, 2, 6, [{"die_id": "d1", "value": 3}, {"die_id": "d2", "value": 6}], 9),
+        make_roll_history_row(game_id, user_id, 2, 8, [{"die_id": "d1", "value": 4}, {"die_id": "d2", "value": 2}], 6,
+                              expression="1d8+1d6"),
+    ])
+    save_roll_history(db, game_id, user_id, 1, 20, d20(11), 11, roll_type="save")
+
+
+def snapshot(db):
+    return (
+        sorted((r.roll_type, r.rolls, r.total_sum) for r in db.query(DiceRollStat).all()),
+        sorted((r.roll_type, r.faces, r.value, r.count) for r in db.query(DiceFaceStat).all()),
+    )
+
+
+def test_counters_follow_saved_history(db_session, test_game, test_user):
+    seed_rolls(db_session, test_game.id, test_user.id)
+
+    stats = get_game_dice_stats(db_session, test_game.id)
+
+    assert stats["total_rolls"] == 5
+    # Смешанное выражение учитывается как бросок, но не по граням
+    assert stats["total_dice"] == 5
+    d20_stats = next(d for d in stats["dice"] if d["faces"] == 20)
+    assert d20_stats["count"] == 3
+    assert d20_stats["frequencies"][19] == 1 and d20_stats["frequencies"][0] == 1
+    assert stats["nat20_rate"] == pytest.approx(1 / 3)
+    attack = next(t for t in stats["roll_types"] if t["roll_type"] == "attack")
+    assert attack["rolls"] == 2
+    assert attack["mean_total"] == pytest.approx(15.5)
+    assert [t["roll_type"] for t in stats["roll_types"]].count(None) == 1
+    assert stats["users"][0]["rolls"] == 5
+
+
+def test_non_string_roll_type_does_not_roll_back_history(db_session, test_game, test_user):
+    save_roll_history_batch(db_session, [
+        make_roll_history_row(test_game.id, test_user.id, 1, 20, d20(7), 7, roll_type=7),
+        make_roll_history_row(test_game.id, test_user.id, 1, 20, d20(9), 9, roll_type="x" * 80),
+    ])
+
+    assert db_session.query(DiceRollHistory).count() == 2
+    assert sorted(snapshot(db_session)[0]) == [("7", 1, 7), ("x" * 50, 1, 9)]
+
+
+def test_rebuild_matches_incremental_counters(db_session, test_game, test_user):
+    seed_rolls(db_session, test_game.id, test_user.id)
+    seed_rolls(db_session, test_game.id, test_user.id)
+    incremental = snapshot(db_session)
+
+    processed = rebuild_roll_stats(db_session, test_game.id, batch_size=3)
+
+    assert processed == 10
+    assert snapshot(db_session) == incremental
+
+
+def test_luck_is_normalized(db_session, test_game, test_user):
+    save_roll_history_batch(db_session, [
+        make_roll_history_row(test_game.id, test_user.id, 1, 20, d20(20), 20),
+        make_roll_history_row(test_game.id, test_user.id, 1, 4, [{"die_id": "d1", "value": 4}], 4),
+    ])
+
+    assert get_game_dice_stats(db_session, test_game.id)["users"][0]["luck"] == pytest.approx(1.0)
+
+
+@pytest.mark.asyncio
+async def test_socket_rolls_update_stats(fake_sio, socket_db, test_user, test_game):
+    game_id = test_game.id
+    connected_users["sid-stats"] = test_user.id
+    try:
+        await fake_sio.handlers["dice_roll_batch"]("sid-stats", {
+            "game_id": str(game_id),
+            "rolls": [{"expression": "1d20+3", "roll_type": "skill"}] * 4,
+        })
+    finally:
+        connected_users.pop("sid-stats", None)
+    await get_dice_history_buffer().drain()
+
+    stats = get_game_dice_stats(socket_db, game_id)
+    assert stats["roll_types"][0]["roll_type"] == "skill"
+    assert stats["roll_types"][0]["rolls"] == 4
+
+
+def test_dice_stats_endpoint(client: TestClient, auth_headers: dict, test_user2_token, db_session, test_game, test_user):
+    game_id = test_game.id
+    seed_rolls(db_session, game_id, test_user.id)
+
+    response = client.get(f"/api/games/{game_id}/dice-stats", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_rolls"] == 5
+    assert data["users"][0]["username"] == test_user.username
+
+    response = client.get(
+        f"/api/games/{game_id}/dice-stats",
+        headers={"Authorization": f"Bearer {test_user2_token}"}
+    )
+    assert response.status_code == 403
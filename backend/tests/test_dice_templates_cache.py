@@ -0,0 +1,90 @@
+"""
+Тесты кэша шаблонов бросков: однократная загрузка, перезагрузка по изменению файла
+"""
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.dice_service import DiceTemplateStore, get_template_store, get_templates
+
+
+TEMPLATES = {
+    "attack_melee": {"label": "Атака", "count": 1, "faces": 20, "modifier_source": "strength", "roll_type": "attack"},
+    "damage": {"label": "Урон", "count": 2, "faces": 6, "roll_type": "damage"},
+}
+
+
+def write_templates(path, data, mtime_ns=None):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = tmp_path / "dice_templates.json"
+    write_templates(path, TEMPLATES, mtime_ns=1_000_000_000)
+    return DiceTemplateStore(path, check_interval=0)
+
+
+def test_templates_loaded_once(store):
+    assert store.as_dict() == TEMPLATES
+    assert store.as_dict() is store.as_dict()
+    assert store.loads == 1
+
+
+def test_reload_on_change_and_hash_confirmation(store):
+    store.as_dict()
+
+    # Новый mtime с тем же содержимым — без перезагрузки
+    write_templates(store.path, TEMPLATES, mtime_ns=2_000_000_000)
+    store.as_dict()
+    assert store.loads == 1
+
+    changed = dict(TEMPLATES, skill={"label": "Навык", "count": 1, "faces": 20, "roll_type": "skill"})
+    write_templates(store.path, changed, mtime_ns=3_000_000_000)
+    assert "skill" in store.as_dict()
+    assert store.loads == 2
+
+
+def test_invalid_file_keeps_last_valid_templates(store):
+    store.as_dict()
+    write_templates(store.path, {"broken": {"count": 0, "faces": 20, "roll_type": "x"}}, mtime_ns=2_000_000_000)
+
+    assert store.as_dict() == TEMPLATES
+
+
+def test_check_interval_skips_stat(tmp_path):
+    path = tmp_path / "dice_templates.json"
+    write_templates(path, TEMPLATES)
+    store = DiceTemplateStore(path, check_interval=3600)
+    store.as_dict()
+
+    write_templates(path, {}, mtime_ns=5_000_000_000)
+    assert store.as_dict() == TEMPLATES
+
+
+def test_apply_memoized_per_ability_score(store):
+    character = SimpleNamespace(strength=16)
+
+    first = store.apply("attack_melee", character)
+    assert first["modifier"] == 3
+    first["modifier"] = 100  # результат — копия, кэш не портится
+    assert store.apply("attack_melee", character)["modifier"] == 3
+    assert len(store._applied) == 1
+
+    character.strength = 18
+    assert store.apply("attack_melee", character)["modifier"] == 4
+    assert store.apply("damage", character)["modifier"] is None
+
+    with pytest.raises(ValueError, match="характеристика"):
+        store.apply("attack_melee", SimpleNamespace())
+    with pytest.raises(ValueError, match="не найден"):
+        store.apply("missing")
+
+
+def test_module_templates_are_shared():
+    assert get_templates() is get_templates()
+    assert get_template_store().loads == 1
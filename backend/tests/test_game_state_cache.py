@@ -0,0 +1,110 @@
+"""
+Тесты чтения состояния игры через кэш Redis
+"""
+import pytest
+import uuid
+from unittest.mock import patch, Mock
+from app.models.game_participant import GameParticipant
+from app.models.token import Token
+from app.schemas.token import TokenUpdate
+from app.services import game_service
+from app.services import game_cache as cache
+from app.sockets.utils import get_game_state
+
+
+@pytest.fixture
+def cache_redis(fake_redis):
+    with patch.object(cache, "redis_client", fake_redis):
+        yield fake_redis
+
+
+@pytest.fixture
+def hidden_token(db_session, test_game):
+    token = Token(id=uuid.uuid4(), game_id=test_game.id, name="Ambush", x=5.0, y=5.0, is_hidden=True)
+    db_session.add(token)
+    db_session.commit()
+    return token
+
+
+def test_warm_read_runs_no_sql(cache_redis, db_session, test_game, test_token, query_counter):
+    game_id = test_game.id
+    cold = get_game_state(db_session, game_id)
+    assert query_counter.count > 0
+
+    query_counter.reset()
+    cache_redis.round_trips = 0
+    warm = get_game_state(db_session, game_id)
+
+    assert query_counter.count == 0
+    assert cache_redis.round_trips == 1
+    assert warm == cold
+
+
+def test_hidden_tokens_filtered_from_cache(cache_redis, db_session, test_game, test_token, hidden_token):
+    master_state = get_game_state(db_session, test_game.id, include_hidden=True)
+    player_state = get_game_state(db_session, test_game.id)
+
+    assert {t["id"] for t in master_state["tokens"]} == {str(test_token.id), str(hidden_token.id)}
+    assert [t["id"] for t in player_state["tokens"]] == [str(test_token.id)]
+
+
+def test_token_mutations_keep_cache_fresh(cache_redis, db_session, test_game, test_token, hidden_token, query_counter):
+    game_id, token_id, hidden_id = test_game.id, test_token.id, hidden_token.id
+    get_game_state(db_session, game_id)
+
+    game_service.update_token_position(db_session, token_id, TokenUpdate(x=42.0, y=24.0))
+    game_service.reveal_token(db_session, hidden_id, game_id)
+
+    query_counter.reset()
+    state = get_game_state(db_session, game_id)
+    assert query_counter.count == 0
+    tokens = {t["id"]: t for t in state["tokens"]}
+    assert (tokens[str(token_id)]["x"], tokens[str(token_id)]["y"]) == (42.0, 24.0)
+    assert str(hidden_id) in tokens
+
+    game_service.delete_token(db_session, token_id)
+    state = get_game_state(db_session, game_id)
+    assert str(token_id) not in {t["id"] for t in state["tokens"]}
+
+
+def test_participant_changes_invalidate_snapshot(cache_redis, db_session, test_game, test_user, test_user2):
+    get_game_state(db_session, test_game.id)
+
+    game_service.join_game(db_session, test_game.id, test_user2.id)
+    state = get_game_state(db_session, test_game.id)
+    assert str(test_user2.id) in {p["user_id"] for p in state["players"]}
+
+    game_service.set_participant_ready(db_session, test_game.id, test_user2.id, True)
+    state = get_game_state(db_session, test_game.id)
+    player = next(p for p in state["players"] if p["user_id"] == str(test_user2.id))
+    assert player["is_ready"] is True
+
+    game_service.transfer_master_role(db_session, test_game.id, test_user.id, test_user2.id)
+    state = get_game_state(db_session, test_game.id)
+    roles = {p["user_id"]: p["role"] for p in state["players"]}
+    assert roles[str(test_user2.id)] == "master"
+
+
+def test_stale_snapshot_is_not_served(cache_redis, db_session, test_game, test_user2):
+    """Снимок, записанный до инвалидации, не используется"""
+    get_game_state(db_session, test_game.id)
+    db_session.add(GameParticipant(game_id=test_game.id, user_id=test_user2.id, role="player"))
+    db_session.commit()
+    cache.invalidate_game_state(test_game.id)
+    cache.write_game_snapshot(test_game.id, 0, {"id": "stale"}, [])
+
+    state = get_game_state(db_session, test_game.id)
+
+    assert state["game"]["id"] == str(test_game.id)
+    assert len(state["players"]) == 2
+
+
+def test_redis_down_falls_back_to_db(db_session, test_game, test_token):
+    from redis.exceptions import ConnectionError
+    broken = Mock()
+    broken.pipeline.side_effect = ConnectionError("down")
+    with patch.object(cache, "redis_client", broken):
+        state = get_game_state(db_session, test_game.id)
+
+    assert state["game"]["id"] == str(test_game.id)
+    assert [t["id"] for t in state["tokens"]] == [str(test_token.id)]
@@ -0,0 +1,129 @@
+"""
+Тесты кэша ролей участников для авторизации событий сокетов
+"""
+import pytest
+import uuid
+from unittest.mock import patch, Mock
+from redis.exceptions import ConnectionError
+from app.models.game_participant import GameParticipant
+from app.models.token import Token
+from app.services import game_service
+from app.services import game_cache as cache
+from app.sockets.state import connected_users
+from app.sockets.utils import get_participant_role
+
+
+@pytest.fixture
+def cache_redis(fake_redis):
+    with patch.object(cache, "redis_client", fake_redis):
+        yield fake_redis
+
+
+@pytest.fixture
+def sockets(test_user, test_user2):
+    connected_users["sid-master"] = test_user.id
+    connected_users["sid-player"] = test_user2.id
+    yield
+    connected_users.pop("sid-master", None)
+    connected_users.pop("sid-player", None)
+
+
+def test_role_cached_after_first_lookup(cache_redis, db_session, test_game, test_user, query_counter):
+    game_id, user_id = test_game.id, test_user.id
+    assert get_participant_role(db_session, game_id, user_id) == "master"
+
+    query_counter.reset()
+    assert get_participant_role(db_session, game_id, user_id) == "master"
+    assert query_counter.count == 0
+
+
+def test_non_participants_are_not_cached(cache_redis, db_session, test_game, test_user2):
+    assert get_participant_role(db_session, test_game.id, test_user2.id) is None
+    assert cache_redis.hgetall(f"game:{test_game.id}:members") == {}
+
+
+def test_transfer_master_role_invalidates(cache_redis, db_session, test_game, test_user, test_user2):
+    game_id = test_game.id
+    game_service.join_game(db_session, game_id, test_user2.id)
+    assert get_participant_role(db_session, game_id, test_user.id) == "master"
+    assert get_participant_role(db_session, game_id, test_user2.id) == "player"
+
+    game_service.transfer_master_role(db_session, game_id, test_user.id, test_user2.id)
+
+    assert get_participant_role(db_session, game_id, test_user.id) == "player"
+    assert get_participant_role(db_session, game_id, test_user2.id) == "master"
+
+
+def test_join_invalidates_cached_roles(cache_redis, db_session, test_game, test_user2):
+    game_id = test_game.id
+    assert get_participant_role(db_session, game_id, test_user2.id) is None
+
+    game_service.join_as_spectator(db_session, game_id, test_user2.id)
+
+    assert get_participant_role(db_session, game_id, test_user2.id) == "spectator"
+
+
+def test_stale_fill_is_ignored(cache_redis, db_session, test_game, test_user):
+    """Запись, сделанная с версией до инвалидации, не используется"""
+    game_id, user_id = test_game.id, test_user.id
+
+    def load_then_demote():
+        role = "master"
+        participant = db_session.query(GameParticipant).filter_by(game_id=game_id, user_id=user_id).one()
+        participant.role = "player"
+        db_session.commit()
+        cache.invalidate_game_state(game_id)
+        return role
+
+    assert cache.get_member_role(game_id, user_id, load_then_demote) == "master"
+    assert get_participant_role(db_session, game_id, user_id) == "player"
+
+
+def test_failed_invalidation_is_bounded_by_role_ttl(cache_redis, db_session, test_game, test_user, test_user2, caplog):
+    """Инвалидация не дошла до Redis: ошибка в логе, устаревшая роль живет не дольше MEMBER_ROLE_TTL"""
+    game_id = test_game.id
+    game_service.join_game(db_session, game_id, test_user2.id)
+    assert get_participant_role(db_session, game_id, test_user.id) == "master"
+
+    with patch.object(cache_redis, "pipeline", side_effect=ConnectionError("down")), \
+            patch.object(cache_redis, "eval", side_effect=ConnectionError("down")):
+        game_service.transfer_master_role(db_session, game_id, test_user.id, test_user2.id)
+    assert any(r.levelname == "ERROR" and "invalidate" in r.getMessage() for r in caplog.records)
+
+    assert get_participant_role(db_session, game_id, test_user.id) == "master"
+    later = cache.time.time() + cache.MEMBER_ROLE_TTL + 1
+    with patch.object(cache.time, "time", return_value=later):
+        assert get_participant_role(db_session, game_id, test_user.id) == "player"
+
+
+def test_redis_down_falls_back_to_db(db_session, test_game, test_user):
+    broken = Mock()
+    broken.pipeline.side_effect = ConnectionError("down")
+    with patch.object(cache, "redis_client", broken):
+        assert get_participant_role(db_session, test_game.id, test_user.id) == "master"
+
+
+@pytest.mark.asyncio
+async def test_socket_events_skip_authz_queries(fake_sio, socket_db, cache_redis, sockets, test_game, test_token, query_counter):
+    game_id, token_id = str(test_game.id), str(test_token.id)
+    await fake_sio.handlers["game_join"]("sid-master", {"game_id": game_id})
+    assert fake_sio.events("game:state")
+
+    query_counter.reset()
+    await fake_sio.handlers["token_move"]("sid-master", {"game_id": game_id, "token_id": token_id, "x": 1.0, "y": 2.0})
+
+    assert fake_sio.events("token:moved")
+    assert query_counter.count == 0
+
+
+@pytest.mark.asyncio
+async def test_demoted_master_loses_token_rights(fake_sio, socket_db, cache_redis, sockets, test_game, test_user, test_user2, test_token):
+    game_id, token_id = test_game.id, test_token.id
+    game_service.join_game(socket_db, game_id, test_user2.id)
+    await fake_sio.handlers["game_join"]("sid-master", {"game_id": str(game_id)})
+
+    game_service.transfer_master_role(socket_db, game_id, test_user.id, test_user2.id)
+    await fake_sio.handlers["token_delete"]("sid-master", {"game_id": str(game_id), "token_id": str(token_id)})
+
+    assert fake_sio.events("error")[-1]["message"] == "Only master can delete tokens"
+    assert socket_db.get(Token, token_id) is not None
@@ -0,0 +1,75 @@
+"""
+Регрессионные тесты на N+1: число запросов не зависит от размера группы
+"""
+import pytest
+import uuid
+from unittest.mock import patch, Mock
+from redis.exceptions import ConnectionError
+from app.models.user import User
+from app.models.game_participant import GameParticipant
+from app.services.game_service import get_game_participants
+from app.services import game_cache as cache
+from app.sockets.utils import get_game_state
+
+
+def _add_players(db_session, game, count):
+    for i in range(count):
+        user = User(id=uuid.uuid4(), email=f"p{i}@example.com", username=f"player{i}", password_hash="x")
+        db_session.add(user)
+        db_session.add(GameParticipant(game_id=game.id, user_id=user.id, role="player", is_ready=i % 2 == 0))
+    db_session.commit()
+
+
+def _count(query_counter, func):
+    query_counter.reset()
+    result = func()
+    return query_counter.count, result
+
+
+@pytest.fixture
+def redis_down():
+    broken = Mock()
+    broken.pipeline.side_effect = ConnectionError("down")
+    broken.set.side_effect = ConnectionError("down")
+    with patch.object(cache, "redis_client", broken):
+        yield
+
+
+def test_get_game_participants_single_query(db_session, test_game, query_counter):
+    game_id = test_game.id
+    small, players = _count(query_counter, lambda: get_game_participants(db_session, game_id))
+    assert len(players) == 1
+
+    _add_players(db_session, test_game, 25)
+    large, players = _count(query_counter, lambda: get_game_participants(db_session, game_id))
+
+    assert small == large == 1
+    assert len(players) == 26
+    assert {"user_id", "username", "role", "is_ready", "character_id"} == set(players[0])
+
+
+def test_get_game_state_constant_queries(redis_down, db_session, test_game, test_token, query_counter):
+    game_id = test_game.id
+    small, _ = _count(query_counter, lambda: get_game_state(db_session, game_id))
+
+    _add_players(db_session, test_game, 25)
+    large, state = _count(query_counter, lambda: get_game_state(db_session, game_id))
+
+    assert small == large
+    assert len(state["players"]) == 26
+
+
+def test_participants_endpoint_constant_queries(authenticated_client, db_session, test_game, query_counter):
+    game_id = test_game.id
+    query_counter.reset()
+    response = authenticated_client.get(f"/api/games/{game_id}/participants")
+    small = query_counter.count
+
+    _add_players(db_session, test_game, 25)
+    query_counter.reset()
+    response = authenticated_client.get(f"/api/games/{game_id}/participants")
+    large = query_counter.count
+
+    assert response.status_code == 200
+    assert len(response.json()) == 26
+    assert small == large
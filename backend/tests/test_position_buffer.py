@@ -0,0 +1,167 @@
+"""
+Тесты write-behind буфера позиций токенов
+"""
+import asyncio
+import pytest
+import uuid
+from unittest.mock import patch, Mock
+from redis.exceptions import ConnectionError
+from app.models.game_session import GameSession
+from app.models.token import Token
+from app.schemas.token import TokenUpdate
+from app.services import game_service
+from app.services import game_cache as cache
+from app.services.position_buffer import TokenPositionBuffer, get_position_buffer
+from app.sockets.state import connected_users, get_state_store
+from app.sockets.utils import get_game_state
+
+
+class RecordingPersist:
+    def __init__(self, fail_times=0):
+        self.calls = []
+        self.fail_times = fail_times
+
+    async def __call__(self, game_id, positions):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("db down")
+        self.calls.append((game_id, dict(positions)))
+        return len(positions)
+
+
+@pytest.mark.asyncio
+async def test_settled_position_flushed_after_quiet_period():
+    persist = RecordingPersist()
+    buffer = TokenPositionBuffer(persist, quiet_period=0.03, max_delay=10)
+    game_id, token_a, token_b = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+
+    for step in range(20):
+        buffer.record(game_id, token_a, float(step), 0.0)
+    buffer.record(game_id, token_b, 5.0, 5.0)
+    await asyncio.sleep(0.1)
+
+    assert persist.calls == [(game_id, {token_a: (19.0, 0.0), token_b: (5.0, 5.0)})]
+    assert buffer.pending_games() == []
+
+
+@pytest.mark.asyncio
+async def test_continuous_drag_flushed_by_max_delay():
+    persist = RecordingPersist()
+    buffer = TokenPositionBuffer(persist, quiet_period=1.0, max_delay=0.05)
+    game_id, token_id = uuid.uuid4(), uuid.uuid4()
+
+    for step in range(15):
+        buffer.record(game_id, token_id, float(step), 0.0)
+        await asyncio.sleep(0.01)
+
+    assert persist.calls
+    await buffer.flush_all()
+    assert persist.calls[-1][1] == {token_id: (14.0, 0.0)}
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_positions():
+    persist = RecordingPersist(fail_times=1)
+    buffer = TokenPositionBuffer(persist, quiet_period=10, max_delay=10)
+    game_id, token_id = uuid.uuid4(), uuid.uuid4()
+    buffer.record(game_id, token_id, 1.0, 2.0)
+
+    await buffer.flush(game_id)
+    assert buffer.pending_positions(game_id) == {token_id: (1.0, 2.0)}
+
+    await buffer.flush_all()
+    assert persist.calls == [(game_id, {token_id: (1.0, 2.0)})]
+
+
+def test_persist_is_single_update(db_session, test_game, query_counter):
+    tokens = [Token(id=uuid.uuid4(), game_id=test_game.id, name=f"T{i}", x=0.0, y=0.0) for i in range(20)]
+    db_session.add_all(tokens)
+    db_session.commit()
+    positions = {token.id: (float(i), float(i) / 2) for i, token in enumerate(tokens)}
+    game_id = test_game.id
+
+    query_counter.reset()
+    rows = game_service.persist_token_positions(db_session, game_id, positions)
+
+    assert rows == 20
+    assert [s.split()[0] for s in query_counter.statements] == ["UPDATE"]
+    db_session.expire_all()
+    assert {t.id: (t.x, t.y) for t in db_session.query(Token)} == positions
+
+
+def test_persist_ignores_tokens_of_other_games(db_session, test_game, test_token):
+    rows = game_service.persist_token_positions(db_session, uuid.uuid4(), {test_token.id: (1.0, 1.0)})
+
+    assert rows == 0
+    db_session.refresh(test_token)
+    assert (test_token.x, test_token.y) == (50.0, 50.0)
+
+
+@pytest.mark.asyncio
+async def test_socket_moves_written_on_disconnect(fake_sio, socket_db, fake_redis, test_user, test_game, test_token):
+    game_id, token_id = test_game.id, test_token.id
+    connected_users["sid-drag"] = test_user.id
+    await get_state_store().join_room(game_id, "sid-drag")
+
+    with patch.object(cache, "redis_client", fake_redis):
+        for step in range(10):
+            await fake_sio.handlers["token_move"]("sid-drag", {
+                "game_id": str(game_id), "token_id": str(token_id), "x": float(step), "y": 1.0,
+            })
+        socket_db.expire_all()
+        assert socket_db.get(Token, token_id).x == 50.0
+        assert get_game_state(socket_db, game_id)["tokens"][0]["x"] == 9.0
+
+        await fake_sio.handlers["disconnect"]("sid-drag")
+
+    socket_db.expire_all()
+    assert (socket_db.get(Token, token_id).x, socket_db.get(Token, token_id).y) == (9.0, 1.0)
+    assert get_position_buffer().pending_games() == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("warm_cache", [True, False], ids=["warm", "cold"])
+async def test_move_of_foreign_token_is_rejected(fake_sio, socket_db, fake_redis, test_user, test_game, test_token,
+                                                 warm_cache):
+    """Мастер одной игры не может разослать перемещение токена другой игры"""
+    other_game = GameSession(id=uuid.uuid4(), name="Other", invite_code="OTHER1", master_id=test_user.id)
+    foreign = Token(id=uuid.uuid4(), game_id=other_game.id, name="Foreign", x=5.0, y=5.0)
+    socket_db.add_all([other_game, foreign])
+    socket_db.commit()
+    connected_users["sid-foreign"] = test_user.id
+
+    with patch.object(cache, "redis_client", fake_redis):
+        if warm_cache:
+            cache.save_game_state_to_redis(test_game.id, [test_token], 0)
+        for token_id in (foreign.id, uuid.uuid4()):
+            await fake_sio.handlers["token_move"]("sid-foreign", {
+                "game_id": str(test_game.id), "token_id": str(token_id), "x": 1.0, "y": 1.0,
+            })
+    connected_users.pop("sid-foreign", None)
+
+    assert fake_sio.events("token:moved") == []
+    assert [e["message"] for e in fake_sio.events("error")] == ["Token not found in this game"] * 2
+    assert get_position_buffer().pending_games() == []
+    assert fake_redis.hgetall(f"game:{test_game.id}:positions") == {}
+
+
+@pytest.mark.asyncio
+async def test_direct_update_discards_pending_position(db_session, test_game, test_token):
+    token_id = test_token.id
+    buffer = get_position_buffer()
+    buffer.record(test_game.id, token_id, 10.0, 10.0)
+
+    game_service.update_token_position(db_session, token_id, TokenUpdate(x=70.0, y=70.0))
+
+    assert buffer.pending_positions(test_game.id) == {}
+
+
+@pytest.mark.asyncio
+async def test_game_state_overlays_pending_positions_without_redis(db_session, test_game, test_token):
+    get_position_buffer().record(test_game.id, test_token.id, 12.0, 34.0)
+    broken = Mock()
+    broken.pipeline.side_effect = ConnectionError("down")
+    with patch.object(cache, "redis_client", broken):
+        state = get_game_state(db_session, test_game.id)
+
+    assert (state["tokens"][0]["x"], state["tokens"][0]["y"]) == (12.0, 34.0)
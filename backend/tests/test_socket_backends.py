@@ -0,0 +1,113 @@
+"""
+Тесты общих бэкендов Socket.IO (client manager и хранилище состояния)
+"""
+import pytest
+import socketio
+from uuid import uuid4
+from unittest.mock import patch
+from app.sockets import state
+from app.sockets.backends import (
+    InMemoryStateStore,
+    RedisStateStore,
+    SocketStateStore,
+    create_client_manager,
+    create_state_store,
+)
+from app.sockets.state import connected_users
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, fake_async_redis):
+    """Оба бэкенда должны вести себя одинаково"""
+    if request.param == "memory":
+        return InMemoryStateStore()
+    return RedisStateStore(fake_async_redis)
+
+
+@pytest.mark.asyncio
+async def test_room_membership(store):
+    game_id = uuid4()
+    other_game_id = uuid4()
+
+    await store.join_room(game_id, "sid-1")
+    await store.join_room(game_id, "sid-2")
+    await store.join_room(other_game_id, "sid-1")
+
+    assert sorted(await store.remove_connection("sid-1")) == sorted([game_id, other_game_id])
+    assert await store.remove_connection("sid-1") == []
+    assert await store.remove_connection("sid-2") == [game_id]
+
+
+def test_state_store_is_abstract():
+    with pytest.raises(TypeError):
+        SocketStateStore()
+
+
+@pytest.mark.asyncio
+async def test_started_games_flag(store):
+    game_id = uuid4()
+    assert await store.is_game_started(game_id) is False
+    await store.mark_game_started(game_id)
+    assert await store.is_game_started(game_id) is True
+
+
+@pytest.mark.asyncio
+async def test_tick_mode_cleared_when_room_empties(store):
+    game_id = uuid4()
+    assert await store.get_tick_mode(game_id) is None
+
+    await store.join_room(game_id, "sid-1")
+    await store.join_room(game_id, "sid-2")
+    await store.set_tick_mode(game_id, True)
+    await store.remove_connection("sid-1")
+    assert await store.get_tick_mode(game_id) is True
+
+    await store.remove_connection("sid-2")
+    assert await store.get_tick_mode(game_id) is None
+
+
+@pytest.mark.asyncio
+async def test_redis_store_is_shared_between_workers(fake_async_redis):
+    """Два воркера с одним Redis видят общие комнаты и флаги"""
+    worker_a = RedisStateStore(fake_async_redis)
+    worker_b = RedisStateStore(fake_async_redis)
+    game_id = uuid4()
+
+    await worker_a.join_room(game_id, "sid-a")
+    await worker_a.mark_game_started(game_id)
+    await worker_a.set_tick_mode(game_id, False)
+
+    assert await worker_b.is_game_started(game_id) is True
+    assert await worker_b.get_tick_mode(game_id) is False
+    # Отключение, обработанное другим воркером, находит комнаты сокета
+    assert await worker_b.remove_connection("sid-a") == [game_id]
+    assert await fake_async_redis.smembers(f"socket:room:{game_id}") == set()
+
+
+def test_factories_follow_socket_backend_setting():
+    with patch("app.sockets.backends.settings.socket_backend", "memory"):
+        assert type(create_client_manager()) is socketio.AsyncManager
+        assert isinstance(create_state_store(), InMemoryStateStore)
+
+    with patch("app.sockets.backends.settings.socket_backend", "redis"):
+        assert isinstance(create_client_manager(), socketio.AsyncRedisManager)
+        assert isinstance(create_state_store(), RedisStateStore)
+
+
+@pytest.mark.asyncio
+async def test_game_start_sets_shared_flag(fake_sio, socket_db, test_user, test_game, authenticated_client):
+    """game_start выставляет флаг в общем хранилище, /status его читает"""
+    shared = InMemoryStateStore()
+    with patch.object(state, "_store", shared):
+        connected_users["sid-start"] = test_user.id
+        try:
+            await fake_sio.handlers["game_start"]("sid-start", {"game_id": str(test_game.id)})
+        finally:
+            connected_users.pop("sid-start", None)
+
+        assert fake_sio.events("game:started") == [{"game_id": str(test_game.id)}]
+        assert await shared.is_game_started(test_game.id) is True
+
+        response = authenticated_client.get(f"/api/games/{test_game.id}/status")
+        assert response.status_code == 200
+        assert response.json() == {"started": True}
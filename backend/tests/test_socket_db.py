@@ -0,0 +1,96 @@
+"""
+Тесты неблокирующего доступа к БД из Socket.IO обработчиков
+"""
+import asyncio
+import threading
+import time
+import pytest
+from app.sockets.db import run_db, SocketEventError
+from app.sockets.dice_history_buffer import get_dice_history_buffer
+from app.sockets.state import connected_users
+from app.models.dice_roll_history import DiceRollHistory
+
+
+@pytest.mark.asyncio
+async def test_run_db_executes_outside_event_loop_thread(socket_db):
+    """Функция выполняется в потоке пула с собственной сессией"""
+    loop_thread = threading.get_ident()
+
+    def _work(db):
+        return threading.get_ident(), db is not None
+
+    thread_id, has_session = await run_db(_work)
+    assert thread_id != loop_thread
+    assert has_session is True
+
+
+@pytest.mark.asyncio
+async def test_run_db_keeps_event_loop_responsive(socket_db):
+    """Медленный запрос к БД не останавливает event loop"""
+    def _slow_query(db):
+        time.sleep(0.3)
+        return "done"
+
+    ticks = 0
+
+    async def _ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticker = asyncio.create_task(_ticker())
+    result = await run_db(_slow_query)
+    ticker.cancel()
+
+    assert result == "done"
+    assert ticks >= 10
+
+
+@pytest.mark.asyncio
+async def test_run_db_propagates_socket_event_error(socket_db):
+    """SocketEventError пробрасывается в обработчик"""
+    def _fail(db):
+        raise SocketEventError("Not a participant")
+
+    with pytest.raises(SocketEventError) as exc_info:
+        await run_db(_fail)
+    assert exc_info.value.message == "Not a participant"
+
+
+@pytest.mark.asyncio
+async def test_dice_roll_handler_uses_executor(fake_sio, socket_db, test_user, test_game):
+    """dice_roll сохраняет историю и рассылает результат"""
+    connected_users["sid-dice"] = test_user.id
+    try:
+        await fake_sio.handlers["dice_roll"]("sid-dice", {
+            "game_id": str(test_game.id),
+            "count": 2,
+            "faces": 6,
+            "modifier": 3,
+        })
+    finally:
+        connected_users.pop("sid-dice", None)
+
+    rolled = fake_sio.events("dice:rolled")
+    assert len(rolled) == 1
+    assert rolled[0]["username"] == test_user.username
+    assert rolled[0]["total"] == sum(r["value"] for r in rolled[0]["rolls"]) + 3
+    await get_dice_history_buffer().drain()
+    assert socket_db.query(DiceRollHistory).count() == 1
+
+
+@pytest.mark.asyncio
+async def test_chat_handler_rejects_non_participant(fake_sio, socket_db, test_user2, test_game):
+    """Не участник игры получает ошибку"""
+    connected_users["sid-chat"] = test_user2.id
+    try:
+        await fake_sio.handlers["game_send_message"]("sid-chat", {
+            "game_id": str(test_game.id),
+            "message": "Привет",
+        })
+    finally:
+        connected_users.pop("sid-chat", None)
+
+    assert fake_sio.events("game:chat_message") == []
+    assert fake_sio.events("error") == [{"message": "Not a participant"}]
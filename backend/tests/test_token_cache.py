@@ -0,0 +1,155 @@
+"""
+Тесты инкрементального кэша токенов в Redis
+"""
+import json
+import pytest
+import uuid
+from unittest.mock import patch, Mock
+from app.models.token import Token
+from app.services import game_cache as cache
+from app.sockets.state import connected_users
+
+
+@pytest.fixture
+def cache_redis(fake_redis):
+    with patch.object(cache, "redis_client", fake_redis):
+        yield fake_redis
+
+
+def _stored_tokens(redis, game_id):
+    stored = redis.hgetall(f"game:{game_id}:tokens")
+    return [json.loads(t) for field, t in stored.items() if field != cache.CACHED_MARKER_FIELD]
+
+
+def _make_tokens(db_session, game, count):
+    tokens = [
+        Token(id=uuid.uuid4(), game_id=game.id, name=f"Goblin {i}", x=float(i % 100), y=10.0)
+        for i in range(count)
+    ]
+    db_session.add_all(tokens)
+    db_session.commit()
+    return tokens
+
+
+def test_cold_start_rebuilds_full_hash(cache_redis, db_session, test_game):
+    tokens = _make_tokens(db_session, test_game, 5)
+    loader = Mock(return_value=tokens)
+
+    cache.update_token_in_redis(test_game.id, tokens[0], loader)
+
+    loader.assert_called_once()
+    stored = _stored_tokens(cache_redis, test_game.id)
+    assert {t["id"] for t in stored} == {str(t.id) for t in tokens}
+
+
+def test_warm_update_is_single_round_trip(cache_redis, db_session, test_game):
+    tokens = _make_tokens(db_session, test_game, 50)
+    cache.save_game_state_to_redis(test_game.id, tokens, 0)
+    cache_redis.round_trips = 0
+    cache_redis.commands = 0
+
+    tokens[3].x = 77.0
+    loader = Mock()
+    cache.update_token_in_redis(test_game.id, tokens[3], loader)
+
+    loader.assert_not_called()
+    assert cache_redis.round_trips == 1
+    assert cache_redis.commands == 1
+    stored = json.loads(cache_redis.hget(f"game:{test_game.id}:tokens", str(tokens[3].id)))
+    assert stored["x"] == 77.0
+
+
+def test_cold_cache_is_never_partial(cache_redis, db_session, test_game):
+    """Без хэша точечная запись ничего не создает: хэш строится сразу целиком"""
+    tokens = _make_tokens(db_session, test_game, 4)
+    seen = []
+
+    def loader():
+        # Момент между точечной записью и перестройкой: читатель не должен видеть неполный хэш
+        seen.append(_stored_tokens(cache_redis, test_game.id))
+        return tokens
+
+    cache.update_tokens_in_redis(test_game.id, [cache.serialize_token(tokens[1])], loader)
+
+    assert seen == [[]]
+    assert {t["id"] for t in _stored_tokens(cache_redis, test_game.id)} == {str(t.id) for t in tokens}
+
+
+def test_remove_token_deletes_single_field(cache_redis, db_session, test_game):
+    tokens = _make_tokens(db_session, test_game, 3)
+    cache.save_game_state_to_redis(test_game.id, tokens, 0)
+
+    cache.remove_token_from_redis(test_game.id, tokens[0].id)
+
+    stored = _stored_tokens(cache_redis, test_game.id)
+    assert {t["id"] for t in stored} == {str(tokens[1].id), str(tokens[2].id)}
+
+
+@pytest.mark.parametrize("change", ["update", "remove"])
+def test_stale_rebuild_is_dropped(cache_redis, db_session, test_game, change):
+    """Список токенов, прочитанный из БД до чужой записи, не попадает в кэш"""
+    tokens = _make_tokens(db_session, test_game, 3)
+    version = cache.read_game_snapshot(test_game.id)[4]
+    stale = list(tokens)
+
+    # Пока читатель ходил в БД, другой запрос изменил токен (хэш затем истек — перестроить снова нужно)
+    if change == "update":
+        tokens[0].x = 42.0
+        cache.update_token_in_redis(test_game.id, tokens[0], lambda: tokens)
+        cache_redis.delete(f"game:{test_game.id}:tokens")
+    else:
+        cache.remove_token_from_redis(test_game.id, tokens[0].id)
+
+    assert cache.save_game_state_to_redis(test_game.id, stale, version) is False
+    assert _stored_tokens(cache_redis, test_game.id) == []
+
+
+def test_empty_game_is_cached(socket_db, cache_redis, test_game):
+    from app.sockets.utils import get_game_state
+
+    get_game_state(socket_db, test_game.id)
+    with patch("app.sockets.utils.get_game_tokens") as get_tokens:
+        state = get_game_state(socket_db, test_game.id)
+        get_tokens.assert_not_called()
+
+    assert state["tokens"] == []
+
+
+def test_redis_errors_do_not_break_callers(db_session, test_game, test_token):
+    from redis.exceptions import ConnectionError
+    broken = Mock()
+    broken.pipeline.side_effect = ConnectionError("down")
+    broken.eval.side_effect = ConnectionError("down")
+    with patch.object(cache, "redis_client", broken):
+        cache.update_token_in_redis(test_game.id, test_token, lambda: [test_token])
+        cache.remove_token_from_redis(test_game.id, test_token.id)
+
+
+@pytest.mark.asyncio
+async def test_token_move_cost_does_not_depend_on_token_count(fake_sio, socket_db, cache_redis, test_user, test_game):
+    """token_move не перечитывает токены: проверка роли и живая позиция — по одному pipeline"""
+    tokens = _make_tokens(socket_db, test_game, 300)
+    cache.save_game_state_to_redis(test_game.id, tokens, 0)
+
+    async def move(token, x, y):
+        await fake_sio.handlers["token_move"]("sid-move", {
+            "game_id": str(test_game.id),
+            "token_id": str(token.id),
+            "x": x,
+            "y": y,
+        })
+
+    connected_users["sid-move"] = test_user.id
+    try:
+        await move(tokens[0], 1.0, 1.0)
+        cache_redis.round_trips = 0
+        with patch("app.services.game_service.get_game_tokens") as get_tokens:
+            await move(tokens[42], 12.5, 33.0)
+            get_tokens.assert_not_called()
+    finally:
+        connected_users.pop("sid-move", None)
+
+    assert cache_redis.round_trips == 2
+    assert fake_sio.events("token:moved")[-1]["x"] == 12.5
+    stored = json.loads(cache_redis.hget(f"game:{test_game.id}:positions", str(tokens[42].id)))
+    assert stored == [12.5, 33.0]
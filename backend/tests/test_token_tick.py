@@ -0,0 +1,149 @@
+"""
+Тесты тиковой рассылки перемещений токенов (token:moved_batch)
+"""
+import asyncio
+import pytest
+import uuid
+from unittest.mock import patch
+from app.models.token import Token
+from app.services import game_cache as cache
+from app.sockets.state import connected_users
+from app.services.position_buffer import get_position_buffer
+from app.sockets.tick import TokenMoveCoalescer, get_move_coalescer, flush_move_coalescer
+
+
+@pytest.fixture(autouse=True)
+async def stop_ticks():
+    yield
+    await flush_move_coalescer()
+
+
+@pytest.fixture
+def master_sid(test_user):
+    connected_users["sid-master"] = test_user.id
+    yield "sid-master"
+    connected_users.pop("sid-master", None)
+
+
+@pytest.fixture
+def player_sid(test_user2, test_game, db_session):
+    from app.models.game_participant import GameParticipant
+    db_session.add(GameParticipant(game_id=test_game.id, user_id=test_user2.id, role="player"))
+    db_session.commit()
+    connected_users["sid-player"] = test_user2.id
+    yield "sid-player"
+    connected_users.pop("sid-player", None)
+
+
+@pytest.fixture
+def tokens(socket_db, test_game, fake_redis):
+    items = [Token(id=uuid.uuid4(), game_id=test_game.id, name=f"T{i}", x=1.0, y=1.0) for i in range(3)]
+    socket_db.add_all(items)
+    socket_db.commit()
+    with patch.object(cache, "redis_client", fake_redis):
+        yield items
+
+
+async def _move(fake_sio, sid, game_id, token_id, x, y):
+    await fake_sio.handlers["token_move"](sid, {
+        "game_id": str(game_id), "token_id": str(token_id), "x": x, "y": y,
+    })
+
+
+@pytest.mark.asyncio
+async def test_moves_within_tick_are_coalesced(fake_sio, master_sid, test_game, tokens, socket_db):
+    game_id = test_game.id
+    coalescer = get_move_coalescer()
+    await coalescer.set_enabled(game_id, True)
+
+    for step in range(10):
+        await _move(fake_sio, master_sid, game_id, tokens[0].id, float(step), 5.0)
+        await _move(fake_sio, master_sid, game_id, tokens[1].id, 20.0, float(step))
+    assert fake_sio.events("token:moved") == []
+    assert coalescer.pending_count(game_id) == 2
+
+    await coalescer.flush(game_id)
+
+    batches = fake_sio.events("token:moved_batch")
+    assert len(batches) == 1
+    moves = {m["token_id"]: (m["x"], m["y"]) for m in batches[0]["moves"]}
+    assert moves == {str(tokens[0].id): (9.0, 5.0), str(tokens[1].id): (20.0, 9.0)}
+
+    await get_position_buffer().flush_all()
+    socket_db.expire_all()
+    stored = {t.id: (t.x, t.y) for t in socket_db.query(Token).filter(Token.game_id == game_id)}
+    assert stored[tokens[0].id] == (9.0, 5.0)
+    assert stored[tokens[1].id] == (20.0, 9.0)
+    assert stored[tokens[2].id] == (1.0, 1.0)
+
+
+@pytest.mark.asyncio
+async def test_tick_loop_flushes_and_stops(fake_sio, master_sid, test_game, tokens):
+    game_id = test_game.id
+    coalescer = get_move_coalescer()
+    coalescer.interval = 0.01
+    await coalescer.set_enabled(game_id, True)
+
+    await _move(fake_sio, master_sid, game_id, tokens[0].id, 50.0, 50.0)
+    for _ in range(100):
+        if fake_sio.events("token:moved_batch"):
+            break
+        await asyncio.sleep(0.01)
+
+    assert len(fake_sio.events("token:moved_batch")) == 1
+    await asyncio.sleep(0.05)
+    assert coalescer._tasks == {}
+
+
+@pytest.mark.asyncio
+async def test_default_mode_emits_single_moves(fake_sio, master_sid, test_game, tokens):
+    await _move(fake_sio, master_sid, test_game.id, tokens[0].id, 30.0, 40.0)
+
+    assert fake_sio.events("token:moved")[0]["x"] == 30.0
+    assert fake_sio.events("token:moved_batch") == []
+
+
+@pytest.mark.asyncio
+async def test_deleted_token_dropped_from_batch():
+    emitted = []
+
+    class Sio:
+        async def emit(self, event, data=None, room=None):
+            emitted.append((event, data, room))
+
+    kept, deleted = uuid.uuid4(), uuid.uuid4()
+
+    async def persist(game_id, positions):
+        return [kept]
+
+    coalescer = TokenMoveCoalescer(Sio(), persist, tick_hz=25)
+    game_id, user_id = uuid.uuid4(), uuid.uuid4()
+    coalescer.add(game_id, kept, 1.0, 2.0, user_id)
+    coalescer.add(game_id, deleted, 3.0, 4.0, user_id)
+    await coalescer.flush_all()
+
+    assert len(emitted) == 1
+    assert [m["token_id"] for m in emitted[0][1]["moves"]] == [str(kept)]
+    assert emitted[0][2] == f"game:{game_id}"
+
+
+@pytest.mark.asyncio
+async def test_tick_mode_requires_master(fake_sio, socket_db, master_sid, player_sid, test_game):
+    game_id = test_game.id
+    await fake_sio.handlers["token_tick_mode"](player_sid, {"game_id": str(game_id), "enabled": True})
+    assert fake_sio.events("error")[0]["message"] == "Only master can configure tokens"
+    assert not await get_move_coalescer().is_enabled(game_id)
+
+    await fake_sio.handlers["token_tick_mode"](master_sid, {"game_id": str(game_id), "enabled": True})
+    assert await get_move_coalescer().is_enabled(game_id)
+    assert fake_sio.events("token:tick_mode")[0]["enabled"] is True
+
+
+@pytest.mark.asyncio
+async def test_player_moves_rejected_in_tick_mode(fake_sio, player_sid, test_game, tokens):
+    await get_move_coalescer().set_enabled(test_game.id, True)
+
+    await _move(fake_sio, player_sid, test_game.id, tokens[0].id, 10.0, 10.0)
+
+    assert fake_sio.events("error")[0]["message"] == "Only master can move tokens"
+    assert get_move_coalescer().pending_count(test_game.id) == 0
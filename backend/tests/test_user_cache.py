@@ -0,0 +1,117 @@
+"""
+Тесты LRU-кэша профилей пользователей
+"""
+import pytest
+import uuid
+from unittest.mock import Mock, patch
+from redis.exceptions import ConnectionError
+from app.config import settings
+from app.services import game_cache as cache
+from app.sockets.state import connected_users
+from app.sockets.user_cache import UserProfileCache, get_user_cache
+from app.sockets.utils import get_username
+
+
+def test_hit_after_first_load():
+    profiles = UserProfileCache(max_size=10, ttl=60)
+    load = Mock(return_value={"username": "alice"})
+    user_id = uuid.uuid4()
+
+    assert profiles.get(user_id, load) == {"username": "alice"}
+    assert profiles.get(user_id, load) == {"username": "alice"}
+
+    load.assert_called_once()
+    assert profiles.stats()["hits"] == 1
+    assert profiles.stats()["misses"] == 1
+    assert profiles.stats()["hit_ratio"] == 0.5
+
+
+def test_lru_eviction():
+    profiles = UserProfileCache(max_size=2, ttl=60)
+    a, b, c = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    profiles.get(a, lambda: {"username": "a"})
+    profiles.get(b, lambda: {"username": "b"})
+    profiles.get(a, Mock())
+    profiles.get(c, lambda: {"username": "c"})
+
+    load_b = Mock(return_value={"username": "b"})
+    profiles.get(b, load_b)
+    load_b.assert_called_once()
+    assert profiles.stats()["evictions"] == 2
+    assert profiles.stats()["size"] == 2
+
+
+def test_ttl_expiry():
+    profiles = UserProfileCache(max_size=10, ttl=60)
+    user_id = uuid.uuid4()
+    with patch("app.sockets.user_cache.time.monotonic", return_value=1000.0):
+        profiles.get(user_id, lambda: {"username": "old"})
+    with patch("app.sockets.user_cache.time.monotonic", return_value=1061.0):
+        assert profiles.get(user_id, lambda: {"username": "new"}) == {"username": "new"}
+
+
+def test_missing_users_are_not_cached():
+    profiles = UserProfileCache(max_size=10, ttl=60)
+    user_id = uuid.uuid4()
+    assert profiles.get(user_id, lambda: None) is None
+    assert profiles.get(user_id, lambda: {"username": "late"}) == {"username": "late"}
+
+
+def test_shared_redis_level(fake_redis):
+    worker_a = UserProfileCache(max_size=10, ttl=60, redis=fake_redis)
+    worker_b = UserProfileCache(max_size=10, ttl=60, redis=fake_redis)
+    user_id = uuid.uuid4()
+    worker_a.get(user_id, lambda: {"username": "shared"})
+
+    load = Mock()
+    assert worker_b.get(user_id, load) == {"username": "shared"}
+    load.assert_not_called()
+    assert worker_b.stats()["redis_hits"] == 1
+
+
+def test_redis_errors_fall_back_to_loader():
+    broken = Mock()
+    broken.get.side_effect = ConnectionError("down")
+    broken.set.side_effect = ConnectionError("down")
+    profiles = UserProfileCache(max_size=10, ttl=60, redis=broken)
+    assert profiles.get(uuid.uuid4(), lambda: {"username": "db"}) == {"username": "db"}
+
+
+@pytest.mark.asyncio
+async def test_dice_roll_hot_path_skips_user_query(fake_sio, socket_db, fake_redis, test_user, test_game, query_counter):
+    game_id = str(test_game.id)
+    connected_users["sid-dice"] = test_user.id
+    try:
+        with patch.object(cache, "redis_client", fake_redis):
+            await fake_sio.handlers["dice_roll"]("sid-dice", {"game_id": game_id, "count": 1, "faces": 20})
+            query_counter.reset()
+            await fake_sio.handlers["dice_roll"]("sid-dice", {"game_id": game_id, "count": 1, "faces": 20})
+    finally:
+        connected_users.pop("sid-dice", None)
+
+    assert [e["username"] for e in fake_sio.events("dice:rolled")] == ["testuser", "testuser"]
+    assert not [s for s in query_counter.statements if "FROM users" in s]
+    assert get_user_cache().stats()["hits"] >= 1
+
+
+@pytest.fixture
+def main_client():
+    """Клиент основного приложения без событий старта"""
+    from fastapi.testclient import TestClient
+    from app.main import app
+    return TestClient(app)
+
+
+def test_metrics_disabled_without_token(main_client):
+    with patch.object(settings, "metrics_token", None):
+        assert main_client.get("/metrics").status_code == 404
+
+
+def test_metrics_requires_token(main_client):
+    with patch.object(settings, "metrics_token", "s3cret"):
+        assert main_client.get("/metrics").status_code == 401
+        assert main_client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+        response = main_client.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+
+    assert response.status_code == 200
+    assert set(response.json()) == {"user_cache", "dice_history"}
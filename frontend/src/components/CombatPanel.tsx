@@ -8,7 +8,15 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from '.
 import { Input } from './ui/input';
 import { combatAPI } from '../services/api';
 import { socketService } from '../services/socket';
-import type { CombatSession, CombatParticipant } from '../types/combat';
+import type {
+  CombatSession,
+  CombatParticipant,
+  DeathSaveEvent,
+  InitiativeBatchResult,
+  InitiativeRolledEvent,
+  ParticipantAddedEvent,
+  TurnState,
+} from '../types/combat';
 import { CONDITIONS } from '../types/combat';
 import HPBar from './HPBar';
 import { Sword, Shield, Zap, X, Crosshair, SkipForward, Heart, Skull, Plus, Minus } from 'lucide-react';
@@ -71,10 +79,50 @@ export default function CombatPanel({ gameId, isMaster, onCombatChange, availabl
       onCombatChange?.(data.id);
     };
 
-    const handleInitiativeRolled = (data: CombatParticipant) => {
-      setCombat(prev => prev ? {
+    // Порядок ходов из события; событие другого боя не применяется
+    const withTurnState = (prev: CombatSession, data: TurnState): CombatSession => ({
+      ...prev,
+      turn_order: data.turn_order,
+      current_turn_index: data.current_turn_index,
+      round_number: data.round_number,
+    });
+
+    const handleInitiativeRolled = (data: InitiativeRolledEvent) => {
+      setCombat(prev => prev && prev.id === data.combat_id ? withTurnState({
         ...prev,
         participants: prev.participants.map(p => p.id === data.id ? data : p),
+      }, data) : prev);
+    };
+
+    const handleDeathSaveRolled = (data: DeathSaveEvent) => {
+      setCombat(prev => prev && prev.id === data.combat_id ? withTurnState({
+        ...prev,
+        participants: prev.participants.map(p => p.id === data.participant_id ? {
+          ...p,
+          death_saves_success: data.death_saves_success,
+          death_saves_failure: data.death_saves_failure,
+          is_dead: p.is_dead || data.died,
+          current_hp: data.regained_hp ?? p.current_hp,
+        } : p),
+      }, data) : prev);
+    };
+
+    const handleParticipantAdded = (data: ParticipantAddedEvent) => {
+      setCombat(prev => prev && prev.id === data.combat_id ? withTurnState({
+        ...prev,
+        participants: [...prev.participants.filter(p => p.id !== data.participant.id), data.participant],
+      }, data) : prev);
+    };
+
+    const handleInitiativeBatch = (data: InitiativeBatchResult) => {
+      const initiatives = new Map(data.rolls.map(r => [r.participant_id, r.initiative]));
+      setCombat(prev => prev && prev.id === data.combat_id ? {
+        ...prev,
+        participants: prev.participants.map(p =>
+          initiatives.has(p.id) ? { ...p, initiative: initiatives.get(p.id) } : p
+        ),
+        turn_order: data.turn_order,
+        current_turn_index: data.current_turn_index,
       } : prev);
     };
 
@@ -113,6 +161,9 @@ export default function CombatPanel({ gameId, isMaster, onCombatChange, availabl
 
     socketService.onCombatStarted(handleCombatStarted);
     socketService.onInitiativeRolled(handleInitiativeRolled);
+    socketService.onInitiativeBatch(handleInitiativeBatch);
+    socketService.onDeathSave(handleDeathSaveRolled);
+    socketService.onParticipantAdded(handleParticipantAdded);
     socketService.onCombatEnded(handleCombatEnded);
     socketService.onCombatAttack(handleCombatAttack);
     socketService.onCombatDamage(handleCombatDamage);
@@ -122,6 +173,9 @@ export default function CombatPanel({ gameId, isMaster, onCombatChange, availabl
     return () => {
       socketService.off('combat:started');
       socketService.off('combat:initiative_rolled');
+      socketService.off('combat:initiative_batch');
+      socketService.off('combat:death_save');
+      socketService.off('combat:participant_added');
       socketService.off('combat:ended');
       socketService.off('combat:attack');
       socketService.off('combat:damage');
@@ -284,9 +338,11 @@ export default function CombatPanel({ gameId, isMaster, onCombatChange, availabl
     : [];
 
   const currentParticipant =
-    combat && orderedParticipants.length > 0
-      ? orderedParticipants[combat.current_turn_index % orderedParticipants.length]
-      : null;
+    combat && combat.turn_order && combat.turn_order.length > 0
+      ? combat.participants.find(p => p.id === combat.turn_order![combat.current_turn_index]) ?? null
+      : combat && orderedParticipants.length > 0
+        ? orderedParticipants[combat.current_turn_index % orderedParticipants.length]
+        : null;
 
   if (!combat) {
     if (!isMaster) return null;
@@ -1,6 +1,12 @@
 import { io, Socket } from 'socket.io-client';
 import type { Token, Player } from '../types/game';
-import type { CombatSession, CombatParticipant } from '../types/combat';
+import type {
+  CombatSession,
+  DeathSaveEvent,
+  InitiativeBatchResult,
+  InitiativeRolledEvent,
+  ParticipantAddedEvent,
+} from '../types/combat';
 
 const WS_URL = import.meta.env.VITE_WS_URL || window.location.origin;
 
@@ -317,12 +323,30 @@ export class SocketService {
     }
   }
 
-  onInitiativeRolled(callback: (data: CombatParticipant) => void): void {
+  onInitiativeRolled(callback: (data: InitiativeRolledEvent) => void): void {
     if (this.socket) {
       this.socket.on('combat:initiative_rolled', callback);
     }
   }
 
+  onInitiativeBatch(callback: (data: InitiativeBatchResult) => void): void {
+    if (this.socket) {
+      this.socket.on('combat:initiative_batch', callback);
+    }
+  }
+
+  onDeathSave(callback: (data: DeathSaveEvent) => void): void {
+    if (this.socket) {
+      this.socket.on('combat:death_save', callback);
+    }
+  }
+
+  onParticipantAdded(callback: (data: ParticipantAddedEvent) => void): void {
+    if (this.socket) {
+      this.socket.on('combat:participant_added', callback);
+    }
+  }
+
   onCombatEnded(callback: () => void): void {
     if (this.socket) {
       this.socket.on('combat:ended', callback);
@@ -36,6 +36,46 @@ export interface CombatSession {
   started_at: string;
   ended_at?: string | null;
   participants: CombatParticipant[];
+  turn_order?: string[];  // ID живых участников в порядке ходов; current_turn_index указывает сюда
+}
+
+export interface InitiativeRoll {
+  participant_id: string;
+  roll: number;
+  modifier: number;
+  initiative: number;
+  rng_offset: number;
+}
+
+export interface InitiativeBatchResult {
+  combat_id: string;
+  rolls: InitiativeRoll[];
+  turn_order: string[];
+  current_turn_index: number;
+}
+
+// Порядок ходов в событиях, которые его меняют
+export interface TurnState {
+  combat_id: string;
+  turn_order: string[];
+  current_turn_index: number;
+  round_number: number;
+}
+
+export type InitiativeRolledEvent = CombatParticipant & TurnState;
+
+export interface DeathSaveEvent extends TurnState {
+  participant_id: string;
+  roll: number;
+  died: boolean;
+  stabilized: boolean;
+  death_saves_success: number;
+  death_saves_failure: number;
+  regained_hp?: number | null;
+}
+
+export interface ParticipantAddedEvent extends TurnState {
+  participant: CombatParticipant;
 }
 
 // D&D 5e conditions with display names and icons